@@ -0,0 +1,181 @@
+"""
+Benchmark of the BM25 index: build time, incremental update time and query latency, against a grep-like
+scan of the page text files (what finding an invoice number takes without an index).
+
+A synthetic text extraction output (Zipf-distributed vocabulary, with invoice numbers and product codes
+sprinkled in) is written in the pipeline's "<document>/<document>_page_<n>.txt" layout, then:
+- the index is built from scratch
+- a few pages are changed, added and removed, and the index is updated incrementally
+- a blank page (empty text) is added and pages are changed over updates that merge segments, the index
+  must match one built from scratch
+- keyword, multi-term and exact code queries are timed, with a document filter too
+- the same code lookups are timed as a regular expression scan of every page file
+
+Usage:
+    python -m benchmarks.bench_bm25 [--documents 500] [--pages 20] [--words 300] [--queries 200]
+"""
+import argparse
+import os
+import re
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from src.constants import TEXT_CHUNK_OVERLAP, TEXT_CHUNK_SIZE
+from src.retrieval.bm25 import BM25Index, update_bm25_index
+from src.utils.main_utils import list_page_files
+
+
+def make_vocabulary(rng, size):
+    letters = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+    return ["".join(rng.choice(letters, rng.integers(3, 10))) for _ in range(size)]
+
+
+def make_page(rng, vocabulary, weights, words, codes):
+    tokens = list(np.array(vocabulary)[rng.choice(len(vocabulary), words, p=weights)])
+    for code in codes:
+        tokens.insert(int(rng.integers(0, len(tokens))), code)
+    return " ".join(tokens)
+
+
+def make_corpus(text_folder, documents, pages, words, vocabulary_size, seed):
+    """
+    Write the synthetic page texts, return the codes written (one invoice number per page)
+    """
+    rng = np.random.default_rng(seed)
+    vocabulary = make_vocabulary(rng, vocabulary_size)
+    weights = 1.0 / np.arange(1, vocabulary_size + 1)
+    weights /= weights.sum()
+    codes = []
+    for document in range(documents):
+        os.makedirs(os.path.join(text_folder, f"doc{document}"), exist_ok=True)
+        for page in range(1, pages + 1):
+            code = f"INV-{2000 + document % 30}/{document:05d}{page:03d}"
+            codes.append(code)
+            text = make_page(rng, vocabulary, weights, words, [code, f"SKU{int(rng.integers(0, 10 ** 6)):06d}"])
+            with open(os.path.join(text_folder, f"doc{document}", f"doc{document}_page_{page}.txt"), "w",
+                      encoding="utf-8") as file:
+                file.write(text)
+    return vocabulary, weights, codes
+
+
+def grep(text_folder, pattern):
+    """
+    Pages whose text matches pattern, by reading every page file
+    """
+    regex = re.compile(re.escape(pattern), re.IGNORECASE)
+    matches = []
+    for _, page_file_path in list_page_files(text_folder):
+        with open(page_file_path, "r", encoding="utf-8") as file:
+            if regex.search(file.read()):
+                matches.append(page_file_path)
+    return matches
+
+
+def time_queries(search, queries):
+    latencies = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(search(query))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return results, np.array(latencies)
+
+
+def report(label, latencies):
+    print(f"{label:<30} p50 {np.percentile(latencies, 50):8.2f} ms  p99 {np.percentile(latencies, 99):8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=500)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--words", type=int, default=300)
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--grep-queries", type=int, default=5)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="bm25_benchmark_")
+    try:
+        text_folder = os.path.join(work_dir, "text_outputs")
+        index_folder = os.path.join(work_dir, "bm25_index")
+        rng = np.random.default_rng(args.seed + 1)
+
+        start = time.perf_counter()
+        vocabulary, weights, codes = make_corpus(text_folder, args.documents, args.pages, args.words,
+                                                 args.vocabulary, args.seed)
+        print(f"{args.documents * args.pages} pages written in {time.perf_counter() - start:.1f}s")
+
+        start = time.perf_counter()
+        result = update_bm25_index(text_folder, index_folder, TEXT_CHUNK_SIZE, TEXT_CHUNK_OVERLAP)
+        size = sum(os.path.getsize(os.path.join(index_folder, name)) for name in os.listdir(index_folder))
+        print(f"Full build: {result['chunks']} chunks in {time.perf_counter() - start:.2f}s, "
+              f"index {size / 2 ** 20:.1f} MB")
+
+        start = time.perf_counter()
+        result = update_bm25_index(text_folder, index_folder, TEXT_CHUNK_SIZE, TEXT_CHUNK_OVERLAP)
+        print(f"No-op update: {time.perf_counter() - start:.2f}s")
+
+        # Rewrite 1% of the pages, add one document and remove another
+        for document in rng.choice(args.documents, max(args.documents * args.pages // 100, 1)):
+            page = int(rng.integers(1, args.pages + 1))
+            with open(os.path.join(text_folder, f"doc{document}", f"doc{document}_page_{page}.txt"), "a",
+                      encoding="utf-8") as file:
+                file.write(" corrected")
+        os.makedirs(os.path.join(text_folder, "docnew"))
+        with open(os.path.join(text_folder, "docnew", "docnew_page_1.txt"), "w", encoding="utf-8") as file:
+            file.write(make_page(rng, vocabulary, weights, args.words, ["INV-9999/0001"]))
+        shutil.rmtree(os.path.join(text_folder, "doc0"))
+
+        start = time.perf_counter()
+        result = update_bm25_index(text_folder, index_folder, TEXT_CHUNK_SIZE, TEXT_CHUNK_OVERLAP)
+        print(f"Incremental update: {result['indexed_pages']} pages indexed, {result['removed_pages']} removed "
+              f"in {time.perf_counter() - start:.2f}s, {result['segments']} segments")
+
+        # A blank page has no chunk: it must survive the segments it was indexed with being dropped and merged
+        with open(os.path.join(text_folder, "docnew", "docnew_page_2.txt"), "w", encoding="utf-8"):
+            pass
+        for update in range(3):
+            with open(os.path.join(text_folder, "docnew", "docnew_page_1.txt"), "a", encoding="utf-8") as file:
+                file.write(f" revision{update}")
+            result = update_bm25_index(text_folder, index_folder, TEXT_CHUNK_SIZE, TEXT_CHUNK_OVERLAP, max_segments=2)
+        rebuilt = update_bm25_index(text_folder, os.path.join(work_dir, "bm25_rebuilt"), TEXT_CHUNK_SIZE,
+                                    TEXT_CHUNK_OVERLAP)
+        assert (result["version"], result["chunks"]) == (rebuilt["version"], rebuilt["chunks"]), (result, rebuilt)
+        print(f"Updates with a blank page and segment merges: {result['chunks']} chunks, same as a rebuild")
+
+        start = time.perf_counter()
+        index = BM25Index(index_folder)
+        print(f"Index loaded in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+        k = args.k
+        single = [vocabulary[int(term)] for term in rng.choice(len(vocabulary), args.queries, p=weights)]
+        multi = [" ".join(vocabulary[int(term)] for term in rng.choice(len(vocabulary), 4, p=weights))
+                 for _ in range(args.queries)]
+        lookups = [codes[int(row)] for row in rng.integers(args.pages, len(codes), args.queries)]
+
+        _, latencies = time_queries(lambda query: index.search(query, k), single)
+        report("single term", latencies)
+        _, latencies = time_queries(lambda query: index.search(query, k), multi)
+        report("4 terms", latencies)
+        results, latencies = time_queries(lambda query: index.search(query, k), lookups)
+        report("invoice number", latencies)
+        found = np.mean([bool(result) and result[0]["text"].find(code) >= 0 for result, code in zip(results, lookups)])
+        print(f"{'':<30} code found at rank 1: {found:.3f}")
+        _, latencies = time_queries(lambda query: index.search(query, k, document="doc1"), multi)
+        report("4 terms, document=doc1", latencies)
+
+        _, latencies = time_queries(lambda query: grep(text_folder, query), lookups[:args.grep_queries])
+        report("grep scan of the page files", latencies)
+        index.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmark of the deskew engines of ImagePreProcessing on the sample pages in artifacts/pdf-outputs.
+
+Every page is preprocessed like the pipeline does (blur + resize), optionally rotated by a known
+angle, and its skew angle is searched with:
+- the legacy "rotate" engine (one imutils.rotate per candidate angle)
+- the vectorized "projection" engine (batched projection profiles + coarse-to-fine refinement)
+
+Usage:
+    python -m benchmarks.bench_deskew [--pages-folder artifacts/pdf-outputs] [--repeat 3]
+"""
+import argparse
+import os
+import time
+
+import cv2
+import imutils as im
+
+from src.components.image_preprocessing import ImagePreProcessing
+from src.entity.config_entity import ImagePreProcessingConfig
+from src.utils.page_store import PageStorage
+
+# (label, engine, delta, precision)
+ENGINES = [
+    ("rotate     delta=1", "rotate", 1, None),
+    ("projection delta=1", "projection", 1, None),
+    ("rotate     delta=0.1", "rotate", 0.1, None),
+    ("projection delta=1 precision=0.1", "projection", 1, 0.1),
+]
+
+
+def load_binary_pages(pages_folder, skews):
+    """
+    Preprocess the sample pages and return (name, known_skew, binary_image) tuples
+    """
+    config = ImagePreProcessingConfig()
+    preprocessing = ImagePreProcessing(image_processing_config=config)
+    page_storage = PageStorage()
+    image_paths = [image_path for document in sorted(os.listdir(pages_folder))
+                   for image_path in page_storage.list_pages(os.path.join(pages_folder, document), ".png")]
+    pages = []
+    for image_path in image_paths:
+        image = preprocessing.preprocess_and_resize_image(image_path, config.blur_kernel_size, config.target_size)
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        for skew in skews:
+            skewed = im.rotate(gray, skew) if skew else gray
+            binary = cv2.threshold(skewed, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)[1]
+            pages.append((os.path.basename(image_path), skew, binary))
+    return preprocessing, pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages-folder", default=os.path.join("artifacts", "pdf-outputs"))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--limit", type=float, default=5)
+    args = parser.parse_args()
+
+    preprocessing, pages = load_binary_pages(args.pages_folder, skews=[0, 2.3, -3.7])
+    print(f"{len(pages)} pages (sample pages x known skews 0, 2.3, -3.7)\n")
+
+    results = {}
+    for label, engine, delta, precision in ENGINES:
+        timings = []
+        angles = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            angles = [float(preprocessing.find_best_angle(binary, delta, args.limit, precision, engine))
+                      for _, _, binary in pages]
+            timings.append(time.perf_counter() - start)
+        results[label] = (min(timings) / len(pages), angles)
+
+    baseline = results[ENGINES[0][0]][0]
+    print(f"{'#':<3}{'engine':<36}{'ms/page':>10}{'speedup':>10}{'mean |angle + skew|':>22}")
+    for index, (label, (seconds, angles)) in enumerate(results.items(), start=1):
+        # The detected angle undoes the known skew, so angle + skew is the residual error
+        error = sum(abs(angle + skew) for angle, (_, skew, _) in zip(angles, pages)) / len(pages)
+        print(f"{index:<3}{label:<36}{seconds * 1000:>10.1f}{baseline / seconds:>9.1f}x{error:>22.3f}")
+
+    print("\nDetected angle per page and engine #")
+    print(f"{'page':<34}{'skew':>6}" + "".join(f"{index:>8}" for index in range(1, len(ENGINES) + 1)))
+    for page_index, (name, skew, _) in enumerate(pages):
+        print(f"{name:<34}{skew:>6}" + "".join(f"{angles[page_index]:>8.2f}" for _, angles in results.values()))
+
+if __name__ == "__main__":
+    main()
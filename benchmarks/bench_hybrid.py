@@ -0,0 +1,117 @@
+"""
+Benchmark of TextExtraction.hybrid_text (indexed fuzzy matcher) against the previous
+O(n*m) difflib implementation of hybrid_txt, on synthetic OCR pages.
+
+Each page pair is a 2k-word text and a copy with OCR-like character noise (substitutions,
+deletions and insertions), like two engines reading the same page.
+
+Usage:
+    python -m benchmarks.bench_hybrid [--words 2000] [--pages 3] [--noise 0.15]
+"""
+import argparse
+import difflib
+import random
+import string
+import time
+
+from src.components.text_extraction import TextExtraction
+from src.entity.config_entity import TextExtractionConfig
+
+
+def legacy_hybrid_text(file_content_1, file_content_2):
+    """
+    The previous hybrid_txt body, kept verbatim as the reference implementation
+    """
+    if not file_content_1 or not file_content_2:
+        return file_content_1 or file_content_2
+
+    final_text = file_content_1
+    words_in_file_1 = set(file_content_1.split())
+    words_in_file_2 = set(file_content_2.split())
+    common_words = words_in_file_1.intersection(words_in_file_2)
+    unique_words_in_file_1 = words_in_file_1 - common_words
+    unique_words_in_file_2 = words_in_file_2 - common_words
+
+    for word_in_file_1 in unique_words_in_file_1:
+        for word_in_file_2 in unique_words_in_file_2:
+            if any(char.isdigit() for char in word_in_file_1) or any(char.isdigit() for char in word_in_file_2):
+                continue
+            seq = difflib.SequenceMatcher(None, word_in_file_1, word_in_file_2)
+            diff_ratio = seq.ratio() * 100
+            if diff_ratio >= 75.0:
+                if len(word_in_file_2) >= len(word_in_file_1):
+                    final_text = final_text.replace(word_in_file_1, word_in_file_2)
+
+    return final_text
+
+
+def make_vocabulary(rng, size):
+    vocabulary = set()
+    while len(vocabulary) < size:
+        length = max(2, min(14, int(rng.gauss(7, 3))))
+        word = "".join(rng.choice(string.ascii_lowercase) for _ in range(length))
+        if rng.random() < 0.05:
+            word += str(rng.randint(0, 9999))
+        vocabulary.add(word)
+    return sorted(vocabulary)
+
+
+def add_ocr_noise(rng, word, noise):
+    if rng.random() >= noise or len(word) < 3:
+        return word
+    position = rng.randrange(len(word))
+    operation = rng.random()
+    if operation < 0.6:
+        return word[:position] + rng.choice(string.ascii_lowercase) + word[position + 1:]
+    if operation < 0.8:
+        return word[:position] + word[position + 1:]
+    return word[:position] + rng.choice(string.ascii_lowercase) + word[position:]
+
+
+def make_page_pair(rng, vocabulary, words, noise):
+    # Zipf-like word frequencies, as in natural text
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    page = rng.choices(vocabulary, weights=weights, k=words)
+    lines = [" ".join(page[index:index + 12]) for index in range(0, len(page), 12)]
+    noisy_lines = [" ".join(add_ocr_noise(rng, word, noise) for word in line.split()) for line in lines]
+    return "\n".join(noisy_lines), "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--words", type=int, default=2000)
+    parser.add_argument("--pages", type=int, default=3)
+    parser.add_argument("--noise", type=float, default=0.15)
+    parser.add_argument("--vocabulary", type=int, default=4000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocabulary = make_vocabulary(rng, args.vocabulary)
+    pages = [make_page_pair(rng, vocabulary, args.words, args.noise) for _ in range(args.pages)]
+    text_extraction = TextExtraction(text_extraction_config=TextExtractionConfig())
+
+    print(f"{args.pages} synthetic pages of {args.words} words, noise {args.noise}\n")
+    print(f"{'page':<6}{'legacy s':>10}{'indexed s':>11}{'speedup':>9}"
+          f"{'legacy ok':>11}{'indexed ok':>12}{'noisy ok':>10}")
+    for index, (noisy_text, clean_text) in enumerate(pages, start=1):
+        start = time.perf_counter()
+        legacy_result = legacy_hybrid_text(noisy_text, clean_text)
+        legacy_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        indexed_result = text_extraction.hybrid_text(noisy_text, clean_text)
+        indexed_seconds = time.perf_counter() - start
+
+        # Fraction of tokens equal to the clean text (the legacy version may also change the token count
+        # by corrupting substrings inside other words)
+        clean_tokens = clean_text.split()
+        def accuracy(text):
+            return sum(a == b for a, b in zip(text.split(), clean_tokens)) / len(clean_tokens)
+
+        print(f"{index:<6}{legacy_seconds:>10.3f}{indexed_seconds:>11.3f}{legacy_seconds / indexed_seconds:>8.1f}x"
+              f"{accuracy(legacy_result):>11.3f}{accuracy(indexed_result):>12.3f}{accuracy(noisy_text):>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Benchmark of the OCR engines of ImageOCRTransformation: throughput and accuracy of Tesseract, PaddleOCR
+(page by page and batched) and their hybrid, to choose OCR_MODE from measurements.
+
+Synthetic pages with known text (see benchmarks/synthetic.py) are OCR'd in memory by a single process,
+after one warm-up page per engine so that model loading is reported apart:
+- "tesseract": ImageOCRTransformation.ocr_with_tesseract, page by page
+- "paddleocr batch=N": ImageOCRTransformation.ocr_with_paddleocr_batch, N pages per call
+- "hybrid": Tesseract plus batched PaddleOCR, merged by TextExtraction.hybrid_text
+An engine that is not installed is skipped.
+
+Usage:
+    python -m benchmarks.bench_ocr_engines [--pages 16] [--dpi 300] [--batch-sizes 1 4 8] [--noise 0.05]
+"""
+import argparse
+import random
+import time
+from dataclasses import replace
+
+import numpy as np
+import pytesseract
+
+from benchmarks.metrics import cer, wer
+from benchmarks.synthetic import make_page_text, render_page
+from src.components.image_ocr_transformation import ImageOCRTransformation
+from src.components.text_extraction import TextExtraction
+from src.entity.config_entity import ImageOCRTransformationConfig, TextExtractionConfig
+from src.utils.paddle_engine import is_paddleocr_available
+
+
+def make_pages(count, dpi, noise, seed=0):
+    """
+    Render `count` synthetic pages, return (page arrays, ground-truth texts)
+    """
+    rng = random.Random(seed)
+    pages, texts = [], []
+    for _ in range(count):
+        image, text = render_page(rng, make_page_text(rng, 250), dpi, skew=0, noise=noise)
+        pages.append(np.asarray(image))
+        texts.append(text)
+    return pages, texts
+
+
+def is_tesseract_available(ocr):
+    if ocr.use_tesserocr():
+        return True
+    try:
+        pytesseract.get_tesseract_version()
+        return True
+    except Exception:
+        return False
+
+
+def run_engine(ocr_pages, pages):
+    """
+    Time an engine, ocr_pages(pages) -> page texts, after a one page warm-up
+
+    Returns:
+    - (float, float, list): Warm-up seconds, seconds per page and page texts
+    """
+    start = time.perf_counter()
+    ocr_pages(pages[:1])
+    warm_up = time.perf_counter() - start
+    start = time.perf_counter()
+    texts = ocr_pages(pages)
+    return warm_up, (time.perf_counter() - start) / len(pages), texts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=16)
+    parser.add_argument("--dpi", type=int, default=300)
+    parser.add_argument("--noise", type=float, default=0.05)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8])
+    args = parser.parse_args()
+
+    pages, truth = make_pages(args.pages, args.dpi, args.noise)
+    print(f"{len(pages)} synthetic pages at {args.dpi} DPI, noise {args.noise}\n")
+
+    # Whole page OCR: the synthetic pages have a single column
+    ocr = ImageOCRTransformation(replace(ImageOCRTransformationConfig(), layout_analysis=False, workers=1))
+    ocr.concurrent_pages = 1
+    text_extraction = TextExtraction(TextExtractionConfig())
+
+    def tesseract(batch):
+        return [ocr.ocr_with_tesseract(page) for page in batch]
+
+    def paddleocr(batch_size):
+        def ocr_pages(batch):
+            texts = []
+            for start in range(0, len(batch), batch_size):
+                texts.extend(result.text if result is not None else ""
+                             for result in ocr.ocr_with_paddleocr_batch(batch[start:start + batch_size]))
+            return texts
+        return ocr_pages
+
+    engines = []
+    if is_tesseract_available(ocr):
+        engines.append(("tesseract", tesseract))
+    else:
+        print("Tesseract is not installed, skipped")
+    if is_paddleocr_available():
+        engines.extend((f"paddleocr batch={batch_size}", paddleocr(batch_size)) for batch_size in args.batch_sizes)
+    else:
+        print("PaddleOCR is not installed (pip install paddlepaddle paddleocr), skipped")
+    if len(engines) > 1 and engines[0][0] == "tesseract":
+        batched = paddleocr(max(args.batch_sizes))
+
+        def hybrid(batch):
+            return [text_extraction.hybrid_text(pocr_text, pyt_text)
+                    for pyt_text, pocr_text in zip(tesseract(batch), batched(batch))]
+        engines.append(("hybrid", hybrid))
+    if not engines:
+        return
+
+    print(f"\n{'engine':<22}{'warm-up s':>10}{'ms/page':>10}{'pages/sec':>11}{'CER':>8}{'WER':>8}")
+    for label, ocr_pages in engines:
+        warm_up, seconds, texts = run_engine(ocr_pages, pages)
+        page_cer = sum(cer(reference, text) for reference, text in zip(truth, texts)) / len(pages)
+        page_wer = sum(wer(reference, text) for reference, text in zip(truth, texts)) / len(pages)
+        print(f"{label:<22}{warm_up:>10.2f}{seconds * 1000:>10.1f}{1 / seconds:>11.2f}{page_cer:>8.3f}{page_wer:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
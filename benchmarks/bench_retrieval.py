@@ -0,0 +1,129 @@
+"""
+Benchmark of the vector index: latency and recall@k of the IVF search against the exact NumPy baseline.
+
+A synthetic vector store of clustered unit vectors (like sentence embeddings of related chunks) is
+written with the pipeline's store format, indexed, and queried with perturbed store vectors:
+- exact search (brute-force scan of the memory-mapped matrix)
+- IVF search for several n_probe values
+- IVF search with a page range filter, and exact search filtered on one document
+
+Usage:
+    python -m benchmarks.bench_retrieval [--chunks 200000] [--dim 384] [--queries 200] [--k 10]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from src.retrieval.vector_index import VectorIndex, build_vector_index
+from src.utils.vector_store import write_vector_store
+
+
+def make_store(store_folder, chunks, dim, documents, clusters, seed):
+    """
+    Write a synthetic vector store of `chunks` clustered unit vectors spread over `documents` documents
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, chunks)] + 0.6 * rng.standard_normal((chunks, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    # Chunks are stored in document order, ~4 chunks per page
+    chunk_documents = np.sort(rng.integers(0, documents, chunks))
+    metadata = []
+    page_chunk = 0
+    for row, document in enumerate(chunk_documents):
+        page_chunk = 0 if row == 0 or chunk_documents[row - 1] != document else page_chunk + 1
+        page = page_chunk // 4 + 1
+        metadata.append({"chunk_id": f"doc{document}_page_{page}:{page_chunk}", "document": f"doc{document}",
+                         "page_name": f"doc{document}_page_{page}", "page": page, "start": 0, "end": 0,
+                         "hash": str(row), "text": ""})
+    write_vector_store(store_folder, metadata, dim, "float16", "synthetic", [(vectors, row) for row in range(chunks)])
+    return vectors
+
+
+def time_queries(search, queries):
+    """
+    Run every query, return (results, latencies in ms)
+    """
+    results = []
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(search(query))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return results, np.array(latencies)
+
+
+def recall_at_k(results, exact_results, k):
+    hits = [len({row["row"] for row in result} & {row["row"] for row in exact}) / max(min(k, len(exact)), 1)
+            for result, exact in zip(results, exact_results)]
+    return float(np.mean(hits))
+
+
+def report(label, latencies, recall=None):
+    recall = f"  recall@k {recall:.3f}" if recall is not None else ""
+    print(f"{label:<34} p50 {np.percentile(latencies, 50):7.2f} ms  p99 {np.percentile(latencies, 99):7.2f} ms{recall}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--documents", type=int, default=2000)
+    parser.add_argument("--clusters", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--n-lists", type=int, default=0, help="Inverted lists, 0 for about sqrt(chunks)")
+    parser.add_argument("--probes", default="1,2,4,8,16,32")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="retrieval_benchmark_")
+    try:
+        store_folder = os.path.join(work_dir, "vector_store")
+        index_folder = os.path.join(work_dir, "vector_index")
+
+        start = time.perf_counter()
+        vectors = make_store(store_folder, args.chunks, args.dim, args.documents, args.clusters, args.seed)
+        print(f"Store of {args.chunks} x {args.dim} float16 written in {time.perf_counter() - start:.1f}s")
+
+        start = time.perf_counter()
+        description = build_vector_index(store_folder, index_folder, "ivf", args.n_lists)
+        print(f"IVF index of {description['n_lists']} lists built in {time.perf_counter() - start:.1f}s")
+
+        start = time.perf_counter()
+        index = VectorIndex(store_folder, index_folder, exact_search_rows=0)
+        print(f"Index loaded in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+        rng = np.random.default_rng(args.seed + 1)
+        queries = vectors[rng.integers(0, args.chunks, args.queries)]
+        queries = queries + 0.3 * rng.standard_normal(queries.shape).astype(np.float32)
+        k = args.k
+
+        exact_results, latencies = time_queries(lambda query: index.search(query, k, exact=True), queries)
+        report("exact", latencies)
+
+        for n_probe in (int(value) for value in args.probes.split(",")):
+            results, latencies = time_queries(lambda query: index.search(query, k, n_probe=n_probe), queries)
+            report(f"ivf n_probe={n_probe}", latencies, recall_at_k(results, exact_results, k))
+
+        page_range = (1, 3)
+        exact_filtered, _ = time_queries(lambda query: index.search(query, k, page_range=page_range, exact=True),
+                                         queries)
+        results, latencies = time_queries(lambda query: index.search(query, k, page_range=page_range), queries)
+        report(f"ivf pages {page_range[0]}-{page_range[1]}", latencies, recall_at_k(results, exact_filtered, k))
+
+        document = sorted(index.description["documents"])[0]
+        results, latencies = time_queries(lambda query: index.search(query, k, document=document, exact=True), queries)
+        report(f"exact document={document}", latencies)
+        index.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+OCR accuracy metrics: character and word error rates against ground-truth text.
+"""
+
+
+def edit_distance(reference, hypothesis):
+    """
+    Levenshtein distance between two sequences (strings or lists of words)
+    """
+    if len(reference) < len(hypothesis):
+        reference, hypothesis = hypothesis, reference
+    previous = list(range(len(hypothesis) + 1))
+    for index, item in enumerate(reference, start=1):
+        current = [index]
+        for other_index, other in enumerate(hypothesis, start=1):
+            current.append(min(previous[other_index] + 1,
+                               current[other_index - 1] + 1,
+                               previous[other_index - 1] + (item != other)))
+        previous = current
+    return previous[-1]
+
+
+def normalize(text):
+    """
+    Collapse whitespace so that layout differences (line breaks, blank lines) do not count as errors
+    """
+    return " ".join(text.split())
+
+
+def cer(reference, hypothesis):
+    """
+    Character error rate: edit distance over characters / reference length
+    """
+    reference, hypothesis = normalize(reference), normalize(hypothesis)
+    return edit_distance(reference, hypothesis) / max(len(reference), 1)
+
+
+def wer(reference, hypothesis):
+    """
+    Word error rate: edit distance over words / number of reference words
+    """
+    reference, hypothesis = reference.split(), hypothesis.split()
+    return edit_distance(reference, hypothesis) / max(len(reference), 1)
@@ -0,0 +1,274 @@
+"""
+Offline benchmark suite of the OCR pipeline on synthetic scanned documents.
+
+A corpus of image-only PDFs with known text is generated (see benchmarks/synthetic.py), then:
+- every component (DocumentIngestion, ImagePreProcessing, ImageOCRTransformation, TextExtraction)
+  is timed on its own, stage after stage
+- the end-to-end pipeline is timed on a fresh artifact folder
+- the extracted text is scored against the ground truth (CER/WER)
+
+Results are written to benchmarks/results/latest.json and compared with benchmarks/baseline.json:
+a stage slower than the baseline by more than --time-tolerance, or a CER/WER worse by more than
+--accuracy-tolerance, is reported as a regression and the script exits with status 1.
+The page cache is disabled so that every run does the full work.
+
+Usage:
+    python -m benchmarks.run_benchmarks [--documents 3] [--pages 4] [--workers 1] [--update-baseline]
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from dataclasses import replace
+
+from benchmarks.metrics import cer, wer
+from benchmarks.synthetic import generate_corpus
+from src.entity.config_entity import (BM25IndexConfig, DataIngestionConfig, DistributedConfig, EmbeddingConfig,
+                                      ImageOCRTransformationConfig, ImagePreProcessingConfig, InstrumentationConfig,
+                                      JournalConfig, PageCacheConfig, TextExtractionConfig)
+from src.instrumentation import start_run_report
+from src.pipeline.pipeline import pipeline
+
+BENCHMARKS_FOLDER = os.path.dirname(os.path.abspath(__file__))
+RESULTS_PATH = os.path.join(BENCHMARKS_FOLDER, "results", "latest.json")
+BASELINE_PATH = os.path.join(BENCHMARKS_FOLDER, "baseline.json")
+
+STAGES = ["data_ingestion", "image_preprocessing", "image_ocr", "text_extraction"]
+
+
+def make_pipeline(artifact_dir, pdf_folder, workers, popplar_path):
+    """
+    Pipeline whose configs all point into artifact_dir, with the page cache disabled
+    """
+    bench_pipeline = pipeline()
+    bench_pipeline.pipeline_config = replace(bench_pipeline.pipeline_config, workers=workers, in_memory=False,
+                                             timestamp=os.path.basename(artifact_dir))
+    bench_pipeline.data_ingestion_config = DataIngestionConfig(
+        pdf_folder=pdf_folder, pdf_output_folder=os.path.join(artifact_dir, "pdf-outputs"),
+        native_text_folder=os.path.join(artifact_dir, "native_texts"), popplar_path=popplar_path, workers=workers)
+    bench_pipeline.image_preprocessing_config = ImagePreProcessingConfig(
+        output_folder=os.path.join(artifact_dir, "preprocessed_images"), workers=workers)
+    bench_pipeline.image_ocr_transformation_config = ImageOCRTransformationConfig(
+        ocr_output_folder=os.path.join(artifact_dir, "ocr_texts"), workers=workers)
+    bench_pipeline.text_extraction_config = TextExtractionConfig(
+        text_output_folder=os.path.join(artifact_dir, "text_outputs"), workers=workers)
+    # The OCR stages are benchmarked, embedding needs a model download
+    bench_pipeline.embedding_config = EmbeddingConfig(enabled=False,
+                                                      vector_store_folder=os.path.join(artifact_dir, "vector_store"))
+    bench_pipeline.bm25_index_config = BM25IndexConfig(index_folder=os.path.join(artifact_dir, "bm25_index"))
+    bench_pipeline.page_cache_config = PageCacheConfig(enabled=False)
+    # Page states and attempts of benchmark runs stay out of the journal and work queue of the real pipeline
+    bench_pipeline.journal_config = JournalConfig(journal_path=os.path.join(artifact_dir, "run_journal.sqlite"))
+    bench_pipeline.distributed_config = DistributedConfig(queue_path=os.path.join(artifact_dir, "work_queue.sqlite"))
+    bench_pipeline.instrumentation_config = InstrumentationConfig(report_folder=os.path.join(artifact_dir, "reports"),
+                                                                  record_pages=False)
+    return bench_pipeline
+
+
+def summarize_stage(stage_report):
+    return {
+        "wall": round(stage_report["wall"], 4),
+        "cpu": round(stage_report["cpu"], 4),
+        "pages": stage_report["pages"],
+        "pages_per_sec": stage_report["pages_per_sec"],
+        "peak_rss_mb": stage_report["peak_rss_mb"],
+    }
+
+
+def benchmark_components(artifact_dir, pdf_folder, workers, popplar_path):
+    """
+    Run the components one after the other, each measured on its own
+
+    Returns:
+    - (dict, str): Per-component results and the text output folder
+    """
+    bench_pipeline = make_pipeline(artifact_dir, pdf_folder, workers, popplar_path)
+    run_report = start_run_report(run_id="components", report_folder=bench_pipeline.instrumentation_config.report_folder,
+                                  record_pages=False)
+    results = {}
+    artifact = None
+    steps = [
+        ("data_ingestion", lambda _: bench_pipeline.start_data_ingestion()),
+        ("image_preprocessing", bench_pipeline.start_image_preprocessing),
+        ("image_ocr", bench_pipeline.start_image_ocr),
+        ("text_extraction", bench_pipeline.start_text_extraction),
+    ]
+    for stage, step in steps:
+        try:
+            artifact = step(artifact)
+            results[stage] = summarize_stage(run_report.stage(stage))
+            results[stage]["failed_pages"] = len(artifact.failed_pages)
+        except Exception as e:
+            # Missing external tools (Poppler, Tesseract) stop the chain, the stages run so far are kept
+            results[stage] = {"error": str(e).strip().splitlines()[-1]}
+            break
+    return results, bench_pipeline.text_extraction_config.text_output_folder
+
+
+def benchmark_end_to_end(artifact_dir, pdf_folder, workers, popplar_path):
+    """
+    Time a complete pipeline run on a fresh artifact folder
+    """
+    bench_pipeline = make_pipeline(artifact_dir, pdf_folder, workers, popplar_path)
+    start = time.perf_counter()
+    try:
+        bench_pipeline.run_pipeline()
+        error = None
+    except Exception as e:
+        error = str(e).strip().splitlines()[-1]
+    return {"wall": round(time.perf_counter() - start, 4), "error": error}
+
+
+def score_accuracy(ground_truth, text_output_folder):
+    """
+    CER/WER of every document against its ground truth, averaged weighted by reference length
+    """
+    documents = {}
+    errors = {"chars": 0, "ref_chars": 0, "words": 0, "ref_words": 0}
+    for document, pages in ground_truth.items():
+        reference = "\n".join(pages)
+        text_path = os.path.join(text_output_folder, f"{document}.txt")
+        hypothesis = ""
+        if os.path.exists(text_path):
+            with open(text_path, "r", encoding="utf-8") as file:
+                hypothesis = file.read()
+
+        document_cer, document_wer = cer(reference, hypothesis), wer(reference, hypothesis)
+        documents[document] = {"cer": round(document_cer, 4), "wer": round(document_wer, 4)}
+
+        ref_chars, ref_words = len(" ".join(reference.split())), len(reference.split())
+        errors["chars"] += document_cer * ref_chars
+        errors["ref_chars"] += ref_chars
+        errors["words"] += document_wer * ref_words
+        errors["ref_words"] += ref_words
+
+    return {
+        "cer": round(errors["chars"] / max(errors["ref_chars"], 1), 4),
+        "wer": round(errors["words"] / max(errors["ref_words"], 1), 4),
+        "documents": documents,
+    }
+
+
+def compare_with_baseline(results, baseline, time_tolerance, accuracy_tolerance):
+    """
+    List the regressions of results against baseline
+
+    Returns:
+    - list: Human readable regression messages, empty when there is none
+    """
+    regressions = []
+    if baseline.get("corpus") != results["corpus"]:
+        regressions.append("corpus settings differ from the baseline, run with the same settings or --update-baseline")
+        return regressions
+
+    timings = [(f"component {stage}", results["components"].get(stage, {}), baseline["components"].get(stage, {}))
+               for stage in STAGES]
+    timings.append(("end_to_end", results["end_to_end"], baseline["end_to_end"]))
+    for name, current, previous in timings:
+        if previous.get("wall") is None:
+            continue
+        if current.get("wall") is None:
+            regressions.append(f"{name}: failed ({current.get('error')}), baseline ran in {previous['wall']}s")
+        elif current["wall"] > previous["wall"] * (1 + time_tolerance):
+            regressions.append(f"{name}: {current['wall']}s vs baseline {previous['wall']}s")
+
+    for metric in ("cer", "wer"):
+        if results["accuracy"][metric] > baseline["accuracy"][metric] + accuracy_tolerance:
+            regressions.append(f"{metric.upper()}: {results['accuracy'][metric]} vs baseline "
+                               f"{baseline['accuracy'][metric]}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=3)
+    parser.add_argument("--pages", type=int, default=4)
+    parser.add_argument("--words", type=int, default=300)
+    parser.add_argument("--dpi", type=int, default=200)
+    parser.add_argument("--max-skew", type=float, default=3.0)
+    parser.add_argument("--noise", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--popplar-path", default=DataIngestionConfig.popplar_path,
+                        help="Folder of the Poppler binaries (pdf2image)")
+    parser.add_argument("--time-tolerance", type=float, default=0.25,
+                        help="Allowed relative slowdown against the baseline")
+    parser.add_argument("--accuracy-tolerance", type=float, default=0.01,
+                        help="Allowed absolute CER/WER increase against the baseline")
+    parser.add_argument("--update-baseline", action="store_true", help="Save this run as the new baseline")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated corpus and artifacts")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="ocr_benchmark_")
+    try:
+        pdf_folder = os.path.join(work_dir, "pdfs")
+        ground_truth = generate_corpus(pdf_folder, args.documents, args.pages, args.words, args.dpi, args.max_skew,
+                                       args.noise, args.seed)
+        # Only the PDFs are pipeline input
+        os.replace(os.path.join(pdf_folder, "ground_truth.json"), os.path.join(work_dir, "ground_truth.json"))
+
+        components, text_output_folder = benchmark_components(os.path.join(work_dir, "components"), pdf_folder,
+                                                              args.workers, args.popplar_path)
+        end_to_end = benchmark_end_to_end(os.path.join(work_dir, "end_to_end"), pdf_folder, args.workers,
+                                          args.popplar_path)
+        accuracy = score_accuracy(ground_truth, text_output_folder)
+    finally:
+        if args.keep:
+            print(f"Benchmark files kept in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    results = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "corpus": {"documents": args.documents, "pages": args.pages, "words": args.words, "dpi": args.dpi,
+                   "max_skew": args.max_skew, "noise": args.noise, "seed": args.seed, "workers": args.workers},
+        "components": components,
+        "end_to_end": end_to_end,
+        "accuracy": accuracy,
+    }
+
+    os.makedirs(os.path.dirname(RESULTS_PATH), exist_ok=True)
+    with open(RESULTS_PATH, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+
+    total_pages = args.documents * args.pages
+    for stage in STAGES:
+        result = components.get(stage)
+        if result is None:
+            print(f"{stage:<22} skipped")
+        elif "error" in result:
+            print(f"{stage:<22} error: {result['error']}")
+        else:
+            print(f"{stage:<22} {result['wall']:>8.2f}s  {result['pages_per_sec']} pages/sec  "
+                  f"{result['failed_pages']} failed pages")
+    print(f"{'end_to_end':<22} {end_to_end['wall']:>8.2f}s  {total_pages} pages"
+          + (f"  error: {end_to_end['error']}" if end_to_end["error"] else ""))
+    print(f"{'accuracy':<22} CER {accuracy['cer']:.4f}  WER {accuracy['wer']:.4f}")
+    print(f"Results written to {RESULTS_PATH}")
+
+    if args.update_baseline:
+        shutil.copyfile(RESULTS_PATH, BASELINE_PATH)
+        print(f"Baseline updated: {BASELINE_PATH}")
+        return 0
+
+    if not os.path.exists(BASELINE_PATH):
+        print("No baseline yet, save one with --update-baseline")
+        return 0
+
+    with open(BASELINE_PATH, "r", encoding="utf-8") as file:
+        baseline = json.load(file)
+    regressions = compare_with_baseline(results, baseline, args.time_tolerance, args.accuracy_tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if not regressions:
+        print("No regression against the baseline")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
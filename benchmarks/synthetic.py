@@ -0,0 +1,157 @@
+"""
+Generator of synthetic scanned PDFs with known ground-truth text.
+
+Pages are rendered as images (like a scanner would produce) with controlled skew, noise,
+resolution and page count, and saved as image-only PDFs next to a JSON file holding the
+exact text of every page.
+
+Usage:
+    python -m benchmarks.synthetic --output-folder benchmarks/data/pdfs --documents 3 --pages 4
+"""
+import argparse
+import json
+import os
+import random
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+VOCABULARY = (
+    "the of and to in is for that on with as by this be are from at or an it was which will not have "
+    "agreement contract party parties section payment invoice date total amount account services "
+    "department health public report county state program data provider request notice period "
+    "shall may must under any such other each all within following required including provided "
+    "information records office director review approval terms conditions effective between "
+    "document page number order customer supplier delivery schedule price tax balance due "
+    "signature name address city phone email policy coverage claim member benefits plan year"
+).split()
+
+# US Letter, in inches
+PAGE_SIZE = (8.5, 11)
+
+
+def load_font(size):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # Pillow < 10.1 has no scalable default font
+        try:
+            return ImageFont.truetype("DejaVuSans.ttf", size)
+        except OSError:
+            return ImageFont.load_default()
+
+
+def make_page_text(rng, words):
+    """
+    Random prose from VOCABULARY with occasional capitalized words and codes, like OCR'd business documents
+    """
+    tokens = []
+    for _ in range(words):
+        roll = rng.random()
+        if roll < 0.04:
+            tokens.append(f"{rng.choice('ABCDEFGH')}{rng.randint(100, 99999)}")
+        elif roll < 0.12:
+            tokens.append(rng.choice(VOCABULARY).capitalize())
+        else:
+            tokens.append(rng.choice(VOCABULARY))
+    return tokens
+
+
+def render_page(rng, tokens, dpi, skew, noise, font_points=12):
+    """
+    Render words onto a page image and simulate a scan
+
+    Returns:
+    - (PIL.Image, str): The grayscale page image and its ground-truth text (one line per rendered line)
+    """
+    width, height = int(PAGE_SIZE[0] * dpi), int(PAGE_SIZE[1] * dpi)
+    margin = dpi
+    font = load_font(max(8, int(font_points * dpi / 72)))
+    line_height = int(font_points * dpi / 72 * 1.6)
+
+    page = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(page)
+
+    lines = []
+    current = []
+    for token in tokens:
+        candidate = " ".join(current + [token])
+        if current and draw.textlength(candidate, font=font) > width - 2 * margin:
+            lines.append(" ".join(current))
+            current = [token]
+        else:
+            current.append(token)
+    if current:
+        lines.append(" ".join(current))
+
+    max_lines = (height - 2 * margin) // line_height
+    lines = lines[:max_lines]
+    for index, line in enumerate(lines):
+        draw.text((margin, margin + index * line_height), line, fill=0, font=font)
+
+    if skew:
+        page = page.rotate(skew, resample=Image.BICUBIC, fillcolor=255)
+
+    if noise:
+        # Gaussian sensor noise plus salt-and-pepper specks
+        pixels = np.asarray(page, dtype=np.float32)
+        pixels += np.random.default_rng(rng.randint(0, 2**31)).normal(0, 255 * noise, pixels.shape)
+        specks = np.random.default_rng(rng.randint(0, 2**31)).random(pixels.shape)
+        pixels[specks < noise / 20] = 0
+        pixels[specks > 1 - noise / 20] = 255
+        page = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+    return page, "\n".join(lines)
+
+
+def generate_corpus(output_folder, documents=3, pages=4, words_per_page=300, dpi=200, max_skew=3.0, noise=0.05,
+                    seed=0):
+    """
+    Generate `documents` image-only PDFs of `pages` pages each into output_folder
+
+    Returns:
+    - dict: Ground truth, document name -> list of page texts (also saved as ground_truth.json)
+    """
+    rng = random.Random(seed)
+    os.makedirs(output_folder, exist_ok=True)
+    ground_truth = {}
+
+    for document_index in range(1, documents + 1):
+        document = f"synthetic_{document_index}"
+        images = []
+        texts = []
+        for _ in range(pages):
+            skew = rng.uniform(-max_skew, max_skew) if max_skew else 0
+            image, text = render_page(rng, make_page_text(rng, words_per_page), dpi, skew, noise)
+            images.append(image)
+            texts.append(text)
+
+        images[0].save(os.path.join(output_folder, f"{document}.pdf"), "PDF", resolution=dpi, save_all=True,
+                       append_images=images[1:])
+        ground_truth[document] = texts
+
+    with open(os.path.join(output_folder, "ground_truth.json"), "w", encoding="utf-8") as file:
+        json.dump(ground_truth, file, indent=2)
+
+    return ground_truth
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output-folder", default=os.path.join("benchmarks", "data", "pdfs"))
+    parser.add_argument("--documents", type=int, default=3)
+    parser.add_argument("--pages", type=int, default=4)
+    parser.add_argument("--words", type=int, default=300)
+    parser.add_argument("--dpi", type=int, default=200)
+    parser.add_argument("--max-skew", type=float, default=3.0)
+    parser.add_argument("--noise", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    generate_corpus(args.output_folder, args.documents, args.pages, args.words, args.dpi, args.max_skew,
+                    args.noise, args.seed)
+    print(f"{args.documents} documents of {args.pages} pages written to {args.output_folder}")
+
+
+if __name__ == "__main__":
+    main()
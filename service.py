@@ -0,0 +1,7 @@
+from dotenv import load_dotenv
+load_dotenv()
+
+from src.service.server import main
+
+if __name__ =="__main__":
+    main()
@@ -0,0 +1,50 @@
+import sys
+
+from src.entity.artifact_entity import TextExtractionArtifact, BM25IndexArtifact
+from src.entity.config_entity import BM25IndexConfig
+from src.logger import get_logger
+logger = get_logger(__name__)
+from src.exception import srcException
+from src.retrieval.bm25 import update_bm25_index
+from src.instrumentation import add_counter, get_run_report
+
+
+class BM25Indexing:
+    """
+    Keep the BM25 (keyword) index of the extracted page texts up to date
+    """
+    def __init__(self, bm25_index_config: BM25IndexConfig, text_extraction_artifact: TextExtractionArtifact):
+        try:
+            self.bm25_index_config = bm25_index_config
+            self.text_extraction_artifact = text_extraction_artifact
+        except Exception as e:
+            raise srcException(e, sys)
+
+    def build_index(self) -> BM25IndexArtifact:
+        """
+        Index the new and changed pages of the text extraction output, unchanged pages are not tokenized again
+
+        Returns:
+        - BM25IndexArtifact: Index folder and version, number of live chunks, of pages (re)indexed and removed
+        """
+        try:
+            config = self.bm25_index_config
+            logger.info(f"BM25 indexing started, text_folder: {self.text_extraction_artifact.text_output_folder}, "
+                        f"index_folder: {config.index_folder}")
+            result = update_bm25_index(self.text_extraction_artifact.text_output_folder, config.index_folder,
+                                       config.chunk_size, config.chunk_overlap, config.max_segments)
+
+            run_report = get_run_report()
+            if run_report is not None:
+                run_report.set_pages("bm25_indexing", result["indexed_pages"])
+            add_counter("bm25_indexing", "indexed_pages", result["indexed_pages"])
+            add_counter("bm25_indexing", "removed_pages", result["removed_pages"])
+
+            logger.info(f"BM25 indexing completed, version: {result['version']}, chunks: {result['chunks']}, "
+                        f"indexed pages: {result['indexed_pages']}, removed pages: {result['removed_pages']}, "
+                        f"segments: {result['segments']}")
+            return BM25IndexArtifact(index_folder=config.index_folder, version=result["version"],
+                                     chunks=result["chunks"], indexed_pages=result["indexed_pages"],
+                                     removed_pages=result["removed_pages"])
+        except Exception as e:
+            raise srcException(e, sys) from e
@@ -0,0 +1,206 @@
+import os
+import sys
+import time
+import multiprocessing
+from dataclasses import replace, asdict
+
+from src.components.document_ingestion import DocumentIngestion
+from src.components.image_ocr_transformation import ImageOCRTransformation
+from src.distributed.worker import run_worker
+from src.entity.artifact_entity import ImagePreProcessingArtifact, ImageOCRTransformationArtifact, PageError
+from src.entity.config_entity import (DataIngestionConfig, ImagePreProcessingConfig, ImageOCRTransformationConfig,
+                                      DistributedConfig, PageCacheConfig, TIMESTAMP)
+from src.logger import get_logger
+logger = get_logger(__name__)
+from src.exception import srcException
+from src.instrumentation import record_task, get_run_report
+from src.utils.run_journal import get_run_journal, OCR_DONE
+from src.utils.work_queue import WorkQueue, DONE, QUEUED, LEASED
+
+
+class DistributedPageProcessing:
+    """
+    Coordinator of the distributed mode: splits the PDFs of the input folder into page-level work units
+    (ranges of `pages_per_unit` pages) on a shared SQLite work queue, which worker processes on any
+    number of hosts pull and run (see src.distributed.worker), writing into the shared artifact tree.
+
+    The coordinator starts `local_workers` workers on its own host, follows the units as they finish,
+    journals their pages and splits a unit that keeps failing into single pages, so that a poison page
+    only fails itself. It returns once every unit is done or failed for good.
+    """
+    def __init__(self, data_ingestion_config: DataIngestionConfig, image_processing_config: ImagePreProcessingConfig,
+                 image_ocr_transformation_config: ImageOCRTransformationConfig,
+                 distributed_config: DistributedConfig = None, page_cache_config: PageCacheConfig = None,
+                 run_id: str = TIMESTAMP):
+        try:
+            self.distributed_config = distributed_config or DistributedConfig()
+            self.data_ingestion_config = replace(data_ingestion_config,
+                                                 chunk_size=self.distributed_config.pages_per_unit)
+            self.image_processing_config = image_processing_config
+            self.image_ocr_transformation_config = image_ocr_transformation_config
+            self.page_cache_config = page_cache_config
+            self.run_id = run_id
+            self.native_text_folder = (data_ingestion_config.native_text_folder
+                                       if data_ingestion_config.native_text_triage else None)
+
+            self.document_ingestion = DocumentIngestion(self.data_ingestion_config, page_cache_config)
+            self.image_ocr = ImageOCRTransformation(
+                image_ocr_transformation_config=image_ocr_transformation_config,
+                image_preprocessing_artifact=ImagePreProcessingArtifact(
+                    preprocessed_images_folder=image_processing_config.output_folder))
+        except Exception as e:
+            raise srcException(e, sys)
+
+    def get_tasks(self):
+        """
+        Render tasks of every PDF of the input folder, split in `pages_per_unit` page ranges. Pages with a
+        usable text layer and pages OCR'd in an earlier run are left out.
+
+        Returns:
+        - (list, list): Render tasks and the PageError of the documents that could not be read
+        """
+        pdf_folder = self.data_ingestion_config.pdf_folder
+        tasks = []
+        failed_pages = []
+        for pdf_file in sorted(f for f in os.listdir(pdf_folder) if f.lower().endswith('pdf')):
+            pdf_path = os.path.join(pdf_folder, pdf_file)
+            document = os.path.splitext(pdf_file)[0]
+            pdf_output_folder = os.path.join(self.data_ingestion_config.pdf_output_folder, document)
+            os.makedirs(pdf_output_folder, exist_ok=True)
+            try:
+                document_tasks, _ = self.document_ingestion.get_document_tasks(
+                    pdf_path, pdf_output_folder, "data_ingestion", split=True, done_state=OCR_DONE,
+                    output_paths=lambda page_no: self.image_ocr.page_output_paths(document, page_no))
+                tasks.extend(document_tasks)
+            except Exception as e:
+                failed_pages.append(PageError("data_ingestion", document, "all", str(e)))
+        return tasks, failed_pages
+
+    def get_settings(self):
+        """
+        Settings of the run the workers build their components from, so every host runs with the
+        configuration of the coordinator: the fields of its configs (see config_from_settings)
+        """
+        configs = {"data_ingestion": self.data_ingestion_config, "image_preprocessing": self.image_processing_config,
+                   "image_ocr": self.image_ocr_transformation_config, "page_cache": self.page_cache_config,
+                   "distributed": self.distributed_config}
+        return {name: asdict(config) if config is not None else None for name, config in configs.items()}
+
+    def start_local_workers(self):
+        workers = []
+        for _ in range(self.distributed_config.local_workers):
+            worker = multiprocessing.Process(target=run_worker, args=(self.distributed_config.queue_path, self.run_id,
+                                                                      False, self.distributed_config.poll_seconds))
+            worker.start()
+            workers.append(worker)
+        return workers
+
+    def collect_unit(self, queue, unit, state, result, error):
+        """
+        Journal and count the pages of a finished unit. Pages that failed in a unit are queued again as
+        single-page units while the run journal allows it. A unit the queue failed for good (it kept
+        failing or killing its workers) is split into pages, and fails for good once it is a single page.
+        """
+        journal = get_run_journal()
+        _, _, first_page, last_page = unit.task
+        metrics = result.pop("metrics", None) if result is not None else None
+        record_task("distributed_processing", unit.task, error if state != DONE else None, metrics)
+        self.unit_attempts += unit.attempts - 1
+
+        if state != DONE:
+            if first_page != last_page:
+                logger.warning(f"Unit {unit.unit_id} ({unit.document} pages {first_page}-{last_page}) failed, "
+                               f"running its pages one by one: {error}")
+                queue.add_units(self.run_id, [(unit.task[0], unit.task[1], page_no, page_no)
+                                              for page_no in range(first_page, last_page + 1)])
+                return
+            page_errors = [("distributed_processing", first_page, error)]
+        else:
+            self.pages += len(result["pages"])
+            self.skipped_pages["blank"] += result["blank_pages"]
+            self.skipped_pages["duplicate"] += result["duplicate_pages"]
+            if journal is not None and result["pages"]:
+                journal.mark_pages(unit.document, result["pages"], OCR_DONE, "distributed_processing")
+            page_errors = result["failed_pages"]
+
+        for stage, page_no, page_error in page_errors:
+            retry = journal is not None and journal.record_failure(stage, unit.document, page_no, page_error)
+            if retry and state == DONE:
+                attempts = journal.page_states(unit.document)[page_no][1]
+                logger.warning(f"{unit.document} page {page_no} failed in {stage}, retrying: {page_error}")
+                queue.add_units(self.run_id, [(unit.task[0], unit.task[1], page_no, page_no)],
+                                delay=journal.backoff_seconds(attempts))
+                continue
+            logger.error(f"{stage} failed for {unit.document} page {page_no}: {page_error}")
+            self.failed_pages.append(PageError(stage, unit.document, str(page_no), page_error))
+
+    def process_multiple_pdfs(self) -> ImageOCRTransformationArtifact:
+        """
+        Queue the pages of every PDF of the input folder as work units and wait until the workers have
+        rendered, preprocessed and OCR'd all of them
+        """
+        try:
+            config = self.distributed_config
+            output_folder = self.image_ocr_transformation_config.ocr_output_folder
+            logger.info(f"Distributed processing started, run {self.run_id}, queue: {config.queue_path}, "
+                        f"local workers: {config.local_workers}, pages per unit: {config.pages_per_unit}")
+
+            start_time = time.perf_counter()
+            self.pages = 0
+            self.unit_attempts = 0
+            self.skipped_pages = {"blank": 0, "duplicate": 0}
+            queue = WorkQueue(config.queue_path, config.lease_seconds, config.max_attempts, config.retry_backoff)
+            queue.start_run(self.run_id, self.get_settings())
+            workers = []
+            try:
+                tasks, self.failed_pages = self.get_tasks()
+                queue.add_units(self.run_id, tasks)
+                logger.info(f"{len(tasks)} work units queued")
+                workers = self.start_local_workers()
+
+                waiting_logged = False
+                while True:
+                    # Counted before collecting: once no unit is queued or leased, this collect gets the
+                    # last finished units, and the run is over unless collecting them queued new units
+                    counts = queue.counts(self.run_id)
+                    for unit, state, result, error in queue.collect(self.run_id):
+                        self.collect_unit(queue, unit, state, result, error)
+                    if not counts.get(QUEUED) and not counts.get(LEASED):
+                        counts = queue.counts(self.run_id)
+                        if not counts.get(QUEUED) and not counts.get(LEASED):
+                            break
+                    if (not waiting_logged and not any(worker.is_alive() for worker in workers)
+                            and not queue.live_workers(self.run_id, config.lease_seconds)):
+                        logger.warning(f"No worker is running, waiting for workers: "
+                                       f"python worker.py --queue {config.queue_path}")
+                        waiting_logged = True
+                    time.sleep(config.poll_seconds)
+                queue.finish_run(self.run_id, "completed")
+            except BaseException:
+                queue.finish_run(self.run_id, "failed")
+                raise
+            finally:
+                # The local workers stop once the run is no longer in progress
+                for worker in workers:
+                    worker.join(timeout=config.lease_seconds)
+                    if worker.is_alive():
+                        worker.terminate()
+                queue.close()
+
+            run_report = get_run_report()
+            if run_report is not None:
+                run_report.set_pages("distributed_processing", self.pages)
+                run_report.add_counter("distributed_processing", "blank_pages", self.skipped_pages["blank"])
+                run_report.add_counter("distributed_processing", "duplicate_pages", self.skipped_pages["duplicate"])
+                run_report.add_counter("distributed_processing", "unit_retries", self.unit_attempts)
+                self.image_ocr.report_cascade("distributed_processing")
+
+            logger.info(f"Distributed processing completed in {time.perf_counter() - start_time:.2f}s, "
+                        f"output_folder: {output_folder}, pages done: {self.pages}, blank pages skipped: "
+                        f"{self.skipped_pages['blank']}, duplicate pages reused: {self.skipped_pages['duplicate']}, "
+                        f"unit retries: {self.unit_attempts}, failed pages: {len(self.failed_pages)}")
+            return ImageOCRTransformationArtifact(ocr_texts_folder=output_folder, failed_pages=self.failed_pages,
+                                                  native_text_folder=self.native_text_folder)
+
+        except Exception as e:
+            raise srcException(e, sys) from e
@@ -1,87 +1,547 @@
+import io
 import os
 import sys
+import time
 from glob import glob
 
 import cv2
 import numpy as np
-from pdf2image import convert_from_path
+from pdf2image import convert_from_path, pdfinfo_from_path
 import imutils as im
+try:
+    import pymupdf
+except ImportError:
+    # PyMuPDF < 1.24.3 is only importable as fitz
+    import fitz as pymupdf
 
-from src.entity.artifact_entity import DataIngestionArtifact
-from src.entity.config_entity import DataIngestionConfig
+from src.entity.artifact_entity import DataIngestionArtifact, PageError
+from src.entity.config_entity import DataIngestionConfig, PageCacheConfig
 from src.logger import get_logger
 logger = get_logger(__name__)
 from src.exception import srcException
+from src.utils.main_utils import run_in_pool, group_consecutive, write_text_file
+from src.instrumentation import get_peak_rss_mb, reset_peak_rss, timed, get_run_report, add_counter
+from src.utils.page_cache import PageCache, file_digest
+from src.utils.page_store import PageStorage
+from src.utils.run_journal import get_run_journal, retry_arguments, RASTERIZED, OCR_DONE
 
 
 class DocumentIngestion:
-    def __init__(self,data_ingestion_config:DataIngestionConfig):
+    def __init__(self,data_ingestion_config:DataIngestionConfig, page_cache_config:PageCacheConfig=None):
         try:
             self.data_ingestion_config = data_ingestion_config
+            self.page_storage = PageStorage(data_ingestion_config.pack_pages)
+            self.page_cache = None
+            if page_cache_config is not None and page_cache_config.enabled:
+                self.page_cache = PageCache(page_cache_config.cache_folder, page_cache_config.max_bytes)
         except Exception as e:
             raise srcException(e,sys)
 
 
-    def pdf_to_images(self, pdf_path, pdf_output_folder, popplar_path):
+    def iter_pdf_pages(self, pdf_path, popplar_path, chunk_size=4, dpi=200, first_page=None, last_page=None):
+        """
+        Lazily rasterize a PDF in bounded chunks of pages.
+        Only `chunk_size` pages are held in memory at any time, so peak memory stays flat
+        no matter how many pages the document has.
+
+        Parameters:
+        - pdf_path (str): Path to the PDF file
+        - popplar_path (str): Path to the Poppler binaries
+        - chunk_size (int): Number of pages rendered per Poppler call
+        - dpi (int | dict): Rasterization resolution, or the resolution of every page number (see get_render_dpi)
+        - first_page (int): First page to render (1-based), defaults to the first page of the document
+        - last_page (int): Last page to render (inclusive), defaults to the last page of the document
+
+        Yields:
+        - (int, PIL.Image): 1-based page number and the rendered page
+        """
+        first_page = first_page or 1
+        if last_page is None:
+            last_page = self.get_page_count(pdf_path, popplar_path)
+
+        for chunk_first_page in range(first_page, last_page + 1, chunk_size):
+            chunk_last_page = min(chunk_first_page + chunk_size - 1, last_page)
+            for run_first_page, run_last_page, run_dpi in self.get_dpi_runs(dpi, chunk_first_page, chunk_last_page):
+                pages = convert_from_path(pdf_path, dpi=run_dpi, first_page=run_first_page, last_page=run_last_page,
+                                          poppler_path=popplar_path)
+
+                page_no = run_first_page
+                while pages:
+                    # Pop the page so it can be released as soon as the caller is done with it
+                    yield page_no, pages.pop(0)
+                    page_no += 1
+
+    def get_dpi_runs(self, dpi, first_page, last_page):
+        """
+        Split a page range into (first_page, last_page, dpi) runs of consecutive pages rendered at the same DPI,
+        one Poppler call each
+
+        Parameters:
+        - dpi (int | dict): One DPI for every page, or the DPI of every page number (adaptive DPI)
+        """
+        if not isinstance(dpi, dict):
+            return [(first_page, last_page, dpi)]
+        runs = []
+        for page_no in range(first_page, last_page + 1):
+            page_dpi = dpi.get(page_no, self.data_ingestion_config.dpi)
+            if runs and runs[-1][2] == page_dpi:
+                runs[-1] = (runs[-1][0], page_no, page_dpi)
+            else:
+                runs.append((page_no, page_no, page_dpi))
+        return runs
+
+    def estimate_text_height(self, gray):
+        """
+        Median glyph height of a grayscale page image in pixels, close to the x-height of its body text.
+        Connected components of the ink are taken as glyphs; specks, rules, borders and pictures are left out.
+
+        Returns:
+        - float: The median glyph height, None when the page has too few glyphs to tell (blank or picture pages)
+        """
+        binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)[1]
+        _, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+        heights = stats[1:, cv2.CC_STAT_HEIGHT]
+        widths = stats[1:, cv2.CC_STAT_WIDTH]
+        areas = stats[1:, cv2.CC_STAT_AREA]
+        glyphs = (heights >= 3) & (areas >= 4) & (heights < gray.shape[0] / 10) & (widths < gray.shape[1] / 2)
+        if np.count_nonzero(glyphs) < 10:
+            return None
+        return float(np.median(heights[glyphs]))
+
+    def estimate_page_dpi(self, page):
+        """
+        Adaptive rasterization DPI of a PyMuPDF page: the DPI that renders its text at `target_text_height`
+        pixels, measured on a `preview_dpi` rendering, within [min_dpi, max_dpi] and the `max_page_pixels`
+        budget, rounded to a multiple of 25. Pages without measurable text get `min_dpi`.
+        """
+        config = self.data_ingestion_config
+        pixmap = page.get_pixmap(dpi=config.preview_dpi, colorspace=pymupdf.csGRAY)
+        gray = np.frombuffer(pixmap.samples, dtype=np.uint8).reshape(pixmap.height, pixmap.stride)[:, :pixmap.width]
+
+        text_height = self.estimate_text_height(gray)
+        dpi = config.min_dpi if text_height is None else config.preview_dpi * config.target_text_height / text_height
+        dpi = min(max(dpi, config.min_dpi), config.max_dpi)
+
+        # Pixel budget, in points (1/72 inch) of the page
+        page_inches = (page.rect.width / 72) * (page.rect.height / 72)
+        dpi = min(dpi, (config.max_page_pixels / max(page_inches, 1e-6)) ** 0.5)
+        return max(25, int(round(dpi / 25)) * 25)
+
+    @timed("adaptive_dpi")
+    def get_page_dpis(self, pdf_path, first_page=None, last_page=None):
+        """
+        Adaptive DPI of every page of a page range (the whole document by default)
+
+        Returns:
+        - dict: 1-based page number -> DPI
+        """
+        page_dpis = {}
+        with pymupdf.open(pdf_path) as pdf:
+            first_page = first_page or 1
+            last_page = last_page or pdf.page_count
+            for page_no in range(first_page, last_page + 1):
+                page_dpis[page_no] = self.estimate_page_dpi(pdf[page_no - 1])
+        logger.debug(f"{os.path.basename(pdf_path)} pages {first_page}-{last_page} DPI: {page_dpis}")
+        return page_dpis
+
+    def get_render_dpi(self, pdf_path, first_page=None, last_page=None):
+        """
+        DPI to rasterize a page range at: the fixed `dpi`, or with `adaptive_dpi` the {page_no: dpi} of its pages.
+        A PDF PyMuPDF cannot read is rasterized at the fixed `dpi`.
+        """
+        if not self.data_ingestion_config.adaptive_dpi:
+            return self.data_ingestion_config.dpi
+        try:
+            return self.get_page_dpis(pdf_path, first_page, last_page)
+        except Exception as e:
+            logger.warning(f"Adaptive DPI failed for {pdf_path}, rasterizing at {self.data_ingestion_config.dpi} DPI: {e}")
+            return self.data_ingestion_config.dpi
+
+    def page_to_array(self, page):
+        """
+        Convert a rendered PIL page into a BGR numpy array, the layout OpenCV expects
+        """
+        return cv2.cvtColor(np.asarray(page.convert("RGB")), cv2.COLOR_RGB2BGR)
+
+    def get_page_count(self, pdf_path, popplar_path):
+        """
+        Return the number of pages of a PDF without rendering it
+        """
+        return int(pdfinfo_from_path(pdf_path, poppler_path=popplar_path)["Pages"])
+
+    def render_pages(self, pdf_path, popplar_path, first_page=None, last_page=None):
+        """
+        Yield (page_no, PIL.Image) for a page range, streamed in chunks or rendered at once
+        depending on the `streaming` config
+        """
+        dpi = self.get_render_dpi(pdf_path, first_page, last_page)
+        if self.data_ingestion_config.streaming or isinstance(dpi, dict):
+            # Render the pdf in bounded chunks of pages (pages of different DPIs need separate Poppler calls anyway)
+            return self.iter_pdf_pages(pdf_path, popplar_path, chunk_size=self.data_ingestion_config.chunk_size,
+                                       dpi=dpi, first_page=first_page, last_page=last_page)
+        # Open the whole page range at once
+        return enumerate(convert_from_path(pdf_path, dpi=dpi, first_page=first_page, last_page=last_page,
+                                           poppler_path=popplar_path), start=first_page or 1)
+
+    def page_cache_key(self, pdf_digest, page_no):
+        """
+        Cache key of a rendered page: source PDF bytes, page number and rasterization settings
+        """
+        config = self.data_ingestion_config
+        if config.adaptive_dpi:
+            # The DPI of the page follows from the PDF and the adaptive settings
+            return PageCache.make_key("pdf_pages", pdf_digest, page_no, "adaptive", config.target_text_height,
+                                      config.min_dpi, config.max_dpi, config.preview_dpi, config.max_page_pixels)
+        return PageCache.make_key("pdf_pages", pdf_digest, page_no, config.dpi)
+
+    @timed("rasterization")
+    def pdf_to_images(self, pdf_path, pdf_output_folder, popplar_path, first_page=None, last_page=None):
+        """
+        Rasterize the pages of a PDF into `pdf_output_folder` as PNG pages (see PageStorage)
+
+        Parameters:
+        - pdf_path (str): Path to the PDF file
+        - pdf_output_folder (str): Folder the page images are written to
+        - popplar_path (str): Path to the Poppler binaries
+        - first_page, last_page (int): Optional inclusive page range, the whole document by default
+
+        Returns:
+        - dict: Statistics of the rendered pages (pages, seconds, pages_per_sec, peak_rss_mb), with the wall clock
+          times the task started_at and finished_at
+        """
         try:
             # Ensure the output folder exists for PDF with its name
             os.makedirs(pdf_output_folder, exist_ok=True)
 
-            # Open the pdf file
-            pdf_document = convert_from_path(pdf_path, poppler_path=popplar_path)
+            prefix = os.path.basename(os.path.normpath(pdf_output_folder))
 
-            # get the total number of pages in the pdf
-            total_pages = len(pdf_document)
+            reset_peak_rss()
+            started_at = time.time()
+            start_time = time.perf_counter()
 
-            for page_no in range(total_pages):
-                # Save the image to output_folder with page_no
-                prefix = pdf_output_folder.split("\\")[-1]
-                image_filename = str(prefix+"_"+f"page_{page_no + 1}.png")
-                image_path = os.path.join(pdf_output_folder, image_filename)
-                pdf_document[page_no].save(image_path, "PNG")
+            page_runs = [(first_page, last_page)]
+            cached_pages = 0
+            if self.page_cache is not None:
+                # Restore the pages that are already cached and only render the missing runs of pages
+                pdf_digest = file_digest(pdf_path)
+                first_page = first_page or 1
+                if last_page is None:
+                    last_page = self.get_page_count(pdf_path, popplar_path)
+
+                missing_pages = []
+                for page_no in range(first_page, last_page + 1):
+                    data = self.page_cache.get("pdf_pages", self.page_cache_key(pdf_digest, page_no))
+                    if data is None:
+                        missing_pages.append(page_no)
+                        continue
+                    self.page_storage.write(os.path.join(pdf_output_folder, f"{prefix}_page_{page_no}.png"), data)
+                    cached_pages += 1
+                page_runs = group_consecutive(missing_pages)
+
+            total_pages = cached_pages
+            for run_first_page, run_last_page in page_runs:
+                for page_no, page in self.render_pages(pdf_path, popplar_path, run_first_page, run_last_page):
+                    # Save the image to output_folder with page_no
+                    image_filename = str(prefix+"_"+f"page_{page_no}.png")
+                    image_path = os.path.join(pdf_output_folder, image_filename)
+                    buffer = io.BytesIO()
+                    page.save(buffer, "PNG")
+                    self.page_storage.write(image_path, buffer.getbuffer(), {"width": page.width, "height": page.height})
+                    if self.page_cache is not None:
+                        self.page_cache.put("pdf_pages", self.page_cache_key(pdf_digest, page_no), buffer.getvalue())
+                    total_pages += 1
+
+            elapsed = time.perf_counter() - start_time
+            page_stats = {
+                "document": prefix,
+                "pages": total_pages,
+                "cached_pages": cached_pages,
+                "seconds": round(elapsed, 3),
+                "pages_per_sec": round(total_pages / elapsed, 3) if elapsed > 0 else None,
+                "peak_rss_mb": get_peak_rss_mb(),
+                "started_at": started_at,
+                "finished_at": time.time(),
+            }
+            logger.debug(f"Pages rendered: {page_stats}")
+
+            return page_stats
 
         except Exception as e:
-            raise srcException(e, sys) from e                
-    
+            raise srcException(e, sys) from e
+
+    def classify_page(self, page):
+        """
+        Classify a PDF page by its native text layer:
+        - "text": the text layer is usable and covers every large image of the page (born-digital pages,
+          or scans that were already OCR'd and carry an invisible text layer over the page image)
+        - "mixed": usable text, but some large image has no text over it (e.g. a scanned figure or table)
+        - "scanned": no usable text layer
+
+        Parameters:
+        - page (pymupdf.Page): Page of an open PyMuPDF document
+
+        Returns:
+        - (str, str): The page type and the text of its text layer
+        """
+        text = page.get_text("text")
+        characters = "".join(text.split())
+        # Fonts without a unicode mapping extract as replacement or control characters
+        garbled = sum(character == "\ufffd" or not character.isprintable() for character in characters)
+        if len(characters) < self.data_ingestion_config.native_text_min_chars or garbled > 0.1 * len(characters):
+            return "scanned", text
+
+        min_image_area = self.data_ingestion_config.native_text_min_image_area * page.rect.width * page.rect.height
+        text_blocks = [pymupdf.Rect(block[:4]) for block in page.get_text("blocks")
+                       if block[6] == 0 and block[4].strip()]
+        for image in page.get_image_info():
+            image_rect = pymupdf.Rect(image["bbox"]) & page.rect
+            if image_rect.is_empty or image_rect.width * image_rect.height < min_image_area:
+                continue
+            if not any(image_rect.intersects(block) for block in text_blocks):
+                return "mixed", text
+        return "text", text
+
+    @timed("triage")
+    def triage_document(self, pdf_path, document):
+        """
+        Classify the pages of a PDF before rasterization and write the text of the text-layer pages
+        to "<native_text_folder>/<document>/<document>_page_<n>.txt". Those pages skip rasterization,
+        preprocessing and OCR, text extraction picks up their native text instead.
+        Mixed pages are OCR'd whole, as their images may hold text the text layer does not have.
+
+        Parameters:
+        - pdf_path (str): Path to the PDF file
+        - document (str): Document name, used for the output folder and file names
+
+        Returns:
+        - (list, dict): The 1-based page numbers left to rasterize, and the number of pages of each type
+        """
+        page_counts = {"text": 0, "scanned": 0, "mixed": 0}
+        pages_to_render = []
+        native_text_folder = os.path.join(self.data_ingestion_config.native_text_folder, document)
+
+        with pymupdf.open(pdf_path) as pdf:
+            for page_no, page in enumerate(pdf, start=1):
+                page_type, text = self.classify_page(page)
+                page_counts[page_type] += 1
+                if page_type != "text":
+                    pages_to_render.append(page_no)
+                    continue
+                os.makedirs(native_text_folder, exist_ok=True)
+                write_text_file(os.path.join(native_text_folder, f"{document}_page_{page_no}.txt"), text)
+
+        logger.debug(f"{document} triage: {page_counts}")
+        return pages_to_render, page_counts
+
+    def get_document_tasks(self, pdf_path, pdf_output_folder, stage, split=None, done_state=RASTERIZED, output_paths=None):
+        """
+        Triage a PDF (when enabled) and split the pages left to rasterize into tasks for the worker pool.
+        A PDF PyMuPDF cannot read is rasterized whole, without triage.
+        With the run journal, the pages that reached `done_state` in an earlier run are left out too
+        (see get_resume_pages).
+
+        Returns:
+        - (list, dict): Render tasks (see get_render_tasks) and the number of pages of each type (empty without triage)
+        """
+        document = os.path.basename(os.path.normpath(pdf_output_folder))
+        pages_to_render = None
+        page_counts = {}
+        if self.data_ingestion_config.native_text_triage:
+            try:
+                pages_to_render, page_counts = self.triage_document(pdf_path, document)
+                for page_type, count in page_counts.items():
+                    add_counter(stage, f"{page_type}_pages", count)
+            except Exception as e:
+                logger.warning(f"Triage failed for {document}, rasterizing every page: {e}")
+
+        journal = get_run_journal()
+        if journal is not None:
+            pages_to_render = self.get_resume_pages(journal, pdf_path, pdf_output_folder, pages_to_render,
+                                                    done_state, output_paths)
+            # Pages are journaled as their task is done: an interrupted run loses at most a chunk per worker
+            split = True if split is None else split
+        return self.get_render_tasks(pdf_path, pdf_output_folder, pages_to_render, split), page_counts
+
+    def get_resume_pages(self, journal, pdf_path, pdf_output_folder, pages, done_state, output_paths=None):
+        """
+        Register the pages of a PDF in the run journal and return the ones left to render: the `pages`
+        (every page by default) that are not quarantined and did not reach `done_state` with their
+        `output_paths(page_no)` stored in an earlier run. The outputs default to the page PNG.
+        Pages left out of `pages` by triage have their native text and are journaled as OCR'd.
+        """
+        document = os.path.basename(os.path.normpath(pdf_output_folder))
+        all_pages = range(1, self.get_page_count(pdf_path, self.data_ingestion_config.popplar_path) + 1)
+        journal.register_document(document, pdf_path, all_pages)
+        if pages is None:
+            pages = all_pages
+        else:
+            journal.mark_pages(document, sorted(set(all_pages) - set(pages)), OCR_DONE, "triage")
+
+        if output_paths is None:
+            def output_paths(page_no):
+                return [os.path.join(pdf_output_folder, f"{document}_page_{page_no}.png")]
+        pages_to_render, quarantined = journal.pages_to_run(document, pages, done_state, output_paths)
+        if quarantined:
+            logger.warning(f"{document}: {len(quarantined)} quarantined page(s) skipped")
+        if len(pages_to_render) < len(pages) - len(quarantined):
+            logger.info(f"{document}: resuming, {len(pages) - len(quarantined) - len(pages_to_render)} "
+                        f"page(s) already done")
+        return pages_to_render
+
+    def retry_pages(self, func, failed_tasks, workers, stage, on_result=None):
+        """
+        Run the pages of failed page-range tasks again one by one with `func`, retried with backoff and
+        recorded in the run journal, so that a poison page only fails (and is quarantined) by itself
+
+        Returns:
+        - list: (task, result, error) of every single-page task
+        """
+        page_tasks = [(pdf_path, pdf_output_folder, page_no, page_no)
+                      for pdf_path, pdf_output_folder, first_page, last_page in failed_tasks
+                      for page_no in range(first_page, last_page + 1)]
+        return run_in_pool(func, page_tasks, workers, stage=stage, on_result=on_result,
+                           **retry_arguments(stage, lambda task: [(os.path.basename(task[1]), task[2])]))
+
+    def journal_rendered_pages(self, task, page_stats):
+        """
+        run_in_pool on_result: journal the pages of a render task as rasterized
+        """
+        _, pdf_output_folder, first_page, last_page = task
+        get_run_journal().mark_pages(os.path.basename(pdf_output_folder), range(first_page, last_page + 1),
+                                     RASTERIZED, "data_ingestion")
+
+    def render_page_range(self, task):
+        """
+        Worker entry point: render one (pdf_path, pdf_output_folder, first_page, last_page) task
+        """
+        pdf_path, pdf_output_folder, first_page, last_page = task
+        return self.pdf_to_images(pdf_path, pdf_output_folder, self.data_ingestion_config.popplar_path,
+                                  first_page, last_page)
+
+    def get_render_tasks(self, pdf_path, pdf_output_folder, pages=None, split=None):
+        """
+        Split a PDF into page-range tasks for the worker pool.
+        With a single worker the whole document is one task, otherwise it is split into
+        ranges of `chunk_size` pages so the pages of one document are spread across workers.
+        When `pages` is given, only those pages are rendered, as runs of consecutive pages.
+        `split` forces (True) or prevents (False) the split into `chunk_size` ranges.
+        """
+        if split is None:
+            split = self.data_ingestion_config.workers > 1
+        if pages is None:
+            if not split:
+                return [(pdf_path, pdf_output_folder, None, None)]
+            total_pages = self.get_page_count(pdf_path, self.data_ingestion_config.popplar_path)
+            page_runs = [(1, total_pages)]
+        else:
+            page_runs = group_consecutive(pages)
+            if not split:
+                return [(pdf_path, pdf_output_folder, first_page, last_page) for first_page, last_page in page_runs]
+
+        chunk_size = self.data_ingestion_config.chunk_size
+        return [(pdf_path, pdf_output_folder, first_page, min(first_page + chunk_size - 1, run_last_page))
+                for run_first_page, run_last_page in page_runs
+                for first_page in range(run_first_page, run_last_page + 1, chunk_size)]
+
     def process_multiple_pdfs(self):
         try:
             pdf_folder = self.data_ingestion_config.pdf_folder
             output_folder = self.data_ingestion_config.pdf_output_folder
-            popplar_path = self.data_ingestion_config.popplar_path
+            workers = self.data_ingestion_config.workers
             # create the output folder
             os.makedirs(output_folder, exist_ok=True)
 
-            logger.info(f"Document Ingestion started, pdf_folder: {pdf_folder}, output_folder: {output_folder}")
+            logger.info(f"Document Ingestion started, pdf_folder: {pdf_folder}, output_folder: {output_folder}, workers: {workers}")
 
             # List all files in the PDF folder
-            pdf_files = [f for f in os.listdir(pdf_folder) if f.lower().endswith('pdf')]
+            pdf_files = sorted(f for f in os.listdir(pdf_folder) if f.lower().endswith('pdf'))
 
+            tasks = []
+            failed_pages = []
+            document_stats = {}
             for pdf_file in pdf_files:
                 pdf_path = os.path.join(pdf_folder, pdf_file)
+                document = os.path.splitext(pdf_file)[0]
 
                 # create pdf output folder
-                pdf_output_folder = os.path.join(output_folder, os.path.splitext(pdf_file)[0])
+                pdf_output_folder = os.path.join(output_folder, document)
                 os.makedirs(pdf_output_folder, exist_ok=True)
 
-                # convert the pdf to an image using pdf2image.pdf_to_images
-                self.pdf_to_images(pdf_path, pdf_output_folder, popplar_path)
-            
-            logger.info(f"Document Ingestion completed, output_folder: {output_folder}")            
-            data_ingestion_artifact = DataIngestionArtifact(pdf_output_folder=output_folder)
+                try:
+                    # pages with a usable text layer are not rasterized
+                    document_tasks, page_counts = self.get_document_tasks(pdf_path, pdf_output_folder, "data_ingestion")
+                    tasks.extend(document_tasks)
+                    if page_counts:
+                        document_stats[document] = {"document": document, "pages": 0, "cached_pages": 0,
+                                                    "seconds": 0.0, "task_seconds": 0.0, "pages_per_sec": None,
+                                                    "peak_rss_mb": None, "page_types": page_counts}
+                except Exception as e:
+                    failed_pages.append(PageError("data_ingestion", document, "all", str(e)))
 
-            return data_ingestion_artifact
-          
+            # convert the pdfs to images using pdf2image, spread across the worker pool
+            journal = get_run_journal()
+            # With the run journal, the pages are journaled as they are rendered
+            on_result = self.journal_rendered_pages if journal is not None else None
+            outcomes = run_in_pool(self.render_page_range, tasks, workers, stage="data_ingestion", on_result=on_result)
+            if journal is not None:
+                failed_tasks = [task for task, _, error in outcomes if error is not None]
+                outcomes = [outcome for outcome in outcomes if outcome[2] is None]
+                outcomes += self.retry_pages(self.render_page_range, failed_tasks, workers, "data_ingestion", on_result)
 
-        except Exception as e:
-            logger.error(f"Error during document ingestion: {e}")
-            raise srcException(e, sys) from e
-    
+            # Wall clock span of the render tasks of every document, whose page ranges render in parallel
+            document_spans = {}
+            for task, page_stats, error in outcomes:
+                pdf_path, pdf_output_folder, first_page, last_page = task
+                document = os.path.basename(pdf_output_folder)
 
+                if error is not None:
+                    logger.error(f"Failed to render {document} pages {first_page}-{last_page}: {error}")
+                    if first_page is None:
+                        failed_pages.append(PageError("data_ingestion", document, "all", error))
+                    else:
+                        failed_pages.extend(PageError("data_ingestion", document, str(page_no), error)
+                                            for page_no in range(first_page, last_page + 1))
+                    continue
 
+                stats = document_stats.setdefault(document, {"document": document, "pages": 0, "cached_pages": 0,
+                                                             "seconds": 0.0, "task_seconds": 0.0,
+                                                             "pages_per_sec": None, "peak_rss_mb": None})
+                stats["pages"] += page_stats["pages"]
+                stats["cached_pages"] += page_stats["cached_pages"]
+                stats["task_seconds"] = round(stats["task_seconds"] + page_stats["seconds"], 3)
+                started_at, finished_at = document_spans.get(document,
+                                                             (page_stats["started_at"], page_stats["finished_at"]))
+                document_spans[document] = (min(started_at, page_stats["started_at"]),
+                                            max(finished_at, page_stats["finished_at"]))
+                if page_stats["peak_rss_mb"] is not None:
+                    stats["peak_rss_mb"] = max(stats["peak_rss_mb"] or 0, page_stats["peak_rss_mb"])
 
+            run_report = get_run_report()
+            if run_report is not None:
+                run_report.set_pages("data_ingestion", sum(stats["pages"] for stats in document_stats.values()))
+                run_report.add_counter("data_ingestion", "cached_pages",
+                                       sum(stats["cached_pages"] for stats in document_stats.values()))
 
-    
+            for document, stats in document_stats.items():
+                if document in document_spans:
+                    # Wall time from the start of the first task of the document to the end of its last one
+                    started_at, finished_at = document_spans[document]
+                    stats["seconds"] = round(finished_at - started_at, 3)
+                if stats["seconds"] > 0:
+                    stats["pages_per_sec"] = round(stats["pages"] / stats["seconds"], 3)
+                logger.info(f"Document ingested: {stats}")
 
+            logger.info(f"Document Ingestion completed, output_folder: {output_folder}, failed pages: {len(failed_pages)}")
+            native_text_folder = (self.data_ingestion_config.native_text_folder
+                                  if self.data_ingestion_config.native_text_triage else None)
+            data_ingestion_artifact = DataIngestionArtifact(pdf_output_folder=output_folder,
+                                                            document_stats=list(document_stats.values()),
+                                                            failed_pages=failed_pages,
+                                                            native_text_folder=native_text_folder)
 
+            return data_ingestion_artifact
+          
 
-        
+        except Exception as e:
+            logger.error(f"Error during document ingestion: {e}")
+            raise srcException(e, sys) from e
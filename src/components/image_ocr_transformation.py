@@ -1,29 +1,163 @@
 import os
 import sys
+import shutil
 import pytesseract
-from glob import glob
-# from paddleocr import PaddleOCR
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 load_dotenv()
 pytesseract.pytesseract.tesseract_cmd = os.getenv('TESSERACT_PATH')
 
-from src.entity.artifact_entity import ImagePreProcessingArtifact, ImageOCRTransformationArtifact
-from src.entity.config_entity import ImageOCRTransformationConfig
+from src.entity.artifact_entity import ImagePreProcessingArtifact, ImageOCRTransformationArtifact, PageError, OCRPageResult
+from src.entity.config_entity import ImageOCRTransformationConfig, PageCacheConfig
 from src.logger import get_logger
 logger = get_logger(__name__)
 from src.exception import srcException
+from src.utils.main_utils import run_in_pool
+from src.utils.page_cache import PageCache, bytes_digest
+from src.utils.page_store import PageStorage
+from src.utils.page_filter import get_page_hash_index, is_same_page
+from src.instrumentation import timed, add_counter, get_run_report
+from src.utils.tesseract_engine import (ocr_with_tesserocr, ocr_with_pytesseract_data, is_tesserocr_available,
+                                        set_psm, to_gray_array)
+from src.utils.paddle_engine import ocr_with_paddleocr_batch, recognize_paddleocr_lines, is_paddleocr_available
+from src.utils.ocr_cascade import (page_confidence, count_lines, find_low_confidence_regions, region_box,
+                                   replace_word_runs)
+from src.utils.layout_analysis import find_text_regions
+from src.utils.run_journal import get_run_journal, retry_arguments, image_page, OCR_DONE
+
+# Threads of this process OCRing the regions of a page, keyed by their number
+_REGION_EXECUTORS = {}
+
+
+def get_region_executor(workers):
+    if workers not in _REGION_EXECUTORS:
+        _REGION_EXECUTORS[workers] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ocr-region")
+    return _REGION_EXECUTORS[workers]
 
 
 class ImageOCRTransformation:
-    def __init__(self, image_ocr_transformation_config = ImageOCRTransformationConfig, image_preprocessing_artifact = ImagePreProcessingArtifact):
+    def __init__(self, image_ocr_transformation_config = ImageOCRTransformationConfig, image_preprocessing_artifact = ImagePreProcessingArtifact,
+                 page_cache_config:PageCacheConfig = None):
         try:
-            # self.paddle_ocr = PaddleOCR(lang='en')
             self.image_ocr_transformation_config = image_ocr_transformation_config
             self.image_preprocessing_artifact = image_preprocessing_artifact
+            # Only reads pages, which are found whether they were packed or not
+            self.page_storage = PageStorage()
+            self.page_cache = None
+            if page_cache_config is not None and page_cache_config.enabled:
+                self.page_cache = PageCache(page_cache_config.cache_folder, page_cache_config.max_bytes)
+            # Pages OCR'd at the same time, set by the stage before it dispatches them to the pool
+            self.concurrent_pages = image_ocr_transformation_config.workers
+            if self.uses_paddleocr() and not is_paddleocr_available():
+                logger.warning(f"OCR mode {image_ocr_transformation_config.mode} needs PaddleOCR, which is not "
+                               f"installed: pages get no PaddleOCR text (pip install paddlepaddle paddleocr)")
+            if image_ocr_transformation_config.tesseract_backend == "tesserocr" and not is_tesserocr_available():
+                logger.warning("Tesseract backend tesserocr is not installed: falling back to pytesseract, which "
+                               "runs a tesseract process per page (pip install tesserocr)")
         except Exception as e:
             raise srcException(e, sys)
+
+    def is_blank_page(self, signature)->bool:
+        """
+        Whether a page is blank from its ink statistics: (almost) no ink, or ink that is hardly darker
+        than the paper, which is what Otsu makes of scanner noise on an empty page
+        """
+        config = self.image_ocr_transformation_config
+        return config.skip_blank_pages and (signature.ink < config.blank_page_max_ink
+                                            or signature.contrast < config.blank_page_min_contrast)
+
+    def find_duplicate(self, signature):
+        """
+        Find an earlier page with the same content: a perceptual hash close enough, confirmed by comparing
+        the page thumbnails, so pages of one template with different values are not mistaken for each other
+
+        Returns:
+        - dict: {"file_name", "pyt", "pocr"} output text paths of the earlier page, None when there is none
+        """
+        config = self.image_ocr_transformation_config
+        if not config.deduplicate_pages:
+            return None
+        page_hashes = get_page_hash_index(config.duplicate_max_distance, config.page_hash_index_size)
+        for thumbnail, original in page_hashes.candidates(signature.phash):
+            if is_same_page(thumbnail, signature.thumbnail, config.duplicate_max_difference):
+                return original
+        return None
+
+    def index_page(self, signature, file_name, pyt_ocr_folder, pocr_ocr_folder):
+        """
+        Remember a page OCR'd to its output folders, for the pages that duplicate it later
+        """
+        config = self.image_ocr_transformation_config
+        if not config.deduplicate_pages:
+            return
+        page_hashes = get_page_hash_index(config.duplicate_max_distance, config.page_hash_index_size)
+        page_hashes.add(signature.phash, (signature.thumbnail, {
+            "file_name": file_name,
+            "pyt": os.path.join(pyt_ocr_folder, f"{file_name}_pyt.txt") if pyt_ocr_folder is not None else None,
+            "pocr": os.path.join(pocr_ocr_folder, f"{file_name}_pocr.txt") if pocr_ocr_folder is not None else None}))
+
+    def write_blank_page(self, file_name, pyt_ocr_folder, pocr_ocr_folder):
+        """
+        Write empty OCR texts for a blank page, so it still counts as a page of its document
+
+        Returns:
+        - list: Names of the engines that got an output file
+        """
+        engines = []
+        for engine, folder, suffix in (("pytesseract", pyt_ocr_folder, "pyt"), ("paddleocr", pocr_ocr_folder, "pocr")):
+            if folder is not None:
+                with open(os.path.join(folder, f"{file_name}_{suffix}.txt"), "w", encoding="utf-8"):
+                    pass
+                engines.append(engine)
+        return engines
+
+    def copy_page_texts(self, original, file_name, pyt_ocr_folder, pocr_ocr_folder):
+        """
+        Reuse the OCR texts of an earlier page for a duplicate page
+
+        Returns:
+        - list: Names of the engines that got an output file
+
+        Raises:
+        - FileNotFoundError: The earlier page has no text of an engine of the mode (it failed or was deleted)
+        """
+        copies = []
+        for engine, folder, suffix in (("pytesseract", pyt_ocr_folder, "pyt"), ("paddleocr", pocr_ocr_folder, "pocr")):
+            if folder is None:
+                continue
+            if original[suffix] is None or not os.path.exists(original[suffix]):
+                raise FileNotFoundError(f"No {engine} text for {original['file_name']}")
+            copies.append((engine, original[suffix], os.path.join(folder, f"{file_name}_{suffix}.txt")))
+
+        for _, original_path, text_file_path in copies:
+            shutil.copyfile(original_path, text_file_path)
+        return [engine for engine, _, _ in copies]
+
+    def filter_page(self, signature, file_name, pyt_ocr_folder, pocr_ocr_folder):
+        """
+        Skip the OCR of a blank page (empty texts) or of a duplicate of a page seen before (its texts are copied).
+        Any other page is indexed for the duplicates that follow it and must be OCR'd by the caller.
+
+        Returns:
+        - str: "blank", "duplicate", or None when the page must be OCR'd
+        """
+        if self.is_blank_page(signature):
+            self.write_blank_page(file_name, pyt_ocr_folder, pocr_ocr_folder)
+            return "blank"
+        original = self.find_duplicate(signature)
+        if original is not None:
+            try:
+                self.copy_page_texts(original, file_name, pyt_ocr_folder, pocr_ocr_folder)
+                logger.debug(f"{file_name} duplicates {original['file_name']}, OCR texts reused")
+                return "duplicate"
+            except OSError as e:
+                logger.debug(f"Could not reuse the OCR texts of {original['file_name']}: {e}")
+        self.index_page(signature, file_name, pyt_ocr_folder, pocr_ocr_folder)
+        return None
     
+    @timed("tesseract")
     def ocr_with_tesseract(self, image_path)->str:
+        # image_path may also be an in-memory image array, which pytesseract hands to Tesseract losslessly
         # OCR Engine Modes:
         # 0. Legacy, 
         # 1. Neural Nets/LSTM (recommended), 
@@ -32,20 +166,516 @@ class ImageOCRTransformation:
         # psm = Page Segmentation Mode
         # 3 - Fully automatic page segmentation, but no OSD (Orientation and Script Detection)
         # OEM 1 and PSM 3 is a solid default for most general-purpose OCR tasks
-        custom_config = r'--oem 1 --psm 3'
+        custom_config = self.image_ocr_transformation_config.tesseract_config
+        lang = self.image_ocr_transformation_config.tesseract_lang
         try:
-            return pytesseract.image_to_string(image_path, output_type='string', config = custom_config, lang = 'eng')
+            if self.image_ocr_transformation_config.layout_analysis:
+                result = self.ocr_text_regions(image_path)
+                if result is not None:
+                    return result.text
+            if self.use_tesserocr():
+                return ocr_with_tesserocr(image_path, lang, custom_config).text
+            return pytesseract.image_to_string(image_path, output_type='string', config = custom_config, lang = lang)
         except Exception as e:
             logger.error(f"Error during tesseract OCR:{e}")
             return ""
+
+    def region_workers(self)->int:
+        """
+        Threads OCRing the regions of a page: the configured number, or the CPUs left to each page
+        OCR'd at the same time
+        """
+        region_workers = self.image_ocr_transformation_config.layout_region_workers
+        if region_workers:
+            return region_workers
+        return max(1, (os.cpu_count() or 1) // max(1, self.concurrent_pages))
+
+    @timed("layout_analysis")
+    def find_text_regions(self, gray)->list:
+        config = self.image_ocr_transformation_config
+        return find_text_regions(gray, config.layout_block_psm, config.layout_line_psm)
+
+    def ocr_text_regions(self, image, data=False)->OCRPageResult:
+        """
+        OCR a page with columns region by region: every region (column, block beside another) is read with
+        the page segmentation mode of its shape, the regions in parallel threads, and their texts are joined
+        in reading order. Whole page segmentation is slower on such pages and often mixes the columns up.
+
+        Parameters:
+        - image (str | np.ndarray): Path to the page image or the in-memory page
+        - data (bool): Also return the word boxes (in page coordinates) and confidences
+
+        Returns:
+        - OCRPageResult: Page text (and words), None when the page has a single region
+        """
+        config = self.image_ocr_transformation_config
+        lang = config.tesseract_lang
+        gray = to_gray_array(image)
+        regions = self.find_text_regions(gray)
+        if len(regions) < 2:
+            return None
+
+        def ocr_region(region):
+            region_image = gray[region.top:region.top + region.height, region.left:region.left + region.width]
+            region_config = set_psm(config.tesseract_config, region.psm)
+            if self.use_tesserocr():
+                result = ocr_with_tesserocr(region_image, lang, region_config)
+            elif data:
+                result = ocr_with_pytesseract_data(region_image, lang, region_config)
+            else:
+                result = OCRPageResult(text=pytesseract.image_to_string(region_image, config=region_config, lang=lang))
+            for word in result.words:
+                word.left += region.left
+                word.top += region.top
+            return result
+
+        # tesserocr releases the GIL while it recognizes and pytesseract waits on a subprocess, so the
+        # regions of a page are read in parallel by threads
+        workers = min(self.region_workers(), len(regions))
+        if workers > 1:
+            results = list(get_region_executor(workers).map(ocr_region, regions))
+        else:
+            results = [ocr_region(region) for region in regions]
+
+        text = "\n\n".join(result.text.strip() for result in results if result.text.strip())
+        return OCRPageResult(text=f"{text}\n" if text else "", words=[word for result in results for word in result.words])
+
+    def use_tesserocr(self)->bool:
+        """
+        Whether Tesseract runs through the warm in-process engine rather than one subprocess per page
+        """
+        return self.image_ocr_transformation_config.tesseract_backend == "tesserocr" and is_tesserocr_available()
+
+    @timed("tesseract")
+    def ocr_with_tesseract_data(self, image)->OCRPageResult:
+        """
+        OCR a page with Tesseract and return the text together with the word boxes and confidences
+
+        Parameters:
+        - image (str | np.ndarray): Path to the page image or the in-memory page
+
+        Returns:
+        - OCRPageResult: Page text and words (an empty result if Tesseract failed)
+        """
+        custom_config = self.image_ocr_transformation_config.tesseract_config
+        lang = self.image_ocr_transformation_config.tesseract_lang
+        try:
+            if self.image_ocr_transformation_config.layout_analysis:
+                result = self.ocr_text_regions(image, data=True)
+                if result is not None:
+                    return result
+            if self.use_tesserocr():
+                return ocr_with_tesserocr(image, lang, custom_config)
+            return ocr_with_pytesseract_data(image, lang, custom_config)
+        except Exception as e:
+            logger.error(f"Error during tesseract OCR:{e}")
+            return OCRPageResult(text="")
         
-    def ocr_with_paddleocr(self, image_path)->list:
+    def uses_paddleocr(self)->bool:
+        mode = self.image_ocr_transformation_config.mode.lower()
+        return "paddleocr" in mode or "hybrid" in mode or self.is_cascade()
+
+    def is_cascade(self)->bool:
+        return self.image_ocr_transformation_config.mode.lower() == "cascade"
+
+    def paddle_cpu_threads(self)->int:
+        """
+        Math library threads of the PaddleOCR models: the configured number, or the CPUs left to each page
+        OCR'd at the same time
+        """
+        cpu_threads = self.image_ocr_transformation_config.paddle_cpu_threads
+        if cpu_threads:
+            return cpu_threads
+        return max(1, (os.cpu_count() or 1) // max(1, self.concurrent_pages))
+
+    @timed("paddleocr")
+    def ocr_with_paddleocr_batch(self, images)->list:
+        """
+        OCR a batch of pages with the warm PaddleOCR models of this process, their text lines recognized together
+
+        Parameters:
+        - images (list): Paths to the page images or in-memory pages
+
+        Returns:
+        - list: OCRPageResult of every page, None for every page if PaddleOCR failed
+        """
+        config = self.image_ocr_transformation_config
         try:
-            # return self.paddle_ocr.predict([image_path])
-            return None
+            return ocr_with_paddleocr_batch(images, config.paddle_lang, config.paddle_use_angle_cls,
+                                            config.paddle_rec_batch_num, self.paddle_cpu_threads(),
+                                            config.paddle_enable_mkldnn, config.paddle_drop_score)
         except Exception as e:
             logger.error(f"Error during paddleocr OCR:{e}")
-            return ""
+            return [None] * len(images)
+
+    def ocr_with_paddleocr(self, image)->OCRPageResult:
+        return self.ocr_with_paddleocr_batch([image])[0]
+
+    @timed("paddleocr")
+    def recognize_with_paddleocr(self, images)->list:
+        """
+        Recognize single text line images (word regions) with the warm PaddleOCR recognizer of this process
+
+        Returns:
+        - list: (text, confidence 0-100) of every image, None for every image if PaddleOCR failed
+        """
+        config = self.image_ocr_transformation_config
+        try:
+            return recognize_paddleocr_lines(images, config.paddle_lang, config.paddle_use_angle_cls,
+                                             config.paddle_rec_batch_num, self.paddle_cpu_threads(),
+                                             config.paddle_enable_mkldnn)
+        except Exception as e:
+            logger.error(f"Error during paddleocr OCR:{e}")
+            return [None] * len(images)
+
+    def ocr_cascade(self, images)->list:
+        """
+        OCR a batch of pages with the engine cascade: Tesseract reads every page with word confidences, then
+        PaddleOCR reads again only what Tesseract is unsure of, for all the pages of the batch together:
+        - a whole page when its mean word confidence is below cascade_page_min_conf, or more than
+          cascade_page_max_low_fraction of its words are below cascade_word_min_conf (or it has no word)
+        - otherwise each run of low-confidence words on a line, cut out of the page and only recognized
+        The more confident reading of a page or region wins. The pages, text lines and words read and the
+        ones escalated to PaddleOCR are counted (see report_cascade).
+
+        Parameters:
+        - images (list): Paths to the page images or in-memory pages
+
+        Returns:
+        - list: Text of every page
+        """
+        config = self.image_ocr_transformation_config
+        pages = []
+        for image in images:
+            gray = to_gray_array(image)
+            pages.append((gray, self.ocr_with_tesseract_data(gray)))
+        texts = [result.text for _, result in pages]
+
+        escalated_pages = []
+        regions = []
+        for index, (gray, result) in enumerate(pages):
+            words = result.words
+            low_confidence_words = sum(word.conf < config.cascade_word_min_conf for word in words)
+            add_counter("image_ocr", "cascade_pages")
+            add_counter("image_ocr", "cascade_lines", count_lines(words))
+            add_counter("image_ocr", "cascade_words", len(words))
+            if (not words or page_confidence(words) < config.cascade_page_min_conf
+                    or low_confidence_words > config.cascade_page_max_low_fraction * len(words)):
+                escalated_pages.append(index)
+                continue
+            for first, last in find_low_confidence_regions(words, config.cascade_word_min_conf):
+                left, top, right, bottom = region_box(words, first, last, gray.shape)
+                regions.append((index, first, last, gray[top:bottom, left:right]))
+
+        if not is_paddleocr_available():
+            # Already warned about in __init__, the pages keep their Tesseract text
+            return texts
+
+        add_counter("image_ocr", "cascade_escalated_pages", len(escalated_pages))
+        add_counter("image_ocr", "cascade_escalated_words", sum(len(pages[index][1].words) for index in escalated_pages))
+        if escalated_pages:
+            paddle_results = self.ocr_with_paddleocr_batch([pages[index][0] for index in escalated_pages])
+            for index, paddle_result in zip(escalated_pages, paddle_results):
+                words = pages[index][1].words
+                if (paddle_result is not None and paddle_result.text.strip()
+                        and (not words or page_confidence(paddle_result.words) > page_confidence(words))):
+                    texts[index] = paddle_result.text
+                    add_counter("image_ocr", "cascade_paddleocr_pages")
+
+        add_counter("image_ocr", "cascade_escalated_regions", len(regions))
+        add_counter("image_ocr", "cascade_escalated_words", sum(last - first + 1 for _, first, last, _ in regions))
+        if regions:
+            replacements = {}
+            readings = self.recognize_with_paddleocr([crop for *_, crop in regions])
+            for (index, first, last, _), reading in zip(regions, readings):
+                if reading is None or not reading[0].strip():
+                    continue
+                text, conf = reading
+                if conf > page_confidence(pages[index][1].words[first:last + 1]):
+                    replacements.setdefault(index, {})[(first, last)] = text.strip()
+            for index, page_replacements in replacements.items():
+                _, result = pages[index]
+                text = replace_word_runs(result.text, result.words, page_replacements)
+                if text is None:
+                    logger.debug("The Tesseract words of a page do not match its text, keeping its Tesseract text")
+                    continue
+                texts[index] = text
+                add_counter("image_ocr", "cascade_paddleocr_regions", len(page_replacements))
+        return texts
+
+    def report_cascade(self, stage):
+        """
+        Add the fractions of pages, text lines (regions) and words the cascade escalated to PaddleOCR to the
+        counters of a stage of the run report, and log them
+        """
+        run_report = get_run_report()
+        if not self.is_cascade() or run_report is None:
+            return
+        counters = run_report.stage(stage)["counters"]
+        if not counters.get("cascade_pages"):
+            return
+        for name, escalated, total in (("page", "cascade_escalated_pages", "cascade_pages"),
+                                       ("region", "cascade_escalated_regions", "cascade_lines"),
+                                       ("word", "cascade_escalated_words", "cascade_words")):
+            counters[f"cascade_escalated_{name}_fraction"] = round(counters.get(escalated, 0) / max(1, counters.get(total, 0)), 4)
+        logger.info(f"OCR cascade: {counters.get('cascade_escalated_pages', 0)} of {counters['cascade_pages']} pages "
+                    f"({counters['cascade_escalated_page_fraction']:.1%}) and {counters.get('cascade_escalated_regions', 0)} "
+                    f"regions for {counters.get('cascade_lines', 0)} text lines "
+                    f"({counters['cascade_escalated_region_fraction']:.1%}) escalated to PaddleOCR, "
+                    f"{counters['cascade_escalated_word_fraction']:.1%} of the words")
+
+    def page_cache_key(self, engine, source_digest):
+        """
+        Cache key of an OCR text: the page content digest, the engine and its settings
+        """
+        config = self.image_ocr_transformation_config
+        if engine == "paddleocr":
+            return PageCache.make_key("ocr_texts", engine, source_digest, config.paddle_lang,
+                                      config.paddle_use_angle_cls, config.paddle_drop_score)
+        # The backend actually used (tesserocr falls back to pytesseract) and the layout analysis change the text too
+        tesseract_settings = (config.tesseract_config, config.tesseract_lang,
+                              "tesserocr" if self.use_tesserocr() else "pytesseract", config.layout_analysis,
+                              config.layout_block_psm, config.layout_line_psm)
+        if self.is_cascade():
+            # The Tesseract text of the cascade is merged with the PaddleOCR readings
+            return PageCache.make_key("ocr_texts", "cascade", source_digest, *tesseract_settings,
+                                      config.paddle_lang, config.cascade_word_min_conf,
+                                      config.cascade_page_min_conf, config.cascade_page_max_low_fraction)
+        return PageCache.make_key("ocr_texts", engine, source_digest, *tesseract_settings)
+
+    def restore_cached_page(self, file_name, pyt_ocr_folder, pocr_ocr_folder, source_digest):
+        """
+        Write the cached OCR texts of a page if every engine of the mode has one
+
+        Returns:
+        - bool: True when the page was restored and does not need to be OCR'd
+        """
+        if self.page_cache is None:
+            return False
+
+        outputs = []
+        for engine, folder, suffix in (("pytesseract", pyt_ocr_folder, "pyt"), ("paddleocr", pocr_ocr_folder, "pocr")):
+            if folder is None:
+                continue
+            cached = self.page_cache.get("ocr_texts", self.page_cache_key(engine, source_digest))
+            if cached is None:
+                return False
+            outputs.append((os.path.join(folder, f"{file_name}_{suffix}.txt"), cached))
+
+        for text_file_path, cached in outputs:
+            with open(text_file_path, "wb") as text_file:
+                text_file.write(cached)
+        return True
+
+    def ocr_image(self, image, file_name, pyt_ocr_folder, pocr_ocr_folder, source_digest=None):
+        """
+        OCR a single page and write one text file per engine.
+        An engine is skipped when its output folder is None.
+
+        Parameters:
+        - image (str | np.ndarray): Path to the page image or the in-memory page
+        - file_name (str): Page name used for the output files
+        - pyt_ocr_folder (str): Output folder of the Tesseract text, or None
+        - pocr_ocr_folder (str): Output folder of the PaddleOCR text, or None
+        - source_digest (str): Digest identifying the page content, enables the page cache when given
+
+        Returns:
+        - list: Names of the engines that produced an output file
+        """
+        return self.ocr_images([(image, file_name, pyt_ocr_folder, pocr_ocr_folder, source_digest)])[0]
+
+    def write_tesseract_text(self, text, file_name, pyt_ocr_folder, source_digest=None):
+        """
+        Write the Tesseract text of a page, and put it in the page cache under `source_digest` when given
+        """
+        # Empty output is not cached, it is also what a failed Tesseract call returns
+        if source_digest is not None and text:
+            self.page_cache.put("ocr_texts", self.page_cache_key("pytesseract", source_digest), text.encode("utf-8"))
+        with open(os.path.join(pyt_ocr_folder, f"{file_name}_pyt.txt"), "w", encoding = "utf-8") as text_file_pyt:
+            text_file_pyt.write(text)
+
+    def ocr_images(self, pages):
+        """
+        OCR a batch of pages and write one text file per engine and page (see ocr_image). Tesseract reads
+        the pages one by one, PaddleOCR reads the pages it has no cached text for in a single batch.
+
+        Parameters:
+        - pages (list): (image, file_name, pyt_ocr_folder, pocr_ocr_folder, source_digest) of every page
+
+        Returns:
+        - list: Names of the engines that produced an output file, for every page
+        """
+        page_engines = [[] for _ in pages]
+        paddle_pages = []
+        cascade_pages = []
+
+        for index, (image, file_name, pyt_ocr_folder, pocr_ocr_folder, source_digest) in enumerate(pages):
+            use_cache = self.page_cache is not None and source_digest is not None
+
+            if pyt_ocr_folder is not None:
+                # for pytesseract OCR text
+                pyt_ocr_txt = None
+                if use_cache:
+                    cached = self.page_cache.get("ocr_texts", self.page_cache_key("pytesseract", source_digest))
+                    pyt_ocr_txt = cached.decode("utf-8") if cached is not None else None
+                if pyt_ocr_txt is not None:
+                    self.write_tesseract_text(pyt_ocr_txt, file_name, pyt_ocr_folder)
+                    page_engines[index].append("pytesseract")
+                elif self.is_cascade():
+                    # the cascade reads the pages without a cached text together below
+                    cascade_pages.append(index)
+                else:
+                    self.write_tesseract_text(self.ocr_with_tesseract(image_path=image), file_name, pyt_ocr_folder,
+                                              source_digest if use_cache else None)
+                    page_engines[index].append("pytesseract")
+
+            if pocr_ocr_folder is not None:
+                # for paddleocr OCR text, the pages without a cached text are OCR'd together below
+                cached = None
+                if use_cache:
+                    cached = self.page_cache.get("ocr_texts", self.page_cache_key("paddleocr", source_digest))
+                if cached is not None:
+                    with open(os.path.join(pocr_ocr_folder, f"{file_name}_pocr.txt"), "wb") as text_file_pocr:
+                        text_file_pocr.write(cached)
+                    page_engines[index].append("paddleocr")
+                elif is_paddleocr_available():
+                    paddle_pages.append(index)
+
+        if cascade_pages:
+            # In cascade mode the Tesseract text file holds the page text merged with the PaddleOCR readings
+            texts = self.ocr_cascade([pages[index][0] for index in cascade_pages])
+            for index, text in zip(cascade_pages, texts):
+                _, file_name, pyt_ocr_folder, _, source_digest = pages[index]
+                self.write_tesseract_text(text, file_name, pyt_ocr_folder,
+                                          source_digest if self.page_cache is not None else None)
+                page_engines[index].append("pytesseract")
+
+        if paddle_pages:
+            results = self.ocr_with_paddleocr_batch([pages[index][0] for index in paddle_pages])
+            for index, result in zip(paddle_pages, results):
+                if result is None:
+                    continue
+                _, file_name, _, pocr_ocr_folder, source_digest = pages[index]
+                if self.page_cache is not None and source_digest is not None:
+                    self.page_cache.put("ocr_texts", self.page_cache_key("paddleocr", source_digest),
+                                        result.text.encode("utf-8"))
+                with open(os.path.join(pocr_ocr_folder, f"{file_name}_pocr.txt"), "w", encoding = "utf-8") as text_file_pocr:
+                    text_file_pocr.write(result.text)
+                page_engines[index].append("paddleocr")
+
+        return page_engines
+
+    def get_engine_folders(self, document):
+        """
+        Create and return the (Tesseract, PaddleOCR) output folders of a document for the configured mode.
+        The folder of an engine that is not used by the mode is None.
+        """
+        output_folder = self.image_ocr_transformation_config.ocr_output_folder
+        mode = self.image_ocr_transformation_config.mode
+        pyt_ocr_folder = None
+        pocr_ocr_folder = None
+
+        if "pytesseract" in mode.lower() or "hybrid" in mode.lower() or self.is_cascade():
+            # for Tesseract folder
+            pyt_ocr_folder = os.path.join(output_folder, "PYTESSERACT", document)
+            os.makedirs(pyt_ocr_folder, exist_ok=True)
+
+        if "paddleocr" in mode.lower() or "hybrid" in mode.lower():
+            # for paddleocr folder
+            pocr_ocr_folder = os.path.join(output_folder, "PADDLEOCR", document)
+            os.makedirs(pocr_ocr_folder, exist_ok=True)
+
+        return pyt_ocr_folder, pocr_ocr_folder
+
+    def page_output_paths(self, document, page_no):
+        """
+        Text files the engines of the mode write for a page
+        """
+        pyt_ocr_folder, pocr_ocr_folder = self.get_engine_folders(document)
+        file_name = f"{document}_page_{page_no}"
+        output_paths = []
+        if pyt_ocr_folder is not None:
+            output_paths.append(os.path.join(pyt_ocr_folder, f"{file_name}_pyt.txt"))
+        if pocr_ocr_folder is not None:
+            output_paths.append(os.path.join(pocr_ocr_folder, f"{file_name}_pocr.txt"))
+        return output_paths
+
+    def ocr_page(self, task):
+        """
+        Worker entry point: OCR one (image_path, pyt_ocr_folder, pocr_ocr_folder) task
+        """
+        image_path, pyt_ocr_folder, pocr_ocr_folder = task
+        # Get the file name without ".jpg" extension
+        file_name = os.path.splitext(os.path.basename(image_path))[0]
+        source_digest = bytes_digest(self.page_storage.read(image_path)) if self.page_cache is not None else None
+        return self.ocr_image(self.page_storage.image_source(image_path), file_name, pyt_ocr_folder, pocr_ocr_folder,
+                              source_digest)
+
+    def ocr_page_batch(self, tasks):
+        """
+        Worker entry point: OCR a list of (image_path, pyt_ocr_folder, pocr_ocr_folder) tasks as one batch
+
+        Returns:
+        - list: Names of the engines that produced an output file, for every page
+        """
+        pages = []
+        for image_path, pyt_ocr_folder, pocr_ocr_folder in tasks:
+            file_name = os.path.splitext(os.path.basename(image_path))[0]
+            source_digest = bytes_digest(self.page_storage.read(image_path)) if self.page_cache is not None else None
+            pages.append((self.page_storage.image_source(image_path), file_name, pyt_ocr_folder, pocr_ocr_folder,
+                          source_digest))
+        return self.ocr_images(pages)
+
+    def batch_size(self, pages=None, workers=1)->int:
+        """
+        Pages OCR'd together: PaddleOCR batches up to paddle_batch_size pages, as long as each of the
+        `workers` still gets a batch of the `pages`. Without PaddleOCR the pages are OCR'd one by one.
+        """
+        if not (self.uses_paddleocr() and is_paddleocr_available()):
+            return 1
+        batch_size = self.image_ocr_transformation_config.paddle_batch_size
+        if pages is not None:
+            batch_size = min(batch_size, -(-pages // max(1, workers)))
+        return max(1, batch_size)
+
+    def run_ocr_tasks(self, tasks, workers):
+        """
+        OCR the tasks across the worker pool, in batches when PaddleOCR is used
+
+        Returns:
+        - list: (task, engines, error) of every task, in order
+        """
+        # With the run journal, pages are journaled as they are OCR'd and failed pages are retried with
+        # backoff until they are quarantined
+        journal = get_run_journal()
+        retry = retry_arguments("image_ocr", lambda task: [image_page(task[0])])
+        on_page = on_batch = None
+        if journal is not None:
+            def on_page(task, engines):
+                journal.mark_files([task[0]], OCR_DONE, "image_ocr")
+
+            def on_batch(batch, page_engines):
+                journal.mark_files([task[0] for task in batch], OCR_DONE, "image_ocr")
+
+        batch_size = self.batch_size(len(tasks), workers)
+        if batch_size == 1:
+            return run_in_pool(self.ocr_page, tasks, workers, stage="image_ocr", on_result=on_page, **retry)
+        batches = [tasks[start:start + batch_size] for start in range(0, len(tasks), batch_size)]
+        outcomes = []
+        failed_tasks = []
+        for batch, page_engines, error in run_in_pool(self.ocr_page_batch, batches, workers, stage="image_ocr",
+                                                      on_result=on_batch):
+            if error is not None and retry:
+                # The pages of the batch run again one by one, so that a poison page only fails itself
+                failed_tasks.extend(batch)
+                continue
+            if error is not None:
+                page_engines = [None] * len(batch)
+            outcomes.extend((task, engines, error) for task, engines in zip(batch, page_engines))
+        if failed_tasks:
+            outcomes.extend(run_in_pool(self.ocr_page, failed_tasks, workers, stage="image_ocr", on_result=on_page,
+                                        **retry))
+        return outcomes
 
     def perform_ocr(self):
         try:
@@ -53,64 +683,107 @@ class ImageOCRTransformation:
             input_folder = self.image_preprocessing_artifact.preprocessed_images_folder
             output_folder = self.image_ocr_transformation_config.ocr_output_folder
             mode = self.image_ocr_transformation_config.mode
+            workers = self.image_ocr_transformation_config.workers
 
             logger.info(f"OCR Mode: {mode}")
             logger.info(f"Input folder: {input_folder}")
             logger.info(f"Output folder: {output_folder}")
 
-            image_folders = os.listdir(input_folder)
+            image_folders = sorted(os.listdir(input_folder))
             logger.info(f"Found image folders: {image_folders}")
 
+            journal = get_run_journal()
+            tasks = []
             for image_folder in image_folders:
-                if "pytesseract" in mode.lower() or "hybrid" in mode.lower():
-                    # for Tesseract folder
-                    pyt_ocr_folder = os.path.join(output_folder, "PYTESSERACT", image_folder)
-                    os.makedirs(pyt_ocr_folder, exist_ok=True)
-                
-                if "paddleocr" in mode.lower() or "hybrid" in mode.lower():
-                    # for paddleocr folder
-                    pocr_ocr_folder = os.path.join(output_folder, "PADDLEOCR", image_folder)
-                    os.makedirs(pocr_ocr_folder, exist_ok=True)
-                
-                image_paths = glob(os.path.join(input_folder, image_folder, "*.jpg"))
+                pyt_ocr_folder, pocr_ocr_folder = self.get_engine_folders(image_folder)
+
+                image_paths = self.page_storage.list_pages(os.path.join(input_folder, image_folder), ".jpg")
                 logger.info(f"Found images in {image_folder}: {len(image_paths)}")
+                if journal is not None:
+                    # Pages OCR'd in an earlier run, or quarantined, are left out
+                    pages = {image_page(image_path)[1]: image_path for image_path in image_paths}
+                    pages_to_run, _ = journal.pages_to_run(image_folder, sorted(pages), OCR_DONE,
+                                                           lambda page_no: self.page_output_paths(image_folder, page_no))
+                    image_paths = [pages[page_no] for page_no in pages_to_run]
+
+                tasks.extend((image_path, pyt_ocr_folder, pocr_ocr_folder) for image_path in image_paths)
+
+            # Blank pages get empty texts and duplicates of an earlier page are set aside, in page order so
+            # the first copy of a page is the one OCR'd
+            page_signatures = self.image_preprocessing_artifact.page_signatures
+            ocr_tasks = []
+            duplicates = []
+            blank_pages = 0
+            blank_paths = []
+            for task in tasks:
+                image_path, pyt_ocr_folder, pocr_ocr_folder = task
+                signature = page_signatures.get(image_path)
+                if signature is None:
+                    ocr_tasks.append(task)
+                    continue
+                file_name = os.path.splitext(os.path.basename(image_path))[0]
+                if self.is_blank_page(signature):
+                    self.write_blank_page(file_name, pyt_ocr_folder, pocr_ocr_folder)
+                    blank_pages += 1
+                    blank_paths.append(image_path)
+                    continue
+                original = self.find_duplicate(signature)
+                if original is not None:
+                    duplicates.append((task, original))
+                    continue
+                self.index_page(signature, file_name, pyt_ocr_folder, pocr_ocr_folder)
+                ocr_tasks.append(task)
 
-                count_pyt = 1
-                count_pocr = 1
-
-                for image_path in image_paths:
-                    # Get the file name without ".jpg" extension
-                    file_name = image_path.split("\\")[-1][:-4]
-
-                    if "pytesseract" in mode.lower() or "hybrid" in mode.lower():
-                        # for pytesseract OCR text
-                        pyt_ocr_txt = self.ocr_with_tesseract(image_path=image_path)
-                        text_file_pyt = open(os.path.join(pyt_ocr_folder, f"{file_name}_pyt.txt"), "w", encoding = "utf-8")
-                        text_file_pyt.write(pyt_ocr_txt)
-                        text_file_pyt.close()
-                        logger.debug(f"Pytesseract OCR generated: count {count_pyt}")
-                        count_pyt+=1
-
-                    if "paddleocr" in mode.lower() or "hybrid" in mode.lower():
-                        # for pytesseract OCR text
-                        pocr_list = self.ocr_with_paddleocr(image_path)
-                        if pocr_list:
-                            pocr_text_list = [x[1][0] for x in pocr_list[0]] # [Bounding box (4 corners), ("recognized_text", confidence_score) ]
-                            text_file_pocr = open(os.path.join(pocr_ocr_folder, f"{file_name}_pocr.txt"), "w", encoding = "utf-8")
-                            for text in pocr_text_list:
-                                text_file_pocr.write(f"{text}\n")
-                            text_file_pocr.close()
-                            logger.debug(f"PaddleOCR OCR generated: count {count_pocr}")
-                            count_pocr+=1
-                        else:
-                            pass
-            
-            logger.info(f"OCR completed: output_folder: {output_folder}")
-            image_ocr_transformation_artifact = ImageOCRTransformationArtifact(ocr_texts_folder=output_folder)
+            if journal is not None:
+                journal.mark_files(blank_paths, OCR_DONE, "image_ocr")
+
+            # OCR every page across the worker pool, gathering errors per page
+            self.concurrent_pages = max(1, min(workers, len(ocr_tasks)))
+            outcomes = self.run_ocr_tasks(ocr_tasks, workers)
+
+            # Duplicates copy the texts of their page, or are OCR'd themselves if it has none
+            duplicate_pages = 0
+            retries = []
+            for task, original in duplicates:
+                image_path, pyt_ocr_folder, pocr_ocr_folder = task
+                try:
+                    self.copy_page_texts(original, os.path.splitext(os.path.basename(image_path))[0],
+                                         pyt_ocr_folder, pocr_ocr_folder)
+                    duplicate_pages += 1
+                    if journal is not None:
+                        journal.mark_files([image_path], OCR_DONE, "image_ocr")
+                except OSError:
+                    retries.append(task)
+            outcomes.extend(self.run_ocr_tasks(retries, workers))
+            add_counter("image_ocr", "blank_pages", blank_pages)
+            add_counter("image_ocr", "duplicate_pages", duplicate_pages)
+
+            count_pyt = 0
+            count_pocr = 0
+            failed_pages = []
+            for (image_path, _, _), engines, error in outcomes:
+                if error is not None:
+                    logger.error(f"OCR failed for {image_path}: {error}")
+                    failed_pages.append(PageError("image_ocr", os.path.basename(os.path.dirname(image_path)),
+                                                  os.path.basename(image_path), error))
+                    continue
+                count_pyt += "pytesseract" in engines
+                count_pocr += "paddleocr" in engines
+
+            # With the "tesseract" and "paddleocr" function timings, the throughput of each engine
+            add_counter("image_ocr", "tesseract_pages", count_pyt)
+            add_counter("image_ocr", "paddleocr_pages", count_pocr)
+            self.report_cascade("image_ocr")
+            logger.debug(f"Pytesseract OCR generated: count {count_pyt}")
+            logger.debug(f"PaddleOCR OCR generated: count {count_pocr}")
+            logger.info(f"OCR completed: output_folder: {output_folder}, blank pages skipped: {blank_pages}, "
+                        f"duplicate pages reused: {duplicate_pages}, failed pages: {len(failed_pages)}")
+            image_ocr_transformation_artifact = ImageOCRTransformationArtifact(ocr_texts_folder=output_folder,
+                                                                               failed_pages=failed_pages,
+                                                                               native_text_folder=self.image_preprocessing_artifact.native_text_folder)
 
             return image_ocr_transformation_artifact
 
         except Exception as e:
             logger.error("Error occurred in start_image_ocr", exc_info=True)
             raise srcException(e,sys) from e
-    
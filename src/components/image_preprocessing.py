@@ -1,23 +1,33 @@
 import os
 import sys
-from glob import glob
 
 import cv2
 import numpy as np
 import imutils as im
 
-from src.entity.artifact_entity import DataIngestionArtifact, ImagePreProcessingArtifact
-from src.entity.config_entity import ImagePreProcessingConfig
+from src.entity.artifact_entity import DataIngestionArtifact, ImagePreProcessingArtifact, PageError
+from src.entity.config_entity import ImagePreProcessingConfig, PageCacheConfig
 from src.logger import get_logger
 logger = get_logger(__name__)
 from src.exception import srcException
+from src.utils.main_utils import run_in_pool
+from src.utils.page_cache import PageCache, bytes_digest
+from src.utils.page_store import PageStorage
+from src.instrumentation import timed, add_counter
+from src.utils.page_filter import page_signature, signature_to_bytes, signature_from_bytes
+from src.utils.run_journal import get_run_journal, retry_arguments, image_page, PREPROCESSED
 
 
 class ImagePreProcessing:
-    def __init__(self, image_processing_config = ImagePreProcessingConfig, data_ingestion_artifact = DataIngestionArtifact):
+    def __init__(self, image_processing_config = ImagePreProcessingConfig, data_ingestion_artifact = DataIngestionArtifact,
+                 page_cache_config:PageCacheConfig = None):
         try:
             self.image_processing_config = image_processing_config
             self.data_ingestion_artifact = data_ingestion_artifact
+            self.page_storage = PageStorage(image_processing_config.pack_pages)
+            self.page_cache = None
+            if page_cache_config is not None and page_cache_config.enabled:
+                self.page_cache = PageCache(page_cache_config.cache_folder, page_cache_config.max_bytes)
         except Exception as e:
             raise srcException(e,sys)
 
@@ -44,13 +54,131 @@ class ImagePreProcessing:
         score = np.sum((histogram[1:] - histogram[:-1])**2, dtype = float)
         return histogram, score
     
-    def correct_skew(self, image, delta=1, limit = 5):
+    def foreground_points(self, arr):
+        """
+        Return the (x, y, value) arrays of the non-zero pixels of an image
+        """
+        points = cv2.findNonZero(arr)
+        if points is None:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, np.zeros(0)
+        points = points.reshape(-1, 2)
+        xs, ys = points[:, 0], points[:, 1]
+        return xs, ys, arr[ys, xs].astype(float)
+
+    def determine_scores(self, arr, angles, points=None, max_batch_elements=2**24):
+        """
+        Vectorized equivalent of determine_score for many angles at once.
+        Instead of rotating the whole page for every angle, only the coordinates of the foreground
+        pixels are rotated (about the same center as imutils.rotate) and binned into row histograms,
+        for a batch of angles in one NumPy operation.
+
+        Parameters:
+        - arr: Input binary image array (white text on black background)
+        - angles: Rotation angles to test
+        - points: Optional precomputed foreground_points(arr), reused across calls on the same image
+        - max_batch_elements: Upper bound of (angles x foreground pixels) processed per batch, bounds memory
+
+        Returns:
+        - np.ndarray: Score of every angle
+        """
+        h, w = arr.shape[:2]
+        # imutils.rotate rotates about the integer center of the image
+        cx, cy = w // 2, h // 2
+
+        xs, ys, weights = points if points is not None else self.foreground_points(arr)
+        dx = (xs - cx).astype(np.float32)
+        dy = (ys - cy).astype(np.float32)
+
+        angles = np.asarray(angles, dtype=float)
+        scores = np.zeros(len(angles))
+        if len(xs) == 0:
+            return scores
+
+        # Binary images have a single foreground value, which lets bincount skip the weights
+        uniform_weight = weights[0] if np.all(weights == weights[0]) else None
+
+        batch_size = max(1, max_batch_elements // len(xs))
+        for start in range(0, len(angles), batch_size):
+            theta = np.deg2rad(angles[start:start + batch_size])[:, None]
+            cos, sin = np.cos(theta).astype(np.float32), np.sin(theta).astype(np.float32)
+
+            # Destination coordinates of the foreground pixels, see cv2.getRotationMatrix2D
+            # (rows are shifted by 0.5 so that truncation rounds them to the nearest row)
+            rows = -sin * dx
+            rows += cos * dy
+            rows += cy + 0.5
+            cols = cos * dx
+            cols += sin * dy
+            cols += cx
+
+            # Pixels rotated outside the page are cropped, as in imutils.rotate
+            inside = (rows >= 0) & (rows < h) & (cols >= 0) & (cols <= w - 1)
+
+            # Offset every angle into its own block of h bins so one bincount builds all histograms
+            bins = rows.astype(np.int64)
+            bins += np.arange(theta.shape[0])[:, None] * h
+            if uniform_weight is not None:
+                histograms = np.bincount(bins[inside], minlength=theta.shape[0] * h) * uniform_weight
+            else:
+                histograms = np.bincount(bins[inside], weights=np.broadcast_to(weights, bins.shape)[inside],
+                                         minlength=theta.shape[0] * h)
+            histograms = histograms.reshape(-1, h)
+
+            scores[start:start + theta.shape[0]] = np.sum(np.diff(histograms, axis=1)**2, axis=1)
+
+        return scores
+
+    def find_best_angle(self, arr, delta=1, limit=5, precision=None, engine="projection"):
+        """
+        Search the skew angle that maximizes the projection score
+
+        - "rotate" engine: scores every angle of the grid with determine_score (rotates the whole page per angle)
+        - "projection" engine: scores the grid with determine_scores, then refines coarse-to-fine around the
+          best angle until `precision` is reached, so sub-degree precision costs a few extra angles
+          rather than a linearly larger grid
+
+        Parameters:
+        - arr: Input binary image array
+        - delta: Step of the coarse angle grid
+        - limit: Largest absolute angle tested
+        - precision: Final angle resolution, defaults to delta
+        - engine: "projection" or "rotate"
+        """
+        angles = np.arange(-limit, limit + delta, delta)
+
+        if engine == "rotate":
+            scores = []
+            for angle in angles:
+                histogram, score = self.determine_score(arr, angle)
+                scores.append(score)
+            return angles[scores.index(max(scores))]
+
+        points = self.foreground_points(arr)
+        best_angle = angles[int(np.argmax(self.determine_scores(arr, angles, points)))]
+
+        step = delta
+        precision = precision or delta
+        while step > precision:
+            # Zoom in on the neighbourhood of the current best angle with a 5x finer step
+            fine_step = max(step / 5, precision)
+            fine_angles = np.arange(best_angle - step, best_angle + step + fine_step / 2, fine_step)
+            fine_angles = fine_angles[(fine_angles >= -limit) & (fine_angles <= limit)]
+            best_angle = fine_angles[int(np.argmax(self.determine_scores(arr, fine_angles, points)))]
+            step = fine_step
+
+        return best_angle
+
+    @timed("deskew")
+    def correct_skew(self, image, delta=1, limit = 5, precision=None, engine="projection", return_binary=False):
         """
         Corrects skewed text in images
+        With `return_binary`, the Otsu binarized page (before rotation) is returned too, for the page filters.
         """
         try:
             # convert image to grayscale
-            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            if image.ndim == 3:
+                image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
 
             # Apply binary thresholding with Otsu's method to create white text on black background
             # Image Thresholding : Convert Grayscale images to binary(black/white) by comparing each pixel
@@ -60,13 +188,7 @@ class ImagePreProcessing:
             binary_thresholded_image = cv2.threshold(image, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)[1]
 
             # Skew detection by Peak-Valley Analysis of horizontal projection
-            scores = []
-            angles = np.arange(-limit, limit + delta, delta)
-            for angle in angles:
-                histogram, score = self.determine_score(binary_thresholded_image, angle)
-                scores.append(score)
-            
-            best_angle = angles[scores.index(max(scores))]
+            best_angle = self.find_best_angle(binary_thresholded_image, delta, limit, precision, engine)
             h,w = image.shape
             center = (w //2, h//3)
 
@@ -80,17 +202,20 @@ class ImagePreProcessing:
             rotated = cv2.warpAffine(image, M, (w,h), flags=cv2.INTER_CUBIC, borderMode = cv2.BORDER_REPLICATE)
 
             # Find angle with highest score
+            if return_binary:
+                return best_angle, rotated, binary_thresholded_image
             return best_angle, rotated
         
         except Exception as e:
             raise srcException(e, sys)
     
-    def deocument_image_rotation(self, image):
+    def deocument_image_rotation(self, image, return_binary=False):
         delta = self.image_processing_config.delta
         limit = self.image_processing_config.limit
+        precision = self.image_processing_config.precision
+        engine = self.image_processing_config.skew_engine
       
-        best_angle, rotated_image = self.correct_skew(image, delta, limit)
-        return best_angle, rotated_image
+        return self.correct_skew(image, delta, limit, precision, engine, return_binary)
     
     def preprocess_and_resize_image(self, image_path, blur_kernel_size=(5,5), target_size=(800, 600)):
         """
@@ -98,11 +223,19 @@ class ImagePreProcessing:
 
         """
         try:
-            # Loading the image
-            image = cv2.imread(image_path)
-            if image is None:
-                raise ValueError(f"Could not load image: {image_path}")
-            
+            # Loading the image, a loose file or a page of a packed document
+            image = self.page_storage.read_image(image_path)
+
+            return self.blur_and_resize_image(image, blur_kernel_size, target_size)
+        except Exception as e:
+            raise srcException(e, sys)
+
+    @timed("blur_resize")
+    def blur_and_resize_image(self, image, blur_kernel_size=(5,5), target_size=(800, 600)):
+        """
+        Blur and resize an in-memory BGR image array, preserving its aspect ratio
+        """
+        try:
             # Applying Gaussian Blur to:
             # - reduce noise
             # - prepare for edge detection
@@ -112,7 +245,8 @@ class ImagePreProcessing:
             
             # Get original dimensions
             original_height, original_width = blurred_image.shape[:2]
-            target_width, target_height = target_size
+            # The target box follows the orientation of the page, portrait pages are not squeezed into landscape
+            target_width, target_height = sorted(target_size, reverse=original_width > original_height)
             
             # Calculate scaling factors
             width_scale = target_width / original_width
@@ -133,6 +267,125 @@ class ImagePreProcessing:
             raise srcException(e, sys)
 
     
+    @timed("crop")
+    def crop_to_content(self, image, margin=20, angle=0):
+        """
+        Crop a grayscale page to the bounding box of its ink plus `margin` pixels, so OCR, whose time grows
+        with the pixel count, does not scan the blank margins.
+        Specks of scanner noise are removed first, and solid bars (scanner borders, rows or columns that are
+        mostly ink) are ignored, so neither stretches the box. For a page deskewed by `angle` degrees, the
+        corners filled by correct_skew's border replication are ignored too.
+
+        Returns:
+        - (np.ndarray, tuple): The cropped image and its (x, y, width, height) box in the page,
+          the page unchanged when no content is found
+        """
+        h, w = image.shape[:2]
+        binary = cv2.threshold(image, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)[1]
+        binary = cv2.morphologyEx(binary, cv2.MORPH_OPEN, np.ones((2, 2), np.uint8))
+        ink = binary > 0
+
+        if angle:
+            # Same rotation as correct_skew, applied to a blank mask with zero borders
+            M = cv2.getRotationMatrix2D((w // 2, h // 3), angle, 1.0)
+            covered = cv2.warpAffine(np.full((h, w), 255, np.uint8), M, (w, h), flags=cv2.INTER_NEAREST,
+                                     borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+            # Cubic interpolation blends a few pixels of border into the page edge
+            ink &= cv2.erode(covered, np.ones((5, 5), np.uint8)) > 0
+
+        bar_rows = np.count_nonzero(ink, axis=1) > w / 2
+        bar_cols = np.count_nonzero(ink, axis=0) > h / 2
+        ink[bar_rows, :] = False
+        ink[:, bar_cols] = False
+
+        rows = np.flatnonzero(np.count_nonzero(ink, axis=1) >= max(2, w // 500))
+        cols = np.flatnonzero(np.count_nonzero(ink, axis=0) >= max(2, h // 500))
+        if len(rows) == 0 or len(cols) == 0:
+            return image, (0, 0, w, h)
+
+        top, bottom = max(rows[0] - margin, 0), min(rows[-1] + margin + 1, h)
+        left, right = max(cols[0] - margin, 0), min(cols[-1] + margin + 1, w)
+        return image[top:bottom, left:right], (int(left), int(top), int(right - left), int(bottom - top))
+
+    def preprocess_image(self, image):
+        """
+        Run the full preprocessing (blur, resize, deskew, crop) on an in-memory BGR image array.
+        Pages are only resized with `resize` (not with adaptive DPI) and cropped with `crop_to_content`.
+
+        Returns:
+        - (float, np.ndarray, PageSignature): Skew angle applied, the preprocessed grayscale image and
+          the page signature (ink statistics and perceptual hash) of the blank and duplicate page filters
+        """
+        config = self.image_processing_config
+        blur_kernel_size = config.blur_kernel_size
+        target_size = config.target_size if config.resize else None
+
+        if target_size is None:
+            preprocessed_image = cv2.GaussianBlur(image, blur_kernel_size, 0)
+        else:
+            preprocessed_image = self.blur_and_resize_image(image, blur_kernel_size, target_size)
+        gray = cv2.cvtColor(preprocessed_image, cv2.COLOR_BGR2GRAY)
+        angle, preprocessed_image, binary = self.deocument_image_rotation(gray, return_binary=True)
+
+        if config.crop_to_content:
+            page_pixels = preprocessed_image.size
+            preprocessed_image, box = self.crop_to_content(preprocessed_image, config.crop_margin, angle)
+            logger.debug(f"Page cropped to {box}, {preprocessed_image.size / page_pixels:.0%} of its pixels")
+
+        logger.info(f"Angle of preprocessed images: {angle}")
+        return angle, preprocessed_image, self.page_signature(gray, binary, preprocessed_image)
+
+    @timed("page_signature")
+    def page_signature(self, gray, binary, preprocessed_image):
+        return page_signature(gray, binary, preprocessed_image)
+
+    def page_cache_key(self, source_digest):
+        """
+        Cache key of a preprocessed page: source image bytes and every setting that changes the output
+        """
+        config = self.image_processing_config
+        return PageCache.make_key("preprocessed_images", source_digest, config.blur_kernel_size, config.target_size,
+                                  config.delta, config.limit, config.precision, config.skew_engine, config.resize,
+                                  config.crop_to_content, config.crop_margin)
+
+    def preprocess_page(self, task):
+        """
+        Worker entry point: preprocess one (image_path, output_subfolder) task and write it as a JPG page
+
+        Returns:
+        - (float, PageSignature): Skew angle applied to the page, None when the page was restored from the
+          page cache, and the page signature (None if it is not cached with the page)
+        """
+        image_path, output_subfolder = task
+        preprocessed_image_filename = os.path.splitext(os.path.basename(image_path))[0] + ".jpg"
+        preprocessed_image_path = os.path.join(output_subfolder, preprocessed_image_filename)
+
+        image_bytes = self.page_storage.read(image_path)
+
+        if self.page_cache is not None:
+            cache_key = self.page_cache_key(bytes_digest(image_bytes))
+            data = self.page_cache.get("preprocessed_images", cache_key)
+            if data is not None:
+                self.page_storage.write(preprocessed_image_path, data)
+                signature = self.page_cache.get("page_signatures", cache_key)
+                return None, signature_from_bytes(signature) if signature is not None else None
+
+        image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError(f"Could not load image: {image_path}")
+        angle, preprocessed_image, signature = self.preprocess_image(image)
+
+        success, encoded_image = cv2.imencode(".jpg", preprocessed_image)
+        if not success:
+            raise ValueError(f"Failed to write image: {preprocessed_image_filename}")
+        self.page_storage.write(preprocessed_image_path, encoded_image, {"angle": float(angle)})
+
+        if self.page_cache is not None:
+            self.page_cache.put("preprocessed_images", cache_key, encoded_image.tobytes())
+            self.page_cache.put("page_signatures", cache_key, signature_to_bytes(signature))
+
+        return float(angle), signature
+
     def get_preprocessed_images(self)->ImagePreProcessingArtifact:
         """
         Main fucntion of image preprocessing pipeline that preprocessed and stores image
@@ -145,39 +398,65 @@ class ImagePreProcessing:
             # get config
             input_folder = data_ingestion_artifact.pdf_output_folder
             output_folder = self.image_processing_config.output_folder
-            blur_kernel_size = self.image_processing_config.blur_kernel_size
-            target_size = self.image_processing_config.target_size
+            workers = self.image_processing_config.workers
 
             logger.info(f"Image preprocessing started, \n\tinput_folder: {input_folder}, \n\toutput_folder: {output_folder}")
 
             # Ensure the output folder exists
             os.makedirs(output_folder, exist_ok=True)
 
-            pdf_image_folders = os.listdir(input_folder)
+            pdf_image_folders = sorted(os.listdir(input_folder))
+            journal = get_run_journal()
 
+            tasks = []
             for pdf_image_folder in pdf_image_folders:
                 output_subfolder = os.path.join(output_folder, pdf_image_folder)
                 os.makedirs(output_subfolder, exist_ok=True)
 
-                image_paths = glob(os.path.join(input_folder, pdf_image_folder)+'\\*.png')
-
-                for image_path in image_paths:
-                    preprocessed_image = self.preprocess_and_resize_image(image_path, blur_kernel_size, target_size)
-                    angle, preprocessed_image = self.deocument_image_rotation(preprocessed_image)
+                image_paths = self.page_storage.list_pages(os.path.join(input_folder, pdf_image_folder), ".png")
+                if journal is not None:
+                    # Pages preprocessed in an earlier run, or quarantined, are left out
+                    pages = {image_page(image_path)[1]: image_path for image_path in image_paths}
+                    pages_to_run, _ = journal.pages_to_run(
+                        pdf_image_folder, sorted(pages), PREPROCESSED,
+                        lambda page_no: [os.path.join(output_subfolder, f"{pdf_image_folder}_page_{page_no}.jpg")])
+                    image_paths = [pages[page_no] for page_no in pages_to_run]
+                tasks.extend((image_path, output_subfolder) for image_path in image_paths)
 
-                    logger.info(f"Angle of preprocessed images: {angle}")
-
-                    preprocessed_image_filename = image_path.split("\\")[-1].split(".png")[0] + ".jpg"
-                    success = cv2.imwrite(os.path.join(output_subfolder, preprocessed_image_filename), preprocessed_image)
-                    if not success:
-                        raise ValueError(f"Failed to write image: {preprocessed_image_filename}")
+            # Preprocess every page across the worker pool, gathering errors per page
+            failed_pages = []
+            cached_pages = 0
+            page_signatures = {}
+            on_result = None
+            if journal is not None:
+                # Pages are journaled as they are preprocessed
+                def on_result(task, result):
+                    journal.mark_files([task[0]], PREPROCESSED, "image_preprocessing")
+            outcomes = run_in_pool(self.preprocess_page, tasks, workers, stage="image_preprocessing", on_result=on_result,
+                                   **retry_arguments("image_preprocessing", lambda task: [image_page(task[0])]))
+            for (image_path, output_subfolder), result, error in outcomes:
+                if error is not None:
+                    logger.error(f"Failed to preprocess {image_path}: {error}")
+                    failed_pages.append(PageError("image_preprocessing", os.path.basename(output_subfolder),
+                                                  os.path.basename(image_path), error))
+                    continue
+                angle, signature = result
+                if angle is None:
+                    cached_pages += 1
+                if signature is not None:
+                    preprocessed_image_filename = os.path.splitext(os.path.basename(image_path))[0] + ".jpg"
+                    page_signatures[os.path.join(output_subfolder, preprocessed_image_filename)] = signature
+            add_counter("image_preprocessing", "cached_pages", cached_pages)
             
-            logger.info(f"Image preprocessing completed, output_folder: {output_folder}")
+            logger.info(f"Image preprocessing completed, output_folder: {output_folder}, "
+                        f"cached pages: {cached_pages}, failed pages: {len(failed_pages)}")
 
-            image_preprocessing_artifact = ImagePreProcessingArtifact(preprocessed_images_folder=output_folder)
+            image_preprocessing_artifact = ImagePreProcessingArtifact(preprocessed_images_folder=output_folder,
+                                                                      failed_pages=failed_pages,
+                                                                      native_text_folder=self.data_ingestion_artifact.native_text_folder,
+                                                                      page_signatures=page_signatures)
 
             return image_preprocessing_artifact
 
         except Exception as e:
             raise srcException(e, sys)                   
-
@@ -0,0 +1,312 @@
+import os
+import sys
+
+import cv2
+
+from src.components.document_ingestion import DocumentIngestion
+from src.components.image_preprocessing import ImagePreProcessing
+from src.components.image_ocr_transformation import ImageOCRTransformation
+from src.entity.artifact_entity import DataIngestionArtifact, ImagePreProcessingArtifact, ImageOCRTransformationArtifact, PageError
+from src.entity.config_entity import DataIngestionConfig, ImagePreProcessingConfig, ImageOCRTransformationConfig, PageCacheConfig
+from src.logger import get_logger
+logger = get_logger(__name__)
+from src.exception import srcException
+from src.utils.main_utils import run_in_pool, group_consecutive
+from src.utils.page_cache import file_digest
+from src.instrumentation import get_run_report
+from src.utils.run_journal import get_run_journal, OCR_DONE, QUARANTINED
+
+
+class InMemoryPageProcessing:
+    """
+    Fused ingestion, preprocessing and OCR: every page goes PDF -> ndarray -> preprocess -> OCR
+    in memory, without the PNG/JPG round-trips through the artifact folders.
+    Intermediate images are only written to disk when `persist_intermediate` is set.
+    """
+    def __init__(self, data_ingestion_config: DataIngestionConfig, image_processing_config: ImagePreProcessingConfig,
+                 image_ocr_transformation_config: ImageOCRTransformationConfig, persist_intermediate: bool = False,
+                 page_cache_config: PageCacheConfig = None):
+        try:
+            self.data_ingestion_config = data_ingestion_config
+            self.image_processing_config = image_processing_config
+            self.image_ocr_transformation_config = image_ocr_transformation_config
+            self.persist_intermediate = persist_intermediate
+            self.use_page_cache = page_cache_config is not None and page_cache_config.enabled
+
+            self.document_ingestion = DocumentIngestion(data_ingestion_config=data_ingestion_config)
+            self.image_preprocessing = ImagePreProcessing(
+                image_processing_config=image_processing_config,
+                data_ingestion_artifact=DataIngestionArtifact(pdf_output_folder=data_ingestion_config.pdf_output_folder))
+            self.image_ocr = ImageOCRTransformation(
+                image_ocr_transformation_config=image_ocr_transformation_config,
+                image_preprocessing_artifact=ImagePreProcessingArtifact(preprocessed_images_folder=image_processing_config.output_folder),
+                page_cache_config=page_cache_config)
+        except Exception as e:
+            raise srcException(e, sys)
+
+    def persist_image(self, page_storage, folder, file_name, image):
+        """
+        Write an intermediate page image for debugging, through the page storage of its stage
+        """
+        os.makedirs(folder, exist_ok=True)
+        success, encoded_image = cv2.imencode(os.path.splitext(file_name)[1], image)
+        if not success:
+            raise ValueError(f"Failed to write image: {file_name}")
+        page_storage.write(os.path.join(folder, file_name), encoded_image)
+
+    def page_digest(self, pdf_digest, page_no):
+        """
+        Digest of a preprocessed page, chained from the source PDF bytes, the page number and the
+        ingestion and preprocessing settings, so cached OCR texts can be found without rendering the page
+        """
+        return self.image_preprocessing.page_cache_key(self.document_ingestion.page_cache_key(pdf_digest, page_no))
+
+    def process_page(self, document, page_no, page, source_digest=None, pending=None):
+        """
+        Preprocess and OCR one rendered page in memory
+
+        Parameters:
+        - document (str): Document name, used for the output folders and file names
+        - page_no (int): 1-based page number
+        - page (PIL.Image): Page rendered by the ingestion stage
+        - source_digest (str): Page digest for the page cache, None disables the cache
+        - pending (list): When given, the page is added to this batch of pages instead of being OCR'd,
+          see flush_pages
+
+        Returns:
+        - str: "blank" or "duplicate" when the page skipped OCR (see ImageOCRTransformation.filter_page),
+          "ocr" otherwise
+        """
+        file_name = f"{document}_page_{page_no}"
+        image = self.document_ingestion.page_to_array(page)
+
+        if self.persist_intermediate:
+            self.persist_image(self.document_ingestion.page_storage,
+                               os.path.join(self.data_ingestion_config.pdf_output_folder, document),
+                               f"{file_name}.png", image)
+
+        angle, preprocessed_image, signature = self.image_preprocessing.preprocess_image(image)
+
+        if self.persist_intermediate:
+            self.persist_image(self.image_preprocessing.page_storage,
+                               os.path.join(self.image_processing_config.output_folder, document),
+                               f"{file_name}.jpg", preprocessed_image)
+
+        pyt_ocr_folder, pocr_ocr_folder = self.image_ocr.get_engine_folders(document)
+        skipped = self.image_ocr.filter_page(signature, file_name, pyt_ocr_folder, pocr_ocr_folder)
+        if skipped is not None:
+            return skipped
+        if pending is not None:
+            pending.append((preprocessed_image, file_name, pyt_ocr_folder, pocr_ocr_folder, source_digest))
+        else:
+            self.image_ocr.ocr_image(preprocessed_image, file_name, pyt_ocr_folder, pocr_ocr_folder, source_digest)
+        return "ocr"
+
+    def flush_pages(self, document, pending):
+        """
+        OCR a batch of preprocessed pages together and empty it
+
+        Returns:
+        - list: PageError of every page of the batch if it failed, empty otherwise
+        """
+        pages = pending[:]
+        pending.clear()
+        try:
+            self.image_ocr.ocr_images(pages)
+            return []
+        except Exception as e:
+            logger.error(f"In-memory OCR failed for {document} pages {pages[0][1]}..{pages[-1][1]}: {e}")
+            return [PageError("in_memory_processing", document, file_name.rsplit("_", 1)[-1], str(e))
+                    for _, file_name, *_ in pages]
+
+    def process_page_range(self, task):
+        """
+        Worker entry point: render, preprocess and OCR one (pdf_path, pdf_output_folder, first_page, last_page) task.
+        Errors are gathered per page so that one bad page does not lose the rest of the range.
+
+        Returns:
+        - dict: Number of pages processed, restored from the page cache, skipped as blank and reused as
+          duplicates, and the PageError records of the pages that failed
+        """
+        pdf_path, pdf_output_folder, first_page, last_page = task
+        popplar_path = self.data_ingestion_config.popplar_path
+        document = os.path.basename(os.path.normpath(pdf_output_folder))
+        failed_pages = []
+        pages_processed = 0
+        cached_pages = 0
+        skipped_pages = {"blank": 0, "duplicate": 0}
+
+        page_runs = [(first_page, last_page)]
+        page_digests = {}
+        if self.use_page_cache:
+            # Restore the pages whose OCR texts are cached and only render the missing runs of pages
+            pdf_digest = file_digest(pdf_path)
+            first_page = first_page or 1
+            if last_page is None:
+                last_page = self.document_ingestion.get_page_count(pdf_path, popplar_path)
+            pyt_ocr_folder, pocr_ocr_folder = self.image_ocr.get_engine_folders(document)
+
+            missing_pages = []
+            for page_no in range(first_page, last_page + 1):
+                page_digests[page_no] = self.page_digest(pdf_digest, page_no)
+                if not self.image_ocr.restore_cached_page(f"{document}_page_{page_no}", pyt_ocr_folder,
+                                                          pocr_ocr_folder, page_digests[page_no]):
+                    missing_pages.append(page_no)
+            page_runs = group_consecutive(missing_pages)
+            cached_pages = last_page - first_page + 1 - len(missing_pages)
+            logger.debug(f"{document}: {cached_pages} pages restored from the page cache")
+
+        # Preprocessed pages waiting to be OCR'd together (PaddleOCR recognizes their text lines in one batch)
+        batch_size = self.image_ocr.batch_size()
+        pending = []
+        for run_first_page, run_last_page in page_runs:
+            dpi = self.document_ingestion.get_render_dpi(pdf_path, run_first_page, run_last_page)
+            pages = self.document_ingestion.iter_pdf_pages(pdf_path, popplar_path,
+                                                           chunk_size=self.data_ingestion_config.chunk_size,
+                                                           dpi=dpi, first_page=run_first_page, last_page=run_last_page)
+            for page_no, page in pages:
+                try:
+                    outcome = self.process_page(document, page_no, page, page_digests.get(page_no),
+                                                pending if batch_size > 1 else None)
+                    pages_processed += 1
+                    if outcome in skipped_pages:
+                        skipped_pages[outcome] += 1
+                except Exception as e:
+                    logger.error(f"In-memory processing failed for {document} page {page_no}: {e}")
+                    failed_pages.append(PageError("in_memory_processing", document, str(page_no), str(e)))
+                if len(pending) >= batch_size:
+                    batch_errors = self.flush_pages(document, pending)
+                    pages_processed -= len(batch_errors)
+                    failed_pages.extend(batch_errors)
+        if pending:
+            batch_errors = self.flush_pages(document, pending)
+            pages_processed -= len(batch_errors)
+            failed_pages.extend(batch_errors)
+
+        return {"pages": pages_processed + cached_pages, "cached_pages": cached_pages,
+                "blank_pages": skipped_pages["blank"], "duplicate_pages": skipped_pages["duplicate"],
+                "failed_pages": failed_pages}
+
+    def process_single_page(self, task):
+        """
+        Worker entry point: process a single-page task (see process_page_range), raising the error of the page
+        """
+        range_result = self.process_page_range(task)
+        if range_result["failed_pages"]:
+            raise RuntimeError(range_result["failed_pages"][0].error)
+        return range_result
+
+    def journal_range(self, task, range_result):
+        """
+        run_in_pool on_result: journal the pages of a processed range as OCR'd, and the failed attempts of
+        the pages that failed
+        """
+        _, pdf_output_folder, first_page, last_page = task
+        document = os.path.basename(pdf_output_folder)
+        journal = get_run_journal()
+        failed = set()
+        for page_error in range_result["failed_pages"]:
+            failed.add(int(page_error.page))
+            journal.record_failure("in_memory_processing", document, int(page_error.page), page_error.error)
+        journal.mark_pages(document, [page_no for page_no in range(first_page, last_page + 1) if page_no not in failed],
+                           OCR_DONE, "in_memory_processing")
+
+    def retry_failed_pages(self, journal, outcomes, workers):
+        """
+        Run the pages that failed again one by one, retried with backoff until they are quarantined
+        (see DocumentIngestion.retry_pages)
+
+        Returns:
+        - list: (task, range_result, error) of the ranges without their retried pages, then of the retried pages
+        """
+        processed = []
+        failed_tasks = []
+        for task, range_result, error in outcomes:
+            pdf_path, pdf_output_folder, _, _ = task
+            if error is not None:
+                failed_tasks.append(task)
+                continue
+            page_states = journal.page_states(os.path.basename(pdf_output_folder))
+            # Quarantined pages stay failed, the others are retried
+            quarantined = [page_error for page_error in range_result["failed_pages"]
+                           if page_states[int(page_error.page)][0] == QUARANTINED]
+            failed_tasks.extend((pdf_path, pdf_output_folder, int(page_error.page), int(page_error.page))
+                                for page_error in range_result["failed_pages"] if page_error not in quarantined)
+            processed.append((task, dict(range_result, failed_pages=quarantined), None))
+
+        return processed + self.document_ingestion.retry_pages(self.process_single_page, failed_tasks, workers,
+                                                               "in_memory_processing", self.journal_range)
+
+    def process_multiple_pdfs(self) -> ImageOCRTransformationArtifact:
+        """
+        Run the fused stages over every PDF of the input folder
+        """
+        try:
+            pdf_folder = self.data_ingestion_config.pdf_folder
+            output_folder = self.image_ocr_transformation_config.ocr_output_folder
+            workers = self.data_ingestion_config.workers
+
+            logger.info(f"In-memory processing started, pdf_folder: {pdf_folder}, output_folder: {output_folder}, "
+                        f"persist_intermediate: {self.persist_intermediate}")
+
+            pdf_files = sorted(f for f in os.listdir(pdf_folder) if f.lower().endswith('pdf'))
+
+            tasks = []
+            failed_pages = []
+            for pdf_file in pdf_files:
+                pdf_path = os.path.join(pdf_folder, pdf_file)
+                document = os.path.splitext(pdf_file)[0]
+                pdf_output_folder = os.path.join(self.data_ingestion_config.pdf_output_folder, document)
+                try:
+                    # pages with a usable text layer are not rendered
+                    document_tasks, _ = self.document_ingestion.get_document_tasks(
+                        pdf_path, pdf_output_folder, "in_memory_processing", done_state=OCR_DONE,
+                        output_paths=lambda page_no: self.image_ocr.page_output_paths(document, page_no))
+                    tasks.extend(document_tasks)
+                except Exception as e:
+                    failed_pages.append(PageError("in_memory_processing", document, "all", str(e)))
+
+            # A page gets the CPUs left by the other pages in flight to OCR its regions
+            self.image_ocr.concurrent_pages = max(1, min(workers, len(tasks)))
+            pages = 0
+            cached_pages = 0
+            blank_pages = 0
+            duplicate_pages = 0
+            # With the run journal, the pages are journaled as their range is processed
+            journal = get_run_journal()
+            outcomes = run_in_pool(self.process_page_range, tasks, workers, stage="in_memory_processing",
+                                   on_result=self.journal_range if journal is not None else None)
+            if journal is not None:
+                outcomes = self.retry_failed_pages(journal, outcomes, workers)
+            for task, range_result, error in outcomes:
+                if error is not None:
+                    _, pdf_output_folder, first_page, last_page = task
+                    document = os.path.basename(pdf_output_folder)
+                    page_range = f"{first_page}-{last_page}" if first_page != last_page else str(first_page)
+                    logger.error(f"In-memory processing failed for {document} pages {page_range}: {error}")
+                    failed_pages.append(PageError("in_memory_processing", document,
+                                                  "all" if first_page is None else page_range, error))
+                    continue
+                pages += range_result["pages"]
+                cached_pages += range_result["cached_pages"]
+                blank_pages += range_result["blank_pages"]
+                duplicate_pages += range_result["duplicate_pages"]
+                failed_pages.extend(range_result["failed_pages"])
+
+            run_report = get_run_report()
+            if run_report is not None:
+                run_report.set_pages("in_memory_processing", pages)
+                run_report.add_counter("in_memory_processing", "cached_pages", cached_pages)
+                run_report.add_counter("in_memory_processing", "blank_pages", blank_pages)
+                run_report.add_counter("in_memory_processing", "duplicate_pages", duplicate_pages)
+                self.image_ocr.report_cascade("in_memory_processing")
+
+            logger.info(f"In-memory processing completed, output_folder: {output_folder}, blank pages skipped: "
+                        f"{blank_pages}, duplicate pages reused: {duplicate_pages}, failed pages: {len(failed_pages)}")
+            native_text_folder = (self.data_ingestion_config.native_text_folder
+                                  if self.data_ingestion_config.native_text_triage else None)
+            return ImageOCRTransformationArtifact(ocr_texts_folder=output_folder, failed_pages=failed_pages,
+                                                  native_text_folder=native_text_folder)
+
+        except Exception as e:
+            raise srcException(e, sys) from e
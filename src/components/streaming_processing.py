@@ -0,0 +1,446 @@
+import os
+import sys
+import time
+import asyncio
+from dataclasses import replace
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from src.components.document_ingestion import DocumentIngestion
+from src.components.image_preprocessing import ImagePreProcessing
+from src.components.image_ocr_transformation import ImageOCRTransformation
+from src.components.text_extraction import TextExtraction
+from src.entity.artifact_entity import (DataIngestionArtifact, ImagePreProcessingArtifact, ImageOCRTransformationArtifact,
+                                        PageError)
+from src.entity.config_entity import (DataIngestionConfig, ImagePreProcessingConfig, ImageOCRTransformationConfig,
+                                      TextExtractionConfig, StreamingConfig, PageCacheConfig)
+from src.logger import get_logger
+logger = get_logger(__name__)
+from src.exception import srcException
+from src.utils.main_utils import call_and_capture
+from src.instrumentation import record_task, get_run_report
+from src.utils.page_store import page_exists
+from src.utils.run_journal import get_run_journal, image_page, RASTERIZED, PREPROCESSED, OCR_DONE
+
+
+class StreamingPageProcessing:
+    """
+    Ingestion, preprocessing and OCR run at the same time as producers and consumers of pages: every stage
+    has its own worker pool, and bounded queues of page work items connect them. While the pages of a
+    document are OCR'd, the next document is rasterized and preprocessed, and as soon as every page of a
+    document is OCR'd its text is extracted. The wall time approaches the one of the slowest stage instead
+    of the sum of the stages, and the first documents are ready long before the last ones.
+
+    The stages read and write the same artifact folders as the stage by stage pipeline, a full queue makes
+    the stage before it wait so no more than `queue_size` pages pile up between two stages.
+    """
+    def __init__(self, data_ingestion_config: DataIngestionConfig, image_processing_config: ImagePreProcessingConfig,
+                 image_ocr_transformation_config: ImageOCRTransformationConfig,
+                 text_extraction_config: TextExtractionConfig, streaming_config: StreamingConfig = None,
+                 page_cache_config: PageCacheConfig = None):
+        try:
+            self.streaming_config = streaming_config or StreamingConfig()
+            self.data_ingestion_config = replace(data_ingestion_config,
+                                                 workers=self.streaming_config.ingestion_workers)
+            self.image_processing_config = replace(image_processing_config,
+                                                   workers=self.streaming_config.preprocessing_workers)
+            self.image_ocr_transformation_config = replace(image_ocr_transformation_config,
+                                                           workers=self.streaming_config.ocr_workers)
+            self.text_extraction_config = text_extraction_config
+            self.native_text_folder = (data_ingestion_config.native_text_folder
+                                       if data_ingestion_config.native_text_triage else None)
+
+            self.document_ingestion = DocumentIngestion(self.data_ingestion_config, page_cache_config)
+            self.image_preprocessing = ImagePreProcessing(
+                image_processing_config=self.image_processing_config,
+                data_ingestion_artifact=DataIngestionArtifact(pdf_output_folder=data_ingestion_config.pdf_output_folder),
+                page_cache_config=page_cache_config)
+            self.image_ocr = ImageOCRTransformation(
+                image_ocr_transformation_config=self.image_ocr_transformation_config,
+                image_preprocessing_artifact=ImagePreProcessingArtifact(
+                    preprocessed_images_folder=image_processing_config.output_folder),
+                page_cache_config=page_cache_config)
+            self.image_ocr.concurrent_pages = self.streaming_config.ocr_workers
+            self.text_extraction = TextExtraction(text_extraction_config, ImageOCRTransformationArtifact(
+                ocr_texts_folder=image_ocr_transformation_config.ocr_output_folder,
+                native_text_folder=self.native_text_folder))
+        except Exception as e:
+            raise srcException(e, sys)
+
+    def get_tasks(self):
+        """
+        Render tasks of every PDF of the input folder, in document order. Documents are always split in
+        `chunk_size` page ranges, so their first pages reach the next stages while the rest is rendered.
+
+        Returns:
+        - (list, list, list): Render tasks, documents and the PageError of the documents that could not be read
+        """
+        pdf_folder = self.data_ingestion_config.pdf_folder
+        tasks = []
+        documents = []
+        failed_pages = []
+        for pdf_file in sorted(f for f in os.listdir(pdf_folder) if f.lower().endswith('pdf')):
+            pdf_path = os.path.join(pdf_folder, pdf_file)
+            document = os.path.splitext(pdf_file)[0]
+            pdf_output_folder = os.path.join(self.data_ingestion_config.pdf_output_folder, document)
+            os.makedirs(pdf_output_folder, exist_ok=True)
+            try:
+                # pages with a usable text layer are not rasterized, nor pages OCR'd in an earlier run
+                document_tasks, _ = self.document_ingestion.get_document_tasks(
+                    pdf_path, pdf_output_folder, "data_ingestion", split=True, done_state=OCR_DONE,
+                    output_paths=lambda page_no: self.image_ocr.page_output_paths(document, page_no))
+                tasks.extend(document_tasks)
+                documents.append(document)
+            except Exception as e:
+                failed_pages.append(PageError("data_ingestion", document, "all", str(e)))
+        return tasks, documents, failed_pages
+
+    def get_page_images(self, task):
+        """
+        Page images written by a render task, in page order
+        """
+        _, pdf_output_folder, first_page, last_page = task
+        document = os.path.basename(pdf_output_folder)
+        if first_page is None:
+            return self.document_ingestion.page_storage.list_pages(pdf_output_folder, ".png")
+        image_paths = [os.path.join(pdf_output_folder, f"{document}_page_{page_no}.png")
+                       for page_no in range(first_page, last_page + 1)]
+        return [image_path for image_path in image_paths if page_exists(image_path)]
+
+    async def run_task(self, stage, func, task, pages=None):
+        """
+        Run one task on a stage's worker pool without blocking the event loop, recorded in the run report.
+        With the run journal, a task working on `pages`, a list of (document, page), is retried with
+        backoff when it fails, until its pages are quarantined.
+
+        Returns:
+        - (object, str): Result of func(task) and the error message, None on success
+        """
+        loop = asyncio.get_running_loop()
+        journal = self.journal
+        attempt = 0
+        while True:
+            pool = self.pools[stage]
+            try:
+                result, error, metrics = await loop.run_in_executor(pool, call_and_capture, func, task)
+            except Exception as e:
+                # The worker process itself died (e.g. killed by the OS)
+                result, error, metrics = None, str(e), None
+                if isinstance(e, BrokenProcessPool) and self.pools[stage] is pool:
+                    # which breaks the whole pool, the next tasks of the stage get a new one
+                    logger.warning(f"A {stage} worker died, restarting the worker pool of the stage")
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    self.pools[stage] = ProcessPoolExecutor(max_workers=self.pool_workers[stage])
+            record_task(stage, task, error, metrics)
+            if error is None or journal is None or not pages:
+                return result, error
+            if not all([journal.record_failure(stage, document, page, error) for document, page in pages]):
+                return result, error
+            attempt += 1
+            await asyncio.sleep(journal.backoff_seconds(attempt))
+
+    def add_pages(self, document, count):
+        """
+        Track the work items (render tasks and pages) of a document still in flight. When none is left,
+        the text of the document is extracted.
+        """
+        self.in_flight[document] += count
+        if self.in_flight[document] == 0:
+            self.text_jobs.append(asyncio.create_task(self.extract_document(document)))
+
+    async def ingest(self, inbox, outbox):
+        """
+        Ingestion consumer: render page ranges to PNG and queue their pages for preprocessing
+        """
+        while (task := await inbox.get()) is not None:
+            await self.ingest_task(task, outbox)
+
+    async def ingest_task(self, task, outbox):
+        """
+        Render one page range and queue its pages, page by page again when it fails with the run journal
+        """
+        _, pdf_output_folder, first_page, last_page = task
+        document = os.path.basename(pdf_output_folder)
+        journal = self.journal
+        pages = None if first_page is None or first_page != last_page else [(document, first_page)]
+        _, error = await self.run_task("data_ingestion", self.document_ingestion.render_page_range, task, pages)
+        if error is not None and journal is not None and first_page is not None and first_page != last_page:
+            # The pages of the range are rendered again one by one, so that a poison page only fails itself
+            logger.warning(f"Failed to render {document} pages {first_page}-{last_page}, retrying page by page: {error}")
+            self.add_pages(document, last_page - first_page + 1)
+            for page_no in range(first_page, last_page + 1):
+                await self.ingest_task((task[0], pdf_output_folder, page_no, page_no), outbox)
+            self.add_pages(document, -1)
+            return
+        if error is not None:
+            page_range = f"{first_page}-{last_page}" if first_page != last_page else str(first_page)
+            logger.error(f"Failed to render {document} pages {page_range}: {error}")
+            self.failed_pages.append(PageError("data_ingestion", document,
+                                               "all" if first_page is None else page_range, error))
+            self.add_pages(document, -1)
+            return
+
+        image_paths = self.get_page_images(task)
+        if journal is not None:
+            journal.mark_files(image_paths, RASTERIZED, "data_ingestion")
+        self.pages["data_ingestion"] += len(image_paths)
+        self.in_flight[document] += len(image_paths)
+        output_subfolder = os.path.join(self.image_processing_config.output_folder, document)
+        os.makedirs(output_subfolder, exist_ok=True)
+        for image_path in image_paths:
+            await outbox.put((image_path, output_subfolder))
+        self.add_pages(document, -1)
+
+    async def preprocess(self, inbox, outbox):
+        """
+        Preprocessing consumer: deskew and crop pages to JPG and queue them for OCR with their signature
+        """
+        while (task := await inbox.get()) is not None:
+            image_path, output_subfolder = task
+            document = os.path.basename(output_subfolder)
+            result, error = await self.run_task("image_preprocessing", self.image_preprocessing.preprocess_page, task,
+                                                [image_page(image_path)])
+            if error is not None:
+                logger.error(f"Failed to preprocess {image_path}: {error}")
+                self.failed_pages.append(PageError("image_preprocessing", document, os.path.basename(image_path), error))
+                self.add_pages(document, -1)
+                continue
+
+            self.pages["image_preprocessing"] += 1
+            if self.journal is not None:
+                self.journal.mark_files([image_path], PREPROCESSED, "image_preprocessing")
+            _, signature = result
+            pyt_ocr_folder, pocr_ocr_folder = self.image_ocr.get_engine_folders(document)
+            preprocessed_image_path = os.path.join(output_subfolder,
+                                                   os.path.splitext(os.path.basename(image_path))[0] + ".jpg")
+            await outbox.put(((preprocessed_image_path, pyt_ocr_folder, pocr_ocr_folder), signature))
+
+    def skip_page(self, task, signature):
+        """
+        Blank pages get empty texts, duplicates of a page already OCR'd get its texts and duplicates of
+        a page still being OCR'd wait for it (see ImageOCRTransformation.filter_page)
+
+        Returns:
+        - bool: True when the page must not be OCR'd now
+        """
+        image_path, pyt_ocr_folder, pocr_ocr_folder = task
+        if signature is None:
+            return False
+        file_name = os.path.splitext(os.path.basename(image_path))[0]
+        document = os.path.basename(os.path.dirname(image_path))
+
+        if self.image_ocr.is_blank_page(signature):
+            self.image_ocr.write_blank_page(file_name, pyt_ocr_folder, pocr_ocr_folder)
+            self.skipped_pages["blank"] += 1
+            self.mark_ocr_done(image_path)
+            self.add_pages(document, -1)
+            return True
+
+        original = self.image_ocr.find_duplicate(signature)
+        if original is not None:
+            if original["file_name"] in self.waiting_pages:
+                self.waiting_pages[original["file_name"]].append(task)
+                return True
+            try:
+                self.image_ocr.copy_page_texts(original, file_name, pyt_ocr_folder, pocr_ocr_folder)
+                self.skipped_pages["duplicate"] += 1
+                self.mark_ocr_done(image_path)
+                self.add_pages(document, -1)
+                return True
+            except OSError as e:
+                logger.debug(f"Could not reuse the OCR texts of {original['file_name']}: {e}")
+
+        self.image_ocr.index_page(signature, file_name, pyt_ocr_folder, pocr_ocr_folder)
+        self.waiting_pages[file_name] = []
+        return False
+
+    async def ocr(self, inbox):
+        """
+        OCR consumer: OCR the pages queued by preprocessing. The pages already waiting in the queue are
+        taken together, up to the PaddleOCR batch size.
+        """
+        batch_size = self.image_ocr.batch_size()
+        done = False
+        while not done:
+            batch = []
+            item = await inbox.get()
+            while item is not None:
+                task, signature = item
+                if not self.skip_page(task, signature):
+                    batch.append(task)
+                if len(batch) >= batch_size:
+                    break
+                if not batch:
+                    item = await inbox.get()
+                    continue
+                try:
+                    item = inbox.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+            done = item is None
+            if batch:
+                await self.ocr_batch(batch)
+
+    def mark_ocr_done(self, image_path):
+        if self.journal is not None:
+            self.journal.mark_files([image_path], OCR_DONE, "image_ocr")
+
+    async def ocr_batch(self, batch):
+        if len(batch) == 1:
+            engines, error = await self.run_task("image_ocr", self.image_ocr.ocr_page, batch[0], [image_page(batch[0][0])])
+            outcomes = [(batch[0], error)]
+        else:
+            _, error = await self.run_task("image_ocr", self.image_ocr.ocr_page_batch, batch)
+            if error is not None and self.journal is not None:
+                # The pages of the batch run again one by one, so that a poison page only fails itself
+                for task in batch:
+                    await self.ocr_batch([task])
+                return
+            outcomes = [(task, error) for task in batch]
+
+        for (image_path, pyt_ocr_folder, pocr_ocr_folder), error in outcomes:
+            file_name = os.path.splitext(os.path.basename(image_path))[0]
+            document = os.path.basename(os.path.dirname(image_path))
+            if error is not None:
+                logger.error(f"OCR failed for {image_path}: {error}")
+                self.failed_pages.append(PageError("image_ocr", document, os.path.basename(image_path), error))
+            else:
+                self.pages["image_ocr"] += 1
+                self.mark_ocr_done(image_path)
+
+            # The duplicates of the page reuse its texts, or are OCR'd themselves if it failed
+            retries = []
+            for duplicate in self.waiting_pages.pop(file_name, []):
+                duplicate_path, duplicate_pyt_folder, duplicate_pocr_folder = duplicate
+                try:
+                    original = {"file_name": file_name,
+                                "pyt": os.path.join(pyt_ocr_folder, f"{file_name}_pyt.txt") if pyt_ocr_folder else None,
+                                "pocr": os.path.join(pocr_ocr_folder, f"{file_name}_pocr.txt") if pocr_ocr_folder else None}
+                    self.image_ocr.copy_page_texts(original, os.path.splitext(os.path.basename(duplicate_path))[0],
+                                                   duplicate_pyt_folder, duplicate_pocr_folder)
+                    self.skipped_pages["duplicate"] += 1
+                    self.mark_ocr_done(duplicate_path)
+                    self.add_pages(os.path.basename(os.path.dirname(duplicate_path)), -1)
+                except OSError:
+                    retries.append(duplicate)
+            if retries:
+                await self.ocr_batch(retries)
+            self.add_pages(document, -1)
+
+    async def extract_document(self, document):
+        """
+        Merge the OCR texts of a document whose pages are all OCR'd into its page and document texts
+        """
+        input_dir = self.image_ocr_transformation_config.ocr_output_folder
+        output_dir = self.text_extraction_config.text_output_folder
+        text_extraction = self.text_extraction
+
+        def merge_document():
+            document_tasks = text_extraction.get_page_tasks(input_dir, output_dir, self.native_text_folder,
+                                                            documents=[document]).get(document, [])
+            os.makedirs(os.path.join(output_dir, document), exist_ok=True)
+            for task in document_tasks:
+                try:
+                    text_extraction.merge_page(task)
+                except Exception as e:
+                    # The text extraction stage of the pipeline merges the page again and reports it
+                    logger.warning(f"Text extraction failed for {task[-1]}: {e}")
+            text_extraction.write_document_text(output_dir, document, document_tasks)
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, merge_document)
+        elapsed = time.perf_counter() - self.start_time
+        if not self.ready_documents:
+            logger.info(f"First document ready after {elapsed:.2f}s: {document}")
+        self.ready_documents.append((document, round(elapsed, 3)))
+        logger.info(f"Document {document} ready after {elapsed:.2f}s")
+
+    async def stream(self, tasks, documents):
+        config = self.streaming_config
+        render_queue = asyncio.Queue()
+        preprocess_queue = asyncio.Queue(maxsize=config.queue_size)
+        ocr_queue = asyncio.Queue(maxsize=config.queue_size)
+
+        self.in_flight = {document: 0 for document in documents}
+        self.text_jobs = []
+        for task in tasks:
+            self.in_flight[os.path.basename(task[1])] += 1
+            render_queue.put_nowait(task)
+        for document in documents:
+            if self.in_flight[document] == 0:
+                # Every page of the document has a native text layer
+                self.add_pages(document, 0)
+
+        # (stage, consumers, consumer, inbox): the consumers of a stage stop on a None each, which the stage
+        # before sends once its own consumers are done
+        stages = [("data_ingestion", config.ingestion_workers, lambda: self.ingest(render_queue, preprocess_queue),
+                   render_queue),
+                  ("image_preprocessing", config.preprocessing_workers,
+                   lambda: self.preprocess(preprocess_queue, ocr_queue), preprocess_queue),
+                  ("image_ocr", config.ocr_workers, lambda: self.ocr(ocr_queue), ocr_queue)]
+        for _ in range(config.ingestion_workers):
+            render_queue.put_nowait(None)
+
+        async def run_stage(index):
+            stage, workers, consumer, _ = stages[index]
+            await asyncio.gather(*(consumer() for _ in range(workers)))
+            if index + 1 < len(stages):
+                _, next_workers, _, next_inbox = stages[index + 1]
+                for _ in range(next_workers):
+                    await next_inbox.put(None)
+            logger.info(f"Streaming stage {stage} done after {time.perf_counter() - self.start_time:.2f}s")
+
+        await asyncio.gather(*(run_stage(index) for index in range(len(stages))))
+        await asyncio.gather(*self.text_jobs)
+
+    def process_multiple_pdfs(self) -> ImageOCRTransformationArtifact:
+        """
+        Run ingestion, preprocessing and OCR as concurrent stages over every PDF of the input folder,
+        and extract the text of every document as soon as it is OCR'd
+        """
+        try:
+            config = self.streaming_config
+            output_folder = self.image_ocr_transformation_config.ocr_output_folder
+            logger.info(f"Streaming processing started, pdf_folder: {self.data_ingestion_config.pdf_folder}, "
+                        f"workers: ingestion {config.ingestion_workers}, preprocessing {config.preprocessing_workers}, "
+                        f"ocr {config.ocr_workers}, queue_size: {config.queue_size}")
+
+            self.start_time = time.perf_counter()
+            self.journal = get_run_journal()
+            tasks, documents, self.failed_pages = self.get_tasks()
+            self.pages = {"data_ingestion": 0, "image_preprocessing": 0, "image_ocr": 0}
+            self.skipped_pages = {"blank": 0, "duplicate": 0}
+            self.waiting_pages = {}
+            self.ready_documents = []
+
+            self.pool_workers = {"data_ingestion": config.ingestion_workers,
+                                 "image_preprocessing": config.preprocessing_workers,
+                                 "image_ocr": config.ocr_workers}
+            self.pools = {stage: ProcessPoolExecutor(max_workers=workers) for stage, workers in self.pool_workers.items()}
+            try:
+                asyncio.run(self.stream(tasks, documents))
+            finally:
+                for pool in self.pools.values():
+                    pool.shutdown(wait=True, cancel_futures=True)
+
+            run_report = get_run_report()
+            if run_report is not None:
+                for stage, pages in self.pages.items():
+                    run_report.set_pages(stage, pages)
+                run_report.set_pages("streaming_processing", self.pages["image_ocr"] + sum(self.skipped_pages.values()))
+                run_report.add_counter("streaming_processing", "blank_pages", self.skipped_pages["blank"])
+                run_report.add_counter("streaming_processing", "duplicate_pages", self.skipped_pages["duplicate"])
+                self.image_ocr.report_cascade("image_ocr")
+                if self.ready_documents:
+                    run_report.add_counter("streaming_processing", "first_document_seconds",
+                                           self.ready_documents[0][1])
+
+            logger.info(f"Streaming processing completed in {time.perf_counter() - self.start_time:.2f}s, "
+                        f"output_folder: {output_folder}, pages OCR'd: {self.pages['image_ocr']}, blank pages "
+                        f"skipped: {self.skipped_pages['blank']}, duplicate pages reused: "
+                        f"{self.skipped_pages['duplicate']}, failed pages: {len(self.failed_pages)}")
+            return ImageOCRTransformationArtifact(ocr_texts_folder=output_folder, failed_pages=self.failed_pages,
+                                                  native_text_folder=self.native_text_folder)
+
+        except Exception as e:
+            raise srcException(e, sys) from e
@@ -0,0 +1,159 @@
+import os
+import sys
+
+from src.entity.artifact_entity import TextExtractionArtifact, EmbeddingArtifact, PageError
+from src.entity.config_entity import EmbeddingConfig
+from src.logger import get_logger
+logger = get_logger(__name__)
+from src.exception import srcException
+from src.utils.main_utils import run_in_pool, read_page_chunks, list_page_files
+from src.utils.embedding_model import embed_texts
+from src.utils.vector_store import load_vector_store, write_vector_store, store_version
+from src.instrumentation import timed, add_counter, get_run_report
+
+
+class TextEmbedding:
+    """
+    Chunk the extracted page texts and embed the chunks into an on-disk vector store.
+    Only chunks whose text hash is not in the store yet are embedded, the vectors of the others are reused.
+    """
+    def __init__(self, embedding_config: EmbeddingConfig, text_extraction_artifact: TextExtractionArtifact):
+        try:
+            self.embedding_config = embedding_config
+            self.text_extraction_artifact = text_extraction_artifact
+        except Exception as e:
+            raise srcException(e, sys)
+
+    def get_page_chunks(self, document, page_file_path):
+        """
+        Chunk one page text file (see read_page_chunks)
+        """
+        return read_page_chunks(document, page_file_path, self.embedding_config.chunk_size,
+                                self.embedding_config.chunk_overlap)
+
+    def get_chunks(self):
+        """
+        Chunk every page of the text extraction output, "<text_output_folder>/<document>/<page>.txt"
+
+        Returns:
+        - (list, int, list): Metadata rows of all chunks in document and page order, number of pages read,
+          and the PageError records of the pages that could not be read
+        """
+        text_output_folder = self.text_extraction_artifact.text_output_folder
+        chunks = []
+        pages = 0
+        failed_pages = []
+        for document, page_file_path in list_page_files(text_output_folder):
+            try:
+                chunks.extend(self.get_page_chunks(document, page_file_path))
+                pages += 1
+            except Exception as e:
+                logger.error(f"Chunking failed for {page_file_path}: {e}")
+                failed_pages.append(PageError("embedding", document, os.path.basename(page_file_path), str(e)))
+        return chunks, pages, failed_pages
+
+    @timed("embedding")
+    def embed_batch(self, task):
+        """
+        Worker entry point: embed one ("batch", start, stop, texts) task with the warm model of the worker process
+        """
+        _, _, _, texts = task
+        return embed_texts(texts, self.embedding_config.model_name, self.embedding_config.device,
+                           self.embedding_config.batch_size, self.embedding_config.workers)
+
+    def embed_chunks(self) -> EmbeddingArtifact:
+        """
+        Chunk the extracted texts and update the vector store of `vector_store_folder`:
+        - a memory-mapped float16/float32 matrix with one L2-normalized embedding per chunk
+        - a metadata table (JSON lines) with the provenance of every chunk, in matrix order
+        - a manifest with the model, dimension, dtype and version of the store
+
+        Chunks are embedded in batches of `batch_size` spread across the worker pool. Vectors of chunks whose
+        text hash is already in the store (same model and dtype) are reused, so an unchanged corpus is not
+        re-embedded.
+
+        Returns:
+        - EmbeddingArtifact: Store folder and version, number of chunks and of newly embedded chunks,
+          and the pages that failed
+        """
+        try:
+            store_folder = self.embedding_config.vector_store_folder
+            model_name = self.embedding_config.model_name
+            dtype = self.embedding_config.dtype
+            batch_size = self.embedding_config.batch_size
+
+            logger.info(f"Embedding started, text_folder: {self.text_extraction_artifact.text_output_folder}, "
+                        f"vector_store_folder: {store_folder}, model: {model_name}")
+
+            chunks, pages, failed_pages = self.get_chunks()
+            run_report = get_run_report()
+            if run_report is not None:
+                run_report.set_pages("embedding", pages)
+
+            # Vectors of the current store can be reused when it was built with the same model and dtype
+            old_matrix, old_metadata, manifest = load_vector_store(store_folder)
+            old_rows = {}
+            if manifest.get("model") == model_name and manifest.get("dtype") == dtype:
+                old_rows = {row["hash"]: index for index, row in enumerate(old_metadata)}
+
+            if old_rows and store_version(model_name, dtype, chunks) == manifest["version"]:
+                logger.info(f"Vector store is up to date, version: {manifest['version']}, chunks: {len(chunks)}")
+                add_counter("embedding", "reused_chunks", len(chunks))
+                return EmbeddingArtifact(vector_store_folder=store_folder, version=manifest["version"],
+                                         chunks=len(chunks), embedded_chunks=0, failed_pages=failed_pages)
+
+            # Embed every distinct new text once
+            texts = {}
+            for chunk in chunks:
+                if chunk["hash"] not in old_rows:
+                    texts.setdefault(chunk["hash"], chunk["text"])
+            new_hashes = list(texts)
+            tasks = [("batch", start, min(start + batch_size, len(new_hashes)),
+                      tuple(texts[chunk_hash] for chunk_hash in new_hashes[start:start + batch_size]))
+                     for start in range(0, len(new_hashes), batch_size)]
+
+            new_rows = {}
+            failed_hashes = set()
+            for task, vectors, error in run_in_pool(self.embed_batch, tasks, self.embedding_config.workers,
+                                                    stage="embedding"):
+                _, start, stop, _ = task
+                if error is not None:
+                    logger.error(f"Embedding failed for chunks {start}-{stop}: {error}")
+                    failed_hashes.update(new_hashes[start:stop])
+                    continue
+                for row, chunk_hash in enumerate(new_hashes[start:stop]):
+                    new_rows[chunk_hash] = (vectors, row)
+
+            # Chunks whose batch failed are left out of the store and embedded again by the next run
+            metadata = []
+            row_sources = []
+            failed_page_names = set()
+            for chunk in chunks:
+                if chunk["hash"] in failed_hashes:
+                    if (chunk["document"], chunk["page_name"]) not in failed_page_names:
+                        failed_page_names.add((chunk["document"], chunk["page_name"]))
+                        failed_pages.append(PageError("embedding", chunk["document"], chunk["page_name"],
+                                                      "embedding batch failed"))
+                    continue
+                metadata.append(chunk)
+                row_sources.append(new_rows[chunk["hash"]] if chunk["hash"] in new_rows
+                                   else (old_matrix, old_rows[chunk["hash"]]))
+
+            if new_rows:
+                dimension = next(iter(new_rows.values()))[0].shape[1]
+            else:
+                dimension = manifest.get("dimension", 0)
+            manifest = write_vector_store(store_folder, metadata, dimension, dtype, model_name, row_sources)
+
+            embedded_chunks = sum(chunk["hash"] in new_rows for chunk in metadata)
+            add_counter("embedding", "embedded_chunks", embedded_chunks)
+            add_counter("embedding", "reused_chunks", len(metadata) - embedded_chunks)
+
+            logger.info(f"Embedding completed, vector_store_folder: {store_folder}, version: {manifest['version']}, "
+                        f"chunks: {len(metadata)}, embedded: {embedded_chunks}, failed pages: {len(failed_pages)}")
+            return EmbeddingArtifact(vector_store_folder=store_folder, version=manifest["version"],
+                                     chunks=len(metadata), embedded_chunks=embedded_chunks,
+                                     failed_pages=failed_pages)
+
+        except Exception as e:
+            raise srcException(e, sys) from e
@@ -1,13 +1,20 @@
 import os
 import sys
+import re
+import math
 import difflib # to match text sequences
 from glob import glob
 
-from src.entity.artifact_entity import ImageOCRTransformationArtifact
+from src.entity.artifact_entity import ImageOCRTransformationArtifact, TextExtractionArtifact, PageError
 from src.entity.config_entity import TextExtractionConfig
-from src.logger import logging
+from src.logger import get_logger
+logger = get_logger(__name__)
 from src.exception import srcException
-from src.utils.main_utils import read_files
+from src.utils.main_utils import read_files, write_text_file, is_up_to_date, natural_sort_key, run_in_pool
+from src.instrumentation import timed, add_counter
+
+# A token is a maximal run of non-whitespace characters, the same words str.split() produces
+TOKEN_PATTERN = re.compile(r"\S+")
 
 
 class TextExtraction:
@@ -42,43 +49,174 @@ class TextExtraction:
             file_content_1 = read_files(file_path_1)
             file_content_2 = read_files(file_path_2)
 
-            if not file_content_1 or not file_content_2:
-                return file_content_1 or file_content_2
-
-            final_text = file_content_1
+            return self.hybrid_text(file_content_1, file_content_2)
+        
+        except Exception as e:
+            raise srcException(e,sys) from e
 
-            # Split the contents of each file into words
-            words_in_file_1 = set(file_content_1.split())
-            words_in_file_2 = set(file_content_2.split())
+    def find_replacements(self, words_1, words_2, threshold=0.75):
+        """
+        Find, for every word of `words_1`, the word of `words_2` that should replace it:
+        a word at least as long with a difflib similarity ratio >= threshold.
 
-            # Find common words
-            common_words = words_in_file_1.intersection(words_in_file_2)
+        Instead of comparing every pair of words, candidates are looked up in a length index.
+        The ratio is 2*M / (len_1 + len_2) with M <= len_1, and len_2 >= len_1, so only words with
+        len_1 <= len_2 <= len_1 * (2 - threshold) / threshold can reach the threshold.
+        The surviving pairs go through difflib's cheap upper bound (quick_ratio) before the exact ratio.
 
-            # find unique words in each file
-            unique_words_in_file_1 = words_in_file_1 - common_words
-            unique_words_in_file_2 = words_in_file_2 - common_words
+        Parameters:
+        - words_1 (set): Words that may be replaced
+        - words_2 (set): Candidate replacement words
+        - threshold (float): Minimum similarity ratio in [0, 1]
 
-            # Iterate through unique words and perform replacement based on similarity
-            for word_in_file_1 in unique_words_in_file_1:
-                for word_in_file_2 in unique_words_in_file_2:
-                    # skip words containign digits
-                    if any(char.isdigit() for char in word_in_file_1) or any(char.isdigit() for char in word_in_file_2):
+        Returns:
+        - dict: word_1 -> replacement word_2, the most similar candidate (then the longest) wins
+        """
+        # skip words containign digits
+        words_1 = [word for word in words_1 if not any(char.isdigit() for char in word)]
+        words_2 = sorted(word for word in words_2 if not any(char.isdigit() for char in word))
+
+        words_1_by_length = {}
+        for word in words_1:
+            words_1_by_length.setdefault(len(word), []).append(word)
+
+        best_matches = {}
+        seq = difflib.SequenceMatcher(None)
+        for word_2 in words_2:
+            # SequenceMatcher caches its analysis of the second sequence, so it is set once per word_2
+            seq.set_seq2(word_2)
+            min_length = math.ceil(len(word_2) * threshold / (2 - threshold) - 1e-9)
+            for length in range(min_length, len(word_2) + 1):
+                for word_1 in words_1_by_length.get(length, ()):
+                    seq.set_seq1(word_1)
+                    if seq.quick_ratio() < threshold:
                         continue
-                    # Calculate similairty ration between words
-                    seq = difflib.SequenceMatcher(None, word_in_file_1, word_in_file_2)
-                    diff_ratio = seq.ratio() * 100
-
-                    # If similarity ratio is above 75%, perform replacement
-                    if diff_ratio >= 75.0:
-                        if len(word_in_file_2) >= len(word_in_file_1):
-                            final_text = final_text.replace(word_in_file_1, word_in_file_2)
-            
-            return final_text
-        
-        except Exception as e:
-            raise srcException(e,sys) from e
+                    diff_ratio = seq.ratio()
+                    if diff_ratio < threshold:
+                        continue
+                    best = best_matches.get(word_1)
+                    if best is None or (diff_ratio, len(word_2)) > (best[0], len(best[1])):
+                        best_matches[word_1] = (diff_ratio, word_2)
+
+        return {word_1: word_2 for word_1, (_, word_2) in best_matches.items()}
+
+    @timed("hybridization")
+    def hybrid_text(self, text_1, text_2):
+        """
+        Hybridize two OCR texts of the same page, using `text_1` as the base (see hybrid_txt).
+        All replacements are applied in a single pass over the tokens of `text_1`, so whole words are
+        replaced and substrings inside other words are left untouched.
+
+        Parameters:
+        - text_1 (str): Base OCR text
+        - text_2 (str): OCR text of the second engine
+
+        Return:
+        - str: The processed text
+        """
+        if not text_1 or not text_2:
+            return text_1 or text_2
+
+        # Split the contents of each text into words
+        words_in_text_1 = set(text_1.split())
+        words_in_text_2 = set(text_2.split())
+
+        # Find common words
+        common_words = words_in_text_1.intersection(words_in_text_2)
+
+        # find unique words in each text and match them by similarity
+        replacements = self.find_replacements(words_in_text_1 - common_words, words_in_text_2 - common_words,
+                                              self.text_extraction_config.similarity_threshold)
+        if not replacements:
+            return text_1
+
+        return TOKEN_PATTERN.sub(lambda match: replacements.get(match.group(0), match.group(0)), text_1)
     
-    def get_hybridized_result(self)-> None:
+    def merge_page(self, task):
+        """
+        Worker entry point: merge the OCR texts of one page and write the result.
+        The page is skipped when its output is newer than all of its inputs, which makes the stage resumable.
+
+        Parameters:
+        - task (tuple): (pyt_file_path, pocr_file_path, native_file_path, text_file_path), a missing output is None
+
+        Returns:
+        - bool: True when the page was (re)written, False when its output was already up to date
+        """
+        pyt_file_path, pocr_file_path, native_file_path, text_file_path = task
+        input_paths = [path for path in (pyt_file_path, pocr_file_path, native_file_path) if path is not None]
+
+        if is_up_to_date(text_file_path, input_paths):
+            return False
+
+        mode = self.text_extraction_config.mode
+        pyt_file_content = read_files(pyt_file_path) if pyt_file_path is not None else ""
+        pocr_file_content = read_files(pocr_file_path) if pocr_file_path is not None else ""
+
+        if native_file_path is not None and not (pyt_file_path or pocr_file_path):
+            # The page was not OCR'd, its native PDF text layer is the text
+            h_text = read_files(native_file_path)
+        elif mode == "hybrid":
+            # PaddleOCR output is the base, improved with the words recognized by Tesseract
+            h_text = self.hybrid_text(pocr_file_content, pyt_file_content)
+        elif "paddleocr" in mode.lower():
+            h_text = pocr_file_content
+        else:
+            # pytesseract, and cascade whose Tesseract text is already merged with the PaddleOCR readings
+            h_text = pyt_file_content
+
+        write_text_file(text_file_path, h_text)
+        return True
+
+    def get_page_tasks(self, input_dir, output_dir, native_text_dir=None, documents=None):
+        """
+        Pair the Tesseract and PaddleOCR text files of every page, and the native text of the pages
+        that skipped OCR because their PDF text layer was usable
+
+        Parameters:
+        - documents (list): Only pair the pages of these documents, every document of input_dir when None
+
+        Returns:
+        - dict: document -> list of (pyt_file_path, pocr_file_path, native_file_path, text_file_path) in page order
+        """
+        sources = [(os.path.join(input_dir, "PYTESSERACT"), "PYTESSERACT", "_pyt.txt"),
+                   (os.path.join(input_dir, "PADDLEOCR"), "PADDLEOCR", "_pocr.txt")]
+        if native_text_dir is not None:
+            sources.append((native_text_dir, "NATIVE", ".txt"))
+
+        pages = {}
+        for engine_root_dir, engine_folder, suffix in sources:
+            if not os.path.isdir(engine_root_dir):
+                continue
+            for document in (os.listdir(engine_root_dir) if documents is None else documents):
+                for file_path in glob(os.path.join(engine_root_dir, document, f"*{suffix}")):
+                    page_name = os.path.basename(file_path)[:-len(suffix)]
+                    pages.setdefault(document, {}).setdefault(page_name, {})[engine_folder] = file_path
+
+        page_tasks = {}
+        for document, document_pages in sorted(pages.items()):
+            page_tasks[document] = [
+                (engine_files.get("PYTESSERACT"), engine_files.get("PADDLEOCR"), engine_files.get("NATIVE"),
+                 os.path.join(output_dir, document, f"{page_name}.txt"))
+                for page_name, engine_files in sorted(document_pages.items(), key=lambda item: natural_sort_key(item[0]))
+            ]
+        return page_tasks
+
+    def write_document_text(self, output_dir, document, document_tasks):
+        """
+        Write "<output_dir>/<document>.txt", the page texts of the document concatenated in page order,
+        unless it is newer than all of them
+
+        Returns:
+        - str: Path of the document text file
+        """
+        text_file_paths = [text_file_path for *_, text_file_path in document_tasks if os.path.exists(text_file_path)]
+        document_file_path = os.path.join(output_dir, f"{document}.txt")
+        if not is_up_to_date(document_file_path, text_file_paths):
+            write_text_file(document_file_path, "\n".join(read_files(path) for path in text_file_paths))
+        return document_file_path
+
+    def get_hybridized_result(self)-> TextExtractionArtifact:
         """
         Generate Hybridized results for OCR output files
         The function takes OCR results from both PyTesseract and PaddleOCR engines and combines them into a single, 
@@ -86,77 +224,56 @@ class TextExtraction:
 
         - Expects an input directory containing two subdirectories - "PYTESSERACT" and "PADDLEOCR", 
         each with matching folder structures containing .txt files with OCR results.
-        -  For each PyTesseract text file, it looks for a corresponding PaddleOCR file by replacing "pyt" with "pocr" in the filename
-        - 
-
-
-        Parameters:
-        - input_dir (str): The input directory containing OCR output files
-        - output_dir (str): The output directory
-        - mode (str): The mode of oepration (default is "hybrid")
+        - Pages are paired by name ("<page>_pyt.txt" / "<page>_pocr.txt") and merged concurrently on the worker pool.
+          A page with only one engine output keeps that output.
+        - Pages that skipped OCR because of their native text layer ("<native_text_folder>/<document>/<page>.txt")
+          keep their native text.
+        - Writes "<output_dir>/<document>/<page>.txt" per page and "<output_dir>/<document>.txt", the pages of
+          the document concatenated in page order.
+        - Resumable: pages and documents whose output is newer than their inputs are skipped.
 
         Returns:
-        -None
+        - TextExtractionArtifact: Output folder and the pages that failed
 
         """
         try:
             input_dir = self.image_ocr_transformation_artifact.ocr_texts_folder
-
             output_dir = self.text_extraction_config.text_output_folder
             mode = self.text_extraction_config.mode
+            workers = self.text_extraction_config.workers
 
-            if mode == "hybrid":
-                pytesseract_root_dir = os.path.join(input_dir, "PYTESSERACT")
-                paddleocr_root_dir = os.path.join(input_dir, "PADDLEOCR")
-
-                result_folder = os.path.join(output_dir, input_dir.split("\\")[-1])
-
-                logger.info(f"result_folder: {result_folder}")
-
-                os.makedirs(result_folder, exist_ok= True)
-
-                logger.info(f"pytesseract_root_dir: {pytesseract_root_dir}")
-
-                for pytesseract_folder in os.listdir(pytesseract_root_dir):
-                    logger.info(f"pytesseract_folder: {pytesseract_folder}")
-                    if not os.path.isdir(os.path.join(pytesseract_root_dir, pytesseract_folder)):
-                        logger.error(f"No folders found Error: {os.path.join(pytesseract_root_dir, pytesseract_folder)}")
-                        continue
-
-                    pytesseract_folder_path = os.path.join(pytesseract_root_dir, pytesseract_folder)
-                    paddleocr_folder_path = os.path.join(paddleocr_root_dir, pytesseract_folder)
+            if mode not in ("hybrid", "pytesseract", "paddleocr", "cascade"):
+                logger.error(f"No other modes available right now")
+                raise srcException(f"No other modes available right now", sys)
 
-                    logger.info(f"pytesseract_folder_path: {pytesseract_folder_path}")
-                    logger.info(f"paddleocr_folder_path: {paddleocr_folder_path}")
+            logger.info(f"Text extraction started, mode: {mode}, input_dir: {input_dir}, output_dir: {output_dir}")
 
+            page_tasks = self.get_page_tasks(input_dir, output_dir,
+                                             self.image_ocr_transformation_artifact.native_text_folder)
+            for document in page_tasks:
+                os.makedirs(os.path.join(output_dir, document), exist_ok=True)
 
-                    pyt_file_paths = sorted(glob(os.path.join(pytesseract_folder_path, "*.txt")))
-                    pocr_file_paths = sorted(glob(os.path.join(paddleocr_folder_path, "*.txt")))
+            tasks = [task for document_tasks in page_tasks.values() for task in document_tasks]
+            failed_pages = []
+            written_pages = 0
+            for task, written, error in run_in_pool(self.merge_page, tasks, workers, stage="text_extraction"):
+                if error is not None:
+                    text_file_path = task[-1]
+                    logger.error(f"Text extraction failed for {text_file_path}: {error}")
+                    failed_pages.append(PageError("text_extraction", os.path.basename(os.path.dirname(text_file_path)),
+                                                  os.path.basename(text_file_path), error))
+                    continue
+                written_pages += written
+            add_counter("text_extraction", "up_to_date_pages", len(tasks) - written_pages - len(failed_pages))
 
-                    for pyt_file_path in pyt_file_paths:
-                        file_path_to_be_compared = os.path.join(paddleocr_folder_path, os.path.basename(pyt_file_path)).replace("pyt", "pocr")
+            # Concatenate the pages of every document
+            for document, document_tasks in page_tasks.items():
+                self.write_document_text(output_dir, document, document_tasks)
 
-                        if file_path_to_be_compared in pocr_file_paths:
-                            # read the contents
-                            pyt_file_content = read_files(pyt_file_path)
-                            pocr_file_content = read_files(file_path_to_be_compared)
+            logger.info(f"Text extraction completed, output_dir: {output_dir}, pages written: {written_pages}, "
+                        f"pages up to date: {len(tasks) - written_pages - len(failed_pages)}, failed pages: {len(failed_pages)}")
 
-                            # get hybridized text
-                            h_text = self.hybrid_txt(file_path_to_be_compared, pyt_file_path)
+            return TextExtractionArtifact(text_output_folder=output_dir, failed_pages=failed_pages)
 
-                            # Write results into text folder
-                            text_folder = os.path.join(result_folder, pytesseract_folder)
-                            os.makedirs(text_folder, exist_ok=True)
-                            # text_name = f"{os.path.join(result_folder, pytesseract_folder)}"
-                            text_file_path = text_folder.replace("_pyt", "")
-                            logger.info(f"text_file_path: {text_file_path}")
-                            text_file = open(text_file_path, "w")
-                            text_file.write(h_text)
-                            text_file.close()
-            else:
-                logger.error(f"No other modes available right now")
-                raise srcException(f"No other modes available right now", sys)
         except Exception as e:
             raise srcException(e,sys) from e
-
-
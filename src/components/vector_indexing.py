@@ -0,0 +1,47 @@
+import sys
+
+from src.entity.artifact_entity import EmbeddingArtifact, VectorIndexArtifact
+from src.entity.config_entity import VectorIndexConfig
+from src.logger import get_logger
+logger = get_logger(__name__)
+from src.exception import srcException
+from src.retrieval.vector_index import build_vector_index, read_index_description
+
+
+class VectorIndexing:
+    """
+    Build the retrieval index of the vector store written by the embedding stage
+    """
+    def __init__(self, vector_index_config: VectorIndexConfig, embedding_artifact: EmbeddingArtifact):
+        try:
+            self.vector_index_config = vector_index_config
+            self.embedding_artifact = embedding_artifact
+        except Exception as e:
+            raise srcException(e, sys)
+
+    def build_index(self) -> VectorIndexArtifact:
+        """
+        Build the index unless it is already built for the current store version
+
+        Returns:
+        - VectorIndexArtifact: Index folder, store version, index type and number of inverted lists
+        """
+        try:
+            config = self.vector_index_config
+            version = self.embedding_artifact.version
+            description = read_index_description(config.index_folder)
+            if (description is not None and description["store_version"] == version
+                    and description["index_type"] == config.index_type):
+                logger.info(f"Vector index is up to date, version: {version}")
+                return VectorIndexArtifact(index_folder=config.index_folder, version=version,
+                                           index_type=description["index_type"], n_lists=description["n_lists"])
+
+            logger.info(f"Vector indexing started, vector_store_folder: {self.embedding_artifact.vector_store_folder}, "
+                        f"index_folder: {config.index_folder}, index_type: {config.index_type}")
+            description = build_vector_index(self.embedding_artifact.vector_store_folder, config.index_folder,
+                                             config.index_type, config.n_lists, config.train_sample,
+                                             config.kmeans_iterations)
+            return VectorIndexArtifact(index_folder=config.index_folder, version=version,
+                                       index_type=config.index_type, n_lists=description["n_lists"])
+        except Exception as e:
+            raise srcException(e, sys) from e
@@ -7,17 +7,218 @@ ARTIFACT_DIR: str = "artifacts"
 PDF_FOLDER: str = "pdfs"
 PDF_OUTPUT_FOLDER: str = "pdf-outputs"
 POPPLAR_PATH = "D:\\Softwares\\Poppler\\poppler-24.08.0\\Library\\bin"
+PDF_DPI: int = 200
+INGESTION_STREAMING: bool = True
+INGESTION_CHUNK_SIZE: int = 4
+# Adaptive resolution: every rendered page gets the DPI that puts its text x-height at about
+# ADAPTIVE_DPI_TEXT_HEIGHT pixels (Tesseract accuracy drops below ~20 px, 10pt at 300 DPI), measured
+# on a low resolution preview, instead of the fixed PDF_DPI
+ADAPTIVE_DPI: bool = True
+ADAPTIVE_DPI_TEXT_HEIGHT: int = 20
+ADAPTIVE_DPI_MIN: int = 150
+ADAPTIVE_DPI_MAX: int = 400
+ADAPTIVE_DPI_PREVIEW: int = 150
+# Pixel budget of a rendered page, large formats get a lower DPI
+ADAPTIVE_DPI_MAX_PIXELS: int = 12_000_000
+# Native text layer triage: pages whose PDF text layer is usable skip rasterization, preprocessing and OCR
+NATIVE_TEXT_TRIAGE: bool = True
+NATIVE_TEXT_FOLDER: str = "native_texts"
+NATIVE_TEXT_MIN_CHARS: int = 50
+# Images covering less than this fraction of a page (logos, stamps, signatures) are ignored by the triage
+NATIVE_TEXT_MIN_IMAGE_AREA: float = 0.1
 
 # Image Preprocessing constants and hyperparameters
 PREPROCESSED_OUTPUT_FOLDER:str = "preprocessed_images"
 BLUR_KERNEL_SIZE: tuple = (1,1)
 RESIZE_TARGET_SIZE: tuple = (1600, 1200)
+# Adaptive DPI already renders pages at the resolution OCR needs, resizing would throw it away
+RESIZE_PAGES: bool = not ADAPTIVE_DPI
+# Only the ink bounding box (plus a margin in pixels) of a page is passed to OCR, not its blank margins
+CROP_TO_CONTENT: bool = True
+CROP_MARGIN: int = 20
 SKEW_DELTA: int = 1
 SKEW_LIMIT: int = 5
+SKEW_PRECISION: float = 1
+SKEW_ENGINE: str = "projection"
 
 # Image OCR Transformation constants and hyperparameters
 OCR_OUTPUT_FOLDER:str = "ocr_texts"
+# "pytesseract", "paddleocr", "hybrid" (both engines on every page, merged by text extraction) or "cascade"
+# (Tesseract reads every page with word confidences, only what it is unsure of is read again by PaddleOCR)
 OCR_MODE:str = "hybrid"
+# OEM 1 (LSTM) and PSM 3 (automatic page segmentation, no OSD)
+TESSERACT_CONFIG:str = r'--oem 1 --psm 3'
+TESSERACT_LANG:str = "eng"
+# "tesserocr" keeps a warm Tesseract engine per worker process (falls back to "pytesseract" when not installed)
+TESSERACT_BACKEND:str = "tesserocr"
+# Layout analysis: pages with columns are cut into text regions OCR'd one by one (in parallel threads)
+# and stitched in reading order; pages without columns keep the whole page TESSERACT_CONFIG segmentation
+LAYOUT_ANALYSIS: bool = True
+# Threads OCRing the regions of a page, 0 shares the CPUs among the pages OCR'd at the same time
+LAYOUT_REGION_WORKERS: int = 0
+# PSM 6 (uniform block of text) for a region, PSM 7 (single text line) for a region of one line
+LAYOUT_BLOCK_PSM: int = 6
+LAYOUT_LINE_PSM: int = 7
+# PaddleOCR runs on the CPU, its models are loaded once per worker process
+PADDLE_LANG: str = "en"
+# Pages whose text lines are recognized together, 1 OCRs page by page
+PADDLE_BATCH_SIZE: int = 8
+# Text lines per recognition forward pass
+PADDLE_REC_BATCH_NUM: int = 32
+# Pages are deskewed before OCR, upside down text lines are rare enough to skip the direction classifier
+PADDLE_USE_ANGLE_CLS: bool = False
+# Math library threads per worker process, 0 shares the CPUs among the worker processes
+PADDLE_CPU_THREADS: int = 0
+PADDLE_ENABLE_MKLDNN: bool = True
+# Recognized text lines less confident than this are dropped
+PADDLE_DROP_SCORE: float = 0.5
+# Cascade mode: runs of words on a line Tesseract reads with a confidence (0-100) below CASCADE_WORD_MIN_CONF
+# are read again by PaddleOCR; a page whose mean word confidence is below CASCADE_PAGE_MIN_CONF, or with more
+# than CASCADE_PAGE_MAX_LOW_FRACTION of low-confidence words, is read again whole. The more confident reading wins.
+CASCADE_WORD_MIN_CONF: float = 80
+CASCADE_PAGE_MIN_CONF: float = 60
+CASCADE_PAGE_MAX_LOW_FRACTION: float = 0.25
+# Blank pages (almost no ink, or "ink" barely darker than the paper: scanner noise) are not OCR'd
+SKIP_BLANK_PAGES: bool = True
+BLANK_PAGE_MAX_INK: float = 0.0005
+BLANK_PAGE_MIN_CONTRAST: float = 70
+# Near-duplicate pages (perceptual hashes within DUPLICATE_PAGE_MAX_DISTANCE of 256 bits, thumbnails within
+# DUPLICATE_PAGE_MAX_DIFFERENCE gray levels) reuse the OCR texts of the first page seen
+DEDUPLICATE_PAGES: bool = True
+DUPLICATE_PAGE_MAX_DISTANCE: int = 10
+DUPLICATE_PAGE_MAX_DIFFERENCE: float = 32
+# Pages remembered per process for the duplicate lookup
+PAGE_HASH_INDEX_SIZE: int = 1000
 
 # Text Extraction constants and hyperparameters
-TEXT_OUTPUT_FOLDER:str = "text_outputs"
\ No newline at end of file
+TEXT_OUTPUT_FOLDER:str = "text_outputs"
+HYBRID_SIMILARITY_THRESHOLD:float = 0.75
+
+# Pipeline constants
+PIPELINE_WORKERS: int = os.cpu_count() or 1
+# Fused mode hands pages PDF -> ndarray -> preprocess -> OCR in memory instead of through image folders
+PIPELINE_IN_MEMORY: bool = False
+PERSIST_INTERMEDIATE_IMAGES: bool = False
+# Streaming mode runs ingestion, preprocessing and OCR at the same time, connected by bounded queues of pages
+# (PIPELINE_IN_MEMORY takes precedence, it already runs the three stages back to back on every page)
+PIPELINE_STREAMING: bool = False
+# Distributed mode: the pipeline process coordinates, worker processes on any number of hosts (python worker.py)
+# pull page-level work units from a shared SQLite queue and write into the shared artifact tree
+# (PIPELINE_IN_MEMORY and PIPELINE_STREAMING take precedence)
+PIPELINE_DISTRIBUTED: bool = False
+
+# Streaming constants
+# Worker processes of every stage, the stages run at the same time so they share the CPUs
+STREAMING_INGESTION_WORKERS: int = max(1, PIPELINE_WORKERS // 4)
+STREAMING_PREPROCESSING_WORKERS: int = max(1, PIPELINE_WORKERS // 4)
+STREAMING_OCR_WORKERS: int = max(1, PIPELINE_WORKERS // 2)
+# Pages waiting between two stages: beyond it the stage upstream waits for the one downstream
+STREAMING_QUEUE_SIZE: int = 32
+
+# Distributed constants
+# The queue file must be on the filesystem all the hosts share with the artifact tree
+DISTRIBUTED_QUEUE_FILE: str = "work_queue.sqlite"
+# Worker processes the coordinator starts on its own host, 0 to only use workers started with worker.py
+DISTRIBUTED_LOCAL_WORKERS: int = PIPELINE_WORKERS
+DISTRIBUTED_PAGES_PER_UNIT: int = 4
+# A unit whose worker sent no heartbeat for DISTRIBUTED_LEASE_SECONDS is delivered to another worker
+DISTRIBUTED_LEASE_SECONDS: float = 120.0
+DISTRIBUTED_HEARTBEAT_SECONDS: float = 15.0
+DISTRIBUTED_MAX_ATTEMPTS: int = 3
+DISTRIBUTED_RETRY_BACKOFF: float = 2.0
+DISTRIBUTED_POLL_SECONDS: float = 1.0
+
+# Page cache constants
+PAGE_CACHE_ENABLED: bool = True
+PAGE_CACHE_FOLDER: str = "cache"
+PAGE_CACHE_MAX_BYTES: int = 10 * 1024**3
+
+# Page store constants
+# Page images are packed into one append-only "<document>.pages" file per document and stage folder
+# instead of one loose PNG/JPG file per page (pages of either layout are read back)
+PAGE_STORE_PACKED: bool = True
+
+# Run journal constants
+# SQLite journal of the state of every page across runs: an interrupted run resumes where it stopped, failed
+# pages are retried and a page failing JOURNAL_MAX_ATTEMPTS times is quarantined (delete the file to start over)
+JOURNAL_ENABLED: bool = True
+JOURNAL_FILE: str = "run_journal.sqlite"
+JOURNAL_MAX_ATTEMPTS: int = 3
+# Seconds before the first retry of a failed page, doubled at every retry
+JOURNAL_RETRY_BACKOFF: float = 2.0
+
+# Instrumentation constants
+REPORT_FOLDER: str = "reports"
+# Stages to profile, e.g. ("image_preprocessing",); profiler is "cprofile" or "pyinstrument"
+PROFILE_STAGES: tuple = ()
+PROFILER: str = "cprofile"
+RECORD_PAGE_METRICS: bool = True
+
+# Embedding constants and hyperparameters
+EMBEDDING_ENABLED: bool = True
+VECTOR_STORE_FOLDER: str = "vector_store"
+EMBEDDING_MODEL: str = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_DEVICE: str = "cpu"
+# Chunks per model.encode call (and per worker pool task)
+EMBEDDING_BATCH_SIZE: int = 256
+# Storage dtype of the embedding matrix, "float16" halves the store size
+EMBEDDING_DTYPE: str = "float16"
+# Characters per chunk and characters shared by consecutive chunks of a page
+TEXT_CHUNK_SIZE: int = 1000
+TEXT_CHUNK_OVERLAP: int = 200
+
+# Vector index constants and hyperparameters
+VECTOR_INDEX_ENABLED: bool = True
+VECTOR_INDEX_FOLDER: str = "vector_index"
+# "ivf" (inverted file, approximate) or "exact" (every query scans the whole matrix)
+VECTOR_INDEX_TYPE: str = "ivf"
+# Number of inverted lists, 0 picks about sqrt(number of chunks)
+IVF_LISTS: int = 0
+# Lists scanned per query: more lists trade latency for recall
+IVF_PROBES: int = 8
+IVF_TRAIN_SAMPLE: int = 100000
+IVF_KMEANS_ITERATIONS: int = 10
+# Searches over at most this many chunks (the whole store, or one filtered document) are exact
+EXACT_SEARCH_ROWS: int = 50000
+
+# BM25 index constants and hyperparameters
+BM25_ENABLED: bool = True
+BM25_INDEX_FOLDER: str = "bm25_index"
+BM25_K1: float = 1.2
+BM25_B: float = 0.75
+# Incremental updates add one segment each, segments are merged into one above this count
+BM25_MAX_SEGMENTS: int = 8
+# Rank constant of reciprocal rank fusion (hybrid BM25 + dense retrieval)
+RRF_K: int = 60
+# Results of each retriever fused by a hybrid search
+HYBRID_CANDIDATES: int = 50
+
+# Ingestion service constants
+SERVICE_HOST: str = "127.0.0.1"
+SERVICE_PORT: int = 8080
+SERVICE_FOLDER: str = "service"
+# Jobs waiting for a runner, uploads beyond it are refused with 429 until the queue drains
+SERVICE_QUEUE_SIZE: int = 16
+# Jobs processed at the same time, their page tasks share the worker pool
+SERVICE_CONCURRENT_JOBS: int = 2
+SERVICE_MAX_UPLOAD_MB: int = 100
+# Pages per worker task: single pages spread even a short document across every worker
+SERVICE_PAGES_PER_TASK: int = 1
+# Finished jobs whose status is kept in memory, the oldest are forgotten first
+SERVICE_JOB_HISTORY: int = 1000
+
+# Question answering (RAG) constants and hyperparameters
+# "stub" is a deterministic extractive stand-in, "transformers" runs QA_LLM_MODEL locally
+QA_LLM_BACKEND: str = "stub"
+QA_LLM_MODEL: str = "Qwen/Qwen2.5-0.5B-Instruct"
+QA_LLM_DEVICE: str = "cpu"
+QA_MAX_NEW_TOKENS: int = 256
+# Tokens of retrieved text given to the model with the question
+QA_CONTEXT_TOKENS: int = 2000
+QA_TOP_K: int = 8
+# Fuse dense and BM25 retrieval when the BM25 index is enabled
+QA_HYBRID: bool = True
+QA_EMBEDDING_CACHE_SIZE: int = 1024
+QA_ANSWER_CACHE_SIZE: int = 256
+# Queries the latency percentiles are computed over
+QA_METRICS_WINDOW: int = 1000
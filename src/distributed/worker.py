@@ -0,0 +1,292 @@
+"""
+Worker of the distributed mode: pulls page-level work units from the shared work queue of the pipeline
+run in progress, renders, preprocesses and OCRs their pages into the shared artifact tree, and reports
+back through the queue. Start any number of workers, on the coordinator host or on other hosts that
+mount the same artifact tree and run the same code; a worker that dies has its unit delivered again
+to another worker once its lease expires.
+
+Usage:
+    python worker.py [--queue artifacts/work_queue.sqlite] [--processes N] [--exit-when-idle]
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+import multiprocessing
+from dataclasses import replace
+
+from src.components.document_ingestion import DocumentIngestion
+from src.components.image_preprocessing import ImagePreProcessing
+from src.components.image_ocr_transformation import ImageOCRTransformation
+from src.entity.artifact_entity import DataIngestionArtifact, ImagePreProcessingArtifact
+from src.entity.config_entity import (DataIngestionConfig, ImagePreProcessingConfig, ImageOCRTransformationConfig,
+                                      DistributedConfig, PageCacheConfig)
+from src.logger import get_logger
+logger = get_logger(__name__)
+from src.exception import srcException
+from src.utils.main_utils import call_and_capture
+from src.utils.page_store import page_exists
+from src.utils.run_journal import image_page
+from src.utils.work_queue import WorkQueue, worker_name
+
+
+class PageUnitExecutor:
+    """
+    Runs one work unit, a (pdf_path, pdf_output_folder, first_page, last_page) page range, with the stage
+    components: DocumentIngestion renders the pages to PNG, ImagePreProcessing writes their JPG and
+    ImageOCRTransformation their OCR texts, in the same artifact folders (and page stores, see PageStorage)
+    as the stage by stage pipeline.
+    Errors are gathered per page so that one bad page does not fail the rest of the unit.
+    """
+    def __init__(self, data_ingestion_config, image_processing_config, image_ocr_transformation_config,
+                 page_cache_config=None):
+        try:
+            self.image_processing_config = image_processing_config
+            self.document_ingestion = DocumentIngestion(replace(data_ingestion_config, workers=1), page_cache_config)
+            self.image_preprocessing = ImagePreProcessing(
+                image_processing_config=replace(image_processing_config, workers=1),
+                data_ingestion_artifact=DataIngestionArtifact(pdf_output_folder=data_ingestion_config.pdf_output_folder),
+                page_cache_config=page_cache_config)
+            self.image_ocr = ImageOCRTransformation(
+                image_ocr_transformation_config=image_ocr_transformation_config,
+                image_preprocessing_artifact=ImagePreProcessingArtifact(
+                    preprocessed_images_folder=image_processing_config.output_folder),
+                page_cache_config=page_cache_config)
+        except Exception as e:
+            raise srcException(e, sys)
+
+    def render_pages(self, task, failed_pages):
+        """
+        Render the pages of a unit to PNG, page by page again when the range fails so that a poison
+        page only fails itself
+
+        Returns:
+        - list: Paths of the rendered page images, in page order
+        """
+        pdf_path, pdf_output_folder, first_page, last_page = task
+        os.makedirs(pdf_output_folder, exist_ok=True)
+        try:
+            self.document_ingestion.render_page_range(task)
+        except Exception as e:
+            if first_page == last_page:
+                raise
+            logger.warning(f"Failed to render {os.path.basename(pdf_output_folder)} pages {first_page}-{last_page}, "
+                           f"retrying page by page: {e}")
+            for page_no in range(first_page, last_page + 1):
+                try:
+                    self.document_ingestion.render_page_range((pdf_path, pdf_output_folder, page_no, page_no))
+                except Exception as page_error:
+                    failed_pages.append(["data_ingestion", page_no, str(page_error)])
+
+        document = os.path.basename(os.path.normpath(pdf_output_folder))
+        failed = {page_no for _, page_no, _ in failed_pages}
+        image_paths = [os.path.join(pdf_output_folder, f"{document}_page_{page_no}.png")
+                       for page_no in range(first_page, last_page + 1) if page_no not in failed]
+        return [image_path for image_path in image_paths if page_exists(image_path)]
+
+    def ocr_pages(self, tasks, failed_pages):
+        """
+        OCR preprocessed pages in batches of the OCR batch size, page by page again when a batch fails
+
+        Returns:
+        - list: Page numbers of the pages OCR'd
+        """
+        done_pages = []
+        batch_size = self.image_ocr.batch_size(len(tasks))
+        for start in range(0, len(tasks), batch_size):
+            batch = tasks[start:start + batch_size]
+            if len(batch) > 1:
+                try:
+                    self.image_ocr.ocr_page_batch(batch)
+                    done_pages.extend(image_page(task[0])[1] for task in batch)
+                    continue
+                except Exception as e:
+                    logger.warning(f"OCR failed for a batch of {len(batch)} pages, retrying page by page: {e}")
+            for task in batch:
+                try:
+                    self.image_ocr.ocr_page(task)
+                    done_pages.append(image_page(task[0])[1])
+                except Exception as e:
+                    failed_pages.append(["image_ocr", image_page(task[0])[1], str(e)])
+        return done_pages
+
+    def run_unit(self, unit):
+        """
+        Worker entry point: render, preprocess and OCR the pages of one WorkUnit
+
+        Returns:
+        - dict: Page numbers OCR'd (or skipped as blank or duplicate), number of blank and duplicate pages
+          and the [stage, page, error] of the pages that failed
+        """
+        document = unit.document
+        failed_pages = []
+        image_paths = self.render_pages(unit.task, failed_pages)
+
+        output_subfolder = os.path.join(self.image_processing_config.output_folder, document)
+        os.makedirs(output_subfolder, exist_ok=True)
+        pyt_ocr_folder, pocr_ocr_folder = self.image_ocr.get_engine_folders(document)
+        skipped_pages = {"blank": 0, "duplicate": 0}
+        done_pages = []
+        ocr_tasks = []
+        for image_path in image_paths:
+            page_no = image_page(image_path)[1]
+            try:
+                _, signature = self.image_preprocessing.preprocess_page((image_path, output_subfolder))
+            except Exception as e:
+                failed_pages.append(["image_preprocessing", page_no, str(e)])
+                continue
+
+            file_name = os.path.splitext(os.path.basename(image_path))[0]
+            # Duplicates are only found among the pages this worker has seen
+            outcome = (self.image_ocr.filter_page(signature, file_name, pyt_ocr_folder, pocr_ocr_folder)
+                       if signature is not None else None)
+            if outcome is not None:
+                skipped_pages[outcome] += 1
+                done_pages.append(page_no)
+            else:
+                ocr_tasks.append((os.path.join(output_subfolder, f"{file_name}.jpg"), pyt_ocr_folder, pocr_ocr_folder))
+
+        done_pages.extend(self.ocr_pages(ocr_tasks, failed_pages))
+        return {"pages": sorted(done_pages), "blank_pages": skipped_pages["blank"],
+                "duplicate_pages": skipped_pages["duplicate"], "failed_pages": failed_pages}
+
+
+class Heartbeat:
+    """
+    Background thread renewing the lease of the unit a worker is working on every `interval` seconds,
+    with its own connection to the queue (SQLite connections belong to the thread that opened them)
+    """
+    def __init__(self, queue_path, worker_id, unit_id, interval, lease_seconds):
+        self.queue_path = queue_path
+        self.worker_id = worker_id
+        self.unit_id = unit_id
+        self.interval = interval
+        self.lease_seconds = lease_seconds
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        queue = WorkQueue(self.queue_path, self.lease_seconds)
+        try:
+            while not self.stopped.wait(self.interval):
+                try:
+                    if not queue.heartbeat(self.worker_id, self.unit_id):
+                        # The unit went to another worker, whose outputs are the same as ours
+                        logger.warning(f"Worker {self.worker_id} lost the lease of unit {self.unit_id}")
+                except Exception as e:
+                    logger.warning(f"Heartbeat of worker {self.worker_id} failed: {e}")
+        finally:
+            queue.close()
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+
+def config_from_settings(config_class, values):
+    """
+    Config of a run rebuilt from the fields stored in the work queue; JSON turned its tuples into lists
+
+    Returns:
+    - object: Instance of config_class, None when the run had no such config
+    """
+    if values is None:
+        return None
+    return config_class(**{name: tuple(value) if isinstance(value, list) else value for name, value in values.items()})
+
+
+def run_worker(queue_path, run_id=None, exit_when_idle=False, poll_seconds=1.0):
+    """
+    Worker main loop: claim the units of the run in progress one at a time and run them with a
+    PageUnitExecutor built from the settings of the run, until stopped
+
+    Parameters:
+    - queue_path (str): Path of the shared work queue
+    - run_id (str): Only work on this run and stop when it is over (the local workers of a coordinator)
+    - exit_when_idle (bool): Stop when no run is in progress, instead of waiting for the next one
+    - poll_seconds (float): Wait between two looks at the queue when there is nothing to do
+
+    Returns:
+    - int: Number of units run
+    """
+    worker_id = worker_name()
+    queue = WorkQueue(queue_path)
+    executor = None
+    executor_run = None
+    units_done = 0
+    try:
+        while True:
+            current_run, settings = queue.current_run()
+            if run_id is not None and current_run != run_id:
+                break
+            if current_run is None:
+                if exit_when_idle:
+                    break
+                time.sleep(poll_seconds)
+                continue
+
+            if current_run != executor_run:
+                distributed_config = config_from_settings(DistributedConfig, settings["distributed"])
+                queue.lease_seconds = distributed_config.lease_seconds
+                queue.max_attempts = distributed_config.max_attempts
+                queue.retry_backoff = distributed_config.retry_backoff
+                executor = PageUnitExecutor(config_from_settings(DataIngestionConfig, settings["data_ingestion"]),
+                                            config_from_settings(ImagePreProcessingConfig, settings["image_preprocessing"]),
+                                            config_from_settings(ImageOCRTransformationConfig, settings["image_ocr"]),
+                                            config_from_settings(PageCacheConfig, settings["page_cache"]))
+                executor_run = current_run
+                queue.register_worker(worker_id, current_run)
+                logger.info(f"Worker {worker_id} joined run {current_run}")
+
+            unit = queue.claim(current_run, worker_id)
+            if unit is None:
+                queue.heartbeat(worker_id)
+                time.sleep(poll_seconds)
+                continue
+
+            with Heartbeat(queue_path, worker_id, unit.unit_id, distributed_config.heartbeat_seconds,
+                           distributed_config.lease_seconds):
+                result, error, metrics = call_and_capture(executor.run_unit, unit)
+            if error is None:
+                result["metrics"] = metrics
+                queue.complete(unit.unit_id, worker_id, result)
+                units_done += 1
+            else:
+                logger.error(f"Unit {unit.unit_id} ({unit.document}) failed on worker {worker_id}: {error}")
+                queue.fail(unit.unit_id, worker_id, error)
+    finally:
+        queue.close()
+    logger.info(f"Worker {worker_id} stopped after {units_done} units")
+    return units_done
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queue", default=DistributedConfig.queue_path)
+    parser.add_argument("--processes", type=int, default=1, help="Worker processes to start on this host")
+    parser.add_argument("--exit-when-idle", action="store_true", help="Stop when no pipeline run is in progress")
+    parser.add_argument("--poll-seconds", type=float, default=DistributedConfig.poll_seconds)
+    args = parser.parse_args()
+
+    worker_args = (args.queue, None, args.exit_when_idle, args.poll_seconds)
+    try:
+        if args.processes <= 1:
+            run_worker(*worker_args)
+            return 0
+        processes = [multiprocessing.Process(target=run_worker, args=worker_args) for _ in range(args.processes)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        logger.info("Workers stopped")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,17 +1,98 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+
+
+@dataclass
+class PageError:
+    stage:str
+    document:str
+    page:str
+    error:str
+
+
+@dataclass
+class OCRWord:
+    text:str
+    left:int
+    top:int
+    width:int
+    height:int
+    conf:float
+
+
+@dataclass
+class OCRPageResult:
+    text:str
+    words:list = field(default_factory=list)
 
 
 @dataclass
 class DataIngestionArtifact:
     pdf_output_folder:str
+    document_stats:list = field(default_factory=list)
+    failed_pages:list = field(default_factory=list)
+    native_text_folder:str = None
 
 
 @dataclass
 class ImagePreProcessingArtifact:
     preprocessed_images_folder:str
+    failed_pages:list = field(default_factory=list)
+    native_text_folder:str = None
+    # Preprocessed image path -> PageSignature, for the blank and duplicate page filters of the OCR stage
+    page_signatures:dict = field(default_factory=dict)
 
 
 @dataclass
 class ImageOCRTransformationArtifact:
     ocr_texts_folder:str
+    failed_pages:list = field(default_factory=list)
+    native_text_folder:str = None
+
+
+@dataclass
+class TextExtractionArtifact:
+    text_output_folder:str
+    failed_pages:list = field(default_factory=list)
+
 
+@dataclass
+class EmbeddingArtifact:
+    vector_store_folder:str
+    version:str
+    chunks:int
+    embedded_chunks:int
+    failed_pages:list = field(default_factory=list)
+
+
+@dataclass
+class VectorIndexArtifact:
+    index_folder:str
+    version:str
+    index_type:str
+    n_lists:int
+
+
+@dataclass
+class BM25IndexArtifact:
+    index_folder:str
+    version:str
+    chunks:int
+    indexed_pages:int
+    removed_pages:int
+
+
+@dataclass
+class PageSignature:
+    ink:float
+    contrast:float
+    phash:int
+    thumbnail:bytes
+
+
+@dataclass
+class TextRegion:
+    left:int
+    top:int
+    width:int
+    height:int
+    psm:int
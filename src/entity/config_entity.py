@@ -12,10 +12,58 @@ class PipelineConfig:
     # artifact_dir: str = os.path.join(pipeline_name,ARTIFACT_DIR)
     artifact_dir: str = ARTIFACT_DIR
     timestamp: str = TIMESTAMP
+    workers: int = PIPELINE_WORKERS
+    in_memory: bool = PIPELINE_IN_MEMORY
+    persist_intermediate: bool = PERSIST_INTERMEDIATE_IMAGES
+    streaming: bool = PIPELINE_STREAMING
+    distributed: bool = PIPELINE_DISTRIBUTED
 
 pipeline_config: PipelineConfig = PipelineConfig()
 
 
+@dataclass
+class PageCacheConfig:
+    enabled: bool = PAGE_CACHE_ENABLED
+    cache_folder: str = os.path.join(pipeline_config.artifact_dir, PAGE_CACHE_FOLDER)
+    max_bytes: int = PAGE_CACHE_MAX_BYTES
+
+
+@dataclass
+class StreamingConfig:
+    ingestion_workers: int = STREAMING_INGESTION_WORKERS
+    preprocessing_workers: int = STREAMING_PREPROCESSING_WORKERS
+    ocr_workers: int = STREAMING_OCR_WORKERS
+    queue_size: int = STREAMING_QUEUE_SIZE
+
+
+@dataclass
+class DistributedConfig:
+    queue_path: str = os.path.join(pipeline_config.artifact_dir, DISTRIBUTED_QUEUE_FILE)
+    local_workers: int = DISTRIBUTED_LOCAL_WORKERS
+    pages_per_unit: int = DISTRIBUTED_PAGES_PER_UNIT
+    lease_seconds: float = DISTRIBUTED_LEASE_SECONDS
+    heartbeat_seconds: float = DISTRIBUTED_HEARTBEAT_SECONDS
+    max_attempts: int = DISTRIBUTED_MAX_ATTEMPTS
+    retry_backoff: float = DISTRIBUTED_RETRY_BACKOFF
+    poll_seconds: float = DISTRIBUTED_POLL_SECONDS
+
+
+@dataclass
+class JournalConfig:
+    enabled: bool = JOURNAL_ENABLED
+    journal_path: str = os.path.join(pipeline_config.artifact_dir, JOURNAL_FILE)
+    max_attempts: int = JOURNAL_MAX_ATTEMPTS
+    retry_backoff: float = JOURNAL_RETRY_BACKOFF
+
+
+@dataclass
+class InstrumentationConfig:
+    report_folder: str = os.path.join(pipeline_config.artifact_dir, REPORT_FOLDER)
+    profile_stages: tuple = PROFILE_STAGES
+    profiler: str = PROFILER
+    record_pages: bool = RECORD_PAGE_METRICS
+
+
 
 @dataclass
 class DataIngestionConfig:
@@ -23,6 +71,21 @@ class DataIngestionConfig:
     pdf_output_folder: str = os.path.join(pipeline_config.artifact_dir, PDF_OUTPUT_FOLDER)
     # pdf_output_folder: str = PDF_OUTPUT_FOLDER
     popplar_path: str = POPPLAR_PATH
+    dpi: int = PDF_DPI
+    streaming: bool = INGESTION_STREAMING
+    chunk_size: int = INGESTION_CHUNK_SIZE
+    workers: int = pipeline_config.workers
+    native_text_triage: bool = NATIVE_TEXT_TRIAGE
+    native_text_folder: str = os.path.join(pipeline_config.artifact_dir, NATIVE_TEXT_FOLDER)
+    native_text_min_chars: int = NATIVE_TEXT_MIN_CHARS
+    native_text_min_image_area: float = NATIVE_TEXT_MIN_IMAGE_AREA
+    adaptive_dpi: bool = ADAPTIVE_DPI
+    target_text_height: int = ADAPTIVE_DPI_TEXT_HEIGHT
+    min_dpi: int = ADAPTIVE_DPI_MIN
+    max_dpi: int = ADAPTIVE_DPI_MAX
+    preview_dpi: int = ADAPTIVE_DPI_PREVIEW
+    max_page_pixels: int = ADAPTIVE_DPI_MAX_PIXELS
+    pack_pages: bool = PAGE_STORE_PACKED
 
 
 @dataclass
@@ -30,17 +93,116 @@ class ImagePreProcessingConfig:
     output_folder: str = os.path.join(pipeline_config.artifact_dir, PREPROCESSED_OUTPUT_FOLDER)
     blur_kernel_size: tuple = BLUR_KERNEL_SIZE
     target_size: tuple = RESIZE_TARGET_SIZE
+    resize: bool = RESIZE_PAGES
+    crop_to_content: bool = CROP_TO_CONTENT
+    crop_margin: int = CROP_MARGIN
     delta: int = SKEW_DELTA
     limit: int = SKEW_LIMIT
+    precision: float = SKEW_PRECISION
+    skew_engine: str = SKEW_ENGINE
+    workers: int = pipeline_config.workers
+    pack_pages: bool = PAGE_STORE_PACKED
 
 
 @dataclass
 class ImageOCRTransformationConfig:
     ocr_output_folder: str = os.path.join(pipeline_config.artifact_dir, OCR_OUTPUT_FOLDER)
     mode: str = OCR_MODE
+    tesseract_config: str = TESSERACT_CONFIG
+    tesseract_lang: str = TESSERACT_LANG
+    tesseract_backend: str = TESSERACT_BACKEND
+    layout_analysis: bool = LAYOUT_ANALYSIS
+    layout_region_workers: int = LAYOUT_REGION_WORKERS
+    layout_block_psm: int = LAYOUT_BLOCK_PSM
+    layout_line_psm: int = LAYOUT_LINE_PSM
+    paddle_lang: str = PADDLE_LANG
+    paddle_batch_size: int = PADDLE_BATCH_SIZE
+    paddle_rec_batch_num: int = PADDLE_REC_BATCH_NUM
+    paddle_use_angle_cls: bool = PADDLE_USE_ANGLE_CLS
+    paddle_cpu_threads: int = PADDLE_CPU_THREADS
+    paddle_enable_mkldnn: bool = PADDLE_ENABLE_MKLDNN
+    paddle_drop_score: float = PADDLE_DROP_SCORE
+    cascade_word_min_conf: float = CASCADE_WORD_MIN_CONF
+    cascade_page_min_conf: float = CASCADE_PAGE_MIN_CONF
+    cascade_page_max_low_fraction: float = CASCADE_PAGE_MAX_LOW_FRACTION
+    skip_blank_pages: bool = SKIP_BLANK_PAGES
+    blank_page_max_ink: float = BLANK_PAGE_MAX_INK
+    blank_page_min_contrast: float = BLANK_PAGE_MIN_CONTRAST
+    deduplicate_pages: bool = DEDUPLICATE_PAGES
+    duplicate_max_distance: int = DUPLICATE_PAGE_MAX_DISTANCE
+    duplicate_max_difference: float = DUPLICATE_PAGE_MAX_DIFFERENCE
+    page_hash_index_size: int = PAGE_HASH_INDEX_SIZE
+    workers: int = pipeline_config.workers
 
 
 @dataclass
 class TextExtractionConfig:
     text_output_folder: str = os.path.join(pipeline_config.artifact_dir, TEXT_OUTPUT_FOLDER)
-    mode: str = OCR_MODE
\ No newline at end of file
+    mode: str = OCR_MODE
+    similarity_threshold: float = HYBRID_SIMILARITY_THRESHOLD
+    workers: int = pipeline_config.workers
+
+
+@dataclass
+class EmbeddingConfig:
+    enabled: bool = EMBEDDING_ENABLED
+    vector_store_folder: str = os.path.join(pipeline_config.artifact_dir, VECTOR_STORE_FOLDER)
+    model_name: str = EMBEDDING_MODEL
+    device: str = EMBEDDING_DEVICE
+    batch_size: int = EMBEDDING_BATCH_SIZE
+    dtype: str = EMBEDDING_DTYPE
+    chunk_size: int = TEXT_CHUNK_SIZE
+    chunk_overlap: int = TEXT_CHUNK_OVERLAP
+    workers: int = pipeline_config.workers
+
+
+@dataclass
+class VectorIndexConfig:
+    enabled: bool = VECTOR_INDEX_ENABLED
+    index_folder: str = os.path.join(pipeline_config.artifact_dir, VECTOR_INDEX_FOLDER)
+    index_type: str = VECTOR_INDEX_TYPE
+    n_lists: int = IVF_LISTS
+    n_probe: int = IVF_PROBES
+    train_sample: int = IVF_TRAIN_SAMPLE
+    kmeans_iterations: int = IVF_KMEANS_ITERATIONS
+    exact_search_rows: int = EXACT_SEARCH_ROWS
+
+
+@dataclass
+class BM25IndexConfig:
+    enabled: bool = BM25_ENABLED
+    index_folder: str = os.path.join(pipeline_config.artifact_dir, BM25_INDEX_FOLDER)
+    chunk_size: int = TEXT_CHUNK_SIZE
+    chunk_overlap: int = TEXT_CHUNK_OVERLAP
+    k1: float = BM25_K1
+    b: float = BM25_B
+    max_segments: int = BM25_MAX_SEGMENTS
+    rrf_k: int = RRF_K
+    hybrid_candidates: int = HYBRID_CANDIDATES
+
+
+@dataclass
+class ServiceConfig:
+    host: str = SERVICE_HOST
+    port: int = SERVICE_PORT
+    service_folder: str = os.path.join(pipeline_config.artifact_dir, SERVICE_FOLDER)
+    workers: int = pipeline_config.workers
+    queue_size: int = SERVICE_QUEUE_SIZE
+    concurrent_jobs: int = SERVICE_CONCURRENT_JOBS
+    max_upload_mb: int = SERVICE_MAX_UPLOAD_MB
+    pages_per_task: int = SERVICE_PAGES_PER_TASK
+    job_history: int = SERVICE_JOB_HISTORY
+
+
+@dataclass
+class QAConfig:
+    llm_backend: str = QA_LLM_BACKEND
+    llm_model: str = QA_LLM_MODEL
+    llm_device: str = QA_LLM_DEVICE
+    max_new_tokens: int = QA_MAX_NEW_TOKENS
+    context_tokens: int = QA_CONTEXT_TOKENS
+    top_k: int = QA_TOP_K
+    hybrid: bool = QA_HYBRID
+    embedding_cache_size: int = QA_EMBEDDING_CACHE_SIZE
+    answer_cache_size: int = QA_ANSWER_CACHE_SIZE
+    metrics_window: int = QA_METRICS_WINDOW
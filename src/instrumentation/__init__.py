@@ -0,0 +1,371 @@
+# src/instrumentation/__init__.py
+
+import os
+import sys
+import json
+import time
+import cProfile
+import functools
+import contextlib
+from datetime import datetime
+
+from src.logger import get_logger
+logger = get_logger(__name__)
+
+
+def reset_peak_rss():
+    """
+    Reset the peak resident set size (high-water mark) of the current process, so that the next
+    call to get_peak_rss_mb reports the peak of the work done after the reset.
+    Only supported on Linux (writing "5" to /proc/self/clear_refs); a no-op elsewhere.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as file:
+            file.write("5")
+    except OSError:
+        pass
+
+
+def get_peak_rss_mb():
+    """
+    Return the peak resident set size of the current process in MB
+    Returns:
+        - float: Peak RSS in MB, or None when it cannot be determined on this platform
+    """
+    try:
+        with open("/proc/self/status", "r") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    try:
+        import resource
+        # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        pass
+
+    try:
+        import psutil
+        memory_info = psutil.Process().memory_info()
+        return getattr(memory_info, "peak_wset", memory_info.rss) / (1024 * 1024)
+    except ImportError:
+        return None
+
+def get_io_counters():
+    """
+    Return (bytes_read, bytes_written) by the read/write calls of the current process,
+    or None when it cannot be determined on this platform
+    """
+    try:
+        counters = {}
+        with open("/proc/self/io", "r") as file:
+            for line in file:
+                name, value = line.split(":")
+                counters[name] = int(value)
+        return counters["rchar"], counters["wchar"]
+    except (OSError, KeyError, ValueError):
+        pass
+
+    try:
+        import psutil
+        io_counters = psutil.Process().io_counters()
+        return (getattr(io_counters, "read_chars", io_counters.read_bytes),
+                getattr(io_counters, "write_chars", io_counters.write_bytes))
+    except (ImportError, AttributeError):
+        return None
+
+
+# Accumulated timings of the instrumented hot functions of this process: name -> {calls, wall, cpu}
+_FUNCTION_TIMINGS = {}
+
+# Counters added by the task measure_task is measuring in this process, None outside of a task
+_TASK_COUNTERS = None
+
+# Run report of the pipeline run in progress in this process, see start_run_report
+_RUN_REPORT = None
+
+
+def timed(name):
+    """
+    Decorator accumulating the call count, wall time and CPU time of a hot function under `name`.
+    The timings are collected per task by measure_task and per stage by RunReport.measure_stage.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            wall_start = time.perf_counter()
+            cpu_start = time.process_time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timing = _FUNCTION_TIMINGS.setdefault(name, {"calls": 0, "wall": 0.0, "cpu": 0.0})
+                timing["calls"] += 1
+                timing["wall"] += time.perf_counter() - wall_start
+                timing["cpu"] += time.process_time() - cpu_start
+        return wrapper
+    return decorator
+
+
+def merge_function_timings(target, timings):
+    for name, timing in timings.items():
+        total = target.setdefault(name, {"calls": 0, "wall": 0.0, "cpu": 0.0})
+        for key in total:
+            total[key] += timing[key]
+
+
+@contextlib.contextmanager
+def measure_task():
+    """
+    Measure one unit of work (usually one page) in the current process.
+    Yields a dict that is filled on exit with wall, cpu, bytes_read, bytes_written, peak_rss_mb,
+    the hot function timings and the counters (see add_counter) of the task.
+    """
+    global _FUNCTION_TIMINGS, _TASK_COUNTERS
+    metrics = {}
+    previous_timings, _FUNCTION_TIMINGS = _FUNCTION_TIMINGS, {}
+    previous_counters, _TASK_COUNTERS = _TASK_COUNTERS, {}
+    io_start = get_io_counters()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield metrics
+    finally:
+        io_end = get_io_counters()
+        metrics.update({
+            "wall": time.perf_counter() - wall_start,
+            "cpu": time.process_time() - cpu_start,
+            "bytes_read": io_end[0] - io_start[0] if io_start and io_end else None,
+            "bytes_written": io_end[1] - io_start[1] if io_start and io_end else None,
+            "peak_rss_mb": get_peak_rss_mb(),
+            "functions": _FUNCTION_TIMINGS,
+            "counters": _TASK_COUNTERS,
+        })
+        _FUNCTION_TIMINGS = previous_timings
+        _TASK_COUNTERS = previous_counters
+
+
+def describe_task(task):
+    """
+    Short label of a worker pool task for the run report, e.g. "doc.pdf:1-4" or "doc_page_1.jpg",
+    and "doc_page_1.jpg+7" for a batch (list) of 8 tasks
+    """
+    if isinstance(task, list) and task:
+        return f"{describe_task(task[0])}+{len(task) - 1}"
+    parts = task if isinstance(task, tuple) else (task,)
+    label = os.path.basename(str(parts[0]))
+    numbers = [str(part) for part in parts[1:] if isinstance(part, int)]
+    return f"{label}:{'-'.join(numbers)}" if numbers else label
+
+
+class RunReport:
+    """
+    Machine-readable report of a pipeline run: per-stage and per-page wall/CPU time, pages/sec,
+    bytes read/written, peak memory, hot function timings and stage counters
+    """
+    def __init__(self, run_id, profile_stages=(), profiler="cprofile", report_folder=None, record_pages=True):
+        self.run_id = run_id
+        self.profile_stages = tuple(profile_stages)
+        self.profiler = profiler
+        self.report_folder = report_folder
+        self.record_pages = record_pages
+        self.started_at = datetime.now().isoformat(timespec="seconds")
+        self.stages = {}
+
+    def stage(self, stage):
+        return self.stages.setdefault(stage, {
+            "wall": 0.0, "cpu": 0.0, "pages": None, "tasks": 0, "failed_tasks": 0, "pages_per_sec": None,
+            "bytes_read": 0, "bytes_written": 0, "peak_rss_mb": None, "worker_peak_rss_mb": None,
+            "functions": {}, "counters": {}, "page_records": [],
+        })
+
+    def record_task(self, stage, task, error, metrics):
+        stage_report = self.stage(stage)
+        stage_report["tasks"] += 1
+        stage_report["failed_tasks"] += error is not None
+        if metrics is None:
+            return
+
+        for key in ("bytes_read", "bytes_written"):
+            if metrics[key] is not None:
+                stage_report[key] += metrics[key]
+        if metrics["peak_rss_mb"] is not None:
+            stage_report["worker_peak_rss_mb"] = max(stage_report["worker_peak_rss_mb"] or 0, metrics["peak_rss_mb"])
+        merge_function_timings(stage_report["functions"], metrics["functions"])
+        for name, value in metrics.get("counters", {}).items():
+            self.add_counter(stage, name, value)
+
+        if self.record_pages:
+            stage_report["page_records"].append({
+                "task": describe_task(task),
+                "wall": round(metrics["wall"], 4),
+                "cpu": round(metrics["cpu"], 4),
+                "bytes_read": metrics["bytes_read"],
+                "bytes_written": metrics["bytes_written"],
+                "error": error,
+            })
+
+    def add_counter(self, stage, name, value=1):
+        counters = self.stage(stage)["counters"]
+        counters[name] = counters.get(name, 0) + value
+
+    def set_pages(self, stage, pages):
+        """
+        Override the page count of a stage, for stages whose tasks are page ranges rather than pages
+        """
+        self.stage(stage)["pages"] = pages
+
+    @contextlib.contextmanager
+    def measure_stage(self, stage):
+        """
+        Measure a whole stage in the current process, including the CPU time of the pool workers it reaped
+        """
+        global _FUNCTION_TIMINGS
+        stage_report = self.stage(stage)
+        profiler = self.start_profiler() if stage in self.profile_stages else None
+
+        previous_timings, _FUNCTION_TIMINGS = _FUNCTION_TIMINGS, {}
+        reset_peak_rss()
+        io_start = get_io_counters()
+        times_start = os.times()
+        wall_start = time.perf_counter()
+        try:
+            yield stage_report
+        finally:
+            times_end = os.times()
+            stage_report["wall"] += time.perf_counter() - wall_start
+            stage_report["cpu"] += sum(times_end[:4]) - sum(times_start[:4])
+            stage_report["peak_rss_mb"] = get_peak_rss_mb()
+
+            io_end = get_io_counters()
+            if not stage_report["page_records"] and io_start and io_end:
+                # No per-task metrics (nothing ran on the pool), use the counters of this process
+                stage_report["bytes_read"] += io_end[0] - io_start[0]
+                stage_report["bytes_written"] += io_end[1] - io_start[1]
+
+            merge_function_timings(stage_report["functions"], _FUNCTION_TIMINGS)
+            _FUNCTION_TIMINGS = previous_timings
+
+            if stage_report["pages"] is None:
+                stage_report["pages"] = stage_report["tasks"] - stage_report["failed_tasks"]
+            if stage_report["wall"] > 0:
+                stage_report["pages_per_sec"] = round(stage_report["pages"] / stage_report["wall"], 3)
+
+            if profiler is not None:
+                self.stop_profiler(profiler, stage)
+
+            logger.info(f"Stage {stage}: wall {stage_report['wall']:.2f}s, cpu {stage_report['cpu']:.2f}s, "
+                        f"pages {stage_report['pages']}, pages/sec {stage_report['pages_per_sec']}")
+
+    def start_profiler(self):
+        if self.profiler == "pyinstrument":
+            try:
+                from pyinstrument import Profiler
+                profiler = Profiler()
+                profiler.start()
+                return profiler
+            except ImportError:
+                logger.warning("pyinstrument is not installed, falling back to cProfile")
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def stop_profiler(self, profiler, stage):
+        """
+        Stop a stage profiler and save its output next to the run report.
+        Only the pipeline process is profiled: run the stage with workers=1 to profile the page work itself.
+        """
+        os.makedirs(self.report_folder, exist_ok=True)
+        if isinstance(profiler, cProfile.Profile):
+            profiler.disable()
+            profile_path = os.path.join(self.report_folder, f"profile_{self.run_id}_{stage}.prof")
+            profiler.dump_stats(profile_path)
+        else:
+            profiler.stop()
+            profile_path = os.path.join(self.report_folder, f"profile_{self.run_id}_{stage}.html")
+            with open(profile_path, "w", encoding="utf-8") as file:
+                file.write(profiler.output_html())
+        logger.info(f"Profile of stage {stage} written to {profile_path}")
+
+    def to_dict(self):
+        stages = {}
+        for stage, stage_report in self.stages.items():
+            stage_report = dict(stage_report)
+            for key in ("wall", "cpu"):
+                stage_report[key] = round(stage_report[key], 4)
+            stage_report["functions"] = {
+                name: {"calls": timing["calls"], "wall": round(timing["wall"], 4), "cpu": round(timing["cpu"], 4)}
+                for name, timing in stage_report["functions"].items()
+            }
+            stages[stage] = stage_report
+        return {
+            "run_id": self.run_id,
+            "started_at": self.started_at,
+            "wall": round(sum(stage_report["wall"] for stage_report in self.stages.values()), 4),
+            "stages": stages,
+        }
+
+    def write(self):
+        """
+        Write the report as JSON into the report folder
+
+        Returns:
+        - str: Path of the report file
+        """
+        os.makedirs(self.report_folder, exist_ok=True)
+        report_path = os.path.join(self.report_folder, f"run_report_{self.run_id}.json")
+        with open(report_path, "w", encoding="utf-8") as file:
+            json.dump(self.to_dict(), file, indent=2)
+        logger.info(f"Run report written to {report_path}")
+        return report_path
+
+
+def start_run_report(run_id, profile_stages=(), profiler="cprofile", report_folder=None, record_pages=True):
+    """
+    Start collecting the run report of a new pipeline run in this process
+    """
+    global _RUN_REPORT
+    _RUN_REPORT = RunReport(run_id, profile_stages, profiler, report_folder, record_pages)
+    return _RUN_REPORT
+
+
+def get_run_report():
+    return _RUN_REPORT
+
+
+def record_task(stage, task, error, metrics):
+    """
+    Record the metrics of a worker pool task in the current run report (no-op outside of a run)
+    """
+    if _RUN_REPORT is not None and stage is not None:
+        _RUN_REPORT.record_task(stage, task, error, metrics)
+
+
+def add_counter(stage, name, value=1):
+    """
+    Increment a counter of a stage in the current run report (no-op outside of a run). Inside a task
+    measured by measure_task, e.g. in a pool worker, the counter travels back with the metrics of the
+    task and is added to the stage that records the task instead.
+    """
+    if _TASK_COUNTERS is not None:
+        _TASK_COUNTERS[name] = _TASK_COUNTERS.get(name, 0) + value
+    elif _RUN_REPORT is not None:
+        _RUN_REPORT.add_counter(stage, name, value)
+
+
+def instrument_stage(stage):
+    """
+    Decorator measuring a pipeline stage method into the current run report
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            if _RUN_REPORT is None:
+                return method(*args, **kwargs)
+            with _RUN_REPORT.measure_stage(stage):
+                return method(*args, **kwargs)
+        return wrapper
+    return decorator
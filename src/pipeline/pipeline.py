@@ -5,6 +5,12 @@ from src.components.document_ingestion import DocumentIngestion
 from src.components.image_preprocessing import ImagePreProcessing
 from src.components.image_ocr_transformation import ImageOCRTransformation
 from src.components.text_extraction import TextExtraction
+from src.components.in_memory_processing import InMemoryPageProcessing
+from src.components.streaming_processing import StreamingPageProcessing
+from src.components.distributed_processing import DistributedPageProcessing
+from src.components.text_embedding import TextEmbedding
+from src.components.vector_indexing import VectorIndexing
+from src.components.bm25_indexing import BM25Indexing
 
 from src.entity.artifact_entity import *
 from src.entity.config_entity import *
@@ -12,21 +18,35 @@ from src.entity.config_entity import *
 from src.logger import get_logger
 logger = get_logger(__name__)
 from src.exception import srcException
+from src.utils.page_cache import PageCache
+from src.instrumentation import instrument_stage, start_run_report
+from src.utils.run_journal import open_run_journal, close_run_journal
 
 class pipeline:
     def __init__(self):
+        self.pipeline_config = pipeline_config
         self.data_ingestion_config = DataIngestionConfig()
         self.image_preprocessing_config = ImagePreProcessingConfig()
         self.image_ocr_transformation_config = ImageOCRTransformationConfig()
         self.text_extraction_config = TextExtractionConfig()
+        self.embedding_config = EmbeddingConfig()
+        self.vector_index_config = VectorIndexConfig()
+        self.bm25_index_config = BM25IndexConfig()
+        self.page_cache_config = PageCacheConfig()
+        self.streaming_config = StreamingConfig()
+        self.distributed_config = DistributedConfig()
+        self.journal_config = JournalConfig()
+        self.instrumentation_config = InstrumentationConfig()
 
+    @instrument_stage("data_ingestion")
     def start_data_ingestion(self) -> DataIngestionArtifact:
         """
         This method of Pipeline class is responsible for starting data ingestion component
         """
         try:
             logger.info("Entered the start_data_ingestion method of Pipeline class")
-            document_ingestion = DocumentIngestion(data_ingestion_config=self.data_ingestion_config)
+            document_ingestion = DocumentIngestion(data_ingestion_config=self.data_ingestion_config,
+                                                   page_cache_config=self.page_cache_config)
             data_ingestion_artifact = document_ingestion.process_multiple_pdfs()
             logger.info("Document Ingestion is complete")
             return data_ingestion_artifact
@@ -34,6 +54,7 @@ class pipeline:
             raise srcException(e, sys) from e
 
 
+    @instrument_stage("image_preprocessing")
     def start_image_preprocessing(self, data_ingestion_artifact: DataIngestionArtifact) -> ImagePreProcessingArtifact:
         """
         This method of Pipeline class is responsible for preprocessing images generated by pdf to images
@@ -41,7 +62,8 @@ class pipeline:
         try:
             logger.info("Entered the start_image_preprocessing method of Pipeline class")            
             image_preprocessing = ImagePreProcessing(data_ingestion_artifact=data_ingestion_artifact,
-                                                     image_processing_config=self.image_preprocessing_config)
+                                                     image_processing_config=self.image_preprocessing_config,
+                                                     page_cache_config=self.page_cache_config)
             image_preprocessing_artifact = image_preprocessing.get_preprocessed_images()
             logger.info("Image Preprocessing is complete")            
             return image_preprocessing_artifact
@@ -49,6 +71,7 @@ class pipeline:
             raise srcException(e, sys)
 
 
+    @instrument_stage("image_ocr")
     def start_image_ocr(self, image_preprocessing_artifact: ImagePreProcessingArtifact) -> ImageOCRTransformationArtifact:
         """
         This method of Pipeline class is responsible for generating text out of images by OCR
@@ -56,7 +79,8 @@ class pipeline:
         try:
             logger.info("Entered the start_image_ocr method of Pipeline class")            
             image_ocr = ImageOCRTransformation(image_preprocessing_artifact=image_preprocessing_artifact,
-                                            image_ocr_transformation_config=self.image_ocr_transformation_config)
+                                            image_ocr_transformation_config=self.image_ocr_transformation_config,
+                                            page_cache_config=self.page_cache_config)
             image_ocr_transformation_artifact = image_ocr.perform_ocr()
             logger.info("Image OCR is complete")            
             return image_ocr_transformation_artifact
@@ -65,30 +89,195 @@ class pipeline:
             raise srcException(e, sys)
 
 
-    # def start_text_extraction(self, image_ocr_transformation_artifact: ImageOCRTransformationArtifact) -> None:
-    #     """
-    #     This method of Pipeline class is responsible for extracting text out of OCR outputs
-    #     """
-    #     try:
-    #         logger.info("Entered the start_text_extraction method of Pipeline class")            
-    #         text_extraction = TextExtraction(image_ocr_transformation_artifact=image_ocr_transformation_artifact,
-    #                                         text_extraction_config=self.text_extraction_config)
-    #         text_extraction.get_hybridized_result()
-    #         logger.info("Text Extraction is complete")            
-    #         return image_ocr_transformation_artifact
-    #     except Exception as e:
-    #         raise srcException(e, sys)
+    @instrument_stage("in_memory_processing")
+    def start_in_memory_processing(self) -> ImageOCRTransformationArtifact:
+        """
+        This method of Pipeline class runs ingestion, preprocessing and OCR fused per page in memory
+        """
+        try:
+            logger.info("Entered the start_in_memory_processing method of Pipeline class")
+            in_memory_processing = InMemoryPageProcessing(data_ingestion_config=self.data_ingestion_config,
+                                                          image_processing_config=self.image_preprocessing_config,
+                                                          image_ocr_transformation_config=self.image_ocr_transformation_config,
+                                                          persist_intermediate=self.pipeline_config.persist_intermediate,
+                                                          page_cache_config=self.page_cache_config)
+            image_ocr_transformation_artifact = in_memory_processing.process_multiple_pdfs()
+            logger.info("In-memory processing is complete")
+            return image_ocr_transformation_artifact
+        except Exception as e:
+            raise srcException(e, sys)
+
+
+    @instrument_stage("streaming_processing")
+    def start_streaming_processing(self) -> ImageOCRTransformationArtifact:
+        """
+        This method of Pipeline class runs ingestion, preprocessing and OCR as concurrent stages connected by queues
+        """
+        try:
+            logger.info("Entered the start_streaming_processing method of Pipeline class")
+            streaming_processing = StreamingPageProcessing(data_ingestion_config=self.data_ingestion_config,
+                                                           image_processing_config=self.image_preprocessing_config,
+                                                           image_ocr_transformation_config=self.image_ocr_transformation_config,
+                                                           text_extraction_config=self.text_extraction_config,
+                                                           streaming_config=self.streaming_config,
+                                                           page_cache_config=self.page_cache_config)
+            image_ocr_transformation_artifact = streaming_processing.process_multiple_pdfs()
+            logger.info("Streaming processing is complete")
+            return image_ocr_transformation_artifact
+        except Exception as e:
+            raise srcException(e, sys)
+
+
+    @instrument_stage("distributed_processing")
+    def start_distributed_processing(self) -> ImageOCRTransformationArtifact:
+        """
+        This method of Pipeline class coordinates ingestion, preprocessing and OCR of page-level work units by worker processes
+        """
+        try:
+            logger.info("Entered the start_distributed_processing method of Pipeline class")
+            distributed_processing = DistributedPageProcessing(data_ingestion_config=self.data_ingestion_config,
+                                                               image_processing_config=self.image_preprocessing_config,
+                                                               image_ocr_transformation_config=self.image_ocr_transformation_config,
+                                                               distributed_config=self.distributed_config,
+                                                               page_cache_config=self.page_cache_config,
+                                                               run_id=self.pipeline_config.timestamp)
+            image_ocr_transformation_artifact = distributed_processing.process_multiple_pdfs()
+            logger.info("Distributed processing is complete")
+            return image_ocr_transformation_artifact
+        except Exception as e:
+            raise srcException(e, sys)
+
+
+    @instrument_stage("text_extraction")
+    def start_text_extraction(self, image_ocr_transformation_artifact: ImageOCRTransformationArtifact) -> TextExtractionArtifact:
+        """
+        This method of Pipeline class is responsible for extracting text out of OCR outputs
+        """
+        try:
+            logger.info("Entered the start_text_extraction method of Pipeline class")            
+            text_extraction = TextExtraction(image_ocr_transformation_artifact=image_ocr_transformation_artifact,
+                                            text_extraction_config=self.text_extraction_config)
+            text_extraction_artifact = text_extraction.get_hybridized_result()
+            logger.info("Text Extraction is complete")            
+            return text_extraction_artifact
+        except Exception as e:
+            raise srcException(e, sys)
+
+
+    @instrument_stage("embedding")
+    def start_embedding(self, text_extraction_artifact: TextExtractionArtifact) -> EmbeddingArtifact:
+        """
+        This method of Pipeline class is responsible for chunking the extracted text and embedding it into the vector store
+        """
+        try:
+            logger.info("Entered the start_embedding method of Pipeline class")
+            text_embedding = TextEmbedding(embedding_config=self.embedding_config,
+                                           text_extraction_artifact=text_extraction_artifact)
+            embedding_artifact = text_embedding.embed_chunks()
+            logger.info("Embedding is complete")
+            return embedding_artifact
+        except Exception as e:
+            raise srcException(e, sys)
+
+
+    @instrument_stage("vector_indexing")
+    def start_vector_indexing(self, embedding_artifact: EmbeddingArtifact) -> VectorIndexArtifact:
+        """
+        This method of Pipeline class is responsible for building the retrieval index of the vector store
+        """
+        try:
+            logger.info("Entered the start_vector_indexing method of Pipeline class")
+            vector_indexing = VectorIndexing(vector_index_config=self.vector_index_config,
+                                             embedding_artifact=embedding_artifact)
+            vector_index_artifact = vector_indexing.build_index()
+            logger.info("Vector indexing is complete")
+            return vector_index_artifact
+        except Exception as e:
+            raise srcException(e, sys)
+
+
+    @instrument_stage("bm25_indexing")
+    def start_bm25_indexing(self, text_extraction_artifact: TextExtractionArtifact) -> BM25IndexArtifact:
+        """
+        This method of Pipeline class is responsible for updating the BM25 keyword index of the extracted text
+        """
+        try:
+            logger.info("Entered the start_bm25_indexing method of Pipeline class")
+            bm25_indexing = BM25Indexing(bm25_index_config=self.bm25_index_config,
+                                         text_extraction_artifact=text_extraction_artifact)
+            bm25_index_artifact = bm25_indexing.build_index()
+            logger.info("BM25 indexing is complete")
+            return bm25_index_artifact
+        except Exception as e:
+            raise srcException(e, sys)
 
 
     def run_pipeline(self) -> None:
         """
         This method of Pipeline class is responsible for running complete pipeline
         """
+        run_report = start_run_report(run_id=self.pipeline_config.timestamp,
+                                      profile_stages=self.instrumentation_config.profile_stages,
+                                      profiler=self.instrumentation_config.profiler,
+                                      report_folder=self.instrumentation_config.report_folder,
+                                      record_pages=self.instrumentation_config.record_pages)
+        journal = None
+        if self.journal_config.enabled:
+            # Pages done in an earlier (e.g. interrupted) run are skipped, failed pages are retried
+            journal = open_run_journal(self.journal_config.journal_path, self.journal_config.max_attempts,
+                                       self.journal_config.retry_backoff)
+            journal.start_run(self.pipeline_config.timestamp)
         try:
-            data_ingestion_artifact = self.start_data_ingestion()
-            image_preprocessing_artifact = self.start_image_preprocessing(data_ingestion_artifact)
-            image_ocr_transformation_artifact = self.start_image_ocr(image_preprocessing_artifact)
-            
+            if self.pipeline_config.in_memory:
+                image_ocr_transformation_artifact = self.start_in_memory_processing()
+                failed_pages = list(image_ocr_transformation_artifact.failed_pages)
+            elif self.pipeline_config.streaming:
+                # The documents are already extracted one by one as they are OCR'd, text extraction
+                # below finds them up to date
+                image_ocr_transformation_artifact = self.start_streaming_processing()
+                failed_pages = list(image_ocr_transformation_artifact.failed_pages)
+            elif self.pipeline_config.distributed:
+                image_ocr_transformation_artifact = self.start_distributed_processing()
+                failed_pages = list(image_ocr_transformation_artifact.failed_pages)
+            else:
+                data_ingestion_artifact = self.start_data_ingestion()
+                image_preprocessing_artifact = self.start_image_preprocessing(data_ingestion_artifact)
+                image_ocr_transformation_artifact = self.start_image_ocr(image_preprocessing_artifact)
+
+                failed_pages = (data_ingestion_artifact.failed_pages + image_preprocessing_artifact.failed_pages
+                                + image_ocr_transformation_artifact.failed_pages)
+
+            text_extraction_artifact = self.start_text_extraction(image_ocr_transformation_artifact)
+            failed_pages += text_extraction_artifact.failed_pages
+
+            if self.bm25_index_config.enabled:
+                self.start_bm25_indexing(text_extraction_artifact)
+
+            if self.embedding_config.enabled:
+                embedding_artifact = self.start_embedding(text_extraction_artifact)
+                failed_pages += embedding_artifact.failed_pages
+
+                if self.vector_index_config.enabled:
+                    self.start_vector_indexing(embedding_artifact)
+
+            for page_error in failed_pages:
+                logger.error(f"Page failed: {page_error}")
+            if journal is not None:
+                for stage, document, page_no, error in journal.quarantined_pages():
+                    logger.error(f"Page quarantined: {PageError(stage, document, str(page_no), error)}")
+                logger.info(f"Run journal: {journal.summary()}")
+                journal.finish_run("completed")
+
+            if self.page_cache_config.enabled:
+                # Keep the page cache within its size budget
+                PageCache(self.page_cache_config.cache_folder, self.page_cache_config.max_bytes).evict()
+            logger.info(f"Pipeline completed with {len(failed_pages)} failed pages")
 
         except Exception as e:
-            raise srcException(e, sys)
\ No newline at end of file
+            if journal is not None:
+                journal.finish_run("failed")
+            raise srcException(e, sys)
+        finally:
+            # The report is also written when the run fails, with the stages completed so far
+            run_report.write()
+            close_run_journal()
@@ -0,0 +1,509 @@
+import os
+import sys
+import re
+import json
+import math
+import hashlib
+from collections import Counter
+
+import numpy as np
+
+from src.logger import get_logger
+logger = get_logger(__name__)
+from src.exception import srcException
+from src.utils.main_utils import write_text_file, list_page_files, read_page_chunks
+from src.utils.page_cache import file_digest
+from src.retrieval.vector_index import MetadataTable, top_k
+
+# The manifest lists the live segments and the indexed pages; replacing it is what switches readers
+# to a new state of the index. Segment files are never modified once written.
+MANIFEST_FILE = "manifest.json"
+
+WORD_PATTERN = re.compile(r"\w+")
+TOKEN_PATTERN = re.compile(r"\S+")
+TOKEN_PUNCTUATION = ".,;:!?\"'()[]{}<>"
+
+
+def tokenize(text):
+    """
+    BM25 terms of a text, lowercased: every word, plus every whitespace-delimited token made of several
+    words (e.g. "INV-2024/0017", "A.B.C") so codes and references also match exactly as a whole.
+    Unlike hybrid_txt, digits are kept: invoice numbers and codes are what exact lookups are for.
+    """
+    text = text.lower()
+    terms = WORD_PATTERN.findall(text)
+    for token in TOKEN_PATTERN.findall(text):
+        token = token.strip(TOKEN_PUNCTUATION)
+        if token and not WORD_PATTERN.fullmatch(token) and len(WORD_PATTERN.findall(token)) > 1:
+            terms.append(token)
+    return terms
+
+
+def encode_varints(values):
+    """
+    LEB128 variable-length encoding of non-negative integers: 7 bits per byte, high bit set on every
+    byte but the last of a value. Vectorized over the whole array.
+
+    Returns:
+    - (numpy.ndarray, numpy.ndarray): uint8 encoded bytes and the number of bytes of every value
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    sizes = np.ones(len(values), dtype=np.int64)
+    for shift in (7, 14, 21, 28, 35, 42, 49, 56, 63):
+        sizes += values >= (np.uint64(1) << np.uint64(shift))
+    ends = np.cumsum(sizes)
+    starts = ends - sizes
+    data = np.empty(int(ends[-1]) if len(ends) else 0, dtype=np.uint8)
+    for byte in range(int(sizes.max()) if len(sizes) else 0):
+        selected = sizes > byte
+        group = (values[selected] >> np.uint64(7 * byte)) & np.uint64(0x7F)
+        more = (sizes[selected] > byte + 1).astype(np.uint64) << np.uint64(7)
+        data[starts[selected] + byte] = group | more
+    return data, sizes
+
+
+def decode_varints(data):
+    """
+    Decode a buffer of LEB128 varints (see encode_varints) into uint64 values
+    """
+    data = np.asarray(data, dtype=np.uint8)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.concatenate([[0], ends[:-1] + 1]).astype(np.int64)
+    sizes = ends - starts + 1
+    values = np.zeros(len(ends), dtype=np.uint64)
+    for byte in range(int(sizes.max()) if len(sizes) else 0):
+        selected = sizes > byte
+        values[selected] |= (data[starts[selected] + byte].astype(np.uint64) & np.uint64(0x7F)) << np.uint64(7 * byte)
+    return values
+
+
+def decode_postings(data):
+    """
+    Decode the postings of one term: delta-encoded chunk ids followed by the term frequencies
+
+    Returns:
+    - (numpy.ndarray, numpy.ndarray): Chunk ids (ascending) and term frequencies
+    """
+    values = decode_varints(data).astype(np.int64)
+    df = len(values) // 2
+    return np.cumsum(values[:df]), values[df:]
+
+
+def write_segment(index_folder, segment_id, terms, term_ids, chunk_ids, tfs, lengths, pages, document_codes,
+                  documents, chunk_lines):
+    """
+    Write an immutable segment of the inverted index. The postings of every term are stored as varints,
+    chunk ids delta-encoded, in one uint8 array with the byte offset of every term:
+    "<segment>.postings.npy", "<segment>.term_offsets.npy", "<segment>.dfs.npy" and "<segment>.terms.json".
+
+    Parameters:
+    - terms (list): Sorted vocabulary of the segment
+    - term_ids, chunk_ids, tfs (numpy.ndarray): One posting per (term, chunk), sorted by term then chunk
+    - lengths, pages, document_codes (numpy.ndarray): Number of terms, page number (-1 when unknown)
+      and document (index into `documents`) of every chunk
+    - documents (list): Documents of the segment
+    - chunk_lines (list): Metadata row of every chunk, as a JSON line
+
+    Returns:
+    - dict: Segment description for the manifest
+    """
+    prefix = os.path.join(index_folder, f"seg_{segment_id}")
+
+    # Per term, `df` delta-encoded chunk ids then `df` term frequencies
+    dfs = np.bincount(term_ids, minlength=len(terms)).astype(np.int64)
+    term_starts = np.cumsum(dfs) - dfs
+    first_of_term = np.repeat(term_starts, dfs)
+    position = np.arange(len(chunk_ids)) - first_of_term
+    deltas = np.diff(chunk_ids, prepend=0)
+    deltas[term_starts[dfs > 0]] = chunk_ids[term_starts[dfs > 0]]
+    values = np.empty(2 * len(chunk_ids), dtype=np.int64)
+    values[2 * first_of_term + position] = deltas
+    values[2 * first_of_term + np.repeat(dfs, dfs) + position] = tfs
+
+    data, sizes = encode_varints(values)
+    value_ends = np.concatenate([[0], np.cumsum(sizes)])
+    term_offsets = value_ends[np.concatenate([2 * term_starts, [len(values)]])]
+
+    np.save(f"{prefix}.postings.npy", data)
+    np.save(f"{prefix}.term_offsets.npy", term_offsets.astype(np.int64))
+    np.save(f"{prefix}.dfs.npy", dfs.astype(np.int32))
+    np.save(f"{prefix}.lengths.npy", np.asarray(lengths, dtype=np.int32))
+    np.save(f"{prefix}.pages.npy", np.asarray(pages, dtype=np.int32))
+    np.save(f"{prefix}.documents.npy", np.asarray(document_codes, dtype=np.int32))
+    write_text_file(f"{prefix}.terms.json", json.dumps({term: index for index, term in enumerate(terms)},
+                                                       ensure_ascii=False))
+    write_text_file(f"{prefix}.chunks.jsonl", "".join(chunk_lines))
+    np.save(f"{prefix}.chunk_offsets.npy", MetadataTable.line_offsets(f"{prefix}.chunks.jsonl"))
+
+    return {"chunks": len(lengths), "live": len(lengths), "live_length": int(np.sum(lengths)),
+            "documents": documents, "deleted_file": None, "generation": 0}
+
+
+def sort_postings(vocabulary, term_ids, chunk_ids, tfs):
+    """
+    Sort a vocabulary and re-number the postings accordingly, sorted by term then chunk
+
+    Returns:
+    - (list, numpy.ndarray, numpy.ndarray, numpy.ndarray): Sorted terms, term_ids, chunk_ids and tfs
+    """
+    terms = sorted(vocabulary, key=vocabulary.get)
+    order = sorted(range(len(terms)), key=terms.__getitem__)
+    rank = np.empty(len(terms), dtype=np.int64)
+    rank[order] = np.arange(len(terms))
+    term_ids = rank[np.asarray(term_ids, dtype=np.int64)]
+    chunk_ids = np.asarray(chunk_ids, dtype=np.int64)
+    postings_order = np.lexsort((chunk_ids, term_ids))
+    return ([terms[index] for index in order], term_ids[postings_order], chunk_ids[postings_order],
+            np.asarray(tfs, dtype=np.int64)[postings_order])
+
+
+def build_segment(index_folder, segment_id, chunks):
+    """
+    Tokenize chunks into a new segment
+    """
+    vocabulary = {}
+    term_ids, chunk_ids, tfs = [], [], []
+    lengths = np.empty(len(chunks), dtype=np.int32)
+    for chunk_id, chunk in enumerate(chunks):
+        counts = Counter(tokenize(chunk["text"]))
+        lengths[chunk_id] = sum(counts.values())
+        for term, tf in counts.items():
+            term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+            chunk_ids.append(chunk_id)
+            tfs.append(tf)
+
+    documents = sorted({chunk["document"] for chunk in chunks})
+    codes = {document: code for code, document in enumerate(documents)}
+    terms, term_ids, chunk_ids, tfs = sort_postings(vocabulary, term_ids, chunk_ids, tfs)
+    return write_segment(index_folder, segment_id, terms, term_ids, chunk_ids, tfs, lengths,
+                         [chunk["page"] if chunk["page"] is not None else -1 for chunk in chunks],
+                         [codes[chunk["document"]] for chunk in chunks], documents,
+                         [json.dumps(chunk, ensure_ascii=False) + "\n" for chunk in chunks])
+
+
+class Segment:
+    """
+    Read-only view of a segment, every array memory-mapped
+    """
+    def __init__(self, index_folder, segment_id, description):
+        prefix = os.path.join(index_folder, f"seg_{segment_id}")
+        self.segment_id = segment_id
+        self.description = description
+        self.postings = np.load(f"{prefix}.postings.npy", mmap_mode="r")
+        self.term_offsets = np.load(f"{prefix}.term_offsets.npy", mmap_mode="r")
+        self.dfs = np.load(f"{prefix}.dfs.npy", mmap_mode="r")
+        self.lengths = np.load(f"{prefix}.lengths.npy", mmap_mode="r")
+        self.pages = np.load(f"{prefix}.pages.npy", mmap_mode="r")
+        self.documents = np.load(f"{prefix}.documents.npy", mmap_mode="r")
+        with open(f"{prefix}.terms.json", "r", encoding="utf-8") as file:
+            self.terms = json.load(file)
+        self.document_codes = {document: code for code, document in enumerate(description["documents"])}
+        self.chunks = MetadataTable(f"{prefix}.chunks.jsonl", np.load(f"{prefix}.chunk_offsets.npy", mmap_mode="r"))
+        self.deleted = None
+        if description["deleted_file"]:
+            self.deleted = np.load(os.path.join(index_folder, description["deleted_file"]))
+
+    def df(self, term):
+        index = self.terms.get(term)
+        return 0 if index is None else int(self.dfs[index])
+
+    def term_postings(self, term):
+        index = self.terms.get(term)
+        if index is None:
+            return None
+        return decode_postings(self.postings[self.term_offsets[index]:self.term_offsets[index + 1]])
+
+    def all_postings(self):
+        """
+        Decode every posting of the segment at once
+
+        Returns:
+        - (list, numpy.ndarray, numpy.ndarray, numpy.ndarray): Terms, and term id, chunk id and tf of every posting
+        """
+        terms = sorted(self.terms, key=self.terms.get)
+        dfs = np.asarray(self.dfs, dtype=np.int64)
+        values = decode_varints(self.postings).astype(np.int64)
+        # Values are laid out per term as [df deltas, df tfs]
+        term_of_value = np.repeat(np.arange(len(terms)), 2 * dfs)
+        value_starts = np.repeat(np.cumsum(2 * dfs) - 2 * dfs, 2 * dfs)
+        is_delta = np.arange(len(values)) - value_starts < np.repeat(dfs, 2 * dfs)
+        term_ids = term_of_value[is_delta]
+        deltas = values[is_delta]
+        # Undo the delta encoding term by term: cumulative sum restarted at every term
+        totals = np.cumsum(deltas)
+        term_starts = np.cumsum(dfs) - dfs
+        restart = np.zeros(len(deltas), dtype=np.int64)
+        nonempty = dfs > 0
+        restart[term_starts[nonempty]] = np.concatenate([[0], totals[term_starts[nonempty][1:] - 1]])
+        chunk_ids = totals - np.maximum.accumulate(restart)
+        return terms, term_ids, chunk_ids, values[~is_delta]
+
+    def close(self):
+        self.chunks.close()
+
+
+def index_version(pages):
+    """
+    Version of the index: changes whenever an indexed page changes
+    """
+    sha = hashlib.sha256()
+    for key in sorted(pages):
+        sha.update(f"{key}|{pages[key]['hash']}\n".encode("utf-8"))
+    return sha.hexdigest()[:16]
+
+
+def read_manifest(index_folder):
+    manifest_path = os.path.join(index_folder, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return {"segments": {}, "pages": {}, "next_segment": 0, "version": None}
+    with open(manifest_path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def merge_segments(index_folder, manifest):
+    """
+    Merge every segment into a new one, dropping the deleted chunks: postings are decoded, re-numbered
+    and re-encoded without re-reading or re-tokenizing any text
+    """
+    segment_id = manifest["next_segment"]
+    manifest["next_segment"] += 1
+
+    vocabulary = {}
+    all_term_ids, all_chunk_ids, all_tfs = [], [], []
+    lengths, pages, document_codes, chunk_lines = [], [], [], []
+    documents = sorted({document for description in manifest["segments"].values()
+                        for document in description["documents"]})
+    codes = {document: code for code, document in enumerate(documents)}
+    remaps = {}
+    base = 0
+    for old_id, description in manifest["segments"].items():
+        segment = Segment(index_folder, old_id, description)
+        live = np.ones(description["chunks"], dtype=bool) if segment.deleted is None else ~segment.deleted
+        remap = np.cumsum(live) - 1 + base
+        remaps[old_id] = remap
+
+        terms, term_ids, chunk_ids, tfs = segment.all_postings()
+        keep = live[chunk_ids]
+        # Terms left without postings once the deleted chunks are dropped are not carried over
+        global_ids = np.full(len(terms), -1, dtype=np.int64)
+        for index in np.unique(term_ids[keep]):
+            global_ids[index] = vocabulary.setdefault(terms[index], len(vocabulary))
+        all_term_ids.append(global_ids[term_ids[keep]])
+        all_chunk_ids.append(remap[chunk_ids[keep]])
+        all_tfs.append(tfs[keep])
+
+        lengths.append(np.asarray(segment.lengths)[live])
+        pages.append(np.asarray(segment.pages)[live])
+        segment_codes = np.array([codes[document] for document in description["documents"]], dtype=np.int32)
+        document_codes.append(segment_codes[np.asarray(segment.documents)[live]] if len(segment_codes)
+                              else np.empty(0, dtype=np.int32))
+        with open(os.path.join(index_folder, f"seg_{old_id}.chunks.jsonl"), "r", encoding="utf-8") as file:
+            chunk_lines.extend(line for line, is_live in zip(file, live) if is_live)
+        base += int(live.sum())
+        segment.close()
+
+    terms, term_ids, chunk_ids, tfs = sort_postings(vocabulary, np.concatenate(all_term_ids),
+                                                    np.concatenate(all_chunk_ids), np.concatenate(all_tfs))
+    description = write_segment(index_folder, segment_id, terms, term_ids, chunk_ids, tfs,
+                                np.concatenate(lengths), np.concatenate(pages), np.concatenate(document_codes),
+                                documents, chunk_lines)
+
+    for page in manifest["pages"].values():
+        # Pages without chunks (empty texts) are bound to no segment
+        if page["count"] == 0:
+            page["segment"] = None
+            continue
+        page["first"] = int(remaps[page["segment"]][page["first"]])
+        page["segment"] = str(segment_id)
+    manifest["segments"] = {str(segment_id): description}
+    logger.info(f"BM25 segments merged into seg_{segment_id}: {description['chunks']} chunks, {len(terms)} terms")
+
+
+def update_bm25_index(text_output_folder, index_folder, chunk_size, chunk_overlap, max_segments=8):
+    """
+    Bring the BM25 index of `index_folder` up to date with the text extraction output, incrementally:
+    - pages whose text did not change keep their postings
+    - chunks of changed and removed pages are marked deleted in their segment
+    - new and changed pages are tokenized into one new segment
+    - when there are more than `max_segments` segments, they are merged into one
+
+    Pages are chunked like the embedding stage, so BM25 and dense results share their chunk ids.
+
+    Returns:
+    - dict: version, chunks (live), indexed_pages (tokenized by this run), removed_pages and segments
+    """
+    try:
+        os.makedirs(index_folder, exist_ok=True)
+        manifest = read_manifest(index_folder)
+        indexed_pages = manifest["pages"]
+
+        current_pages = {}
+        for document, page_file_path in list_page_files(text_output_folder):
+            page_name = os.path.splitext(os.path.basename(page_file_path))[0]
+            current_pages[f"{document}/{page_name}"] = (document, page_file_path, file_digest(page_file_path))
+
+        changed = [key for key, (_, _, digest) in current_pages.items()
+                   if key not in indexed_pages or indexed_pages[key]["hash"] != digest]
+        removed = [key for key in indexed_pages if key not in current_pages]
+
+        # Tombstones: the chunks of changed and removed pages are deleted from their segments
+        deleted_chunks = {}
+        for key in changed + removed:
+            if key in indexed_pages:
+                page = indexed_pages.pop(key)
+                if page["count"] == 0:
+                    continue
+                deleted_chunks.setdefault(page["segment"], []).append((page["first"], page["first"] + page["count"]))
+
+        for segment_id, ranges in deleted_chunks.items():
+            description = manifest["segments"][segment_id]
+            deleted = np.zeros(description["chunks"], dtype=bool)
+            if description["deleted_file"]:
+                deleted = np.load(os.path.join(index_folder, description["deleted_file"]))
+            lengths = np.load(os.path.join(index_folder, f"seg_{segment_id}.lengths.npy"), mmap_mode="r")
+            for first, stop in ranges:
+                description["live"] -= int(stop - first - deleted[first:stop].sum())
+                description["live_length"] -= int(np.sum(lengths[first:stop][~deleted[first:stop]]))
+                deleted[first:stop] = True
+            # A new file per generation: readers keep the bitmap of the manifest they loaded
+            description["generation"] += 1
+            description["deleted_file"] = f"seg_{segment_id}.deleted_{description['generation']}.npy"
+            np.save(os.path.join(index_folder, description["deleted_file"]), deleted)
+            if description["live"] == 0:
+                del manifest["segments"][segment_id]
+
+        if changed:
+            chunks = []
+            segment_id = str(manifest["next_segment"])
+            manifest["next_segment"] += 1
+            for key in changed:
+                document, page_file_path, digest = current_pages[key]
+                page_chunks = read_page_chunks(document, page_file_path, chunk_size, chunk_overlap)
+                indexed_pages[key] = {"hash": digest, "segment": segment_id if page_chunks else None,
+                                      "first": len(chunks), "count": len(page_chunks)}
+                chunks.extend(page_chunks)
+            manifest["segments"][segment_id] = build_segment(index_folder, segment_id, chunks)
+
+        if len(manifest["segments"]) > max_segments:
+            merge_segments(index_folder, manifest)
+
+        manifest["version"] = index_version(indexed_pages)
+        write_text_file(os.path.join(index_folder, MANIFEST_FILE), json.dumps(manifest))
+
+        # Drop the files of merged segments and of older deleted bitmaps
+        live_files = {description["deleted_file"] for description in manifest["segments"].values()}
+        for file_name in os.listdir(index_folder):
+            if not file_name.startswith("seg_"):
+                continue
+            segment_id = file_name[len("seg_"):].split(".")[0]
+            if segment_id not in manifest["segments"] or (".deleted_" in file_name and file_name not in live_files):
+                try:
+                    os.remove(os.path.join(index_folder, file_name))
+                except OSError:
+                    # Still open by a reader (Windows), removed by a later update
+                    pass
+
+        return {"version": manifest["version"],
+                "chunks": sum(description["live"] for description in manifest["segments"].values()),
+                "indexed_pages": len(changed), "removed_pages": len(removed),
+                "segments": len(manifest["segments"])}
+
+    except Exception as e:
+        raise srcException(e, sys) from e
+
+
+class BM25Index:
+    """
+    Okapi BM25 search over the segments of an index folder.
+    Scores are accumulated per segment from the postings of the query terms only, never by scanning chunks.
+    """
+    def __init__(self, index_folder, k1=1.2, b=0.75):
+        try:
+            self.k1 = k1
+            self.b = b
+            manifest = read_manifest(index_folder)
+            if manifest["version"] is None:
+                raise FileNotFoundError(f"No BM25 index in {index_folder}")
+            self.version = manifest["version"]
+            self.segments = [Segment(index_folder, segment_id, description)
+                             for segment_id, description in manifest["segments"].items()]
+            self.chunks = sum(description["live"] for description in manifest["segments"].values())
+            live_length = sum(description["live_length"] for description in manifest["segments"].values())
+            self.average_length = live_length / max(self.chunks, 1)
+        except Exception as e:
+            raise srcException(e, sys) from e
+
+    def __len__(self):
+        return self.chunks
+
+    def search(self, query, k=10, document=None, page_range=None):
+        """
+        Top-k chunks of a text query
+
+        Parameters:
+        - query (str): Query text, tokenized like the chunks
+        - k (int): Number of results
+        - document (str): Only return chunks of this document
+        - page_range (tuple): Only return chunks of the pages first_page..last_page (inclusive)
+
+        Returns:
+        - list: Metadata rows of the results (chunk_id, document, page, offsets, text) with their "score", best first
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+
+        # Live postings of the query terms, and their exact document frequencies (deleted chunks excluded)
+        segment_postings = []
+        dfs = Counter()
+        for segment in self.segments:
+            postings = {}
+            for term in terms:
+                term_postings = segment.term_postings(term)
+                if term_postings is None:
+                    continue
+                ids, tfs = term_postings
+                if segment.deleted is not None:
+                    live = ~segment.deleted[ids]
+                    ids, tfs = ids[live], tfs[live]
+                if len(ids):
+                    postings[term] = (ids, tfs)
+                    dfs[term] += len(ids)
+            segment_postings.append(postings)
+        idfs = {term: math.log(1 + (self.chunks - df + 0.5) / (df + 0.5)) for term, df in dfs.items()}
+
+        best_scores, best_ids = np.empty(0), np.empty(0, dtype=np.int64)
+        for segment_index, (segment, postings) in enumerate(zip(self.segments, segment_postings)):
+            if not postings or (document is not None and document not in segment.document_codes):
+                continue
+            ids_list, contributions = [], []
+            for term, (ids, tfs) in postings.items():
+                norms = self.k1 * (1 - self.b + self.b * segment.lengths[ids] / self.average_length)
+                ids_list.append(ids)
+                contributions.append(idfs[term] * tfs * (self.k1 + 1) / (tfs + norms))
+
+            ids, inverse = np.unique(np.concatenate(ids_list), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate(contributions))
+            if document is not None or page_range is not None:
+                mask = np.ones(len(ids), dtype=bool)
+                if document is not None:
+                    mask &= segment.documents[ids] == segment.document_codes[document]
+                if page_range is not None:
+                    pages = segment.pages[ids]
+                    mask &= (pages >= page_range[0]) & (pages <= page_range[1])
+                scores, ids = scores[mask], ids[mask]
+            scores, ids = top_k(scores, ids, k)
+
+            # Candidates of every segment are ranked together, ids encoded as (segment, chunk)
+            best_scores = np.concatenate([best_scores, scores])
+            best_ids = np.concatenate([best_ids, ids + (segment_index << 40)])
+
+        best_scores, best_ids = top_k(best_scores, best_ids, k)
+        results = []
+        for score, encoded in zip(best_scores, best_ids):
+            result = self.segments[int(encoded) >> 40].chunks[int(encoded) & ((1 << 40) - 1)]
+            result["score"] = float(score)
+            results.append(result)
+        return results
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
@@ -0,0 +1,25 @@
+def reciprocal_rank_fusion(rankings, k=60, limit=None):
+    """
+    Fuse ranked result lists with reciprocal rank fusion: a chunk scores sum(1 / (k + rank)) over the
+    lists it appears in (rank starting at 1). Only ranks are used, so BM25 and cosine scores, which are
+    on unrelated scales, need no normalization.
+
+    Parameters:
+    - rankings (list): Result lists (metadata rows with a "chunk_id"), best first
+    - k (int): Rank constant, larger values flatten the advantage of the top ranks
+    - limit (int): Number of fused results, all when None
+
+    Returns:
+    - list: Rows of the fused ranking, best first, with their "score" replaced by the fused score and the
+      per-list scores kept in "scores" (None for the lists the chunk is not in)
+    """
+    fused = {}
+    for list_index, ranking in enumerate(rankings):
+        for rank, row in enumerate(ranking, start=1):
+            entry = fused.get(row["chunk_id"])
+            if entry is None:
+                entry = fused[row["chunk_id"]] = dict(row, score=0.0, scores=[None] * len(rankings))
+            entry["score"] += 1.0 / (k + rank)
+            entry["scores"][list_index] = row.get("score")
+    results = sorted(fused.values(), key=lambda row: row["score"], reverse=True)
+    return results if limit is None else results[:limit]
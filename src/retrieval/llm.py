@@ -0,0 +1,130 @@
+import re
+import threading
+from abc import ABC, abstractmethod
+
+from src.logger import get_logger
+logger = get_logger(__name__)
+from src.retrieval.bm25 import tokenize
+
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n+")
+CONTEXT_BLOCK_PATTERN = re.compile(r"^\[(\d+)\][^\n]*\n(.*?)(?=^\[\d+\]|\Z)", re.MULTILINE | re.DOTALL)
+NO_ANSWER = "I could not find the answer in the documents."
+STOP_WORDS = {"a", "an", "and", "are", "at", "be", "by", "did", "do", "does", "for", "from", "how", "in", "is", "it",
+              "of", "on", "or", "that", "the", "this", "to", "was", "what", "when", "where", "which", "who", "with"}
+
+
+class LLMClient(ABC):
+    """
+    Interface of the language models answering questions: a chat (list of {"role", "content"} messages)
+    in, the answer streamed out as text pieces
+    """
+    name = "llm"
+
+    def count_tokens(self, text):
+        """
+        Number of tokens of a text, used to fit the context in the token budget.
+        Approximated by words and punctuation marks unless the model has a tokenizer.
+        """
+        return len(TOKEN_PATTERN.findall(text))
+
+    @abstractmethod
+    def stream(self, messages, max_new_tokens=256):
+        """
+        Answer to a chat, generated piece by piece
+
+        Parameters:
+        - messages: list of {"role", "content"} messages
+        - max_new_tokens: Maximum number of tokens generated
+
+        Returns:
+        - iterator of str: Pieces of the answer text
+        """
+
+
+class StubLLM(LLMClient):
+    """
+    Local deterministic stand-in for a language model, for tests and offline use: the answer is made of
+    the context sentences sharing the most terms with the question, each cited with its [n] source.
+    It reads the context blocks and the question from the prompt built by QuestionAnswering.
+    """
+    name = "stub"
+
+    def __init__(self, max_sentences=2):
+        self.max_sentences = max_sentences
+
+    def answer(self, prompt):
+        context, _, question = prompt.rpartition("Question:")
+        question_terms = set(tokenize(question)) - STOP_WORDS
+        candidates = []
+        for number, text in CONTEXT_BLOCK_PATTERN.findall(context):
+            for sentence in SENTENCE_BOUNDARY.split(text):
+                sentence = " ".join(sentence.split())
+                overlap = len(question_terms & set(tokenize(sentence)))
+                if sentence and overlap:
+                    # Best overlap first, then context order (the retrieval rank)
+                    candidates.append((-overlap, len(candidates), sentence, number))
+        if not candidates:
+            return NO_ANSWER
+        best = sorted(candidates)[:self.max_sentences]
+        return " ".join(f"{sentence} [{number}]" for _, _, sentence, number in sorted(best, key=lambda c: c[1]))
+
+    def stream(self, messages, max_new_tokens=256):
+        answer = self.answer(messages[-1]["content"])
+        for piece in re.findall(r"\S+\s*", answer)[:max_new_tokens]:
+            yield piece
+
+
+class TransformersLLM(LLMClient):
+    """
+    Local chat model of the Hugging Face hub run with transformers, greedy decoding
+    """
+    name = "transformers"
+
+    def __init__(self, model_name, device="cpu"):
+        # transformers pulls in torch: it is only imported when this backend is used
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+        logger.info(f"Loading language model {model_name} on {device}")
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModelForCausalLM.from_pretrained(model_name).to(device)
+        self.model.eval()
+
+    def count_tokens(self, text):
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+    def stream(self, messages, max_new_tokens=256):
+        from transformers import TextIteratorStreamer
+        prompt = self.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+        inputs = self.tokenizer(prompt, return_tensors="pt").to(self.model.device)
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        generation = threading.Thread(target=self.model.generate, kwargs=dict(
+            **inputs, max_new_tokens=max_new_tokens, do_sample=False, streamer=streamer))
+        generation.start()
+        for piece in streamer:
+            if piece:
+                yield piece
+        generation.join()
+
+
+# Warm models of this process, keyed by (backend, model_name, device)
+_LLMS = {}
+
+
+def get_llm(backend, model_name=None, device="cpu"):
+    """
+    Return the warm language model of this process for a backend, loading it on first use
+
+    Parameters:
+    - backend (str): "stub" (deterministic, no model) or "transformers"
+    - model_name (str): Hugging Face model of the "transformers" backend
+    - device (str): Device of the model
+    """
+    key = (backend, model_name, device)
+    if key not in _LLMS:
+        if backend == "stub":
+            _LLMS[key] = StubLLM()
+        elif backend == "transformers":
+            _LLMS[key] = TransformersLLM(model_name, device)
+        else:
+            raise ValueError(f"Unknown LLM backend: {backend}")
+    return _LLMS[key]
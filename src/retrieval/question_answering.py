@@ -0,0 +1,203 @@
+import re
+import sys
+import time
+import threading
+from collections import deque
+
+import numpy as np
+
+from src.entity.config_entity import QAConfig
+from src.logger import get_logger
+logger = get_logger(__name__)
+from src.exception import srcException
+from src.retrieval.retriever import Retriever
+from src.retrieval.llm import get_llm
+from src.utils.lru_cache import LRUCache
+
+SYSTEM_PROMPT = ("You answer questions about scanned documents using only the numbered context passages. "
+                 "Cite every passage you use with its number in brackets, e.g. [2]. "
+                 "If the passages do not contain the answer, say that you could not find it.")
+CITATION_PATTERN = re.compile(r"\[(\d+)\]")
+# A passage is only cut to fit the token budget when at least this many of its tokens still fit
+MIN_PASSAGE_TOKENS = 50
+
+
+def percentiles(values):
+    if not values:
+        return None
+    p50, p95, p99 = np.percentile(np.array(values) * 1000, [50, 95, 99])
+    return {"p50": round(float(p50), 2), "p95": round(float(p95), 2), "p99": round(float(p99), 2)}
+
+
+class QuestionAnswering:
+    """
+    Retrieval augmented question answering over the indexed documents: the chunks retrieved for a
+    question are packed into a context within a token budget, the language model answers from them,
+    and the answer comes back with the pages it cites.
+
+    Query embeddings and whole answers are kept in LRU caches keyed by the question and the index version,
+    so a repeated question costs a dictionary lookup and a rebuilt index never serves stale answers.
+    """
+    def __init__(self, qa_config: QAConfig = None, retriever: Retriever = None, llm=None):
+        try:
+            self.qa_config = qa_config or QAConfig()
+            self.retriever = retriever or Retriever()
+            self.llm = llm or get_llm(self.qa_config.llm_backend, self.qa_config.llm_model,
+                                      self.qa_config.llm_device)
+            self.embedding_cache = LRUCache(self.qa_config.embedding_cache_size)
+            self.answer_cache = LRUCache(self.qa_config.answer_cache_size)
+            self.latencies = deque(maxlen=self.qa_config.metrics_window)
+            self.first_token_latencies = deque(maxlen=self.qa_config.metrics_window)
+            self.queries = 0
+            self.lock = threading.Lock()
+        except Exception as e:
+            raise srcException(e, sys) from e
+
+    def get_retriever(self):
+        """
+        The retriever of the current indexes, reloaded when the pipeline has rebuilt them
+        """
+        with self.lock:
+            if self.retriever.is_stale():
+                logger.info("Indexes changed on disk, reloading the retriever")
+                retriever = self.retriever
+                # Queries still running on the previous retriever keep it alive until they finish
+                self.retriever = Retriever(retriever.embedding_config, retriever.vector_index_config,
+                                           retriever.bm25_index_config)
+            return self.retriever
+
+    def embed_question(self, retriever, question):
+        key = (retriever.index.version, question)
+        vector = self.embedding_cache.get(key)
+        if vector is None:
+            vector = retriever.embed_query(question)
+            self.embedding_cache.put(key, vector)
+        return vector
+
+    def retrieve(self, retriever, question, k, document=None, page_range=None):
+        vector = self.embed_question(retriever, question)
+        if self.qa_config.hybrid and retriever.bm25_index is not None:
+            return retriever.hybrid_search(question, k, document, page_range, query_vector=vector)
+        return retriever.search(vector, k, document, page_range)
+
+    def build_context(self, chunks):
+        """
+        Number the retrieved chunks, best first, until the token budget is spent. The passage that
+        overflows the budget is cut to the remaining tokens.
+
+        Returns:
+        - (str, list): Context text of "[n] document, page p" headed passages, and the sources used
+        """
+        budget = self.qa_config.context_tokens
+        passages = []
+        sources = []
+        for chunk in chunks:
+            number = len(sources) + 1
+            header = f"[{number}] {chunk['document']}, page {chunk['page']}"
+            text = " ".join(chunk["text"].split())
+            tokens = self.llm.count_tokens(header) + self.llm.count_tokens(text)
+            if tokens > budget:
+                if budget < MIN_PASSAGE_TOKENS:
+                    break
+                words = text.split()
+                text = " ".join(words[:max(1, len(words) * budget // tokens)])
+                tokens = budget
+            passages.append(f"{header}\n{text}")
+            sources.append({"source": number, "document": chunk["document"], "page": chunk["page"],
+                            "page_name": chunk["page_name"], "chunk_id": chunk["chunk_id"],
+                            "start": chunk["start"], "end": chunk["end"], "score": chunk.get("score")})
+            budget -= tokens
+        return "\n\n".join(passages), sources
+
+    def build_messages(self, context, question):
+        return [{"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": f"Context:\n{context}\n\nQuestion: {question}"}]
+
+    def stream_answer(self, question, k=None, document=None, page_range=None):
+        """
+        Answer a question, streaming the answer as it is generated
+
+        Parameters:
+        - question (str): Question
+        - k (int): Chunks retrieved, the config top_k when None
+        - document (str): Only answer from this document
+        - page_range (tuple): Only answer from the pages first_page..last_page (inclusive)
+
+        Yields:
+        - dict: {"type": "token", "text"} events, then one {"type": "done"} event with the answer,
+          its citations (the sources referenced in the answer), all sources given to the model,
+          whether it came from the cache, the index version and the timings in seconds
+        """
+        start = time.perf_counter()
+        question = " ".join(question.split())
+        k = k or self.qa_config.top_k
+        page_range = tuple(page_range) if page_range else None
+        retriever = self.get_retriever()
+        key = (retriever.version, question, k, document, page_range)
+
+        cached = self.answer_cache.get(key)
+        if cached is not None:
+            yield {"type": "token", "text": cached["answer"]}
+            elapsed = time.perf_counter() - start
+            self.record_query(elapsed, elapsed)
+            yield dict(cached, type="done", cached=True, timings={"total": round(elapsed, 4)})
+            return
+
+        chunks = self.retrieve(retriever, question, k, document, page_range)
+        retrieval_time = time.perf_counter() - start
+        context, sources = self.build_context(chunks)
+
+        pieces = []
+        first_token_time = None
+        for piece in self.llm.stream(self.build_messages(context, question), self.qa_config.max_new_tokens):
+            if first_token_time is None:
+                first_token_time = time.perf_counter() - start
+            pieces.append(piece)
+            yield {"type": "token", "text": piece}
+        answer = "".join(pieces).strip()
+
+        cited = {int(number) for number in CITATION_PATTERN.findall(answer)}
+        result = {"question": question, "answer": answer,
+                  "citations": [source for source in sources if source["source"] in cited],
+                  "sources": sources, "index_version": retriever.version, "llm": self.llm.name}
+        self.answer_cache.put(key, result)
+
+        elapsed = time.perf_counter() - start
+        self.record_query(elapsed, first_token_time if first_token_time is not None else elapsed)
+        logger.info(f"Question answered in {elapsed * 1000:.1f} ms (retrieval {retrieval_time * 1000:.1f} ms), "
+                    f"{len(sources)} sources, {len(result['citations'])} cited")
+        yield dict(result, type="done", cached=False, timings={
+            "retrieval": round(retrieval_time, 4),
+            "first_token": round(first_token_time, 4) if first_token_time is not None else None,
+            "total": round(elapsed, 4)})
+
+    def answer(self, question, k=None, document=None, page_range=None):
+        """
+        Answer a question (see stream_answer)
+
+        Returns:
+        - dict: The answer, its citations, sources, cache status, index version and timings
+        """
+        try:
+            for event in self.stream_answer(question, k, document, page_range):
+                if event["type"] == "done":
+                    del event["type"]
+                    return event
+        except Exception as e:
+            raise srcException(e, sys) from e
+
+    def record_query(self, latency, first_token_latency):
+        with self.lock:
+            self.queries += 1
+            self.latencies.append(latency)
+            self.first_token_latencies.append(first_token_latency)
+
+    def metrics(self):
+        """
+        Query count, latency percentiles (ms) of the last `metrics_window` queries, and cache hit rates
+        """
+        with self.lock:
+            latencies, first_token_latencies = list(self.latencies), list(self.first_token_latencies)
+        return {"queries": self.queries, "latency_ms": percentiles(latencies),
+                "first_token_ms": percentiles(first_token_latencies),
+                "embedding_cache": self.embedding_cache.stats(), "answer_cache": self.answer_cache.stats()}
@@ -0,0 +1,127 @@
+import os
+import sys
+
+from src.entity.config_entity import EmbeddingConfig, VectorIndexConfig, BM25IndexConfig
+from src.logger import get_logger
+logger = get_logger(__name__)
+from src.exception import srcException
+from src.utils.embedding_model import embed_texts
+from src.retrieval.vector_index import VectorIndex, INDEX_FILE
+from src.retrieval.bm25 import BM25Index, MANIFEST_FILE
+from src.retrieval.fusion import reciprocal_rank_fusion
+
+
+class Retriever:
+    """
+    Query API over the vector store and index built by the pipeline: questions are embedded with the
+    model the store was built with and matched against the chunks by the vector index.
+    When the BM25 index is enabled, hybrid_search also matches the exact terms of the question
+    (invoice numbers, codes, names) and fuses both rankings.
+    """
+    def __init__(self, embedding_config: EmbeddingConfig = None, vector_index_config: VectorIndexConfig = None,
+                 bm25_index_config: BM25IndexConfig = None):
+        try:
+            self.embedding_config = embedding_config or EmbeddingConfig()
+            self.vector_index_config = vector_index_config or VectorIndexConfig()
+            self.bm25_index_config = bm25_index_config or BM25IndexConfig()
+            self.index_files_mtime = self.get_index_files_mtime()
+            self.index = VectorIndex(self.embedding_config.vector_store_folder, self.vector_index_config.index_folder,
+                                     n_probe=self.vector_index_config.n_probe,
+                                     exact_search_rows=self.vector_index_config.exact_search_rows)
+            self.bm25_index = None
+            if self.bm25_index_config.enabled:
+                self.bm25_index = BM25Index(self.bm25_index_config.index_folder, self.bm25_index_config.k1,
+                                            self.bm25_index_config.b)
+            logger.info(f"Retriever loaded: {len(self.index)} chunks, index version {self.index.version}"
+                        + (f", BM25 version {self.bm25_index.version}" if self.bm25_index is not None else ""))
+        except Exception as e:
+            raise srcException(e, sys) from e
+
+    @property
+    def version(self):
+        """
+        Version of the indexes searched: the vector store version, and the BM25 index version when enabled
+        """
+        if self.bm25_index is None:
+            return self.index.version
+        return f"{self.index.version}+{self.bm25_index.version}"
+
+    def get_index_files_mtime(self):
+        paths = [os.path.join(self.vector_index_config.index_folder, INDEX_FILE)]
+        if self.bm25_index_config.enabled:
+            paths.append(os.path.join(self.bm25_index_config.index_folder, MANIFEST_FILE))
+        return [os.path.getmtime(path) if os.path.exists(path) else None for path in paths]
+
+    def is_stale(self):
+        """
+        Whether the pipeline has rebuilt an index since this retriever loaded it
+        """
+        return self.get_index_files_mtime() != self.index_files_mtime
+
+    def embed_query(self, question):
+        """
+        Embed a question with the model of the vector store
+        """
+        return embed_texts([question], self.index.manifest["model"], self.embedding_config.device)[0]
+
+    def search(self, query, k=10, document=None, page_range=None, exact=False, n_probe=None):
+        """
+        Top-k chunks for a question (str) or a query embedding
+
+        Parameters:
+        - query (str | array-like): Question or query embedding
+        - k (int): Number of results
+        - document (str): Only return chunks of this document
+        - page_range (tuple): Only return chunks of the pages first_page..last_page (inclusive)
+        - exact (bool): Force the exact search
+        - n_probe (int): Inverted lists scanned by the IVF search, the config default when None
+
+        Returns:
+        - list: Metadata rows of the results with their "score", best first
+        """
+        try:
+            vector = self.embed_query(query) if isinstance(query, str) else query
+            return self.index.search(vector, k, document, page_range, exact, n_probe)
+        except Exception as e:
+            raise srcException(e, sys) from e
+
+    def keyword_search(self, question, k=10, document=None, page_range=None):
+        """
+        Top-k chunks of a question by BM25 only, the exact lookup of codes and names (see search for the parameters)
+        """
+        try:
+            if self.bm25_index is None:
+                raise ValueError("The BM25 index is disabled in BM25IndexConfig")
+            return self.bm25_index.search(question, k, document, page_range)
+        except Exception as e:
+            raise srcException(e, sys) from e
+
+    def hybrid_search(self, question, k=10, document=None, page_range=None, candidates=None, rrf_k=None,
+                      query_vector=None):
+        """
+        Top-k chunks of a question by reciprocal rank fusion of the dense and BM25 rankings
+
+        Parameters:
+        - question (str): Question
+        - k (int): Number of results
+        - document (str): Only return chunks of this document
+        - page_range (tuple): Only return chunks of the pages first_page..last_page (inclusive)
+        - candidates (int): Results of each ranking that are fused, the config default when None
+        - rrf_k (int): Rank constant of the fusion, the config default when None
+        - query_vector (array-like): Embedding of the question when already known, computed when None
+
+        Returns:
+        - list: Metadata rows of the results with their fused "score" and the ("dense", "bm25") "scores", best first
+        """
+        try:
+            candidates = max(candidates or self.bm25_index_config.hybrid_candidates, k)
+            dense = self.search(question if query_vector is None else query_vector, candidates, document, page_range)
+            keyword = self.keyword_search(question, candidates, document, page_range)
+            return reciprocal_rank_fusion([dense, keyword], rrf_k or self.bm25_index_config.rrf_k, limit=k)
+        except Exception as e:
+            raise srcException(e, sys) from e
+
+    def close(self):
+        self.index.close()
+        if self.bm25_index is not None:
+            self.bm25_index.close()
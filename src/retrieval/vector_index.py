@@ -0,0 +1,407 @@
+import os
+import sys
+import json
+import math
+import mmap
+import shutil
+
+import numpy as np
+
+from src.logger import get_logger
+logger = get_logger(__name__)
+from src.exception import srcException
+from src.utils.main_utils import write_text_file
+from src.utils.vector_store import load_vector_store
+
+# index.json at the root of the index folder points to the folder of the current index version
+INDEX_FILE = "index.json"
+# Rows scored per matrix product by the exact search and the k-means assignment
+BLOCK_ROWS = 65536
+
+
+def normalize_query(query):
+    """
+    Return a query vector as a float32 unit vector
+    """
+    query = np.asarray(query, dtype=np.float32).reshape(-1)
+    norm = np.linalg.norm(query)
+    return query / norm if norm > 0 else query
+
+
+def top_k(scores, ids, k):
+    """
+    Best k (score, id) pairs, highest score first
+    """
+    if len(scores) > k:
+        best = np.argpartition(-scores, k - 1)[:k]
+        scores, ids = scores[best], ids[best]
+    order = np.argsort(-scores, kind="stable")
+    return scores[order], ids[order]
+
+
+def assign_lists(vectors, centroids):
+    """
+    Index of the nearest centroid (highest inner product) of every vector, computed block by block
+    """
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), BLOCK_ROWS):
+        block = np.asarray(vectors[start:start + BLOCK_ROWS], dtype=np.float32)
+        assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+
+def train_kmeans(sample, n_lists, iterations=10, seed=0):
+    """
+    Spherical k-means: centroids of the inverted lists, as unit vectors
+
+    Parameters:
+    - sample (numpy.ndarray): float32 unit vectors the centroids are trained on
+    - n_lists (int): Number of centroids
+    - iterations (int): Lloyd iterations
+    - seed (int): Seed of the initial centroids
+
+    Returns:
+    - numpy.ndarray: float32 (n_lists, dimension) centroids
+    """
+    rng = np.random.default_rng(seed)
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = assign_lists(sample, centroids)
+        # Sum the vectors of every list with one sort + reduceat instead of a loop over the lists
+        order = np.argsort(assignments, kind="stable")
+        lists, starts = np.unique(assignments[order], return_index=True)
+        sums = np.add.reduceat(sample[order], starts, axis=0)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        # Empty lists keep their previous centroid
+        centroids[lists] = sums / np.maximum(norms, 1e-12)
+    return centroids
+
+
+class MetadataTable:
+    """
+    Random access to the rows of a vector store metadata file (JSON lines) through a memory-mapped
+    array of line offsets, so opening the table does not parse millions of rows.
+    Rows are sliced out of a read-only mapping of the file, so concurrent queries can share the table.
+    """
+    def __init__(self, metadata_path, offsets):
+        self.metadata_path = metadata_path
+        self.offsets = offsets
+        self.mapping = None
+        with open(metadata_path, "rb") as file:
+            # An empty file cannot be mapped, it has no rows either
+            if os.fstat(file.fileno()).st_size:
+                self.mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, row):
+        start = int(self.offsets[row])
+        end = self.mapping.find(b"\n", start)
+        return json.loads(self.mapping[start:end if end >= 0 else len(self.mapping)])
+
+    def close(self):
+        if self.mapping is not None:
+            self.mapping.close()
+
+    @staticmethod
+    def line_offsets(metadata_path):
+        """
+        Byte offset of every line of a JSON lines file
+        """
+        offsets = []
+        position = 0
+        with open(metadata_path, "rb") as file:
+            for line in file:
+                if line.strip():
+                    offsets.append(position)
+                position += len(line)
+        return np.asarray(offsets, dtype=np.int64)
+
+
+def build_vector_index(store_folder, index_folder, index_type="ivf", n_lists=0, train_sample=100000,
+                       kmeans_iterations=10, seed=0):
+    """
+    Build the retrieval index of a vector store into "<index_folder>/<store version>/":
+    - documents.npy / pages.npy: document code and page number (-1 when unknown) of every chunk, in store order
+    - metadata_offsets.npy: byte offset of every chunk in the store metadata file
+    - for "ivf": centroids.npy, the chunk vectors grouped by inverted list (ivf_vectors.npy), their store
+      rows (ivf_ids.npy) and the list boundaries (ivf_offsets.npy)
+    Every array is saved as .npy so the query process memory-maps it instead of reading it.
+
+    Parameters:
+    - store_folder (str): Folder of the vector store
+    - index_folder (str): Folder of the index
+    - index_type (str): "ivf" or "exact" (filters and metadata only, every search scans the matrix)
+    - n_lists (int): Number of inverted lists, 0 for about sqrt(number of chunks)
+    - train_sample (int): Maximum number of vectors the k-means is trained on
+    - kmeans_iterations (int): Lloyd iterations of the k-means
+    - seed (int): Seed of the training sample and initial centroids
+
+    Returns:
+    - dict: The index description saved in index.json
+    """
+    try:
+        matrix, metadata, manifest = load_vector_store(store_folder)
+        if not manifest:
+            raise FileNotFoundError(f"No vector store in {store_folder}")
+
+        version_folder = os.path.join(index_folder, manifest["version"])
+        if os.path.exists(version_folder):
+            shutil.rmtree(version_folder)
+        os.makedirs(version_folder)
+
+        # Filters: documents as integer codes with their row ranges (chunks are stored in document order)
+        document_names = sorted({row["document"] for row in metadata})
+        document_codes = {document: code for code, document in enumerate(document_names)}
+        documents = np.array([document_codes[row["document"]] for row in metadata], dtype=np.int32)
+        pages = np.array([row["page"] if row["page"] is not None else -1 for row in metadata], dtype=np.int32)
+        np.save(os.path.join(version_folder, "documents.npy"), documents)
+        np.save(os.path.join(version_folder, "pages.npy"), pages)
+        np.save(os.path.join(version_folder, "metadata_offsets.npy"),
+                MetadataTable.line_offsets(os.path.join(store_folder, manifest["metadata_file"])))
+
+        # [first row, last row + 1, number of chunks] of every document
+        document_ranges = {}
+        if len(documents):
+            _, first_rows, counts = np.unique(documents, return_index=True, return_counts=True)
+            last_rows = len(documents) - 1 - np.unique(documents[::-1], return_index=True)[1]
+            document_ranges = {document: [int(first_rows[code]), int(last_rows[code]) + 1, int(counts[code])]
+                               for code, document in enumerate(document_names)}
+
+        description = {
+            "store_version": manifest["version"],
+            "index_type": index_type,
+            "count": len(metadata),
+            "dimension": manifest["dimension"],
+            "documents": document_ranges,
+            "n_lists": 0,
+        }
+
+        if index_type == "ivf" and len(metadata):
+            n_lists = n_lists or max(1, int(math.sqrt(len(metadata))))
+            rng = np.random.default_rng(seed)
+            sample_rows = np.sort(rng.choice(len(metadata), min(train_sample, len(metadata)), replace=False))
+            sample = np.asarray(matrix[sample_rows], dtype=np.float32)
+            n_lists = min(n_lists, len(sample))
+            logger.info(f"Training IVF index: {n_lists} lists on {len(sample)} of {len(metadata)} vectors")
+            centroids = train_kmeans(sample, n_lists, kmeans_iterations, seed)
+
+            assignments = assign_lists(matrix, centroids)
+            ivf_ids = np.argsort(assignments, kind="stable")
+            ivf_offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=n_lists))])
+
+            ivf_vectors = np.lib.format.open_memmap(os.path.join(version_folder, "ivf_vectors.npy"), mode="w+",
+                                                    dtype=matrix.dtype, shape=matrix.shape)
+            for start in range(0, len(ivf_ids), BLOCK_ROWS):
+                block_ids = ivf_ids[start:start + BLOCK_ROWS]
+                # Read the rows of the block in store order, then place them in list order
+                order = np.argsort(block_ids)
+                ivf_vectors[start + order] = matrix[block_ids[order]]
+            ivf_vectors.flush()
+            del ivf_vectors
+
+            np.save(os.path.join(version_folder, "centroids.npy"), centroids)
+            np.save(os.path.join(version_folder, "ivf_ids.npy"), ivf_ids.astype(np.int64))
+            np.save(os.path.join(version_folder, "ivf_offsets.npy"), ivf_offsets.astype(np.int64))
+            description["n_lists"] = n_lists
+
+        write_text_file(os.path.join(version_folder, INDEX_FILE), json.dumps(description, indent=2))
+        # Switch readers to the new version, then drop the older ones
+        write_text_file(os.path.join(index_folder, INDEX_FILE), json.dumps({"version": manifest["version"]}))
+        for folder_name in os.listdir(index_folder):
+            if folder_name != manifest["version"] and os.path.isdir(os.path.join(index_folder, folder_name)):
+                shutil.rmtree(os.path.join(index_folder, folder_name), ignore_errors=True)
+
+        logger.info(f"Vector index built: {description['index_type']}, {description['count']} chunks, "
+                    f"{description['n_lists']} lists, folder: {version_folder}")
+        return description
+
+    except Exception as e:
+        raise srcException(e, sys) from e
+
+
+def get_index_version(index_folder):
+    """
+    Store version the current index of `index_folder` was built from, None when there is no index
+    """
+    index_path = os.path.join(index_folder, INDEX_FILE)
+    if not os.path.exists(index_path):
+        return None
+    with open(index_path, "r", encoding="utf-8") as file:
+        return json.load(file)["version"]
+
+
+def read_index_description(index_folder):
+    """
+    Description (index.json) of the current index of `index_folder`, None when there is no index
+    """
+    version = get_index_version(index_folder)
+    if version is None:
+        return None
+    with open(os.path.join(index_folder, version, INDEX_FILE), "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+class VectorIndex:
+    """
+    Top-k inner-product search over a vector store, with document and page range filters.
+
+    - search_exact: brute-force NumPy scan of the store matrix, block by block (the exact baseline)
+    - search_ivf: inverted file index, only the `n_probe` lists whose centroids are closest to the query
+      are scanned; more lists mean higher recall and higher latency
+
+    Every array is memory-mapped, so loading the index reads a few small files only.
+    """
+    def __init__(self, store_folder, index_folder, n_probe=8, exact_search_rows=50000):
+        try:
+            self.n_probe = n_probe
+            self.exact_search_rows = exact_search_rows
+
+            self.matrix, _, self.manifest = load_vector_store(store_folder, mmap_mode="r", read_metadata=False)
+            self.version = get_index_version(index_folder)
+            if self.version is None:
+                raise FileNotFoundError(f"No vector index in {index_folder}")
+            if self.version != self.manifest.get("version"):
+                raise ValueError(f"Vector index {self.version} is stale, the store is at version "
+                                 f"{self.manifest.get('version')}: rebuild the index")
+
+            version_folder = os.path.join(index_folder, self.version)
+            self.description = read_index_description(index_folder)
+
+            def load(name):
+                return np.load(os.path.join(version_folder, name), mmap_mode="r")
+
+            self.documents = load("documents.npy")
+            self.pages = load("pages.npy")
+            self.document_codes = {document: code for code, document in enumerate(sorted(self.description["documents"]))}
+            self.metadata = MetadataTable(os.path.join(store_folder, self.manifest["metadata_file"]),
+                                          load("metadata_offsets.npy"))
+
+            self.centroids = None
+            if self.description["n_lists"]:
+                self.centroids = np.load(os.path.join(version_folder, "centroids.npy"))
+                self.ivf_vectors = load("ivf_vectors.npy")
+                self.ivf_ids = load("ivf_ids.npy")
+                self.ivf_offsets = np.load(os.path.join(version_folder, "ivf_offsets.npy"))
+
+        except Exception as e:
+            raise srcException(e, sys) from e
+
+    def __len__(self):
+        return self.description["count"]
+
+    def filter_mask(self, ids, document=None, page_range=None):
+        """
+        Boolean mask of the chunk rows `ids` that match the filters, None when there is no filter
+        """
+        mask = None
+        if document is not None:
+            mask = self.documents[ids] == self.document_codes[document]
+        if page_range is not None:
+            first_page, last_page = page_range
+            pages = self.pages[ids]
+            page_mask = (pages >= first_page) & (pages <= last_page)
+            mask = page_mask if mask is None else mask & page_mask
+        return mask
+
+    def search_exact(self, query, k=10, document=None, page_range=None):
+        """
+        Exact top-k: score every chunk (of the filtered document only, when given)
+
+        Returns:
+        - (numpy.ndarray, numpy.ndarray): Scores and store rows of the results, best first
+        """
+        query = normalize_query(query)
+        start, stop = 0, len(self)
+        if document is not None:
+            start, stop, _ = self.description["documents"][document]
+
+        best_scores, best_ids = np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+        for block_start in range(start, stop, BLOCK_ROWS):
+            block_stop = min(block_start + BLOCK_ROWS, stop)
+            ids = np.arange(block_start, block_stop)
+            scores = np.asarray(self.matrix[block_start:block_stop], dtype=np.float32) @ query
+            mask = self.filter_mask(ids, document, page_range)
+            if mask is not None:
+                scores, ids = scores[mask], ids[mask]
+            best_scores, best_ids = top_k(np.concatenate([best_scores, scores]),
+                                          np.concatenate([best_ids, ids]), k)
+        return best_scores, best_ids
+
+    def search_ivf(self, query, k=10, document=None, page_range=None, n_probe=None):
+        """
+        Approximate top-k: scan the `n_probe` inverted lists closest to the query. When the filters leave
+        fewer than k results, the number of probed lists is doubled until k are found or every list is scanned.
+
+        Returns:
+        - (numpy.ndarray, numpy.ndarray): Scores and store rows of the results, best first
+        """
+        query = normalize_query(query)
+        n_lists = len(self.centroids)
+        n_probe = min(n_probe or self.n_probe, n_lists)
+        list_order = np.argsort(-(self.centroids @ query), kind="stable")
+
+        scanned = 0
+        best_scores, best_ids = np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+        while True:
+            probe = list_order[scanned:n_probe]
+            ranges = [(self.ivf_offsets[lst], self.ivf_offsets[lst + 1]) for lst in probe]
+            ids = np.concatenate([self.ivf_ids[start:stop] for start, stop in ranges])
+            # Gather the lists straight into one float32 buffer: a single conversion copy per vector
+            vectors = np.empty((len(ids), self.ivf_vectors.shape[1]), dtype=np.float32)
+            position = 0
+            for start, stop in ranges:
+                vectors[position:position + stop - start] = self.ivf_vectors[start:stop]
+                position += stop - start
+            scores = vectors @ query
+            mask = self.filter_mask(ids, document, page_range)
+            if mask is not None:
+                scores, ids = scores[mask], ids[mask]
+            best_scores, best_ids = top_k(np.concatenate([best_scores, scores]),
+                                          np.concatenate([best_ids, ids]), k)
+
+            scanned = n_probe
+            if len(best_ids) >= k or n_probe >= n_lists:
+                return best_scores, best_ids
+            n_probe = min(n_probe * 2, n_lists)
+
+    def search(self, query, k=10, document=None, page_range=None, exact=False, n_probe=None):
+        """
+        Top-k chunks for a query vector, with optional filters
+
+        Parameters:
+        - query (array-like): Query embedding
+        - k (int): Number of results
+        - document (str): Only return chunks of this document
+        - page_range (tuple): Only return chunks of the pages first_page..last_page (inclusive)
+        - exact (bool): Force the exact search
+        - n_probe (int): Inverted lists scanned by the IVF search, the index default when None
+
+        Returns:
+        - list: Metadata rows of the results (chunk_id, document, page, offsets, text) with their "score"
+          and store "row", best first
+        """
+        if document is not None and document not in self.document_codes:
+            return []
+
+        # Small stores and single documents of at most `exact_search_rows` chunks are scanned exactly:
+        # this is both faster than probing lists and exact
+        rows = len(self)
+        if document is not None:
+            rows = self.description["documents"][document][2]
+        if exact or self.centroids is None or rows <= self.exact_search_rows:
+            scores, ids = self.search_exact(query, k, document, page_range)
+        else:
+            scores, ids = self.search_ivf(query, k, document, page_range, n_probe)
+
+        results = []
+        for score, row in zip(scores, ids):
+            result = self.metadata[row]
+            result["score"] = float(score)
+            result["row"] = int(row)
+            results.append(result)
+        return results
+
+    def close(self):
+        self.metadata.close()
@@ -0,0 +1,350 @@
+import os
+import sys
+import time
+import uuid
+import shutil
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field, asdict, replace
+
+from src.components.document_ingestion import DocumentIngestion
+from src.components.in_memory_processing import InMemoryPageProcessing
+from src.components.text_extraction import TextExtraction
+from src.entity.artifact_entity import ImageOCRTransformationArtifact, PageError
+from src.entity.config_entity import (ServiceConfig, DataIngestionConfig, ImagePreProcessingConfig,
+                                      ImageOCRTransformationConfig, TextExtractionConfig, PageCacheConfig)
+from src.logger import get_logger
+logger = get_logger(__name__)
+from src.exception import srcException
+from src.utils.tesseract_engine import parse_tesseract_config, get_tesseract_api
+from src.utils.paddle_engine import get_paddle_ocr, is_paddleocr_available
+from src.utils.page_cache import PageCache
+
+
+# Warm components of this worker process, built once by init_worker and reused for every job
+_WORKER = {}
+
+
+def init_worker(data_ingestion_config, image_preprocessing_config, image_ocr_transformation_config,
+                text_extraction_config, page_cache_config):
+    """
+    Process pool initializer: build the page processing and text extraction components once per worker
+    process and load the OCR engine, so jobs do not pay for imports and model loading
+    """
+    page_processing = InMemoryPageProcessing(data_ingestion_config, image_preprocessing_config,
+                                             image_ocr_transformation_config, page_cache_config=page_cache_config)
+    text_extraction = TextExtraction(text_extraction_config, ImageOCRTransformationArtifact(
+        ocr_texts_folder=image_ocr_transformation_config.ocr_output_folder))
+    _WORKER["pages"] = page_processing.process_page_range
+    _WORKER["text"] = text_extraction.merge_page
+
+    if page_processing.image_ocr.use_tesserocr():
+        oem, psm = parse_tesseract_config(image_ocr_transformation_config.tesseract_config)
+        get_tesseract_api(image_ocr_transformation_config.tesseract_lang, oem, psm)
+    if page_processing.image_ocr.uses_paddleocr() and is_paddleocr_available():
+        config = image_ocr_transformation_config
+        get_paddle_ocr(config.paddle_lang, config.paddle_use_angle_cls, config.paddle_rec_batch_num,
+                       page_processing.image_ocr.paddle_cpu_threads(), config.paddle_enable_mkldnn)
+
+
+def warm_up():
+    return os.getpid()
+
+
+def run_worker_task(name, task):
+    """
+    Worker entry point: run one task with a warm component of this worker process.
+    Errors travel back as strings, like in run_in_pool.
+    """
+    try:
+        return _WORKER[name](task), None
+    except Exception as e:
+        return None, str(e)
+
+
+@dataclass
+class Job:
+    job_id: str
+    filename: str
+    pdf_path: str
+    status: str = "queued"
+    submitted_at: float = field(default_factory=time.time)
+    started_at: float = None
+    finished_at: float = None
+    pages: int = 0
+    page_types: dict = field(default_factory=dict)
+    blank_pages: int = 0
+    duplicate_pages: int = 0
+    failed_pages: list = field(default_factory=list)
+    text_path: str = None
+    error: str = None
+
+    def to_dict(self):
+        job = asdict(self)
+        del job["pdf_path"], job["text_path"]
+        job["queue_seconds"] = round((self.started_at or time.time()) - self.submitted_at, 3)
+        if self.started_at is not None:
+            job["processing_seconds"] = round((self.finished_at or time.time()) - self.started_at, 3)
+        return job
+
+
+class IngestionService:
+    """
+    Resident OCR service: uploaded PDFs wait in a bounded job queue, a few job runners take them in turn
+    and spread their pages over one process pool that stays warm (imports, OCR engines) for the life of
+    the service. Everything a job writes lives in "<service_folder>/...", in folders named after its job id.
+
+    Memory stays bounded under bursty load: uploads are streamed to disk, the queue only holds job records
+    and refuses jobs beyond `queue_size`, the pool is never given more than two tasks per worker, and only
+    the last `job_history` finished jobs are kept. The page cache is brought back within its size budget
+    after every job.
+    """
+    def __init__(self, service_config: ServiceConfig = None):
+        try:
+            self.service_config = service_config or ServiceConfig()
+            folder = self.service_config.service_folder
+            workers = self.service_config.workers
+
+            self.data_ingestion_config = replace(
+                DataIngestionConfig(), pdf_folder=os.path.join(folder, "pdfs"),
+                pdf_output_folder=os.path.join(folder, "pdf-outputs"),
+                native_text_folder=os.path.join(folder, "native_texts"),
+                chunk_size=self.service_config.pages_per_task, workers=workers)
+            self.image_preprocessing_config = replace(
+                ImagePreProcessingConfig(), output_folder=os.path.join(folder, "preprocessed_images"), workers=workers)
+            self.image_ocr_transformation_config = replace(
+                ImageOCRTransformationConfig(), ocr_output_folder=os.path.join(folder, "ocr_texts"), workers=workers)
+            self.text_extraction_config = replace(
+                TextExtractionConfig(), text_output_folder=os.path.join(folder, "text_outputs"), workers=workers)
+            self.page_cache_config = PageCacheConfig()
+            self.page_cache = (PageCache(self.page_cache_config.cache_folder, self.page_cache_config.max_bytes)
+                               if self.page_cache_config.enabled else None)
+
+            self.native_text_folder = (self.data_ingestion_config.native_text_folder
+                                       if self.data_ingestion_config.native_text_triage else None)
+            self.document_ingestion = DocumentIngestion(data_ingestion_config=self.data_ingestion_config)
+            self.text_extraction = TextExtraction(self.text_extraction_config, ImageOCRTransformationArtifact(
+                ocr_texts_folder=self.image_ocr_transformation_config.ocr_output_folder,
+                native_text_folder=self.native_text_folder))
+
+            self.jobs = OrderedDict()
+            self.queue = None
+            self.slots = None
+            self.pool = None
+            self.runners = []
+            self.running_jobs = 0
+        except Exception as e:
+            raise srcException(e, sys) from e
+
+    async def start(self):
+        """
+        Start the worker pool (every worker warmed up before the first job) and the job runners
+        """
+        workers = self.service_config.workers
+        os.makedirs(self.data_ingestion_config.pdf_folder, exist_ok=True)
+        self.queue = asyncio.Queue(maxsize=self.service_config.queue_size)
+        self.slots = asyncio.Semaphore(2 * workers)
+        self.pool = self.create_pool()
+
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        pids = await asyncio.gather(*(loop.run_in_executor(self.pool, warm_up) for _ in range(workers)))
+        logger.info(f"Worker pool ready: {len(set(pids))} processes warmed up in {time.perf_counter() - start:.1f}s")
+
+        self.runners = [asyncio.create_task(self.run_jobs()) for _ in range(self.service_config.concurrent_jobs)]
+
+    def create_pool(self):
+        return ProcessPoolExecutor(max_workers=self.service_config.workers, initializer=init_worker, initargs=(
+            self.data_ingestion_config, self.image_preprocessing_config, self.image_ocr_transformation_config,
+            self.text_extraction_config, self.page_cache_config))
+
+    def replace_pool(self, pool):
+        """
+        Replace the worker pool broken by a worker process that died (e.g. out of memory on a huge page),
+        unless another job already did: the new workers warm up on their first task
+        """
+        if self.pool is pool:
+            logger.warning("A worker process died, restarting the worker pool")
+            pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = self.create_pool()
+
+    async def stop(self):
+        for runner in self.runners:
+            runner.cancel()
+        await asyncio.gather(*self.runners, return_exceptions=True)
+        if self.pool is not None:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+
+    def is_full(self):
+        return self.queue.full()
+
+    def stats(self):
+        return {"queued": self.queue.qsize(), "running": self.running_jobs, "queue_size": self.queue.maxsize,
+                "workers": self.service_config.workers, "jobs": len(self.jobs)}
+
+    def create_job(self, filename):
+        """
+        New job record, its upload is written to job.pdf_path + ".part" and then handed to enqueue
+        """
+        job_id = uuid.uuid4().hex[:16]
+        return Job(job_id=job_id, filename=os.path.basename(filename or f"{job_id}.pdf"),
+                   pdf_path=os.path.join(self.data_ingestion_config.pdf_folder, f"{job_id}.pdf"))
+
+    def enqueue(self, job):
+        """
+        Queue a job whose upload is complete
+
+        Raises:
+        - asyncio.QueueFull: The queue is full, the upload is deleted
+        """
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            os.remove(f"{job.pdf_path}.part")
+            raise
+        os.replace(f"{job.pdf_path}.part", job.pdf_path)
+        self.jobs[job.job_id] = job
+        logger.info(f"Job {job.job_id} queued: {job.filename}")
+
+    def get_job(self, job_id):
+        return self.jobs.get(job_id)
+
+    async def run_jobs(self):
+        """
+        Job runner: process the queued jobs one after the other
+        """
+        while True:
+            job = await self.queue.get()
+            self.running_jobs += 1
+            try:
+                await self.process_job(job)
+            finally:
+                self.running_jobs -= 1
+                self.queue.task_done()
+                await self.forget_old_jobs()
+
+    async def map_on_pool(self, name, tasks):
+        """
+        Run tasks on the warm pool, at most two per worker in flight across all jobs.
+        Each job waits for one slot at a time, so running jobs take turns instead of a long document
+        holding every worker until it is done.
+
+        Returns:
+        - list: (task, result, error) tuples in the same order as tasks; error is None on success
+        """
+        loop = asyncio.get_running_loop()
+        outcomes = [None] * len(tasks)
+        pending = list(range(len(tasks)))
+        # The tasks a dying worker process took down with the pool run once more on the new pool
+        for attempt in range(2):
+            futures = []
+            for index in pending:
+                await self.slots.acquire()
+                pool = self.pool
+                try:
+                    future = loop.run_in_executor(pool, run_worker_task, name, tasks[index])
+                except BrokenProcessPool:
+                    self.replace_pool(pool)
+                    pool = self.pool
+                    future = loop.run_in_executor(pool, run_worker_task, name, tasks[index])
+                future.add_done_callback(lambda _: self.slots.release())
+                futures.append((index, pool, future))
+
+            broken = []
+            results = await asyncio.gather(*(future for _, _, future in futures), return_exceptions=True)
+            for (index, pool, _), outcome in zip(futures, results):
+                if isinstance(outcome, BrokenProcessPool):
+                    self.replace_pool(pool)
+                    broken.append(index)
+                if isinstance(outcome, BaseException):
+                    # The worker process itself died (e.g. killed by the OS)
+                    outcomes[index] = (tasks[index], None, str(outcome))
+                else:
+                    outcomes[index] = (tasks[index], *outcome)
+            pending = broken
+            if not pending or attempt:
+                break
+            logger.warning(f"Running {len(pending)} {name} task(s) again on the new worker pool")
+        return outcomes
+
+    async def process_job(self, job):
+        """
+        Triage, OCR and text extraction of one uploaded PDF, its pages spread over the worker pool
+        """
+        loop = asyncio.get_running_loop()
+        job.status = "running"
+        job.started_at = time.time()
+        document = job.job_id
+        try:
+            pdf_output_folder = os.path.join(self.data_ingestion_config.pdf_output_folder, document)
+            render_tasks, job.page_types = await loop.run_in_executor(
+                None, self.document_ingestion.get_document_tasks, job.pdf_path, pdf_output_folder, "service")
+
+            for task, result, error in await self.map_on_pool("pages", render_tasks):
+                if error is not None:
+                    _, _, first_page, last_page = task
+                    job.failed_pages.append(PageError("in_memory_processing", document,
+                                                      "all" if first_page is None else f"{first_page}-{last_page}",
+                                                      error))
+                    continue
+                job.blank_pages += result["blank_pages"]
+                job.duplicate_pages += result["duplicate_pages"]
+                job.failed_pages.extend(result["failed_pages"])
+
+            text_output_folder = self.text_extraction_config.text_output_folder
+            page_tasks = await loop.run_in_executor(
+                None, self.text_extraction.get_page_tasks, self.image_ocr_transformation_config.ocr_output_folder,
+                text_output_folder, self.native_text_folder, [document])
+            page_tasks = page_tasks.get(document, [])
+            os.makedirs(os.path.join(text_output_folder, document), exist_ok=True)
+
+            for task, _, error in await self.map_on_pool("text", page_tasks):
+                if error is not None:
+                    job.failed_pages.append(PageError("text_extraction", document, os.path.basename(task[-1]), error))
+
+            job.text_path = await loop.run_in_executor(None, self.text_extraction.write_document_text,
+                                                       text_output_folder, document, page_tasks)
+            job.pages = len(page_tasks)
+            if job.failed_pages and not os.path.getsize(job.text_path):
+                raise ValueError("No text could be extracted from any page")
+            job.status = "done"
+        except Exception as e:
+            logger.error(f"Job {job.job_id} failed: {e}")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            logger.info(f"Job {job.job_id} {job.status}: {job.pages} pages, {len(job.failed_pages)} failed, "
+                        f"queued {job.started_at - job.submitted_at:.2f}s, "
+                        f"processed {job.finished_at - job.started_at:.2f}s")
+
+    async def forget_old_jobs(self):
+        """
+        Drop the oldest finished jobs beyond `job_history`, with their files, and evict the least recently
+        used page cache entries beyond its size budget (the cache outlives the files of the jobs)
+        """
+        finished = [job for job in self.jobs.values() if job.finished_at is not None]
+        loop = asyncio.get_running_loop()
+        for job in finished[:max(len(finished) - self.service_config.job_history, 0)]:
+            del self.jobs[job.job_id]
+            await loop.run_in_executor(None, self.remove_job_files, job)
+        if self.page_cache is not None:
+            await loop.run_in_executor(None, self.page_cache.evict)
+
+    def remove_job_files(self, job):
+        document = job.job_id
+        ocr_output_folder = self.image_ocr_transformation_config.ocr_output_folder
+        folders = [os.path.join(self.data_ingestion_config.pdf_output_folder, document),
+                   os.path.join(self.data_ingestion_config.native_text_folder, document),
+                   os.path.join(self.image_preprocessing_config.output_folder, document),
+                   os.path.join(ocr_output_folder, "PYTESSERACT", document),
+                   os.path.join(ocr_output_folder, "PADDLEOCR", document),
+                   os.path.join(self.text_extraction_config.text_output_folder, document)]
+        for folder in folders:
+            shutil.rmtree(folder, ignore_errors=True)
+        for path in (job.pdf_path, os.path.join(self.text_extraction_config.text_output_folder, f"{document}.txt")):
+            if os.path.exists(path):
+                os.remove(path)
+
@@ -0,0 +1,294 @@
+"""
+HTTP API of the ingestion service (asyncio, standard library only).
+
+    POST /jobs?filename=<name.pdf>   PDF bytes as the request body -> 202 {"job_id", "status_url"}
+                                     429 when the job queue is full (retry after Retry-After seconds)
+    GET  /jobs                       Status of the recent jobs
+    GET  /jobs/<job_id>              Status of a job: queued, running, done or failed, page counts and timings
+    GET  /jobs/<job_id>/text         Extracted text of a finished job (text/plain)
+    POST /query                      {"question", "k", "document", "page_range", "stream"} -> answer with page
+                                     citations, streamed as JSON lines of token events when "stream" is true
+    GET  /metrics                    Query latency percentiles and cache hit rates
+    GET  /health                     Queue and worker pool state
+
+Usage:
+    python service.py [--host 127.0.0.1] [--port 8080] [--workers N]
+    curl --data-binary @invoice.pdf "http://127.0.0.1:8080/jobs?filename=invoice.pdf"
+    curl -d '{"question": "What is the total of invoice INV-2024/0017?"}' http://127.0.0.1:8080/query
+"""
+import os
+import sys
+import json
+import asyncio
+import argparse
+import inspect
+from dataclasses import replace
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qs
+
+from src.entity.config_entity import ServiceConfig
+from src.logger import get_logger
+logger = get_logger(__name__)
+from src.service.ingestion_service import IngestionService
+from src.retrieval.question_answering import QuestionAnswering
+
+UPLOAD_CHUNK_BYTES = 1 << 20
+MAX_JSON_BYTES = 1 << 20
+MAX_HEADER_LINES = 100
+RETRY_AFTER_SECONDS = 5
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class IngestionServer:
+    """
+    Minimal HTTP/1.1 front of an IngestionService: one request per connection
+    """
+    def __init__(self, service: IngestionService):
+        self.service = service
+        self.max_upload_bytes = service.service_config.max_upload_mb * 2 ** 20
+        self.question_answering = None
+        self.question_answering_lock = asyncio.Lock()
+
+    async def read_request(self, reader):
+        """
+        Returns:
+        - (str, str, dict, dict): Method, path, query parameters and lowercased headers
+        """
+        request_line = (await reader.readline()).decode("latin-1").strip()
+        parts = request_line.split()
+        if len(parts) != 3:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Malformed request line")
+        method, target, _ = parts
+
+        headers = {}
+        for _ in range(MAX_HEADER_LINES):
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        else:
+            raise HTTPError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "Too many headers")
+
+        url = urlsplit(target)
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        return method.upper(), url.path.rstrip("/") or "/", query, headers
+
+    async def receive_upload(self, reader, headers, query):
+        """
+        Stream a PDF request body to disk and queue its job. The queue and the size are checked before
+        the body is read, so a refused upload costs nothing.
+        """
+        if self.service.is_full():
+            raise HTTPError(HTTPStatus.TOO_MANY_REQUESTS, "Job queue is full",
+                            {"Retry-After": str(RETRY_AFTER_SECONDS)})
+        if "content-length" not in headers:
+            raise HTTPError(HTTPStatus.LENGTH_REQUIRED, "Content-Length is required")
+        try:
+            length = int(headers["content-length"])
+        except ValueError:
+            length = -1
+        if length < 0:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+        if length > self.max_upload_bytes:
+            raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                            f"Upload larger than {self.service.service_config.max_upload_mb} MB")
+
+        job = self.service.create_job(query.get("filename"))
+        upload_path = f"{job.pdf_path}.part"
+        with open(upload_path, "wb") as file:
+            remaining = length
+            while remaining:
+                data = await reader.read(min(UPLOAD_CHUNK_BYTES, remaining))
+                if not data:
+                    break
+                if remaining == length and not data.startswith(b"%PDF"):
+                    remaining = -1
+                    break
+                file.write(data)
+                remaining -= len(data)
+
+        if remaining:
+            # Truncated upload or not a PDF
+            os.remove(upload_path)
+            if remaining < 0:
+                raise HTTPError(HTTPStatus.UNSUPPORTED_MEDIA_TYPE, "The body is not a PDF")
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Incomplete upload")
+
+        try:
+            self.service.enqueue(job)
+        except asyncio.QueueFull:
+            raise HTTPError(HTTPStatus.TOO_MANY_REQUESTS, "Job queue is full",
+                            {"Retry-After": str(RETRY_AFTER_SECONDS)})
+        return HTTPStatus.ACCEPTED, {"job_id": job.job_id, "status": job.status,
+                                     "status_url": f"/jobs/{job.job_id}"}
+
+    async def read_json(self, reader, headers):
+        length = int(headers.get("content-length", 0))
+        if length > MAX_JSON_BYTES:
+            raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Request body too large")
+        try:
+            return json.loads(await reader.readexactly(length))
+        except (ValueError, asyncio.IncompleteReadError):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "The body is not valid JSON")
+
+    async def get_question_answering(self):
+        """
+        Question answering over the indexes of the pipeline, loaded (retriever, models) on the first query
+        """
+        async with self.question_answering_lock:
+            if self.question_answering is None:
+                loop = asyncio.get_running_loop()
+                try:
+                    self.question_answering = await loop.run_in_executor(None, QuestionAnswering)
+                except Exception as e:
+                    raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE,
+                                    f"Question answering is unavailable: {str(e).strip().splitlines()[-1]}")
+        return self.question_answering
+
+    async def query(self, reader, headers):
+        request = await self.read_json(reader, headers)
+        question = request.get("question") if isinstance(request, dict) else None
+        if not isinstance(question, str) or not question.strip():
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "A question is required")
+        question_answering = await self.get_question_answering()
+        arguments = (question, request.get("k"), request.get("document"), request.get("page_range"))
+        if request.get("stream"):
+            return HTTPStatus.OK, question_answering.stream_answer(*arguments)
+        loop = asyncio.get_running_loop()
+        return HTTPStatus.OK, await loop.run_in_executor(None, question_answering.answer, *arguments)
+
+    def get_job(self, job_id):
+        job = self.service.get_job(job_id)
+        if job is None:
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"Unknown job {job_id}")
+        return job
+
+    async def route(self, method, path, query, headers, reader):
+        """
+        Returns:
+        - (HTTPStatus, dict | str | generator): Status and JSON (dict), plain text (str) or streamed
+          JSON lines (generator of dicts) body
+        """
+        parts = path.strip("/").split("/")
+        if method == "GET" and path == "/health":
+            return HTTPStatus.OK, dict(status="ok", **self.service.stats())
+        if method == "POST" and path == "/query":
+            return await self.query(reader, headers)
+        if method == "GET" and path == "/metrics":
+            metrics = self.question_answering.metrics() if self.question_answering is not None else None
+            return HTTPStatus.OK, {"queries": metrics, "service": self.service.stats()}
+        if parts[0] == "jobs" and len(parts) == 1:
+            if method == "POST":
+                return await self.receive_upload(reader, headers, query)
+            if method == "GET":
+                return HTTPStatus.OK, {"jobs": [job.to_dict() for job in reversed(self.service.jobs.values())]}
+        if method == "GET" and parts[0] == "jobs" and len(parts) == 2:
+            return HTTPStatus.OK, self.get_job(parts[1]).to_dict()
+        if method == "GET" and parts[0] == "jobs" and len(parts) == 3 and parts[2] == "text":
+            job = self.get_job(parts[1])
+            if job.status != "done":
+                raise HTTPError(HTTPStatus.CONFLICT, f"Job {job.job_id} is {job.status}")
+            loop = asyncio.get_running_loop()
+            return HTTPStatus.OK, await loop.run_in_executor(None, read_text, job.text_path)
+        raise HTTPError(HTTPStatus.NOT_FOUND, f"No route for {method} {path}")
+
+    async def handle(self, reader, writer):
+        response_headers = {}
+        try:
+            try:
+                method, path, query, headers = await self.read_request(reader)
+                status, body = await self.route(method, path, query, headers, reader)
+            except HTTPError as e:
+                status, body, response_headers = e.status, {"error": str(e)}, e.headers
+            except Exception as e:
+                logger.error(f"Request failed: {e}")
+                status, body = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)}
+            await self.send_response(writer, status, body, response_headers)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def send_response(self, writer, status, body, headers):
+        if inspect.isgenerator(body):
+            return await self.send_stream(writer, status, body)
+        if isinstance(body, str):
+            content, content_type = body.encode("utf-8"), "text/plain; charset=utf-8"
+        else:
+            content, content_type = json.dumps(body).encode("utf-8"), "application/json"
+        head = [f"HTTP/1.1 {status.value} {status.phrase}", f"Content-Type: {content_type}",
+                f"Content-Length: {len(content)}", "Connection: close"]
+        head.extend(f"{name}: {value}" for name, value in headers.items())
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + content)
+        await writer.drain()
+
+
+    async def send_stream(self, writer, status, events):
+        """
+        Send the events of a generator as JSON lines with chunked transfer encoding, each one as soon as
+        it is produced. The generator runs in a thread so a slow model does not block the event loop.
+        """
+        head = [f"HTTP/1.1 {status.value} {status.phrase}", "Content-Type: application/x-ndjson",
+                "Transfer-Encoding: chunked", "Connection: close"]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                event = await loop.run_in_executor(None, next, events, None)
+            except Exception as e:
+                logger.error(f"Streamed request failed: {e}")
+                event = {"type": "error", "error": str(e)}
+            if event is None:
+                break
+            line = json.dumps(event).encode("utf-8") + b"\n"
+            writer.write(f"{len(line):X}\r\n".encode("latin-1") + line + b"\r\n")
+            await writer.drain()
+            if event["type"] == "error":
+                break
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+def read_text(path):
+    with open(path, "r", encoding="utf-8") as file:
+        return file.read()
+
+
+async def serve(service_config: ServiceConfig):
+    service = IngestionService(service_config)
+    await service.start()
+    server = await asyncio.start_server(IngestionServer(service).handle, service_config.host, service_config.port)
+    logger.info(f"Ingestion service listening on http://{service_config.host}:{service_config.port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=ServiceConfig.host)
+    parser.add_argument("--port", type=int, default=ServiceConfig.port)
+    parser.add_argument("--workers", type=int, default=ServiceConfig.workers)
+    parser.add_argument("--queue-size", type=int, default=ServiceConfig.queue_size)
+    args = parser.parse_args()
+
+    service_config = replace(ServiceConfig(), host=args.host, port=args.port, workers=args.workers,
+                             queue_size=args.queue_size)
+    try:
+        asyncio.run(serve(service_config))
+    except KeyboardInterrupt:
+        logger.info("Ingestion service stopped")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,43 @@
+import os
+
+# sentence-transformers pulls in torch: it is only imported when the embedding stage actually runs
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
+from src.logger import get_logger
+logger = get_logger(__name__)
+
+
+# Warm models of this process, keyed by (model_name, device). With the process pool every
+# worker process loads the model once and reuses it for all the batches it is given.
+_EMBEDDING_MODELS = {}
+
+
+def get_embedding_model(model_name, device="cpu", workers=1):
+    """
+    Return the warm sentence-transformer model of this process, loading it on first use.
+    The CPU threads of torch are split between the pool workers so they do not oversubscribe the cores.
+    """
+    key = (model_name, device)
+    if key not in _EMBEDDING_MODELS:
+        if SentenceTransformer is None:
+            raise ImportError("sentence-transformers is required by the embedding stage: pip install sentence-transformers")
+        import torch
+        torch.set_num_threads(max(1, (os.cpu_count() or 1) // max(workers, 1)))
+        logger.info(f"Loading embedding model {model_name} on {device}")
+        _EMBEDDING_MODELS[key] = SentenceTransformer(model_name, device=device)
+    return _EMBEDDING_MODELS[key]
+
+
+def embed_texts(texts, model_name, device="cpu", batch_size=64, workers=1):
+    """
+    Embed a batch of texts with the warm model of this process
+
+    Returns:
+    - numpy.ndarray: float32 matrix of L2-normalized embeddings, one row per text
+    """
+    model = get_embedding_model(model_name, device, workers)
+    return model.encode(list(texts), batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=True,
+                        show_progress_bar=False).astype("float32", copy=False)
@@ -0,0 +1,129 @@
+import cv2
+import numpy as np
+
+from src.entity.artifact_entity import TextRegion
+
+# Fewer glyphs than this and the page has no layout worth analysing
+MIN_GLYPHS = 20
+# Pages are analysed shrunk by an integer factor to about this width, glyphs stay several pixels high
+ANALYSIS_WIDTH = 1000
+
+
+def text_mask(gray):
+    """
+    Binary mask (white on black) of the glyphs of a page and their median height. Specks, rules and
+    pictures (components much larger than a glyph) are left out so they cannot bridge columns.
+
+    Returns:
+    - (np.ndarray, int): Glyph mask and median glyph height in pixels, (None, None) without enough glyphs
+    """
+    binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)[1]
+    binary = cv2.morphologyEx(binary, cv2.MORPH_OPEN, np.ones((2, 2), np.uint8))
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    widths, heights = stats[1:, cv2.CC_STAT_WIDTH], stats[1:, cv2.CC_STAT_HEIGHT]
+
+    candidates = (heights >= 4) & (heights <= gray.shape[0] // 10)
+    if np.count_nonzero(candidates) < MIN_GLYPHS:
+        return None, None
+    glyph_height = int(np.median(heights[candidates]))
+
+    # Headline letters are kept (up to 4 glyph heights), horizontal rules are not
+    glyphs = (heights >= 3) & (heights <= 4 * glyph_height) & ~((widths > 10 * glyph_height) & (heights < glyph_height // 2))
+    keep = np.concatenate([[False], glyphs])
+    return np.where(keep[labels], 255, 0).astype(np.uint8), glyph_height
+
+
+def find_blocks(mask, glyph_height):
+    """
+    Text blocks of a glyph mask: glyphs are smeared together over two glyph heights, so letters and words
+    join (but not columns, whose gutters are wider) and so do the lines of a paragraph
+
+    Returns:
+    - list: (left, top, right, bottom) boxes of the blocks
+    """
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (2 * glyph_height, 2 * glyph_height))
+    smeared = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+    count, _, stats, _ = cv2.connectedComponentsWithStats(smeared, connectivity=8)
+    return [(int(x), int(y), int(x + w), int(y + h)) for x, y, w, h, _ in stats[1:]]
+
+
+def split_on_gaps(boxes, axis):
+    """
+    Split boxes into groups separated by an empty band along an axis (0: columns, 1: rows), in order
+    """
+    boxes = sorted(boxes, key=lambda box: box[axis])
+    groups = [[boxes[0]]]
+    end = boxes[0][axis + 2]
+    for box in boxes[1:]:
+        if box[axis] >= end:
+            groups.append([])
+        groups[-1].append(box)
+        end = max(end, box[axis + 2])
+    return groups
+
+
+def xy_cut(boxes):
+    """
+    Recursive XY-cut of blocks into regions in reading order: columns are cut first, then rows.
+
+    Wherever the paragraph breaks of side by side columns line up, the columns also split into rows,
+    which read one after the other would interleave the columns. So consecutive rows are gathered into
+    bands as long as the band still has a gutter (the rows of a multi column body, even a row where only
+    one column has text) or none of them has one (a single column run), and each band is cut on its own.
+
+    Returns:
+    - list: Regions in reading order, each a list of boxes
+    """
+    columns = split_on_gaps(boxes, 0)
+    if len(columns) > 1:
+        return [region for column in columns for region in xy_cut(column)]
+
+    rows = split_on_gaps(boxes, 1)
+    if len(rows) == 1:
+        return [boxes]
+
+    def has_columns(band):
+        return len(split_on_gaps(band, 0)) > 1
+
+    bands = [rows[0]]
+    for row in rows[1:]:
+        if has_columns(bands[-1] + row) or not (has_columns(bands[-1]) or has_columns(row)):
+            bands[-1] = bands[-1] + row
+        else:
+            bands.append(row)
+    return [region for band in bands for region in (xy_cut(band) if has_columns(band) else [band])]
+
+
+def find_text_regions(gray, block_psm=6, line_psm=7):
+    """
+    Cut a page into the text regions (columns, blocks beside one another) Tesseract should read one by one,
+    in reading order. A region of a single line is read with `line_psm`, any other with `block_psm`.
+
+    Returns:
+    - list: TextRegion of the page in reading order, a single region when the page has no columns
+      and an empty list when it has too little text
+    """
+    h, w = gray.shape[:2]
+    scale = max(1, w // ANALYSIS_WIDTH)
+    if scale > 1:
+        gray = cv2.resize(gray[:h // scale * scale, :w // scale * scale], (w // scale, h // scale),
+                          interpolation=cv2.INTER_AREA)
+
+    mask, glyph_height = text_mask(gray)
+    if mask is None:
+        return []
+    blocks = find_blocks(mask, glyph_height)
+    if not blocks:
+        return []
+
+    margin = glyph_height // 2
+    regions = []
+    for boxes in xy_cut(blocks):
+        left = max((min(box[0] for box in boxes) - margin) * scale, 0)
+        top = max((min(box[1] for box in boxes) - margin) * scale, 0)
+        right = min((max(box[2] for box in boxes) + margin) * scale, w)
+        bottom = min((max(box[3] for box in boxes) + margin) * scale, h)
+        single_line = len(boxes) == 1 and boxes[0][3] - boxes[0][1] < 2 * glyph_height
+        regions.append(TextRegion(left=left, top=top, width=right - left, height=bottom - top,
+                                  psm=line_psm if single_line else block_psm))
+    return regions
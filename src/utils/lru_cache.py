@@ -0,0 +1,40 @@
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache of at most `max_items` entries, counting its hits and misses
+    """
+    def __init__(self, max_items):
+        self.max_items = max_items
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.items:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self.items.move_to_end(key)
+            return self.items[key]
+
+    def put(self, key, value):
+        if self.max_items <= 0:
+            return
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.max_items:
+                self.items.popitem(last=False)
+
+    def __len__(self):
+        return len(self.items)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"items": len(self.items), "hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None}
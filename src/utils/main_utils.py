@@ -1,8 +1,19 @@
 import os
+import re
 import sys
+import time
+import hashlib
+from glob import glob
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 from src.exception import srcException
-from src.logger import logging
+from src.logger import get_logger
+from src.instrumentation import measure_task, record_task
+logger = get_logger(__name__)
+
+# Page files of text extraction are named "<document>_page_<n>.txt"
+PAGE_NUMBER_PATTERN = re.compile(r"_page_(\d+)$")
 
 
 def read_files(file_path):
@@ -14,8 +25,257 @@ def read_files(file_path):
         - str: Text files
     """
     try:
-        with open(file_path,'r') as file:
+        with open(file_path,'r', encoding="utf-8") as file:
             content = file.read()
             return content
     except Exception as e:
-        raise srcException(e, sys) from e
\ No newline at end of file
+        raise srcException(e, sys) from e
+
+def write_text_file(file_path, content):
+    """
+    Write a text file atomically (through a temporary file), so an interrupted run never leaves
+    a truncated output that looks up to date
+    Parameters:
+        - file_path(str): Path of the text file
+        - content(str): Text to write
+    """
+    try:
+        temp_path = f"{file_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            file.write(content)
+        os.replace(temp_path, file_path)
+    except Exception as e:
+        raise srcException(e, sys) from e
+
+
+def is_up_to_date(output_path, input_paths):
+    """
+    Whether output_path exists and is at least as recent as every one of input_paths
+    """
+    if not os.path.exists(output_path):
+        return False
+    output_mtime = os.path.getmtime(output_path)
+    return all(os.path.getmtime(input_path) <= output_mtime for input_path in input_paths)
+
+
+def natural_sort_key(name):
+    """
+    Sort key that orders embedded numbers numerically, e.g. "page_2" before "page_10"
+    """
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", name)]
+
+
+
+def call_and_capture(func, task):
+    """
+    Call func(task) and return (result, error, metrics) so that failures travel back from worker
+    processes as plain strings instead of (possibly unpicklable) exception objects, together with
+    the time, I/O and memory the task used
+    """
+    with measure_task() as metrics:
+        try:
+            result, error = func(task), None
+        except Exception as e:
+            result, error = None, str(e)
+    return result, error, metrics
+
+
+def run_in_pool(func, tasks, workers=1, stage=None, retries=0, backoff=0.0, on_error=None, on_result=None):
+    """
+    Apply func to every task, spreading the work across a process pool.
+    Errors are gathered per task instead of aborting the remaining tasks.
+
+    Parameters:
+        - func (callable): Picklable callable (module function or bound method) applied to each task
+        - tasks (iterable): Work items
+        - workers (int): Number of worker processes, 1 runs the tasks in the current process
+        - stage (str): Stage name the per-task metrics are recorded under in the run report
+        - retries (int): Times a failed task is run again
+        - backoff (float): Seconds before the first retry, doubled at every retry
+        - on_error (callable): on_error(task, error) is called in this process as soon as a task fails and
+          returns whether it may be retried, every failure is retried when it is None
+        - on_result (callable): on_result(task, result) is called in this process as soon as a task succeeds,
+          e.g. to journal it before the remaining tasks are done
+    Returns:
+        - list: (task, result, error) tuples in the same order as tasks; error is None on success
+    """
+    tasks = list(tasks)
+    outcomes = [None] * len(tasks)
+    pending = list(range(len(tasks)))
+    for attempt in range(retries + 1):
+        if attempt:
+            time.sleep(backoff * 2 ** (attempt - 1))
+            logger.info(f"Retrying {len(pending)} failed task(s) of {stage}, attempt {attempt + 1}")
+        failed = []
+        for index, outcome in zip(pending, iter_pool(func, [tasks[index] for index in pending], workers, stage)):
+            outcomes[index] = outcome
+            task, result, error = outcome
+            if error is None:
+                if on_result is not None:
+                    on_result(task, result)
+            elif (on_error is None or on_error(task, error)) and attempt < retries:
+                failed.append(index)
+        pending = failed
+        if not pending:
+            break
+    return outcomes
+
+
+def pool_outcomes(func, tasks, workers):
+    """
+    Yield the (result, error, metrics) of every task run across a new process pool, in order, or None for
+    the tasks the pool could not finish because one of its worker processes died
+    """
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+        futures = [executor.submit(call_and_capture, func, task) for task in tasks]
+        for future in futures:
+            try:
+                yield future.result()
+            except BrokenProcessPool:
+                yield None
+            except Exception as e:
+                yield None, str(e), None
+
+
+def iter_pool(func, tasks, workers, stage, rerun=0):
+    """
+    Yield the (task, result, error) of every task in order, as soon as it is done (see run_in_pool)
+
+    A task that kills its worker process (out of memory, a crash in a native OCR engine) breaks the pool
+    for every task it had not finished. Those tasks did not fail by themselves: they run again in a new
+    pool, then one at a time in a process of their own if the pool breaks again, where a dying worker
+    is the failure of its task only.
+    """
+    if not tasks:
+        return
+    # A single task still gets a worker process when there is a pool: a task that kills its process
+    # (typically the retry of the one that broke the pool) must not take this one down with it
+    if not workers or workers <= 1:
+        for task in tasks:
+            result, error, metrics = call_and_capture(func, task)
+            record_task(stage, task, error, metrics)
+            yield task, result, error
+        return
+
+    def record(task, outcome):
+        result, error, metrics = outcome
+        record_task(stage, task, error, metrics)
+        return task, result, error
+
+    isolated = rerun >= 2 or rerun and len(tasks) == 1
+    if isolated:
+        outcomes = (outcome for task in tasks for outcome in pool_outcomes(func, [task], 1))
+    else:
+        outcomes = pool_outcomes(func, tasks, workers)
+
+    # Tasks from the first one the pool did not finish on are held back, to be yielded in order
+    held = []
+    for task, outcome in zip(tasks, outcomes):
+        if outcome is None and isolated:
+            outcome = (None, "The worker process running the task died", None)
+        if held or outcome is None:
+            held.append((task, outcome))
+        else:
+            yield record(task, outcome)
+    if not held:
+        return
+
+    unfinished = [task for task, outcome in held if outcome is None]
+    logger.warning(f"A worker process of {stage} died, running its {len(unfinished)} unfinished task(s) again"
+                   f"{' one at a time' if rerun else ''}")
+    reruns = iter_pool(func, unfinished, workers, stage, rerun + 1)
+    for task, outcome in held:
+        yield next(reruns) if outcome is None else record(task, outcome)
+
+
+def group_consecutive(numbers):
+    """
+    Group sorted integers into inclusive (first, last) runs of consecutive values
+    e.g. [1, 2, 3, 7, 9, 10] -> [(1, 3), (7, 7), (9, 10)]
+    """
+    runs = []
+    for number in numbers:
+        if runs and number == runs[-1][1] + 1:
+            runs[-1] = (runs[-1][0], number)
+        else:
+            runs.append((number, number))
+    return runs
+
+
+def chunk_text(text, chunk_size, chunk_overlap):
+    """
+    Split a text into chunks of whole words of at most `chunk_size` characters, consecutive chunks
+    sharing up to `chunk_overlap` characters. A word longer than `chunk_size` is a chunk on its own.
+    Parameters:
+        - text(str): Text to split
+        - chunk_size(int): Maximum characters per chunk
+        - chunk_overlap(int): Maximum characters shared by consecutive chunks
+    Returns:
+        - list: (start, end) character offsets of the chunks in text
+    """
+    words = [(match.start(), match.end()) for match in re.finditer(r"\S+", text)]
+    spans = []
+    first = 0
+    while first < len(words):
+        # Extend the chunk word by word while it fits
+        last = first + 1
+        while last < len(words) and words[last][1] - words[first][0] <= chunk_size:
+            last += 1
+        spans.append((words[first][0], words[last - 1][1]))
+        if last == len(words):
+            break
+
+        # Start the next chunk on the earliest word that keeps the overlap within chunk_overlap
+        # and still leaves room for the next word
+        next_first = last
+        while (next_first - 1 > first and words[last - 1][1] - words[next_first - 1][0] <= chunk_overlap
+               and words[last][1] - words[next_first - 1][0] <= chunk_size):
+            next_first -= 1
+        first = next_first
+    return spans
+
+
+def list_page_files(text_output_folder):
+    """
+    Page text files of the text extraction output, "<text_output_folder>/<document>/<page>.txt"
+    Returns:
+        - list: (document, page_file_path) in document and page order, empty when no page was extracted
+          (the folder is only created for documents with pages)
+    """
+    if not os.path.isdir(text_output_folder):
+        return []
+    documents = sorted(document for document in os.listdir(text_output_folder)
+                       if os.path.isdir(os.path.join(text_output_folder, document)))
+    return [(document, page_file_path) for document in documents
+            for page_file_path in sorted(glob(os.path.join(text_output_folder, document, "*.txt")), key=natural_sort_key)]
+
+
+def read_page_chunks(document, page_file_path, chunk_size, chunk_overlap):
+    """
+    Chunk one page text file of the text extraction output
+    Parameters:
+        - document(str): Document the page belongs to
+        - page_file_path(str): Path of the page text file
+        - chunk_size(int), chunk_overlap(int): See chunk_text
+    Returns:
+        - list: One row per chunk: chunk_id, document, page name and number, character offsets
+          in the page text, text hash and text
+    """
+    page_name = os.path.splitext(os.path.basename(page_file_path))[0]
+    page_number = PAGE_NUMBER_PATTERN.search(page_name)
+    text = read_files(page_file_path)
+
+    chunks = []
+    for start, end in chunk_text(text, chunk_size, chunk_overlap):
+        content = text[start:end]
+        chunks.append({
+            "chunk_id": f"{page_name}:{start}",
+            "document": document,
+            "page_name": page_name,
+            "page": int(page_number.group(1)) if page_number else None,
+            "start": start,
+            "end": end,
+            "hash": hashlib.sha256(content.encode("utf-8")).hexdigest(),
+            "text": content,
+        })
+    return chunks
@@ -0,0 +1,93 @@
+import re
+
+# A token is a maximal run of non-whitespace characters: the words of a Tesseract result are the tokens
+# of its text, in the same order
+TOKEN_PATTERN = re.compile(r"\S+")
+# Margin around a word region cut out for the second engine, as a fraction of the region height
+REGION_PADDING = 0.3
+
+
+def page_confidence(words):
+    """
+    Mean confidence (0-100) of OCR words weighted by their length, 0 when there is no word
+    """
+    characters = sum(len(word.text) for word in words)
+    if characters == 0:
+        return 0.0
+    return sum(max(word.conf, 0.0) * len(word.text) for word in words) / characters
+
+
+def same_line(word, other):
+    """
+    Whether two words are on the same text line: their boxes overlap vertically over half the smaller height
+    """
+    overlap = min(word.top + word.height, other.top + other.height) - max(word.top, other.top)
+    return overlap > 0.5 * min(word.height, other.height)
+
+
+def count_lines(words):
+    """
+    Number of text lines of a page from its words in reading order
+    """
+    return sum(1 for index, word in enumerate(words) if index == 0 or not same_line(words[index - 1], word))
+
+
+def find_low_confidence_regions(words, min_conf):
+    """
+    Group the words of a page read with a confidence below `min_conf` into regions: runs of consecutive
+    words (in reading order) on the same text line
+
+    Returns:
+    - list: (first, last) word indices of every region
+    """
+    regions = []
+    for index, word in enumerate(words):
+        if word.conf >= min_conf:
+            continue
+        if regions and regions[-1][1] == index - 1 and same_line(words[index - 1], word):
+            regions[-1][1] = index
+        else:
+            regions.append([index, index])
+    return [tuple(region) for region in regions]
+
+
+def region_box(words, first, last, shape):
+    """
+    Box of the words `first`..`last` of a page with a margin, clipped to the page of `shape`
+
+    Returns:
+    - (int, int, int, int): left, top, right, bottom
+    """
+    region_words = words[first:last + 1]
+    left = min(word.left for word in region_words)
+    top = min(word.top for word in region_words)
+    right = max(word.left + word.width for word in region_words)
+    bottom = max(word.top + word.height for word in region_words)
+    padding = max(2, int(REGION_PADDING * (bottom - top)))
+    return (max(0, left - padding), max(0, top - padding),
+            min(shape[1], right + padding), min(shape[0], bottom + padding))
+
+
+def replace_word_runs(text, words, replacements):
+    """
+    Replace runs of words in the text of a page, keeping the rest of the text (and its layout) as is
+
+    Parameters:
+    - text (str): Page text whose tokens are `words`
+    - words (list): OCRWord of the page, in reading order
+    - replacements (dict): (first, last) word indices -> text replacing those words
+
+    Returns:
+    - str: The new text, None when the words are not the tokens of the text
+    """
+    spans = [match.span() for match in TOKEN_PATTERN.finditer(text)]
+    if len(spans) != len(words):
+        return None
+    pieces = []
+    position = 0
+    for (first, last), replacement in sorted(replacements.items()):
+        pieces.append(text[position:spans[first][0]])
+        pieces.append(replacement)
+        position = spans[last][1]
+    pieces.append(text[position:])
+    return "".join(pieces)
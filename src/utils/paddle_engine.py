@@ -0,0 +1,154 @@
+import os
+
+import cv2
+import numpy as np
+
+# PaddleOCR (and paddlepaddle under it) takes seconds to import and to load its models: it is only
+# imported here, and the models of a process are loaded once and kept warm by get_paddle_ocr
+try:
+    from paddleocr import PaddleOCR
+except ImportError:
+    PaddleOCR = None
+
+from src.entity.artifact_entity import OCRWord, OCRPageResult
+from src.logger import get_logger
+logger = get_logger(__name__)
+
+
+# Warm PaddleOCR models of this process, keyed by their settings.
+# With the process pool every worker process loads the detection and recognition models once.
+_PADDLE_OCRS = {}
+
+# Text boxes whose tops are closer than this (in pixels) are on the same line
+LINE_TOLERANCE = 10
+
+
+def is_paddleocr_available():
+    return PaddleOCR is not None
+
+
+def get_paddle_ocr(lang, use_angle_cls=False, rec_batch_num=32, cpu_threads=0, enable_mkldnn=True):
+    """
+    Return the warm CPU PaddleOCR models of this process for the given settings, loading them on first use
+
+    Parameters:
+    - lang (str): PaddleOCR language, e.g. "en"
+    - use_angle_cls (bool): Also load the text direction classifier (upside down text lines)
+    - rec_batch_num (int): Text lines recognized per forward pass
+    - cpu_threads (int): Math library threads of the models, 0 uses every CPU
+    - enable_mkldnn (bool): Run the models with oneDNN (MKL-DNN) kernels, several times faster on x86 CPUs
+    """
+    key = (lang, use_angle_cls, rec_batch_num, cpu_threads, enable_mkldnn)
+    if key not in _PADDLE_OCRS:
+        logger.info(f"Loading PaddleOCR models lang={lang} angle_cls={use_angle_cls} cpu_threads={cpu_threads}")
+        _PADDLE_OCRS[key] = PaddleOCR(lang=lang, use_angle_cls=use_angle_cls, use_gpu=False, show_log=False,
+                                      rec_batch_num=rec_batch_num, cpu_threads=cpu_threads or os.cpu_count() or 1,
+                                      enable_mkldnn=enable_mkldnn)
+    return _PADDLE_OCRS[key]
+
+
+def to_bgr_array(image):
+    """
+    Convert an image path or an OpenCV (BGR or grayscale) array into the BGR array PaddleOCR reads
+    """
+    if isinstance(image, np.ndarray):
+        return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR) if image.ndim == 2 else image
+    bgr = cv2.imread(image, cv2.IMREAD_COLOR)
+    if bgr is None:
+        raise ValueError(f"Could not load image: {image}")
+    return bgr
+
+
+def sort_boxes(boxes):
+    """
+    Sort detected text boxes (4 corners, clockwise from the top left one) in reading order:
+    top to bottom, then left to right within a line
+    """
+    boxes = sorted(boxes, key=lambda box: (box[0][1], box[0][0]))
+    lines = []
+    for box in boxes:
+        if lines and abs(box[0][1] - lines[-1][0][0][1]) < LINE_TOLERANCE:
+            lines[-1].append(box)
+        else:
+            lines.append([box])
+    return [box for line in lines for box in sorted(line, key=lambda box: box[0][0])]
+
+
+def crop_text_box(image, box):
+    """
+    Crop a detected text box out of a page, straightened by a perspective transform. A box much taller
+    than wide is a vertical line of text and is turned to read horizontally.
+    """
+    box = np.float32(box)
+    width = int(max(np.linalg.norm(box[0] - box[1]), np.linalg.norm(box[2] - box[3])))
+    height = int(max(np.linalg.norm(box[0] - box[3]), np.linalg.norm(box[1] - box[2])))
+    target = np.float32([[0, 0], [width, 0], [width, height], [0, height]])
+    crop = cv2.warpPerspective(image, cv2.getPerspectiveTransform(box, target), (width, height),
+                               borderMode=cv2.BORDER_REPLICATE, flags=cv2.INTER_CUBIC)
+    if height >= 1.5 * width:
+        crop = np.ascontiguousarray(np.rot90(crop))
+    return crop
+
+
+def ocr_with_paddleocr_batch(images, lang, use_angle_cls=False, rec_batch_num=32, cpu_threads=0, enable_mkldnn=True,
+                             drop_score=0.5):
+    """
+    OCR a batch of pages with the warm PaddleOCR models of this process. Text boxes are detected page by
+    page (pages differ in size), then the text lines of all the pages are recognized together, sorted by
+    width by the recognizer so every forward pass is a full batch of lines of similar shape, instead of
+    a few small batches per page.
+
+    Parameters:
+    - images (list): Paths to the page images or in-memory pages
+    - use_angle_cls, rec_batch_num, cpu_threads, enable_mkldnn: Model settings, see get_paddle_ocr
+    - drop_score (float): Recognized lines less confident than this are dropped
+
+    Returns:
+    - list: OCRPageResult of every page, its words are the text lines with their box and confidence (0-100)
+    """
+    paddle_ocr = get_paddle_ocr(lang, use_angle_cls, rec_batch_num, cpu_threads, enable_mkldnn)
+
+    crops = []
+    owners = []
+    for page_index, image in enumerate(images):
+        image = to_bgr_array(image)
+        boxes, _ = paddle_ocr.text_detector(image)
+        if boxes is None:
+            continue
+        for box in sort_boxes([box.tolist() for box in boxes]):
+            crops.append(crop_text_box(image, box))
+            owners.append((page_index, box))
+
+    if crops and use_angle_cls:
+        crops, _, _ = paddle_ocr.text_classifier(crops)
+    recognized, _ = paddle_ocr.text_recognizer(crops) if crops else ([], None)
+
+    results = [OCRPageResult(text="") for _ in images]
+    for (page_index, box), (text, score) in zip(owners, recognized):
+        if score < drop_score or not text.strip():
+            continue
+        xs, ys = [int(x) for x, _ in box], [int(y) for _, y in box]
+        result = results[page_index]
+        result.text += f"{text}\n"
+        result.words.append(OCRWord(text=text, left=min(xs), top=min(ys), width=max(xs) - min(xs),
+                                    height=max(ys) - min(ys), conf=round(float(score) * 100, 2)))
+    return results
+
+
+def recognize_paddleocr_lines(images, lang, use_angle_cls=False, rec_batch_num=32, cpu_threads=0, enable_mkldnn=True):
+    """
+    Recognize images that are each a single line of text (e.g. word regions cut out of a page) with the
+    warm PaddleOCR recognizer of this process, without running text detection on them
+
+    Parameters:
+    - images (list): Text line images (BGR or grayscale arrays)
+    - use_angle_cls, rec_batch_num, cpu_threads, enable_mkldnn: Model settings, see get_paddle_ocr
+
+    Returns:
+    - list: (text, confidence 0-100) of every image
+    """
+    if not images:
+        return []
+    paddle_ocr = get_paddle_ocr(lang, use_angle_cls, rec_batch_num, cpu_threads, enable_mkldnn)
+    recognized, _ = paddle_ocr.text_recognizer([to_bgr_array(image) for image in images])
+    return [(text, round(float(score) * 100, 2)) for text, score in recognized]
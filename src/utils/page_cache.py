@@ -0,0 +1,129 @@
+import os
+import sys
+import hashlib
+from functools import lru_cache
+
+from src.logger import get_logger
+logger = get_logger(__name__)
+from src.exception import srcException
+
+
+@lru_cache(maxsize=256)
+def _file_digest(file_path, size, mtime_ns):
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def file_digest(file_path):
+    """
+    SHA-256 of a file's bytes, memoized per process on (path, size, mtime)
+    so a large PDF is hashed once even when its pages are split across many tasks
+    """
+    stat = os.stat(file_path)
+    return _file_digest(os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+
+
+def bytes_digest(data):
+    """
+    SHA-256 of in-memory bytes
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+class PageCache:
+    """
+    Content-addressed cache of per-page stage outputs.
+
+    Entries are stored as `<cache_folder>/<stage>/<key[:2]>/<key>` where the key is a hash of the stage
+    inputs (source bytes, page number and the config that affects the output), so an entry can never be
+    stale: any change to the inputs or the config produces a different key.
+    Writes go through a temporary file and an atomic rename, so concurrent workers can share one cache.
+    Eviction is least-recently-used (by file modification time, refreshed on every hit) against a size budget.
+    """
+    def __init__(self, cache_folder, max_bytes):
+        self.cache_folder = cache_folder
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def make_key(*parts):
+        """
+        Build a cache key from the stage inputs and the relevant config values
+        """
+        return hashlib.sha256(repr(parts).encode("utf-8")).hexdigest()
+
+    def entry_path(self, stage, key):
+        return os.path.join(self.cache_folder, stage, key[:2], key)
+
+    def get(self, stage, key):
+        """
+        Return the cached bytes of an entry, or None on a miss
+        """
+        entry_path = self.entry_path(stage, key)
+        try:
+            with open(entry_path, "rb") as file:
+                data = file.read()
+        except OSError:
+            return None
+
+        try:
+            # Mark the entry as recently used for the LRU eviction
+            os.utime(entry_path, None)
+        except OSError:
+            pass
+        return data
+
+    def put(self, stage, key, data):
+        """
+        Store the bytes of an entry
+        """
+        entry_path = self.entry_path(stage, key)
+        try:
+            os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+            temp_path = f"{entry_path}.{os.getpid()}.tmp"
+            with open(temp_path, "wb") as file:
+                file.write(data)
+            os.replace(temp_path, entry_path)
+        except OSError as e:
+            # A cache that cannot be written to must never fail the pipeline
+            logger.warning(f"Could not write cache entry {entry_path}: {e}")
+
+    def evict(self):
+        """
+        Delete the least recently used entries until the cache fits in its size budget
+
+        Returns:
+        - int: Number of entries deleted
+        """
+        try:
+            entries = []
+            total_bytes = 0
+            for root, _, file_names in os.walk(self.cache_folder):
+                for file_name in file_names:
+                    entry_path = os.path.join(root, file_name)
+                    try:
+                        stat = os.stat(entry_path)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry_path))
+                    total_bytes += stat.st_size
+
+            deleted = 0
+            if total_bytes > self.max_bytes:
+                for _, size, entry_path in sorted(entries):
+                    if total_bytes <= self.max_bytes:
+                        break
+                    try:
+                        os.remove(entry_path)
+                    except OSError:
+                        continue
+                    total_bytes -= size
+                    deleted += 1
+
+            logger.info(f"Page cache size: {total_bytes} bytes, evicted entries: {deleted}")
+            return deleted
+
+        except Exception as e:
+            raise srcException(e, sys) from e
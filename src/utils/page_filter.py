@@ -0,0 +1,174 @@
+import json
+import base64
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from src.entity.artifact_entity import PageSignature
+
+# Side of the perceptual hash grid, the hash has HASH_SIZE**2 bits
+HASH_SIZE = 16
+# Width of the page thumbnails compared to confirm a near duplicate
+THUMBNAIL_WIDTH = 256
+
+
+def ink_statistics(gray, binary):
+    """
+    Ink density and contrast of a page, from its grayscale image and the Otsu binarized image
+    (white ink on black) that correct_skew computes.
+
+    A blank page binarized by Otsu is either empty (a clean white page) or split in two halves of
+    scanner noise: its ink density is near zero, or its ink is barely darker than its background.
+
+    Returns:
+    - (float, float): Fraction of the page covered by ink once single-pixel specks are removed, and
+      the difference of mean gray level between the background and the ink
+    """
+    opened = cv2.morphologyEx(binary, cv2.MORPH_OPEN, np.ones((2, 2), np.uint8))
+    ink = cv2.countNonZero(opened) / opened.size
+
+    # Gray level means over every other pixel of every other row, a quarter of the work for the same means
+    gray = np.ascontiguousarray(gray[::2, ::2])
+    binary = np.ascontiguousarray(binary[::2, ::2])
+    ink_pixels = cv2.countNonZero(binary)
+    if ink_pixels == 0 or ink_pixels == binary.size:
+        return ink, 0.0
+    ink_mean = cv2.mean(gray, mask=binary)[0]
+    background_mean = (cv2.mean(gray)[0] * binary.size - ink_mean * ink_pixels) / (binary.size - ink_pixels)
+    return ink, background_mean - ink_mean
+
+
+def perceptual_hash(gray, hash_size=HASH_SIZE):
+    """
+    DCT perceptual hash of a page (or of its thumbnail): the low frequencies of the page shrunk to
+    (4 * hash_size)^2, one bit per coefficient above their median. Two renderings of the same page differ
+    in a few bits, different pages in about half of them.
+
+    Returns:
+    - int: hash_size**2 bit hash
+    """
+    small = cv2.resize(gray, (4 * hash_size, 4 * hash_size), interpolation=cv2.INTER_AREA)
+    low_frequencies = cv2.dct(np.float32(small))[:hash_size, :hash_size].flatten()
+    # The DC coefficient is the mean brightness, left out of the median
+    bits = low_frequencies > np.median(low_frequencies[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def make_thumbnail(gray, width=THUMBNAIL_WIDTH):
+    """
+    Grayscale thumbnail of a page, `width` to 2 * `width` pixels wide: the page is shrunk by an integer
+    factor, which OpenCV's area interpolation does several times faster than an arbitrary one
+    """
+    h, w = gray.shape[:2]
+    factor = max(1, w // width)
+    return cv2.resize(gray[:max(h // factor, 1) * factor, :w // factor * factor],
+                      (w // factor, max(h // factor, 1)), interpolation=cv2.INTER_AREA)
+
+
+def is_same_page(thumbnail_1, thumbnail_2, max_difference=32):
+    """
+    Whether two page thumbnails show the same content. The mean gray level difference is taken over
+    every 3x3 window: scanner noise averages out, while a single changed word or digit leaves one window
+    far above `max_difference`. Pages cropped to different sizes are never the same.
+    """
+    image_1 = cv2.imdecode(np.frombuffer(thumbnail_1, np.uint8), cv2.IMREAD_GRAYSCALE)
+    image_2 = cv2.imdecode(np.frombuffer(thumbnail_2, np.uint8), cv2.IMREAD_GRAYSCALE)
+    if image_1.shape != image_2.shape:
+        return False
+    difference = cv2.blur(cv2.absdiff(image_1, image_2).astype(np.float32), (3, 3))
+    return float(difference.max()) <= max_difference
+
+
+def page_signature(gray, binary, page_image):
+    """
+    Signature of a preprocessed page for the blank and near-duplicate page filters
+
+    Parameters:
+    - gray (np.ndarray): Grayscale page, before deskew
+    - binary (np.ndarray): Otsu binarized page of correct_skew
+    - page_image (np.ndarray): Preprocessed (deskewed and cropped) page, hashed
+    """
+    ink, contrast = ink_statistics(gray, binary)
+    thumbnail = make_thumbnail(page_image)
+    return PageSignature(ink=round(ink, 6), contrast=round(contrast, 2), phash=perceptual_hash(thumbnail),
+                         thumbnail=cv2.imencode(".png", thumbnail)[1].tobytes())
+
+
+def signature_to_bytes(signature):
+    return json.dumps({"ink": signature.ink, "contrast": signature.contrast, "phash": f"{signature.phash:x}",
+                       "thumbnail": base64.b64encode(signature.thumbnail).decode("ascii")}).encode("utf-8")
+
+
+def signature_from_bytes(data):
+    signature = json.loads(data)
+    return PageSignature(ink=signature["ink"], contrast=signature["contrast"], phash=int(signature["phash"], 16),
+                         thumbnail=base64.b64decode(signature["thumbnail"]))
+
+
+class PageHashIndex:
+    """
+    Index of the perceptual hashes of the pages seen, answering "which pages are within `max_distance`
+    bits of this one" without comparing against every page.
+
+    Multi-index hashing: the hash is cut in max_distance + 1 bands, and two hashes within max_distance
+    bits of each other share at least one band exactly (pigeonhole), so only the pages sharing a band
+    are compared. The oldest pages are forgotten beyond `max_items`.
+    """
+    def __init__(self, max_distance=10, bits=HASH_SIZE ** 2, max_items=1000):
+        self.max_distance = max_distance
+        self.max_items = max_items
+        bounds = np.linspace(0, bits, max_distance + 2).astype(int)
+        self.bands = [(int(start), (1 << int(end - start)) - 1) for start, end in zip(bounds[:-1], bounds[1:])]
+        self.buckets = [{} for _ in self.bands]
+        self.items = OrderedDict()
+
+    def band_keys(self, phash):
+        return [(phash >> shift) & mask for shift, mask in self.bands]
+
+    def candidates(self, phash):
+        """
+        Returns:
+        - list: Values of the pages within max_distance bits, closest first
+        """
+        distances = {}
+        for bucket, key in zip(self.buckets, self.band_keys(phash)):
+            for candidate in bucket.get(key, ()):
+                if candidate not in distances:
+                    distances[candidate] = (candidate ^ phash).bit_count()
+        return [self.items[candidate] for candidate, distance in sorted(distances.items(), key=lambda item: item[1])
+                if distance <= self.max_distance]
+
+    def add(self, phash, value):
+        """
+        Index a page; the value of a page with the same hash is replaced
+        """
+        if phash in self.items:
+            self.items[phash] = value
+            self.items.move_to_end(phash)
+            return
+        self.items[phash] = value
+        for bucket, key in zip(self.buckets, self.band_keys(phash)):
+            bucket.setdefault(key, []).append(phash)
+
+        while len(self.items) > self.max_items:
+            oldest, _ = self.items.popitem(last=False)
+            for bucket, key in zip(self.buckets, self.band_keys(oldest)):
+                bucket[key].remove(oldest)
+                if not bucket[key]:
+                    del bucket[key]
+
+    def __len__(self):
+        return len(self.items)
+
+
+# Pages seen by this process, keyed by (max_distance, max_items), so duplicates are found across the tasks
+# a worker process runs
+_PAGE_HASH_INDEXES = {}
+
+
+def get_page_hash_index(max_distance, max_items):
+    key = (max_distance, max_items)
+    if key not in _PAGE_HASH_INDEXES:
+        _PAGE_HASH_INDEXES[key] = PageHashIndex(max_distance, max_items=max_items)
+    return _PAGE_HASH_INDEXES[key]
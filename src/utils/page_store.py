@@ -0,0 +1,317 @@
+import os
+import json
+import mmap
+import time
+import zlib
+import struct
+import threading
+import contextlib
+from glob import glob
+
+import cv2
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from src.logger import get_logger
+logger = get_logger(__name__)
+from src.utils.lru_cache import LRUCache
+from src.utils.main_utils import PAGE_NUMBER_PATTERN, natural_sort_key
+
+PACK_EXTENSION = ".pages"
+RECORD_MAGIC = b"PGR1"
+# Record header: magic, kind (the page file extension), page number, payload CRC-32, metadata length, payload length
+RECORD_HEADER = struct.Struct("<4s8sIIIQ")
+# Page stores kept open (mapped) per process
+MAX_OPEN_STORES = 64
+
+
+@contextlib.contextmanager
+def locked(file):
+    """
+    Exclusive lock of an open file across processes, held for the duration of the block
+    """
+    if fcntl is not None:
+        # flock rather than lockf: a POSIX lock is released when any descriptor of the file is closed
+        # by the process, such as the one a replaced memory mapping holds
+        fcntl.flock(file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(file, fcntl.LOCK_UN)
+        return
+    # msvcrt locks a byte range from the current position and gives up after 10 seconds of waiting
+    while True:
+        file.seek(0)
+        try:
+            msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+            break
+        except OSError:
+            time.sleep(0.1)
+    try:
+        yield
+    finally:
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class PageStore:
+    """
+    Append-only pack of the pages of one document: page images, their metadata and texts are records
+    (header, JSON metadata, payload) keyed by (kind, page number), the latest record of a key wins.
+
+    The file is memory-mapped and indexed by scanning the record headers, so a page is read by index as
+    a slice of the mapping, without copying it. Writers append one record at a time under an exclusive
+    file lock, so the worker processes of a stage (on one or more hosts) can share the pack of a document;
+    readers pick up the records appended by others on their next miss. A record torn by a crash is left
+    out of the index and cut off by the next writer.
+    """
+    def __init__(self, store_path):
+        self.store_path = store_path
+        self.index = {}
+        # End of the last complete record indexed
+        self.end = 0
+        self.mapping = None
+        self.lock = threading.Lock()
+
+    def scan(self, size):
+        """
+        Index the complete records between the end of the index and `size`
+        """
+        position = self.end
+        while position + RECORD_HEADER.size <= size:
+            magic, kind, page, crc, meta_length, length = RECORD_HEADER.unpack_from(self.mapping, position)
+            if magic != RECORD_MAGIC:
+                break
+            meta_start = position + RECORD_HEADER.size
+            if meta_start + meta_length + length > size:
+                break
+            self.index[(kind.rstrip(b"\0").decode("ascii"), page)] = (meta_start, meta_length, length, crc)
+            position = meta_start + meta_length + length
+        self.end = position
+
+    def refresh(self, file=None):
+        """
+        Map and index the records appended since the last look, by this process or another one
+        (from the open `file` of a writer when given)
+        """
+        if not os.path.exists(self.store_path):
+            return
+        size = os.path.getsize(self.store_path)
+        if size > (len(self.mapping) if self.mapping is not None else 0):
+            # Views handed out keep the previous mapping alive until they are released
+            if file is not None:
+                self.mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                with open(self.store_path, "rb") as file:
+                    self.mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mapping is not None:
+            self.scan(min(size, len(self.mapping)))
+
+    def find(self, kind, page):
+        with self.lock:
+            entry = self.index.get((kind, page))
+            # Records this process appended since the file was last mapped are past the end of the mapping
+            if entry is None or entry[0] + entry[1] + entry[2] > len(self.mapping or b""):
+                self.refresh()
+            return self.index.get((kind, page))
+
+    def get(self, kind, page):
+        """
+        Payload of a page as a read-only memoryview of the mapped pack, None when the pack does not have it
+        """
+        entry = self.find(kind, page)
+        if entry is None:
+            return None
+        meta_start, meta_length, length, _ = entry
+        start = meta_start + meta_length
+        return memoryview(self.mapping)[start:start + length]
+
+    def metadata(self, kind, page):
+        """
+        Metadata stored with a page, None when the pack does not have the page
+        """
+        entry = self.find(kind, page)
+        if entry is None:
+            return None
+        meta_start, meta_length, _, _ = entry
+        return json.loads(self.mapping[meta_start:meta_start + meta_length]) if meta_length else {}
+
+    def pages(self, kind):
+        """
+        Page numbers of the pages of a kind, in page order
+        """
+        with self.lock:
+            self.refresh()
+            return sorted(page for page_kind, page in self.index if page_kind == kind)
+
+    def append(self, kind, page, data, metadata=None):
+        """
+        Append a page to the pack, unless the pack already holds the same payload and metadata for it
+        (a page rendered or preprocessed again by a later run)
+        """
+        meta = json.dumps(metadata, sort_keys=True).encode("utf-8") if metadata else b""
+        crc = zlib.crc32(data)
+        header = RECORD_HEADER.pack(RECORD_MAGIC, kind.encode("ascii"), page, crc, len(meta), len(data))
+        with self.lock:
+            fd = os.open(self.store_path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o666)
+            with os.fdopen(fd, "r+b") as file, locked(file):
+                # Records appended by other processes since the last look
+                self.refresh(file)
+                entry = self.index.get((kind, page))
+                if entry is not None:
+                    meta_start, meta_length, length, entry_crc = entry
+                    if (entry_crc, length) == (crc, len(data)) and self.mapping[meta_start:meta_start + meta_length] == meta:
+                        return
+                if os.fstat(file.fileno()).st_size > self.end:
+                    logger.warning(f"Cutting off a torn record at the end of {self.store_path}")
+                    file.truncate(self.end)
+                file.seek(self.end)
+                file.write(b"".join((header, meta, data)))
+                file.flush()
+                meta_start = self.end + RECORD_HEADER.size
+                self.index[(kind, page)] = (meta_start, len(meta), len(data), crc)
+                self.end = meta_start + len(meta) + len(data)
+
+
+# Page stores of this process, keyed by their path
+_PAGE_STORES = LRUCache(MAX_OPEN_STORES)
+_PAGE_STORES_LOCK = threading.Lock()
+
+
+def get_page_store(store_path):
+    with _PAGE_STORES_LOCK:
+        store = _PAGE_STORES.get(store_path)
+        if store is None:
+            store = PageStore(store_path)
+            _PAGE_STORES.put(store_path, store)
+        return store
+
+
+def store_path_of(document_folder):
+    """
+    Path of the pack of a document: "<stage folder>/<document>/<document>.pages"
+    """
+    return os.path.join(document_folder, os.path.basename(os.path.normpath(document_folder)) + PACK_EXTENSION)
+
+
+def locate_page(page_path):
+    """
+    Pack, kind and page number of a page path "<stage folder>/<document>/<document>_page_<n>.<ext>"
+
+    Returns:
+    - (str, str, int): Path of the pack of the document, "<ext>" and n; None for any other path
+    """
+    file_name, extension = os.path.splitext(os.path.basename(page_path))
+    match = PAGE_NUMBER_PATTERN.search(file_name)
+    if match is None:
+        return None
+    return store_path_of(os.path.dirname(page_path)), extension.lstrip("."), int(match.group(1))
+
+
+class PageStorage:
+    """
+    Storage of the per-page files of the stages, addressed by their path whatever the backend:
+    "<stage folder>/<document>/<document>_page_<n>.<ext>" is a loose file, or with `packed` a record
+    of kind <ext> in the PageStore of the document, one "<document>.pages" file in its folder.
+    Reads find a page in either place (the packed one first when packing), so the artifacts of runs
+    with either backend stay readable.
+    """
+    def __init__(self, packed=True):
+        self.packed = packed
+
+    def write(self, page_path, data, metadata=None):
+        """
+        Write a page (bytes of an encoded image or text) with optional JSON-serializable metadata, which
+        loose files do not keep
+        """
+        if self.packed:
+            location = locate_page(page_path)
+            if location is None:
+                raise ValueError(f"Not a page file name: {page_path}")
+            store_path, kind, page_no = location
+            get_page_store(store_path).append(kind, page_no, data, metadata)
+            return
+        with open(page_path, "wb") as file:
+            file.write(data)
+
+    def read_packed(self, page_path):
+        location = locate_page(page_path)
+        if location is None or not os.path.exists(location[0]):
+            return None
+        store_path, kind, page_no = location
+        return get_page_store(store_path).get(kind, page_no)
+
+    def read(self, page_path):
+        """
+        Bytes of a page: a view of the mapped pack for a packed page, the file contents for a loose one
+
+        Raises:
+        - FileNotFoundError: The page is in neither place
+        """
+        data = self.read_packed(page_path) if self.packed else None
+        if data is None and os.path.exists(page_path):
+            with open(page_path, "rb") as file:
+                return file.read()
+        if data is None and not self.packed:
+            data = self.read_packed(page_path)
+        if data is None:
+            raise FileNotFoundError(f"No page {page_path}")
+        return data
+
+    def read_image(self, page_path, flags=cv2.IMREAD_COLOR):
+        """
+        Decoded image of a page, decoded straight from the mapped pack for a packed page
+        """
+        image = cv2.imdecode(np.frombuffer(self.read(page_path), dtype=np.uint8), flags)
+        if image is None:
+            raise ValueError(f"Could not load image: {page_path}")
+        return image
+
+    def image_source(self, page_path):
+        """
+        What the OCR engines read a page image from: the path of a loose file, which they load
+        themselves, or the image decoded from the pack
+        """
+        if (not self.packed or self.read_packed(page_path) is None) and os.path.exists(page_path):
+            return page_path
+        return self.read_image(page_path)
+
+    def metadata(self, page_path):
+        """
+        Metadata stored with a packed page, {} for a loose one
+        """
+        location = locate_page(page_path)
+        if location is None or not os.path.exists(location[0]):
+            return {}
+        store_path, kind, page_no = location
+        return get_page_store(store_path).metadata(kind, page_no) or {}
+
+    def list_pages(self, document_folder, extension):
+        """
+        Paths of the pages of a document with an extension (".png"), loose or packed, in page order
+        """
+        page_paths = set(glob(os.path.join(document_folder, f"*{extension}")))
+        store_path = store_path_of(document_folder)
+        if os.path.exists(store_path):
+            document = os.path.basename(os.path.normpath(document_folder))
+            page_paths.update(os.path.join(document_folder, f"{document}_page_{page_no}{extension}")
+                              for page_no in get_page_store(store_path).pages(extension.lstrip(".")))
+        return sorted(page_paths, key=natural_sort_key)
+
+
+def page_exists(page_path):
+    """
+    Whether a page exists as a loose file or in the pack of its document
+    """
+    if os.path.exists(page_path):
+        return True
+    location = locate_page(page_path)
+    if location is None or not os.path.exists(location[0]):
+        return False
+    store_path, kind, page_no = location
+    return get_page_store(store_path).find(kind, page_no) is not None
@@ -0,0 +1,279 @@
+import os
+import time
+import sqlite3
+from datetime import datetime
+
+from src.logger import get_logger
+logger = get_logger(__name__)
+from src.utils.main_utils import PAGE_NUMBER_PATTERN
+from src.utils.page_store import page_exists
+
+# Page states, in pipeline order: a page only moves forward until it is failed or quarantined
+PENDING = "pending"
+RASTERIZED = "rasterized"
+PREPROCESSED = "preprocessed"
+OCR_DONE = "ocr_done"
+FAILED = "failed"
+QUARANTINED = "quarantined"
+STATE_ORDER = {PENDING: 0, FAILED: 0, RASTERIZED: 1, PREPROCESSED: 2, OCR_DONE: 3}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    started_at TEXT NOT NULL,
+    finished_at TEXT,
+    status TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS documents (
+    document TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    document TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    stage TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (document, page)
+);
+CREATE INDEX IF NOT EXISTS pages_state ON pages (state);
+"""
+
+
+def source_signature(pdf_path):
+    """
+    Identity of a source PDF for the journal: its size and modification time, a changed file restarts
+    its pages from scratch (cheaper than hashing every PDF of a large batch on every run)
+    """
+    stat = os.stat(pdf_path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def image_page(image_path):
+    """
+    (document, page number) of a page file named "<document>_page_<n>.<ext>" in the folder of its document
+    """
+    file_name = os.path.splitext(os.path.basename(image_path))[0]
+    return os.path.basename(os.path.dirname(image_path)), int(PAGE_NUMBER_PATTERN.search(file_name).group(1))
+
+
+class RunJournal:
+    """
+    Durable SQLite journal of the state of every page of every document across pipeline runs: pending,
+    rasterized, preprocessed, OCR'd, failed (with its error and number of attempts) or quarantined.
+
+    Stages skip the pages that already reached their state in an earlier run, so a run interrupted by a
+    crash resumes where it stopped. A failed page is retried with exponential backoff, and a page failing
+    `max_attempts` times in a row (over all runs) is quarantined: it is no longer tried and is reported instead.
+    A page that makes progress starts a new streak of attempts.
+
+    Only the pipeline process writes the journal; the workers report their pages back to it. The
+    database runs in WAL mode and every update is a single transaction, so a crash loses at most the
+    update in progress.
+    """
+    def __init__(self, journal_path, max_attempts=3, retry_backoff=2.0):
+        self.journal_path = journal_path
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        os.makedirs(os.path.dirname(os.path.abspath(journal_path)), exist_ok=True)
+        self.connection = sqlite3.connect(journal_path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        self.connection.commit()
+        self.run_id = None
+
+    def close(self):
+        self.connection.close()
+
+    def start_run(self, run_id):
+        """
+        Record the start of a run, runs still marked as running were interrupted
+        """
+        with self.connection:
+            interrupted = self.connection.execute("UPDATE runs SET status = 'interrupted' WHERE status = 'running'")
+            if interrupted.rowcount:
+                logger.warning(f"{interrupted.rowcount} interrupted run(s) in the journal, resuming their pages")
+            self.connection.execute("INSERT OR REPLACE INTO runs VALUES (?, ?, NULL, 'running')",
+                                    (run_id, datetime.now().isoformat(timespec="seconds")))
+        self.run_id = run_id
+
+    def finish_run(self, status):
+        with self.connection:
+            self.connection.execute("UPDATE runs SET finished_at = ?, status = ? WHERE run_id = ?",
+                                    (datetime.now().isoformat(timespec="seconds"), status, self.run_id))
+
+    def register_document(self, document, pdf_path, pages):
+        """
+        Register the pages of a document as pending. The pages of a document whose PDF changed since it was
+        journaled start over.
+        """
+        source = source_signature(pdf_path)
+        now = time.time()
+        with self.connection:
+            row = self.connection.execute("SELECT source FROM documents WHERE document = ?", (document,)).fetchone()
+            if row is not None and row[0] != source:
+                logger.info(f"{document} changed since the last run, its pages start over")
+                self.connection.execute("DELETE FROM pages WHERE document = ?", (document,))
+            self.connection.execute("INSERT OR REPLACE INTO documents VALUES (?, ?, ?)", (document, source, now))
+            self.connection.executemany("INSERT OR IGNORE INTO pages (document, page, state, updated_at) "
+                                        "VALUES (?, ?, ?, ?)", [(document, page, PENDING, now) for page in pages])
+
+    def page_states(self, document):
+        """
+        Returns:
+        - dict: page -> (state, attempts, error) of the journaled pages of a document
+        """
+        rows = self.connection.execute("SELECT page, state, attempts, error FROM pages WHERE document = ?", (document,))
+        return {page: (state, attempts, error) for page, state, attempts, error in rows}
+
+    def pages_to_run(self, document, pages, state, output_paths=None):
+        """
+        Pages of a document a stage still has to run: the ones that have not reached `state`, or whose
+        outputs (the page files of `output_paths(page)`, loose or packed) are missing, and are not quarantined
+
+        Returns:
+        - (list, list): Pages to run, and (page, error) of the quarantined pages
+        """
+        page_states = self.page_states(document)
+        to_run = []
+        quarantined = []
+        for page in pages:
+            page_state, _, error = page_states.get(page, (PENDING, 0, None))
+            if page_state == QUARANTINED:
+                quarantined.append((page, error))
+            elif (STATE_ORDER[page_state] < STATE_ORDER[state] or output_paths is not None
+                  and not all(page_exists(path) for path in output_paths(page))):
+                to_run.append(page)
+        return to_run, quarantined
+
+    def mark_pages(self, document, pages, state, stage=None):
+        """
+        Move pages of a document to a state, clearing their error and failed attempts. Pages never move back
+        to an earlier state.
+        """
+        page_states = self.page_states(document)
+        now = time.time()
+        rows = [(document, page, state, stage, now) for page in pages
+                if page_states.get(page, (PENDING,))[0] == QUARANTINED
+                or STATE_ORDER.get(page_states.get(page, (PENDING,))[0], 0) <= STATE_ORDER[state]]
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO pages (document, page, state, stage, updated_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (document, page) DO UPDATE SET state = excluded.state, stage = excluded.stage, "
+                "attempts = 0, error = NULL, updated_at = excluded.updated_at", rows)
+
+    def mark_files(self, paths, state, stage=None):
+        """
+        Move the pages of page files (see image_page) to a state, one transaction per document
+        """
+        documents = {}
+        for path in paths:
+            document, page = image_page(path)
+            documents.setdefault(document, []).append(page)
+        for document, pages in documents.items():
+            self.mark_pages(document, pages, state, stage)
+
+    def record_failure(self, stage, document, page, error):
+        """
+        Record a failed attempt of a page, since the last time it made progress
+
+        Returns:
+        - bool: True when the page may be retried, False once it is quarantined
+        """
+        with self.connection:
+            row = self.connection.execute("SELECT attempts FROM pages WHERE document = ? AND page = ?",
+                                          (document, page)).fetchone()
+            attempts = (row[0] if row is not None else 0) + 1
+            state = QUARANTINED if attempts >= self.max_attempts else FAILED
+            self.connection.execute(
+                "INSERT INTO pages (document, page, state, stage, attempts, error, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (document, page) DO UPDATE SET state = excluded.state, stage = excluded.stage, "
+                "attempts = excluded.attempts, error = excluded.error, updated_at = excluded.updated_at",
+                (document, page, state, stage, attempts, str(error), time.time()))
+        if state == QUARANTINED:
+            logger.error(f"{document} page {page} quarantined after {attempts} failed attempts: {error}")
+        return state != QUARANTINED
+
+    def backoff_seconds(self, attempt):
+        """
+        Wait before the retry `attempt` (1 for the first retry): retry_backoff, doubled at every retry
+        """
+        return self.retry_backoff * 2 ** (attempt - 1)
+
+    def quarantined_pages(self):
+        """
+        Returns:
+        - list: (stage, document, page, error) of the quarantined pages
+        """
+        return self.connection.execute("SELECT stage, document, page, error FROM pages WHERE state = ? "
+                                       "ORDER BY document, page", (QUARANTINED,)).fetchall()
+
+    def summary(self):
+        """
+        Returns:
+        - dict: Number of journaled pages in every state
+        """
+        return dict(self.connection.execute("SELECT state, COUNT(*) FROM pages GROUP BY state").fetchall())
+
+    def document_summary(self):
+        """
+        Returns:
+        - dict: document -> number of its pages in every state
+        """
+        documents = {}
+        for document, state, count in self.connection.execute(
+                "SELECT document, state, COUNT(*) FROM pages GROUP BY document, state ORDER BY document"):
+            documents.setdefault(document, {})[state] = count
+        return documents
+
+
+# Journal of the pipeline run in progress in this process, see open_run_journal
+_RUN_JOURNAL = None
+
+
+def open_run_journal(journal_path, max_attempts=3, retry_backoff=2.0):
+    """
+    Open the journal the stages of this process record their pages in
+    """
+    global _RUN_JOURNAL
+    if _RUN_JOURNAL is not None:
+        _RUN_JOURNAL.close()
+    _RUN_JOURNAL = RunJournal(journal_path, max_attempts, retry_backoff)
+    return _RUN_JOURNAL
+
+
+def close_run_journal():
+    global _RUN_JOURNAL
+    if _RUN_JOURNAL is not None:
+        _RUN_JOURNAL.close()
+        _RUN_JOURNAL = None
+
+
+def get_run_journal():
+    return _RUN_JOURNAL
+
+
+def retry_arguments(stage, pages_of):
+    """
+    run_in_pool arguments retrying the failed tasks of a stage with backoff while the journal allows it
+
+    Parameters:
+    - stage (str): Stage the failures are recorded under
+    - pages_of (callable): task -> list of the (document, page) the task works on
+
+    Returns:
+    - dict: retries, backoff and on_error keyword arguments, empty without a journal
+    """
+    journal = get_run_journal()
+    if journal is None:
+        return {}
+
+    def on_error(task, error):
+        # Every page of the task records the attempt, the task is retried while none is quarantined
+        return all([journal.record_failure(stage, document, page, error) for document, page in pages_of(task)])
+
+    return {"retries": journal.max_attempts - 1, "backoff": journal.retry_backoff, "on_error": on_error}
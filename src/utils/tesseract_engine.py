@@ -0,0 +1,161 @@
+import re
+import atexit
+import threading
+
+import cv2
+import numpy as np
+import pytesseract
+from PIL import Image
+
+# tesserocr binds the Tesseract C-API directly: the engine and its language model are loaded once and
+# reused for every page, instead of pytesseract forking a `tesseract` process (and reloading the model)
+# per page and exchanging the image and the result through temporary files
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+from src.entity.artifact_entity import OCRWord, OCRPageResult
+from src.logger import get_logger
+logger = get_logger(__name__)
+
+
+# Warm engines of this process, keyed by (thread, lang, oem). With the process pool every
+# worker process keeps its own engines alive across all the pages it is given. An engine is not
+# thread safe, so the threads OCRing the regions of a page each have their own.
+_TESSERACT_APIS = {}
+
+
+def parse_tesseract_config(config):
+    """
+    Extract the OCR engine mode and page segmentation mode from a Tesseract command line config
+    e.g. "--oem 1 --psm 3" -> (1, 3)
+    """
+    oem = re.search(r"--oem\s+(\d+)", config)
+    psm = re.search(r"--psm\s+(\d+)", config)
+    return int(oem.group(1)) if oem else 3, int(psm.group(1)) if psm else 3
+
+
+def is_tesserocr_available():
+    return tesserocr is not None
+
+
+def set_psm(config, psm):
+    """
+    Tesseract command line config with its page segmentation mode replaced (or added)
+    e.g. ("--oem 1 --psm 3", 6) -> "--oem 1 --psm 6"
+    """
+    if re.search(r"--psm\s+\d+", config):
+        return re.sub(r"--psm\s+\d+", f"--psm {psm}", config)
+    return f"{config} --psm {psm}".strip()
+
+
+def get_tesseract_api(lang, oem, psm):
+    """
+    Return the warm tesserocr engine of this thread for the given settings, creating it on first use.
+    The page segmentation mode is set on every call, it is cheap to change between images.
+    """
+    key = (threading.get_ident(), lang, oem)
+    if key not in _TESSERACT_APIS:
+        logger.info(f"Loading Tesseract engine lang={lang} oem={oem}")
+        _TESSERACT_APIS[key] = tesserocr.PyTessBaseAPI(lang=lang, oem=tesserocr.OEM(oem), psm=tesserocr.PSM(psm))
+    api = _TESSERACT_APIS[key]
+    api.SetPageSegMode(tesserocr.PSM(psm))
+    return api
+
+
+@atexit.register
+def _end_tesseract_apis():
+    for api in _TESSERACT_APIS.values():
+        api.End()
+    _TESSERACT_APIS.clear()
+
+
+def to_pil_image(image):
+    """
+    Convert an image path or an OpenCV (BGR or grayscale) array into a PIL image without touching the disk
+    """
+    if isinstance(image, Image.Image):
+        return image
+    if isinstance(image, np.ndarray):
+        if image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        return Image.fromarray(image)
+    return Image.open(image)
+
+
+def to_gray_array(image):
+    """
+    Convert an image path, a PIL image or an OpenCV (BGR or grayscale) array into a grayscale array
+    """
+    if isinstance(image, Image.Image):
+        return np.asarray(image.convert("L"))
+    if isinstance(image, np.ndarray):
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    gray = cv2.imread(image, cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        raise ValueError(f"Could not load image: {image}")
+    return gray
+
+
+def ocr_with_tesserocr(image, lang, config):
+    """
+    OCR a page with the warm tesserocr engine of this process
+
+    Returns:
+    - OCRPageResult: Page text plus every word with its bounding box and confidence
+    """
+    oem, psm = parse_tesseract_config(config)
+    api = get_tesseract_api(lang, oem, psm)
+    api.SetImage(to_pil_image(image))
+    api.Recognize()
+    text = api.GetUTF8Text()
+
+    words = []
+    level = tesserocr.RIL.WORD
+    for result in tesserocr.iterate_level(api.GetIterator(), level):
+        word = result.GetUTF8Text(level)
+        if not word:
+            continue
+        left, top, right, bottom = result.BoundingBox(level)
+        words.append(OCRWord(text=word, left=left, top=top, width=right - left, height=bottom - top,
+                             conf=float(result.Confidence(level))))
+    api.Clear()
+
+    return OCRPageResult(text=text, words=words)
+
+
+def ocr_with_pytesseract_data(image, lang, config):
+    """
+    OCR a page through the tesseract command line with `image_to_data`, for when tesserocr is not installed.
+    The page text is rebuilt from the word table so only one Tesseract process is started.
+
+    Returns:
+    - OCRPageResult: Page text plus every word with its bounding box and confidence
+    """
+    if isinstance(image, np.ndarray):
+        image = to_pil_image(image)
+    data = pytesseract.image_to_data(image, config=config, lang=lang, output_type=pytesseract.Output.DICT)
+
+    words = []
+    lines = []
+    current_line = None
+    for index, word in enumerate(data["text"]):
+        if not word.strip():
+            continue
+        words.append(OCRWord(text=word, left=data["left"][index], top=data["top"][index],
+                             width=data["width"][index], height=data["height"][index],
+                             conf=float(data["conf"][index])))
+
+        line = (data["block_num"][index], data["par_num"][index], data["line_num"][index])
+        if line != current_line:
+            # A blank line separates blocks/paragraphs, as in image_to_string
+            if current_line is not None and line[:2] != current_line[:2]:
+                lines.append("")
+            lines.append(word)
+            current_line = line
+        else:
+            lines[-1] += " " + word
+
+    text = "\n".join(lines) + "\n" if lines else ""
+    return OCRPageResult(text=text, words=words)
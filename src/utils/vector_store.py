@@ -0,0 +1,133 @@
+import os
+import sys
+import json
+import hashlib
+
+import numpy as np
+
+from src.logger import get_logger
+logger = get_logger(__name__)
+from src.exception import srcException
+from src.utils.main_utils import write_text_file
+
+
+# Files of a vector store folder. The matrix and metadata files are named after the store version, so a
+# new version never overwrites files that readers may still have open (or memory-mapped): replacing the
+# manifest is what switches readers to the new version
+EMBEDDINGS_FILE = "embeddings_{version}.npy"
+METADATA_FILE = "metadata_{version}.jsonl"
+MANIFEST_FILE = "manifest.json"
+
+# Rows copied per slice when the matrix is rewritten, bounds the memory of an incremental update
+COPY_ROWS = 65536
+
+
+def store_version(model_name, dtype, metadata):
+    """
+    Version of a vector store: changes whenever the model, the dtype or any chunk (text or provenance) changes
+    """
+    sha = hashlib.sha256(f"{model_name}|{dtype}".encode("utf-8"))
+    for row in metadata:
+        sha.update(f"{row['chunk_id']}|{row['hash']}\n".encode("utf-8"))
+    return sha.hexdigest()[:16]
+
+
+def load_vector_store(store_folder, mmap_mode="r", read_metadata=True):
+    """
+    Open a vector store without reading its matrix into memory
+
+    Parameters:
+    - store_folder (str): Folder of the store
+    - mmap_mode (str): numpy memory-map mode of the matrix, None to load it in memory
+    - read_metadata (bool): Parse the metadata rows, an empty list is returned otherwise
+
+    Returns:
+    - (numpy.ndarray, list, dict): Embedding matrix (memory-mapped), metadata rows in matrix order and manifest,
+      or (None, [], {}) when the store does not exist yet
+    """
+    try:
+        manifest_path = os.path.join(store_folder, MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            return None, [], {}
+
+        with open(manifest_path, "r", encoding="utf-8") as file:
+            manifest = json.load(file)
+        metadata = []
+        if read_metadata:
+            with open(os.path.join(store_folder, manifest["metadata_file"]), "r", encoding="utf-8") as file:
+                metadata = [json.loads(line) for line in file if line.strip()]
+
+        matrix = None
+        if manifest["count"]:
+            matrix = np.load(os.path.join(store_folder, manifest["matrix_file"]), mmap_mode=mmap_mode)
+        return matrix, metadata, manifest
+
+    except Exception as e:
+        raise srcException(e, sys) from e
+
+
+def write_vector_store(store_folder, metadata, dimension, dtype, model_name, row_sources):
+    """
+    Write a vector store, reusing rows of the previous matrix where possible.
+    The matrix is written to a new memory-mapped file filled slice by slice, then the metadata, and the
+    manifest is replaced last, so readers never see a half-written store. Files of older versions are
+    removed once the manifest points to the new one.
+
+    Parameters:
+    - store_folder (str): Folder of the store
+    - metadata (list): Metadata rows, one per chunk in matrix order
+    - dimension (int): Embedding dimension
+    - dtype (str): Storage dtype of the matrix, "float16" or "float32"
+    - model_name (str): Embedding model, recorded in the manifest
+    - row_sources (list): One (matrix, row) pair per chunk, where the row of `matrix` (the previous store
+      or the newly embedded vectors) holds its vector
+
+    Returns:
+    - dict: The manifest of the new store
+    """
+    try:
+        os.makedirs(store_folder, exist_ok=True)
+        version = store_version(model_name, dtype, metadata)
+        matrix_file = EMBEDDINGS_FILE.format(version=version)
+        metadata_file = METADATA_FILE.format(version=version)
+        matrix_path = os.path.join(store_folder, matrix_file)
+
+        if metadata and not os.path.exists(matrix_path):
+            temp_path = f"{matrix_path}.tmp.npy"
+            matrix = np.lib.format.open_memmap(temp_path, mode="w+", dtype=dtype, shape=(len(metadata), dimension))
+            for start in range(0, len(metadata), COPY_ROWS):
+                rows = row_sources[start:start + COPY_ROWS]
+                for source in {id(source): source for source, _ in rows}.values():
+                    # Gather the rows coming from the same source matrix with one fancy-indexing read
+                    positions = [position for position, (row_source, _) in enumerate(rows) if row_source is source]
+                    matrix[start + np.array(positions)] = source[[rows[position][1] for position in positions]]
+            matrix.flush()
+            del matrix
+            os.replace(temp_path, matrix_path)
+
+        write_text_file(os.path.join(store_folder, metadata_file),
+                        "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in metadata))
+
+        manifest = {
+            "model": model_name,
+            "dimension": dimension,
+            "dtype": dtype,
+            "count": len(metadata),
+            "normalized": True,
+            "version": version,
+            "matrix_file": matrix_file,
+            "metadata_file": metadata_file,
+        }
+        write_text_file(os.path.join(store_folder, MANIFEST_FILE), json.dumps(manifest, indent=2))
+
+        for file_name in os.listdir(store_folder):
+            if file_name.startswith(("embeddings_", "metadata_")) and file_name not in (matrix_file, metadata_file):
+                try:
+                    os.remove(os.path.join(store_folder, file_name))
+                except OSError:
+                    # Still memory-mapped by a reader (Windows), removed by a later write
+                    pass
+        return manifest
+
+    except Exception as e:
+        raise srcException(e, sys) from e
@@ -0,0 +1,289 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import contextlib
+from dataclasses import dataclass
+
+from src.logger import get_logger
+logger = get_logger(__name__)
+
+# Unit states: queued -> leased -> done, or back to queued when the unit fails or its lease expires,
+# until it fails `max_attempts` times
+QUEUED = "queued"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    status TEXT NOT NULL,
+    settings TEXT
+);
+CREATE TABLE IF NOT EXISTS units (
+    unit_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL,
+    document TEXT NOT NULL,
+    pdf_path TEXT NOT NULL,
+    output_folder TEXT NOT NULL,
+    first_page INTEGER,
+    last_page INTEGER,
+    state TEXT NOT NULL,
+    worker TEXT,
+    lease_expires REAL,
+    available_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    result TEXT,
+    collected INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS units_run_state ON units (run_id, state);
+CREATE TABLE IF NOT EXISTS workers (
+    worker_id TEXT PRIMARY KEY,
+    host TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    run_id TEXT,
+    started_at REAL NOT NULL,
+    heartbeat_at REAL NOT NULL,
+    units_done INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+def worker_name():
+    """
+    Name of a worker process, unique across the hosts sharing a queue: "<host>-<pid>"
+    """
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+@dataclass
+class WorkUnit:
+    unit_id: int
+    run_id: str
+    document: str
+    task: tuple
+    attempts: int
+
+
+class WorkQueue:
+    """
+    Shared SQLite queue of page-level work units (page ranges of a document) with leases.
+
+    A worker claims a unit with a lease of `lease_seconds` and renews it with heartbeats while it works
+    on it. The lease of a worker that died (or lost the shared filesystem) expires, and the unit is
+    delivered again to the next worker that claims a unit. A unit that fails, or whose lease expires,
+    `max_attempts` times is failed for good.
+
+    Every claim and update is one IMMEDIATE transaction, so any number of worker processes can share
+    the queue. The database keeps SQLite's rollback journal rather than WAL: WAL needs shared memory
+    between the processes, so it only works when they all run on one host, while the rollback journal
+    relies on file locks only and also works on a network filesystem with working POSIX locks.
+    """
+    def __init__(self, queue_path, lease_seconds=60.0, max_attempts=3, retry_backoff=2.0):
+        self.queue_path = queue_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        os.makedirs(os.path.dirname(os.path.abspath(queue_path)), exist_ok=True)
+        # Transactions are explicit (see transaction), lock waits are retried for up to 60 seconds
+        self.connection = sqlite3.connect(queue_path, timeout=60, isolation_level=None)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Write transaction that takes the database lock up front, so concurrent claims never deadlock
+        """
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.connection
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        self.connection.execute("COMMIT")
+
+    def start_run(self, run_id, settings):
+        """
+        Start a run whose units the workers build their components for from `settings`, stored as JSON:
+        whoever can write the shared queue file must not be able to run code on the workers.
+        Runs still marked as running were interrupted, their units are dropped.
+        """
+        with self.transaction() as connection:
+            interrupted = [row[0] for row in connection.execute("SELECT run_id FROM runs WHERE status = 'running'")]
+            for interrupted_run in interrupted:
+                logger.warning(f"Run {interrupted_run} of the work queue was interrupted, dropping its units")
+                connection.execute("UPDATE runs SET status = 'interrupted', finished_at = ? WHERE run_id = ?",
+                                   (time.time(), interrupted_run))
+                connection.execute("DELETE FROM units WHERE run_id = ? AND state IN (?, ?)",
+                                   (interrupted_run, QUEUED, LEASED))
+            connection.execute("INSERT OR REPLACE INTO runs VALUES (?, ?, NULL, 'running', ?)",
+                               (run_id, time.time(), json.dumps(settings)))
+
+    def finish_run(self, run_id, status):
+        with self.transaction() as connection:
+            connection.execute("UPDATE runs SET status = ?, finished_at = ? WHERE run_id = ?",
+                               (status, time.time(), run_id))
+
+    def current_run(self):
+        """
+        Returns:
+        - (str, dict): Id and settings of the run in progress, (None, None) when there is none
+        """
+        row = self.connection.execute("SELECT run_id, settings FROM runs WHERE status = 'running' "
+                                      "ORDER BY started_at DESC LIMIT 1").fetchone()
+        if row is None:
+            return None, None
+        return row[0], json.loads(row[1])
+
+    def run_status(self, run_id):
+        row = self.connection.execute("SELECT status FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        return row[0] if row is not None else None
+
+    def add_units(self, run_id, tasks, delay=0.0):
+        """
+        Queue (pdf_path, output_folder, first_page, last_page) render tasks as units of a run,
+        claimable after `delay` seconds
+        """
+        now = time.time()
+        rows = [(run_id, os.path.basename(os.path.normpath(output_folder)), pdf_path, output_folder, first_page,
+                 last_page, QUEUED, now + delay, now)
+                for pdf_path, output_folder, first_page, last_page in tasks]
+        with self.transaction() as connection:
+            connection.executemany(
+                "INSERT INTO units (run_id, document, pdf_path, output_folder, first_page, last_page, state, "
+                "available_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def register_worker(self, worker_id, run_id):
+        """
+        Record the worker process calling it as working on a run
+        """
+        now = time.time()
+        with self.transaction() as connection:
+            connection.execute(
+                "INSERT INTO workers (worker_id, host, pid, run_id, started_at, heartbeat_at) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (worker_id) DO UPDATE SET run_id = excluded.run_id, heartbeat_at = excluded.heartbeat_at",
+                (worker_id, socket.gethostname(), os.getpid(), run_id, now, now))
+
+    def claim(self, run_id, worker_id):
+        """
+        Lease the next unit of a run: a queued unit whose retry delay is over, or a unit whose lease
+        expired (its worker stopped sending heartbeats), which is delivered again
+
+        Returns:
+        - WorkUnit: The leased unit, None when no unit is available right now
+        """
+        now = time.time()
+        with self.transaction() as connection:
+            # Units whose worker died on their last attempt are not delivered again
+            connection.execute(
+                "UPDATE units SET state = ?, error = 'lease expired: the worker stopped sending heartbeats', "
+                "updated_at = ? WHERE run_id = ? AND state = ? AND lease_expires < ? AND attempts >= ?",
+                (FAILED, now, run_id, LEASED, now, self.max_attempts))
+            row = connection.execute(
+                "SELECT unit_id, document, pdf_path, output_folder, first_page, last_page, state, worker, attempts "
+                "FROM units WHERE run_id = ? AND (state = ? AND available_at <= ? OR state = ? AND lease_expires < ?) "
+                "ORDER BY unit_id LIMIT 1", (run_id, QUEUED, now, LEASED, now)).fetchone()
+            if row is None:
+                return None
+            unit_id, document, pdf_path, output_folder, first_page, last_page, state, previous_worker, attempts = row
+            connection.execute("UPDATE units SET state = ?, worker = ?, lease_expires = ?, attempts = ?, "
+                               "updated_at = ? WHERE unit_id = ?",
+                               (LEASED, worker_id, now + self.lease_seconds, attempts + 1, now, unit_id))
+        if state == LEASED:
+            logger.warning(f"Unit {unit_id} ({document}) delivered again, the lease of worker {previous_worker} expired")
+        return WorkUnit(unit_id, run_id, document, (pdf_path, output_folder, first_page, last_page), attempts + 1)
+
+    def heartbeat(self, worker_id, unit_id=None):
+        """
+        Renew the lease of the unit a worker is working on, and record that the worker is alive
+
+        Returns:
+        - bool: False when the worker lost the lease of the unit (it expired and the unit was delivered again)
+        """
+        now = time.time()
+        with self.transaction() as connection:
+            connection.execute("UPDATE workers SET heartbeat_at = ? WHERE worker_id = ?", (now, worker_id))
+            if unit_id is None:
+                return True
+            renewed = connection.execute("UPDATE units SET lease_expires = ? WHERE unit_id = ? AND worker = ? "
+                                         "AND state = ?", (now + self.lease_seconds, unit_id, worker_id, LEASED))
+            return renewed.rowcount == 1
+
+    def complete(self, unit_id, worker_id, result):
+        """
+        Record the result (a JSON-serializable dict) of a unit. The outputs of a unit are idempotent, so the
+        first completion wins, also when it comes from a worker whose lease had expired.
+        """
+        now = time.time()
+        with self.transaction() as connection:
+            connection.execute("UPDATE units SET state = ?, worker = ?, result = ?, error = NULL, updated_at = ? "
+                               "WHERE unit_id = ? AND state IN (?, ?)",
+                               (DONE, worker_id, json.dumps(result), now, unit_id, QUEUED, LEASED))
+            connection.execute("UPDATE workers SET units_done = units_done + 1, heartbeat_at = ? WHERE worker_id = ?",
+                               (now, worker_id))
+
+    def fail(self, unit_id, worker_id, error):
+        """
+        Record a failed attempt of a unit: it is queued again after a backoff (retry_backoff, doubled at
+        every attempt) until it failed `max_attempts` times
+
+        Returns:
+        - bool: True when the unit will be retried
+        """
+        now = time.time()
+        with self.transaction() as connection:
+            row = connection.execute("SELECT attempts FROM units WHERE unit_id = ? AND worker = ? AND state = ?",
+                                     (unit_id, worker_id, LEASED)).fetchone()
+            if row is None:
+                # The lease expired meanwhile, the unit belongs to another worker now
+                return True
+            retry = row[0] < self.max_attempts
+            connection.execute("UPDATE units SET state = ?, error = ?, available_at = ?, lease_expires = NULL, "
+                               "updated_at = ? WHERE unit_id = ?",
+                               (QUEUED if retry else FAILED, str(error),
+                                now + self.retry_backoff * 2 ** (row[0] - 1), now, unit_id))
+        return retry
+
+    def collect(self, run_id):
+        """
+        Units of a run finished (done or failed) since the last call, for the coordinator
+
+        Returns:
+        - list: (WorkUnit, state, result dict or None, error) of every newly finished unit
+        """
+        with self.transaction() as connection:
+            rows = connection.execute(
+                "SELECT unit_id, document, pdf_path, output_folder, first_page, last_page, attempts, state, result, "
+                "error FROM units WHERE run_id = ? AND state IN (?, ?) AND collected = 0 ORDER BY unit_id",
+                (run_id, DONE, FAILED)).fetchall()
+            connection.executemany("UPDATE units SET collected = 1 WHERE unit_id = ?", [(row[0],) for row in rows])
+        return [(WorkUnit(unit_id, run_id, document, (pdf_path, output_folder, first_page, last_page), attempts),
+                 state, json.loads(result) if result is not None else None, error)
+                for unit_id, document, pdf_path, output_folder, first_page, last_page, attempts, state, result, error
+                in rows]
+
+    def counts(self, run_id):
+        """
+        Returns:
+        - dict: Number of units of a run in every state
+        """
+        return dict(self.connection.execute("SELECT state, COUNT(*) FROM units WHERE run_id = ? GROUP BY state",
+                                            (run_id,)).fetchall())
+
+    def live_workers(self, run_id, max_silence):
+        """
+        Returns:
+        - list: (worker_id, units_done) of the workers of a run that sent a heartbeat in the last `max_silence` seconds
+        """
+        return self.connection.execute("SELECT worker_id, units_done FROM workers WHERE run_id = ? "
+                                       "AND heartbeat_at >= ? ORDER BY worker_id",
+                                       (run_id, time.time() - max_silence)).fetchall()